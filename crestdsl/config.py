@@ -37,6 +37,27 @@ class ConfigObject(object):
     """When we're in commandline and plotting graphviz to a file, we'll use this format.
     Possible output values are listed here: https://www.graphviz.org/doc/info/output.html.
     """
+
+    incremental_solving: bool = True
+    """Should the simulator keep the Z3 solvers of its next-behaviour-change queries
+    and only exchange the current port values when they are asked again?"""
+
+    incremental_solving_max_queries: int = 4096
+    """How many of these solvers are kept at most."""
+
+    analytic_transition_times: bool = True
+    """Calculate the time until a transition is enabled without Z3,
+    if the guard and the updates/influences it depends on are linear in dt (Z3 is used otherwise)."""
+
+    partial_order_reduction: bool = False
+    """When exploring state spaces, advance each subentity only once for all branches
+    that don't differ in the subentity's ports and states, and continue with only one
+    of the branches that reach the same state (see :class:`~crestdsl.verification.statespace.StateSpaceCalculator`)."""
+
+    constraint_cache: str = None
+    """A directory where the Z3 constraints of updates and influences are cached,
+    so they don't have to be created again in the next run. (``None`` deactivates the cache.)
+    See :mod:`crestdsl.simulation.constraintcache`."""
     
     def __init__(self):
         # z3 Definitions
@@ -77,6 +77,8 @@ class MetaEntity(type):
         for subentity in get_entities(obj):
             if hasattr(subentity, "__post__"):
                 subentity.__post__()
+
+        get_structure(obj)  # the entity is complete, build its structure index right away
         return obj
 
 
@@ -87,6 +89,9 @@ class Entity(meta.CrestObject, metaclass=MetaEntity):
     To create a new entity, create from this class using e.g. `class MyEntity(crest.Entity)`.
     Note, that you can implement (parameterized) constructors for your entities with `__init__`.
     """
+
+    _structure_index = None
+    """The entity's EntityStructure. Don't access it directly, use get_structure() instead."""
     
     def __new__(cls, *args, **kwargs):
         newobj = super().__new__(cls)
@@ -127,6 +132,16 @@ class Entity(meta.CrestObject, metaclass=MetaEntity):
 
         super().__setattr__(name, value)
 
+        # the entity's structure changed, the index has to be rebuilt
+        if name not in _STRUCTURE_NEUTRAL_ATTRIBUTES and \
+                (isinstance(value, (meta.CrestObject, list)) or isinstance(current_value, (meta.CrestObject, list))):
+            invalidate_structure(self)
+
+    def __delattr__(self, name):
+        super().__delattr__(name)
+        if name not in _STRUCTURE_NEUTRAL_ATTRIBUTES:
+            invalidate_structure(self)
+
     # TODO: add an equals that lets us compare entities
 
         # while parent is not None and parent != "":
@@ -584,9 +599,107 @@ def get_equivalent_in_system(original, object_to_find, newsystem):
     return operator.attrgetter(path)(newsystem)
 
 
+""" structure index """
+
+# setting these attributes doesn't change which objects an entity contains
+_STRUCTURE_NEUTRAL_ATTRIBUTES = (meta.PARENT_IDENTIFIER, meta.CURRENT_IDENTIFIER, meta.NAME_IDENTIFIER, "_structure_index")
+
+
+class EntityStructure(object):
+    """
+    A frozen index of the crestdsl objects that an entity instance holds.
+    It is built once (using ``dir()``) and then answers all ``get_*`` queries,
+    so we don't have to iterate over the entity's attributes every time.
+    
+    The index is dropped whenever a CrestObject is (re)assigned to the entity,
+    (e.g. by ``setattr`` or ``crestdsl.model.api.add``) and rebuilt on the next query.
+    """
+
+    def __init__(self, entity):
+        objects = dict()
+        for name in dir(entity):
+            if name in _STRUCTURE_NEUTRAL_ATTRIBUTES:
+                continue  # parent and current state are looked up when queried, they change
+            attr = getattr(entity, name)
+            if isinstance(attr, meta.CrestObject):
+                objects[name] = attr
+            elif isinstance(attr, meta.CrestList):
+                raise AttributeError(f"Class or Entity {entity} has an attribute {name} which is a crestlist. This is forbidden!!")
+        self.objects = objects
+
+        self._by_klass = dict()
+        self._recursive = dict()
+
+        self.ports = self.get_by_klass(ports.Port)[1]
+        self.inputs = self.get_by_klass(ports.Input)[1]
+        self.outputs = self.get_by_klass(ports.Output)[1]
+        self.locals = self.get_by_klass(ports.Local)[1]
+        self.states = self.get_by_klass(model.State)[1]
+        self.transitions = self.get_by_klass(model.Transition)[1]
+        self.updates = self.get_by_klass(model.Update)[1]
+        self.actions = self.get_by_klass(model.Action)[1]
+        self.influences = self.get_by_klass(model.Influence)[1]
+        self.entities = self.get_by_klass(Entity)[1]
+
+    def get_by_klass(self, klass):
+        """Returns a pair of (dict of name to object, tuple of distinct objects) of a certain class."""
+        if klass not in self._by_klass:
+            as_dict = {name: obj for name, obj in self.objects.items() if isinstance(obj, klass)}
+            distinct = []
+            for obj in as_dict.values():
+                if not any(obj is other for other in distinct):  # an object can be stored under several names
+                    distinct.append(obj)
+            self._by_klass[klass] = (as_dict, tuple(distinct))
+        return self._by_klass[klass]
+
+    def get_recursive(self, entity, key, collect):
+        """Returns (and caches) a tuple of objects that are collected from the entity and all its subentities."""
+        if key not in self._recursive:
+            self._recursive[key] = tuple(collect(entity))
+        return self._recursive[key]
+
+
+def get_structure(entity):
+    """
+    Returns the structure index of an entity instance (and builds it if necessary).
+    
+    Parameters
+    ----------
+    entity : Entity
+    
+    Returns
+    -------
+    EntityStructure
+        The index of the entity's ports, states, transitions, updates, actions, influences and subentities.
+    """
+    index = entity._structure_index
+    if index is None:
+        index = EntityStructure(entity)
+        object.__setattr__(entity, "_structure_index", index)
+    return index
+
+
+def invalidate_structure(entity):
+    """
+    Drops the structure index of an entity and the recursively collected objects of its ancestors.
+    You only need to call this if you modify an entity in a way that bypasses ``setattr`` 
+    (e.g. modifying the entity's class after the instance was created).
+    """
+    if entity.__dict__.get("_structure_index", None) is not None:
+        object.__setattr__(entity, "_structure_index", None)
+
+    parent = getattr(entity, meta.PARENT_IDENTIFIER, None)
+    while isinstance(parent, Entity):
+        index = parent.__dict__.get("_structure_index", None)
+        if index is not None:
+            index._recursive.clear()
+        parent = getattr(parent, meta.PARENT_IDENTIFIER, None)
+
+
 """ helper functions """
 
 
+
 def get_all_entities(entity):
     """
     Recursively descends through the entity hierarchy and collects all entities, 
@@ -602,12 +715,28 @@ def get_all_entities(entity):
     list of Entity
         A list of entities within the entity or its children.
     """
+    if not isinstance(entity, Entity):
+        return _collect_all_entities(entity)
+    return list(get_structure(entity).get_recursive(entity, "entities", _collect_all_entities))
+
+
+def _collect_all_entities(entity):
     entities = [entity]
-    for name, ent in get_entities(entity, as_dict=True).items():
+    for ent in get_entities(entity):
         entities.extend(get_all_entities(ent))
     return entities
 
 
+def _get_all(entity, key, getter):
+    """Collects the objects that getter returns for the entity and all its subentities (cached in the structure index)."""
+    def collect(root):
+        return [obj for e in get_all_entities(root) for obj in getter(e)]
+
+    if not isinstance(entity, Entity):
+        return collect(entity)
+    return list(get_structure(entity).get_recursive(entity, key, collect))
+
+
 def get_all_influences(entity):
     """
     Recursively descends through the entity hierarchy and collects all influences 
@@ -623,7 +752,7 @@ def get_all_influences(entity):
     list of Influence
         A list of influences within the entity or its children.
     """
-    return [inf for e in get_all_entities(entity) for inf in get_influences(e)]
+    return _get_all(entity, "influences", get_influences)
 
 
 def get_all_updates(entity):
@@ -641,7 +770,7 @@ def get_all_updates(entity):
     list of Update
         A list of updates within the entity or its children.
     """
-    return [up for e in get_all_entities(entity) for up in get_updates(e)]
+    return _get_all(entity, "updates", get_updates)
 
 
 def get_all_ports(entity):
@@ -659,7 +788,7 @@ def get_all_ports(entity):
     list of Port
         A list of ports within the entity or its children.
     """
-    return [p for e in get_all_entities(entity) for p in get_ports(e)]
+    return _get_all(entity, "ports", get_ports)
 
 
 def get_all_states(entity):
@@ -677,7 +806,7 @@ def get_all_states(entity):
     list of State
         A list of states within the entity or its children.
     """
-    return [s for e in get_all_entities(entity) for s in get_states(e)]
+    return _get_all(entity, "states", get_states)
 
 
 def get_all_transitions(entity):
@@ -695,7 +824,7 @@ def get_all_transitions(entity):
     list of Transition
         A list of transitions within the entity or its children.
     """
-    return [s for e in get_all_entities(entity) for s in get_transitions(e)]
+    return _get_all(entity, "transitions", get_transitions)
 
 
 def get_all_actions(entity):
@@ -713,7 +842,7 @@ def get_all_actions(entity):
     list of Action
         A list of actions within the entity or its children.
     """
-    return [s for e in get_all_entities(entity) for s in get_actions(e)]
+    return _get_all(entity, "actions", get_actions)
 
 
 def get_all_crest_objects(entity):
@@ -776,52 +905,84 @@ def get_states(entity, as_dict=False):
 
 
 def get_inputs(entity, as_dict=False):
-    return get_by_klass(entity, ports.Input, as_dict)
+    return _get_indexed(entity, "inputs", ports.Input, as_dict)
 
 
 def get_outputs(entity, as_dict=False):
-    return get_by_klass(entity, ports.Output, as_dict)
+    return _get_indexed(entity, "outputs", ports.Output, as_dict)
 
 
 def get_locals(entity, as_dict=False):
-    return get_by_klass(entity, ports.Local, as_dict)
+    return _get_indexed(entity, "locals", ports.Local, as_dict)
 
 
 def get_ports(entity, as_dict=False):
-    return get_by_klass(entity, ports.Port, as_dict)
+    return _get_indexed(entity, "ports", ports.Port, as_dict)
 
 
 def get_actions(entity, as_dict=False):
-    return get_by_klass(entity, model.Action, as_dict)
+    return _get_indexed(entity, "actions", model.Action, as_dict)
 
 
 def get_updates(entity, as_dict=False):
-    return get_by_klass(entity, model.Update, as_dict)
+    return _get_indexed(entity, "updates", model.Update, as_dict)
 
 
 def get_transitions(entity, as_dict=False):
-    return get_by_klass(entity, model.Transition, as_dict)
+    return _get_indexed(entity, "transitions", model.Transition, as_dict)
 
 
 def get_influences(entity, as_dict=False):
-    return get_by_klass(entity, model.Influence, as_dict)
+    return _get_indexed(entity, "influences", model.Influence, as_dict)
 
 
 def get_entities(entity, as_dict=False):
     # prevent recursion, don't return reference to parent !!!
+    if not isinstance(entity, Entity):
+        return {name: ent for name, ent in get_by_klass(entity, Entity, True).items() if name not in (meta.PARENT_IDENTIFIER, meta.CURRENT_IDENTIFIER)} if as_dict else \
+            [ent for name, ent in get_by_klass(entity, Entity, True).items() if name not in (meta.PARENT_IDENTIFIER, meta.CURRENT_IDENTIFIER)]
+
+    # the structure index never contains the parent or current
     if as_dict:
-        return {name: ent for name, ent in get_by_klass(entity, Entity, True).items() if name not in (meta.PARENT_IDENTIFIER, meta.CURRENT_IDENTIFIER)}
+        return dict(get_structure(entity).get_by_klass(Entity)[0])
     else:
-        return [ent for name, ent in get_by_klass(entity, Entity, True).items() if name not in (meta.PARENT_IDENTIFIER, meta.CURRENT_IDENTIFIER)]
+        return list(get_structure(entity).entities)
 
 
 def get_crest_objects(entity, as_dict=False):
     return get_by_klass(entity, meta.CrestObject, as_dict)
 
 
+def _get_indexed(entity, attribute, klass, as_dict):
+    """Shortcut for the object types that can never be parent or current state."""
+    if as_dict or not isinstance(entity, Entity):
+        return get_by_klass(entity, klass, as_dict)
+    return list(getattr(get_structure(entity), attribute))
+
+
 def get_by_klass(class_or_entity, klass, as_dict=False):
-    isclass = type(class_or_entity) == type
-    attrs = dir(class_or_entity)  # if isclass else class_or_entity.__dict__.keys()
+    if not isinstance(class_or_entity, Entity):  # classes don't have a structure index
+        return _get_by_klass_from_attributes(class_or_entity, klass, as_dict)
+
+    named, distinct = get_structure(class_or_entity).get_by_klass(klass)
+    # parent and current state change during the entity's lifetime, so they're not indexed
+    dynamic = [(name, getattr(class_or_entity, name, None)) for name in (meta.PARENT_IDENTIFIER, meta.CURRENT_IDENTIFIER)]
+    dynamic = [(name, obj) for name, obj in dynamic if isinstance(obj, klass)]
+
+    if as_dict:
+        retval = dict(named)
+        retval.update(dynamic)
+        return retval
+    else:
+        retval = list(distinct)
+        for name, obj in dynamic:
+            if not any(obj is other for other in retval):
+                retval.append(obj)
+        return retval
+
+
+def _get_by_klass_from_attributes(class_or_entity, klass, as_dict=False):
+    attrs = dir(class_or_entity)
     if as_dict:
         retval = dict()
         # attrs = {attr: get_dict_attr(entity, attr) for attr in dir(entity)}
@@ -1,4 +1,5 @@
 from .simulator import Simulator
 from .interactivesimulator import InteractiveSimulator
 from .plansimulator import PlanSimulator
+from .batchsimulator import BatchSimulator
 from .epsilon import Epsilon, eps
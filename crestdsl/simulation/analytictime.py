@@ -0,0 +1,312 @@
+"""
+Closed-form transition times for guards that are affine in ``dt``.
+
+Most guards compare a port with a constant (``self.temp.value >= 100``), and most updates
+change the port linearly over time (``self.temp.pre + rate * dt``).
+For these, the earliest time when the guard is enabled can be calculated without an SMT solver:
+the constraints (created by the Z3Converter) are evaluated with exact rational arithmetic,
+every comparison becomes a lower or upper bound of ``dt``, and the smallest feasible ``dt`` is the answer.
+Strict bounds (``>``) produce an Epsilon value, just like the ``lower_values`` of z3.Optimize.
+The epsilon coefficient is ``1 / |slope|`` of the compared expression (e.g. ``1/4`` for ``temp > 100`` if temp rises by 4 per time unit).
+This is what Z3 reports for a port compared with a constant. For other strict comparisons,
+Z3's coefficient depends on its internal normal form and can differ (only the sign of the infinitesimal is meaningful).
+
+If/else branches are resolved when their condition does not depend on ``dt`` (e.g. if it only reads ``.pre`` values).
+Everything else (non-linear terms, disjunctions over ``dt``, integer variables, conditions that change over time)
+raises NotAffine, and the caller falls back to Z3.
+"""
+
+from fractions import Fraction
+
+import z3
+
+from .epsilon import Epsilon
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class NotAffine(Exception):
+    """Raised if the constraints cannot be solved analytically."""
+
+
+_FLIPPED = {
+    z3.Z3_OP_GE: z3.Z3_OP_LE,
+    z3.Z3_OP_GT: z3.Z3_OP_LT,
+    z3.Z3_OP_LE: z3.Z3_OP_GE,
+    z3.Z3_OP_LT: z3.Z3_OP_GT,
+}
+
+_NEGATED = {
+    z3.Z3_OP_GE: z3.Z3_OP_LT,
+    z3.Z3_OP_GT: z3.Z3_OP_LE,
+    z3.Z3_OP_LE: z3.Z3_OP_GT,
+    z3.Z3_OP_LT: z3.Z3_OP_GE,
+}
+
+_COMPARISONS = set(_FLIPPED) | {z3.Z3_OP_EQ}
+
+
+def _kind(expr):
+    return expr.decl().kind()
+
+
+def _is_variable(expr):
+    return z3.is_const(expr) and _kind(expr) == z3.Z3_OP_UNINTERPRETED
+
+
+def _flatten(constraints):
+    """Splits top-level conjunctions."""
+    todo = list(reversed(constraints))
+    while todo:
+        constraint = todo.pop()
+        if z3.is_and(constraint):
+            todo.extend(reversed(constraint.children()))
+        else:
+            yield constraint
+
+
+class AffineTransitionTime(object):
+    """
+    The constraints of a transition time query (see ConditionTimedChangeCalculator.get_transition_time),
+    prepared for analytic solving.
+    The pre values of the ports are passed to :func:`minimum_dt` for each query.
+    """
+
+    def __init__(self, constraints, dt):
+        """
+        Parameters
+        ----------
+        constraints: list of z3.BoolRef
+            The port relations, the modifier constraints, the guard and ``dt >= 0``.
+        dt: z3.ArithRef
+            The time variable (has to be real-valued).
+        """
+        if not z3.is_real(dt):
+            raise NotAffine("dt is not a real-valued variable")
+        self.dt = dt
+        self.constraints = list(_flatten(constraints))
+
+    def minimum_dt(self, pre_value_constraints):
+        """
+        Parameters
+        ----------
+        pre_value_constraints: list of z3.BoolRef
+            The ``port_0 == value`` constraints of the current state.
+
+        Returns
+        -------
+        Epsilon or None
+            The smallest dt that satisfies the constraints, or None if they are unsatisfiable.
+
+        Raises
+        ------
+        NotAffine
+            If the constraints are outside of what we can solve analytically.
+        """
+        return _Evaluation(self.dt).minimum(list(_flatten(pre_value_constraints)) + self.constraints)
+
+
+class _Evaluation(object):
+    """One query: the variable definitions and the bounds of dt."""
+
+    def __init__(self, dt):
+        self.dt = dt
+        self.definitions = {}  # ast id -> defining expression
+        self.values = {}  # ast id -> (constant, dt coefficient)
+        self.evaluating = set()
+        self.lower = None  # (value, epsilon coefficient)
+        self.upper = None
+        self.feasible = True
+
+    def minimum(self, constraints):
+        atoms = []
+        branches = []
+        for constraint in constraints:
+            self._add(constraint, atoms, branches)
+
+        # resolve the if/else branches whose condition is known
+        # (a condition can use variables that are defined in another branch, so we repeat until there is no progress)
+        while branches:
+            pending, branches = branches, []
+            for branch in pending:
+                condition, then_branch, else_branch = branch.children()
+                try:
+                    chosen = then_branch if self._truth(condition) else else_branch
+                except NotAffine:
+                    branches.append(branch)
+                    continue
+                for constraint in _flatten([chosen]):
+                    self._add(constraint, atoms, branches)
+            if len(branches) == len(pending) and all(a is b for a, b in zip(branches, pending)):
+                raise NotAffine("Cannot resolve the if/else conditions")
+
+        for atom in atoms:
+            self._bound(atom)
+            if not self.feasible:
+                return None
+
+        if self.lower is None:
+            raise NotAffine("dt has no lower bound")
+        if self.upper is not None:
+            (low, low_epsilon), (high, high_strict) = self.lower, self.upper
+            if low > high or (low == high and (low_epsilon > 0 or high_strict)):
+                return None
+        low, epsilon = self.lower
+        return Epsilon(float(low.numerator) / float(low.denominator), float(epsilon.numerator) / float(epsilon.denominator))
+
+    def _add(self, constraint, atoms, branches):
+        """Sorts a constraint into definitions, if/else branches and atoms (comparisons over dt)."""
+        if z3.is_eq(constraint):
+            left, right = constraint.children()
+            for variable, definition in [(left, right), (right, left)]:
+                if _is_variable(variable) and not variable.eq(self.dt) and variable.get_id() not in self.definitions:
+                    self.definitions[variable.get_id()] = definition
+                    return
+        if z3.is_app_of(constraint, z3.Z3_OP_ITE) and z3.is_bool(constraint):
+            branches.append(constraint)
+        else:
+            atoms.append(constraint)
+
+    def _bound(self, atom):
+        """Adds the dt bound of a comparison atom."""
+        op = _kind(atom)
+        if op == z3.Z3_OP_NOT and _kind(atom.arg(0)) in _NEGATED:
+            atom = atom.arg(0)
+            op = _NEGATED[_kind(atom)]
+        elif op not in _COMPARISONS:
+            if not self._truth(atom):
+                self.feasible = False
+            return
+
+        if z3.is_bool(atom.arg(0)):  # boolean equality
+            if self._truth(atom.arg(0)) != self._truth(atom.arg(1)):
+                self.feasible = False
+            return
+
+        left, right = self._affine(atom.arg(0)), self._affine(atom.arg(1))
+        # constant + coefficient * dt  op  0
+        constant, coefficient = left[0] - right[0], left[1] - right[1]
+        if coefficient == 0:
+            if not _compare(op, constant, 0):
+                self.feasible = False
+            return
+
+        point = -constant / coefficient
+        if op == z3.Z3_OP_EQ:
+            self._lower(point, Fraction(0))
+            self._upper(point, False)
+            return
+
+        if coefficient < 0:  # dividing by a negative number flips the comparison
+            op = _FLIPPED[op]
+        if op in (z3.Z3_OP_GE, z3.Z3_OP_GT):
+            self._lower(point, 1 / abs(coefficient) if op == z3.Z3_OP_GT else Fraction(0))
+        else:
+            self._upper(point, op == z3.Z3_OP_LT)
+
+    def _lower(self, value, epsilon):
+        if self.lower is None or (value, epsilon) > self.lower:
+            self.lower = (value, epsilon)
+
+    def _upper(self, value, strict):
+        if self.upper is None or value < self.upper[0] or (value == self.upper[0] and strict):
+            self.upper = (value, strict)
+
+    def _truth(self, expr):
+        """Evaluates a boolean expression that must not depend on dt."""
+        op = _kind(expr)
+        if op == z3.Z3_OP_TRUE:
+            return True
+        if op == z3.Z3_OP_FALSE:
+            return False
+        if op == z3.Z3_OP_AND:
+            return all(self._truth(child) for child in expr.children())
+        if op == z3.Z3_OP_OR:
+            return any(self._truth(child) for child in expr.children())
+        if op == z3.Z3_OP_NOT:
+            return not self._truth(expr.arg(0))
+        if op == z3.Z3_OP_UNINTERPRETED and z3.is_const(expr):
+            return self._truth(self._definition(expr))
+        if op in _COMPARISONS:
+            if z3.is_bool(expr.arg(0)):
+                return self._truth(expr.arg(0)) == self._truth(expr.arg(1))
+            left, right = self._affine(expr.arg(0)), self._affine(expr.arg(1))
+            if left[1] != right[1]:
+                raise NotAffine(f"The condition {expr} changes over time")
+            return _compare(op, left[0] - right[0], 0)
+        raise NotAffine(f"Unsupported boolean expression {expr}")
+
+    def _definition(self, variable):
+        definition = self.definitions.get(variable.get_id())
+        if definition is None:
+            raise NotAffine(f"The variable {variable} is not defined")
+        return definition
+
+    def _affine(self, expr):
+        """Evaluates an arithmetic expression to (constant, dt coefficient)."""
+        key = expr.get_id()
+        if key not in self.values:
+            if key in self.evaluating:
+                raise NotAffine(f"Cyclic definition of {expr}")
+            self.evaluating.add(key)
+            try:
+                self.values[key] = self._evaluate(expr)
+            finally:
+                self.evaluating.discard(key)
+        return self.values[key]
+
+    def _evaluate(self, expr):
+        if not z3.is_real(expr) and not z3.is_int_value(expr):  # integer constants appear in ToReal conversions
+            raise NotAffine(f"{expr} is not real-valued")
+
+        if z3.is_rational_value(expr):
+            return (Fraction(expr.numerator_as_long(), expr.denominator_as_long()), Fraction(0))
+        if z3.is_int_value(expr):
+            return (Fraction(expr.as_long()), Fraction(0))
+
+        op = _kind(expr)
+        if op == z3.Z3_OP_UNINTERPRETED and z3.is_const(expr):
+            if expr.eq(self.dt):
+                return (Fraction(0), Fraction(1))
+            return self._affine(self._definition(expr))
+
+        if op == z3.Z3_OP_TO_REAL:
+            return self._affine(expr.arg(0))
+        if op == z3.Z3_OP_ITE:
+            condition, then_value, else_value = expr.children()
+            return self._affine(then_value if self._truth(condition) else else_value)
+
+        children = [self._affine(child) for child in expr.children()]
+        if op == z3.Z3_OP_ADD:
+            return (sum(c[0] for c in children), sum(c[1] for c in children))
+        if op == z3.Z3_OP_SUB:
+            first, rest = children[0], children[1:]
+            return (first[0] - sum(c[0] for c in rest), first[1] - sum(c[1] for c in rest))
+        if op == z3.Z3_OP_UMINUS:
+            return (-children[0][0], -children[0][1])
+        if op == z3.Z3_OP_MUL:
+            constant, coefficient = Fraction(1), Fraction(0)
+            for value in children:
+                if coefficient != 0 and value[1] != 0:
+                    raise NotAffine(f"{expr} is not linear in dt")
+                constant, coefficient = constant * value[0], constant * value[1] + coefficient * value[0]
+            return (constant, coefficient)
+        if op == z3.Z3_OP_DIV:
+            dividend, divisor = children
+            if divisor[1] != 0 or divisor[0] == 0:
+                raise NotAffine(f"{expr} divides by a time-dependent value or zero")
+            return (dividend[0] / divisor[0], dividend[1] / divisor[0])
+        raise NotAffine(f"Unsupported expression {expr}")
+
+
+def _compare(op, left, right):
+    if op == z3.Z3_OP_GE:
+        return left >= right
+    if op == z3.Z3_OP_GT:
+        return left > right
+    if op == z3.Z3_OP_LE:
+        return left <= right
+    if op == z3.Z3_OP_LT:
+        return left < right
+    return left == right
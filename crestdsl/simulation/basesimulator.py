@@ -1,6 +1,6 @@
 from crestdsl.caching import Cache
 from crestdsl.config import config
-from .tracestore import TraceStore
+from .tracestore import create_tracestore
 from crestdsl.model import get_all_entities, get_all_ports, REAL, \
     get_influences, get_transitions, get_entities, get_updates, get_actions, \
     get_inputs, get_outputs, get_locals
@@ -9,6 +9,7 @@ from .transitiontime import TransitionTimeCalculator
 from .conditiontimedchangecalculator import ConditionTimedChangeCalculator
 from .fastconditiontimedchangecalculator import FastConditionTimedChangeCalculator
 from .contextconditiontimedchangecalculator import ContextConditionTimedChangeCalculator
+from .parallelconditiontimedchangecalculator import ParallelConditionTimedChangeCalculator
 from .to_z3 import evaluate_to_bool
 from crestdsl.config import to_python
 from .epsilon import Epsilon
@@ -24,7 +25,7 @@ class BaseSimulator(object):
     def __init__(self, system, timeunit=REAL, 
             plotter=config.default_plotter, default_to_integer_real=config.use_integer_and_real, 
             record_traces=config.record_traces, own_context=False,
-            max_step_size=math.inf):
+            max_step_size=math.inf, workers=None):
         """
         Create a new simulator object.
         In most cases you will only need ot declare the first ``system`` parameter.
@@ -41,9 +42,11 @@ class BaseSimulator(object):
             Modify the library that this simulator uses for drawing CREST diagrams.
         default_to_integer_real: bool
             Should the SMT solver use INTEGER and REAL theories when encountering int/float datatypes (unless otherwise specified)?
-        record_traces: bool
+        record_traces: bool or str or TraceStore
             You can deactivate the recording of trace data. 
             (Slightly more performance/memory friendly, although usually you wouldn't notice.)
+            Pass the name of a trace backend (e.g. ``"columnar"`` for long simulations)
+            or a TraceStore object to choose where the traces are recorded.
         own_context: bool
             DON'T USE THIS! 
             It's a preliminary switch that should enable parallel execution at some point in the future.
@@ -52,6 +55,10 @@ class BaseSimulator(object):
             You can use it to increase the amount of trace data.
             Can also be useful for non-linear systems. 
             (Although they aren't really supported by crestdsl anyway)
+        workers: int
+            Calculate the next behaviour change with this many worker processes
+            (see :class:`ParallelConditionTimedChangeCalculator`).
+            Only useful for systems with many entities.
         """
         self._system = system
                 
@@ -61,12 +68,14 @@ class BaseSimulator(object):
         
         self._global_time = 0
         self.default_to_integer_real = default_to_integer_real
-        self.traces = TraceStore()
-        self.record_traces = record_traces
+        self.traces = create_tracestore(record_traces)
+        self.record_traces = record_traces is not False
         
         # the latter one is a (tiny) bit slower, but operates in its own Z3 context !! (I hope we can parallelize things now)
         if own_context:
             self.conditionchangecalculator = ContextConditionTimedChangeCalculator(self.system, self.timeunit, use_integer_and_real=self.default_to_integer_real)
+        elif workers is not None and workers > 1:
+            self.conditionchangecalculator = ParallelConditionTimedChangeCalculator(self.system, self.timeunit, use_integer_and_real=self.default_to_integer_real, workers=workers)
         else:
             self.conditionchangecalculator = ConditionTimedChangeCalculator(self.system, self.timeunit, use_integer_and_real=self.default_to_integer_real)
 
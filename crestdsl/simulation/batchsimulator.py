@@ -0,0 +1,800 @@
+"""
+The BatchSimulator runs many copies of the same system at once,
+e.g. for parameter sweeps over initial values.
+
+Port values live in a 2-D array (one row per port, one column per instance),
+entity states in another one (one row per entity, holding state indices).
+The update, influence, guard and action functions are compiled into NumPy array expressions
+when the simulator is created (if/else becomes ``np.where``),
+so one step executes each modifier once for all instances::
+
+    sim = BatchSimulator(system, [{system.x: x} for x in range(1000)])
+    sim.stabilise()
+    sim.advance(10)
+    df = sim.to_dataframe()
+
+Functions that cannot be translated (e.g. because they call arbitrary Python code)
+are evaluated per instance on the system object instead.
+
+Like the :class:`~crestdsl.simulation.Simulator`, each instance's steps end when one of its transitions becomes enabled.
+The guards' comparisons are compiled too (as ``left - right``): if they change linearly during a step,
+the transition times are their roots. Otherwise the time is found by bisection.
+"""
+
+from crestdsl.model import Entity, Port, Influence, Update, Types, \
+    get_all_entities, get_all_ports, get_states, get_transitions, get_actions, get_updates, get_inputs
+from crestdsl.model.api import get_targets
+from crestdsl import sourcehelper as SH
+from . import dependencyOrder as DO
+from .tracesink import get_column_name
+
+import ast
+import copy
+import math
+import inspect
+import builtins
+from operator import attrgetter
+from functools import reduce
+
+import numpy as np
+import pandas as pd
+
+import logging
+logger = logging.getLogger(__name__)
+
+# the names that compiled kernels use for numpy, dt and the port rows
+NUMPY_NAME = "_crest_np"
+DT_NAME = "_crest_dt"
+
+NUMERIC_DOMAINS = (Types.INT, Types.INTEGER, Types.FLOAT, Types.REAL, Types.BOOL)
+
+# builtins that have an element-wise numpy counterpart
+BUILTIN_UFUNCS = {abs: "abs", min: "minimum", max: "maximum"}
+
+# the comparisons whose roots are candidates for the transition times
+ROOT_COMPARISONS = (ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.Eq, ast.NotEq)
+
+# a comparison is linear in a step if its middle value deviates less than this (relative to its start and end values)
+LINEARITY_TOLERANCE = 1e-9
+
+# the transitions are checked at a comparison's root and slightly after it, in case rounding hides them (relative to the root)
+ROOT_NUDGE = 1e-10
+
+# the maximum number of bisection steps for the transition times of other guards
+BISECTION_STEPS = 60
+
+
+class NotVectorizable(Exception):
+    """Raised if a function contains code that can't be translated into an array expression."""
+
+
+class Kernel(object):
+    """A modifier function that was compiled into a single NumPy array expression."""
+
+    def __init__(self, code, global_vars, ports):
+        self.code = code
+        self.globals = global_vars
+        self.ports = ports  # list of (name, row, is_pre)
+
+    def __call__(self, values, pre, dt=0):
+        local_vars = {name: (pre[row] if is_pre else values[row]) for (name, row, is_pre) in self.ports}
+        local_vars[DT_NAME] = dt
+        return eval(self.code, self.globals, local_vars)
+
+
+def _np_call(funcname, *args):
+    func = ast.Attribute(value=ast.Name(id=NUMPY_NAME, ctx=ast.Load()), attr=funcname, ctx=ast.Load())
+    return ast.Call(func=func, args=list(args), keywords=[])
+
+
+class KernelCompiler(ast.NodeTransformer):
+    """
+    Translates the AST of a modifier function into one array expression.
+    Local variables are inlined, port accesses (``self.port.value``/``.pre``)
+    become references to rows of the value arrays,
+    and the boolean operators and conditionals are replaced by their numpy equivalents.
+    """
+
+    def __init__(self, function, port_rows, params):
+        """
+        Parameters
+        ----------
+        function: function or lambda
+            The update, influence, guard or action function.
+        port_rows: dict
+            The {port: row} map of the value arrays.
+        params: list
+            What the function's parameters stand for, in order.
+            Either an Entity (``self``), a Port (the influence's source value) or ``DT_NAME``.
+        """
+        self.function = function
+        self.port_rows = port_rows
+        self.params = dict(zip(SH.get_param_names(function), params))
+        self.variables = dict()
+        self.ports = dict()
+
+        closure = inspect.getclosurevars(function)
+        self.global_vars = dict(function.__globals__)
+        self.global_vars.update(closure.nonlocals)
+        self.global_vars[NUMPY_NAME] = np
+
+    def compile(self):
+        body = SH.get_ast_body(self.function)
+        if isinstance(body, list):
+            expression = self.compile_statements(body, dict())
+        else:  # lambdas
+            expression = self.expression(body, dict())
+        return self.kernel(expression)
+
+    def compile_expression(self, node):
+        """Compile an expression of the function's body (e.g. a part of a guard)."""
+        return self.kernel(self.expression(node, dict()))
+
+    def kernel(self, expression):
+        tree = ast.fix_missing_locations(ast.Expression(body=expression))
+        code = compile(tree, f"<crest kernel {self.function.__name__}>", "eval")
+        ports = [(name, row, is_pre) for ((row, is_pre), name) in self.ports.items()]
+        return Kernel(code, self.global_vars, ports)
+
+    def compile_statements(self, statements, variables):
+        """Follows every path through the statements and merges the returned values with np.where."""
+        for idx, statement in enumerate(statements):
+            if isinstance(statement, ast.Return):
+                return self.expression(statement.value, variables)
+            elif isinstance(statement, ast.Assign) and len(statement.targets) == 1 and isinstance(statement.targets[0], ast.Name):
+                variables = dict(variables, **{statement.targets[0].id: self.expression(statement.value, variables)})
+            elif isinstance(statement, ast.AnnAssign) and statement.value is not None and isinstance(statement.target, ast.Name):
+                variables = dict(variables, **{statement.target.id: self.expression(statement.value, variables)})
+            elif isinstance(statement, ast.AugAssign) and isinstance(statement.target, ast.Name):
+                binop = ast.BinOp(left=ast.Name(id=statement.target.id, ctx=ast.Load()), op=statement.op, right=statement.value)
+                variables = dict(variables, **{statement.target.id: self.expression(binop, variables)})
+            elif isinstance(statement, ast.If):
+                # the statements after the if belong to both branches (like SH.RewriteIfElse)
+                following = statements[idx + 1:]
+                test = self.expression(statement.test, variables)
+                body = self.compile_statements(statement.body + following, variables)
+                orelse = self.compile_statements(statement.orelse + following, variables)
+                return _np_call("where", test, body, orelse)
+            elif isinstance(statement, (ast.Pass, ast.Expr)):  # docstrings, comments, ...
+                continue
+            else:
+                raise NotVectorizable(f"Cannot vectorize statement {type(statement).__name__} in {self.function.__name__}")
+        raise NotVectorizable(f"Not every path through {self.function.__name__} returns a value")
+
+    def expression(self, node, variables):
+        self.variables = variables
+        return self.visit(copy.deepcopy(node))  # the ASTs are cached by the sourcehelper, don't modify them
+
+    def port_reference(self, port, is_pre=False):
+        if port not in self.port_rows:
+            raise NotVectorizable(f"Port {port._name} is not part of the simulated system")
+        key = (self.port_rows[port], is_pre)
+        if key not in self.ports:
+            self.ports[key] = f"_crest_{'pre' if is_pre else 'value'}_{key[0]}"
+        return ast.Name(id=self.ports[key], ctx=ast.Load())
+
+    def visit_Name(self, node):
+        if node.id in self.variables:
+            return copy.deepcopy(self.variables[node.id])
+        if node.id in self.params:
+            param = self.params[node.id]
+            if isinstance(param, Port):
+                return self.port_reference(param)
+            if param == DT_NAME:
+                return ast.Name(id=DT_NAME, ctx=ast.Load())
+            raise NotVectorizable(f"Cannot vectorize direct access to the entity in {self.function.__name__}")
+        return node
+
+    def visit_Attribute(self, node):
+        path = []
+        base = node
+        while isinstance(base, ast.Attribute):
+            path.insert(0, base.attr)
+            base = base.value
+
+        if not isinstance(base, ast.Name) or not isinstance(self.params.get(base.id), Entity):
+            return self.generic_visit(node)  # e.g. math.pi
+
+        if len(path) < 2 or path[-1] not in ("value", "pre"):
+            raise NotVectorizable(f"Cannot vectorize attribute access {SH.get_attribute_string(node)} in {self.function.__name__}")
+        try:
+            port = attrgetter(".".join(path[:-1]))(self.params[base.id])
+        except AttributeError:
+            raise NotVectorizable(f"Cannot resolve {SH.get_attribute_string(node)} in {self.function.__name__}")
+        if not isinstance(port, Port):
+            raise NotVectorizable(f"{SH.get_attribute_string(node)} in {self.function.__name__} is not a port value")
+        return self.port_reference(port, is_pre=(path[-1] == "pre"))
+
+    def visit_BoolOp(self, node):
+        funcname = "logical_and" if isinstance(node.op, ast.And) else "logical_or"
+        values = [self.visit(value) for value in node.values]
+        return reduce(lambda left, right: _np_call(funcname, left, right), values)
+
+    def visit_UnaryOp(self, node):
+        node = self.generic_visit(node)
+        if isinstance(node.op, ast.Not):
+            return _np_call("logical_not", node.operand)
+        return node
+
+    def visit_Compare(self, node):
+        node = self.generic_visit(node)
+        if len(node.ops) == 1:
+            return node
+        # a < b < c  -->  (a < b) & (b < c)
+        operands = [node.left] + node.comparators
+        comparisons = [ast.Compare(left=copy.deepcopy(operands[i]), ops=[op], comparators=[copy.deepcopy(operands[i + 1])])
+                       for i, op in enumerate(node.ops)]
+        return reduce(lambda left, right: _np_call("logical_and", left, right), comparisons)
+
+    def visit_IfExp(self, node):
+        node = self.generic_visit(node)
+        return _np_call("where", node.test, node.body, node.orelse)
+
+    def visit_Call(self, node):
+        if node.keywords:
+            raise NotVectorizable(f"Cannot vectorize calls with keyword arguments in {self.function.__name__}")
+        func = self._resolve(node.func)
+        args = [self.visit(arg) for arg in node.args]
+
+        if func in BUILTIN_UFUNCS:
+            funcname = BUILTIN_UFUNCS[func]
+            if funcname == "abs":
+                return _np_call(funcname, *args)
+            if len(args) < 2:  # min/max of an iterable
+                raise NotVectorizable(f"Cannot vectorize {func.__name__} with a single argument in {self.function.__name__}")
+            return reduce(lambda left, right: _np_call(funcname, left, right), args)
+        if getattr(math, getattr(func, "__name__", ""), None) is func and hasattr(np, func.__name__):
+            return _np_call(func.__name__, *args)
+        if isinstance(func, np.ufunc) or getattr(func, "__module__", "").startswith("numpy"):
+            node.args = args
+            return node
+        raise NotVectorizable(f"Cannot vectorize call of {getattr(func, '__name__', func)} in {self.function.__name__}")
+
+    def _resolve(self, node):
+        """Find the object that a (dotted) function name refers to."""
+        if isinstance(node, ast.Name):
+            if node.id in self.global_vars:
+                return self.global_vars[node.id]
+            if hasattr(builtins, node.id):
+                return getattr(builtins, node.id)
+        elif isinstance(node, ast.Attribute):
+            try:
+                return getattr(self._resolve(node.value), node.attr)
+            except AttributeError:
+                pass
+        raise NotVectorizable(f"Cannot resolve called function in {self.function.__name__}")
+
+
+def compile_kernel(function, port_rows, params):
+    """
+    Compile a modifier function into a :class:`Kernel`.
+
+    Parameters
+    ----------
+    function: function or lambda
+        The update, influence, guard or action function.
+    port_rows: dict
+        The {port: row} map of the value arrays.
+    params: list
+        What the function's parameters stand for (see :class:`KernelCompiler`).
+
+    Returns
+    -------
+    Kernel
+        The compiled function.
+
+    Raises
+    ------
+    NotVectorizable
+        If the function can't be translated.
+    """
+    try:
+        return KernelCompiler(function, port_rows, params).compile()
+    except NotVectorizable:
+        raise
+    except Exception as exc:  # e.g. no source code available
+        raise NotVectorizable(f"Cannot compile {getattr(function, '__name__', function)}: {exc}") from exc
+
+
+def compile_guard_comparisons(guard, port_rows, entity):
+    """
+    Compile the comparisons of a guard into kernels of ``left - right``.
+    The guard can only change its value when one of them changes its sign.
+
+    Parameters
+    ----------
+    guard: function or lambda
+        The transition's guard.
+    port_rows: dict
+        The {port: row} map of the value arrays.
+    entity: Entity
+        The transition's entity (the guard's ``self``).
+
+    Returns
+    -------
+    list of Kernel
+        One kernel per comparison (chained comparisons are split).
+
+    Raises
+    ------
+    NotVectorizable
+        If the guard reads port values outside of comparisons (e.g. a boolean port) or uses other comparisons.
+    """
+    body = SH.get_ast_body(guard)
+    if isinstance(body, list):
+        if len(body) != 1 or not isinstance(body[0], ast.Return):
+            raise NotVectorizable(f"Cannot find the comparisons of guard {guard.__name__}, it is not a single expression")
+        body = body[0].value
+    self_name = SH.get_param_names(guard)[0]
+
+    differences = []
+    todo = [body]
+    while todo:
+        node = todo.pop(0)
+        if isinstance(node, ast.Compare):
+            if not all(isinstance(op, ROOT_COMPARISONS) for op in node.ops):
+                raise NotVectorizable(f"Cannot find the roots of {type(node.ops[0]).__name__} comparisons in guard {guard.__name__}")
+            operands = [node.left] + node.comparators
+            differences.extend(ast.BinOp(left=operands[i], op=ast.Sub(), right=operands[i + 1]) for i in range(len(node.ops)))
+        elif isinstance(node, ast.Name) and node.id == self_name:
+            raise NotVectorizable(f"Guard {guard.__name__} reads port values outside of comparisons")
+        else:
+            todo.extend(ast.iter_child_nodes(node))
+
+    try:
+        return [KernelCompiler(guard, port_rows, [entity]).compile_expression(difference) for difference in differences]
+    except NotVectorizable:
+        raise
+    except Exception as exc:
+        raise NotVectorizable(f"Cannot compile the comparisons of guard {guard.__name__}: {exc}") from exc
+
+
+class BatchSimulator(object):
+    """
+    Simulates N instances of a system at once.
+
+    Each step executes the updates and influences of all instances (in dependency order, per active state)
+    and afterwards fires the enabled transitions (and the following epsilon transitions).
+    Like in the :class:`Simulator`, an instance's step ends when one of its transitions becomes enabled,
+    so the instances advance by different amounts of time until they meet at the end of :func:`advance`.
+    The transition times are exact if the guards' comparisons change linearly during a step (up to rounding).
+    For other guards, they are found by bisection, which can miss a guard that is only enabled within a step
+    (set a ``max_step_size`` to check these guards more often).
+    Non-determinism is resolved randomly for each instance.
+
+    .. automethod:: __init__
+    """
+
+    def __init__(self, system, initial_values=None, instances=None, max_step_size=math.inf, seed=None):
+        """
+        Parameters
+        ----------
+        system: Entity
+            The system whose instances should be simulated.
+            Its current port values and states are the defaults for all instances.
+        initial_values: list of dict or dict
+            Either one {port: value, entity: state} dict per instance,
+            or one dict that maps ports/entities to a sequence of N values (or a single value for all instances).
+        instances: int
+            The number of instances, if it isn't defined by the initial values.
+        max_step_size: numeric value
+            Advances are split into steps of at most this size (in addition to the steps that end at transitions).
+        seed: int
+            Seed for the random resolution of non-determinism.
+        """
+        self._system = system
+        self.max_step_size = max_step_size
+        self.global_time = 0
+        self.random = np.random.default_rng(seed)
+
+        self.ports = get_all_ports(system)
+        self.entities = get_all_entities(system)
+        self.port_rows = {port: row for row, port in enumerate(self.ports)}
+        self.entity_rows = {entity: row for row, entity in enumerate(self.entities)}
+        self.state_lists = [get_states(entity) for entity in self.entities]
+        self.state_codes = [{state: code for code, state in enumerate(states)} for states in self.state_lists]
+
+        if isinstance(initial_values, dict):
+            lengths = {len(vals) for vals in initial_values.values() if isinstance(vals, (list, tuple, np.ndarray))}
+            assert len(lengths) <= 1, "All initial value sequences need the same length"
+            instances = instances if instances is not None else (lengths.pop() if lengths else 1)
+        elif initial_values is not None:
+            initial_values = list(initial_values)
+            instances = len(initial_values)
+        assert instances is not None and instances >= 1, "Define the initial values or the number of instances"
+        self.instances = instances
+
+        numeric = all(self._domain(port) in NUMERIC_DOMAINS for port in self.ports)
+        self.values = np.empty((len(self.ports), instances), dtype=float if numeric else object)
+        self.states = np.zeros((len(self.entities), instances), dtype=np.int32)
+        for row, port in enumerate(self.ports):
+            self.values[row, :] = port.value
+        for row, entity in enumerate(self.entities):
+            if self.state_lists[row]:
+                self.states[row, :] = self.state_codes[row][entity.current]
+
+        if isinstance(initial_values, dict):
+            self._set(initial_values, slice(None))
+        elif initial_values is not None:
+            for instance, values in enumerate(initial_values):
+                self._set(values, instance)
+        self.pre = self.values.copy()
+
+        self.python_fallbacks = []
+        self._kernels = dict()
+        self._schedules = dict()
+        self._transitions = dict()
+        self._comparisons = dict()  # transition -> kernels of its guard's comparisons, None if it has to be bisected
+        for entity in self.entities:
+            self._prepare(entity)
+
+    @property
+    def system(self):
+        """The system whose instances are simulated."""
+        return self._system
+
+    """ - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - """
+    """ preparation """
+
+    def _domain(self, port):
+        domain = getattr(port.resource, "domain", None)
+        return domain if isinstance(domain, Types) else None
+
+    def _set(self, value_map, instances):
+        for obj, value in value_map.items():
+            if isinstance(obj, Port):
+                self.values[self.port_rows[obj], instances] = value
+            elif isinstance(obj, Entity):
+                row = self.entity_rows[obj]
+                codes = [self.state_codes[row][state] for state in np.atleast_1d(np.asarray(value, dtype=object))]
+                self.states[row, instances] = codes if len(codes) > 1 else codes[0]
+            else:
+                raise ValueError(f"Cannot set the value of {obj}. Use ports and entities as keys.")
+
+    def _prepare(self, entity):
+        """Compile the entity's modifiers and order them for each of its states."""
+        row = self.entity_rows[entity]
+        states = self.state_lists[row]
+        if states:
+            current = entity.current
+            for code, state in enumerate(states):
+                entity.current = state
+                self._schedules[(entity, code)] = DO.get_entity_modifiers_in_dependency_order(entity)
+            entity.current = current
+        else:
+            self._schedules[(entity, None)] = DO.get_entity_modifiers_in_dependency_order(entity)
+
+        for modifier in {mod for key, mods in self._schedules.items() if key[0] is entity for mod in mods}:
+            if isinstance(modifier, Influence):
+                self._compile(modifier, modifier.function or (lambda value: value), [modifier.source])
+            elif isinstance(modifier, Update):
+                self._compile(modifier, modifier.function, [entity, DT_NAME])
+
+        for code, state in enumerate(states):
+            self._transitions[(entity, code)] = []
+        for transition in get_transitions(entity):
+            actions = [a for a in get_actions(entity) if a.transition is transition] + \
+                      [up for up in get_updates(entity) if up.state is transition]
+            self._compile(transition, transition.guard, [entity])
+            self._compile_comparisons(transition, entity)
+            for action in actions:
+                self._compile(action, action.function, [entity, DT_NAME])
+            target = self.state_codes[row][transition.target]
+            self._transitions[(entity, self.state_codes[row][transition.source])].append((transition, target, actions))
+
+    def _compile(self, modifier, function, params):
+        if modifier in self._kernels:
+            return
+        try:
+            self._kernels[modifier] = compile_kernel(function, self.port_rows, params)
+        except NotVectorizable as exc:
+            logger.info(f"{exc}. {modifier._name} will be evaluated for each instance.")
+            self._kernels[modifier] = None
+            self.python_fallbacks.append(modifier)
+
+    def _compile_comparisons(self, transition, entity):
+        self._comparisons[transition] = None
+        if self._kernels[transition] is None or self.values.dtype == object:
+            return
+        try:
+            self._comparisons[transition] = compile_guard_comparisons(transition.guard, self.port_rows, entity)
+        except NotVectorizable as exc:
+            logger.info(f"{exc}. The transition time of {transition._name} will be found by bisection.")
+
+    """ - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - """
+    """ evaluation """
+
+    def _evaluate(self, modifier, mask, dt=0):
+        """Returns the modifier's function value for all instances (as array or scalar)."""
+        kernel = self._kernels[modifier]
+        if kernel is not None:
+            with np.errstate(all="ignore"):  # instances outside the mask might e.g. divide by zero
+                return kernel(self.values, self.pre, dt)
+        return self._evaluate_python(modifier, mask, dt)
+
+    def _evaluate_python(self, modifier, mask, dt):
+        """Loads each instance's values into the system and calls the original function."""
+        results = np.zeros(self.instances, dtype=self.values.dtype)
+        backup = [(port, port.value, getattr(port, "pre", None)) for port in self.ports]
+        backup_states = [(entity, entity.current) for entity, states in zip(self.entities, self.state_lists) if states]
+        try:
+            for instance in np.flatnonzero(mask):
+                self._load_instance(instance)
+                if isinstance(modifier, Influence):
+                    results[instance] = modifier.get_function_value()
+                elif isinstance(modifier, Update):
+                    results[instance] = modifier.function(modifier._parent, dt[instance] if np.ndim(dt) > 0 else dt)
+                elif hasattr(modifier, "guard"):
+                    results[instance] = modifier.guard(modifier._parent)
+                else:
+                    results[instance] = modifier.function(modifier._parent)
+        finally:
+            for port, value, pre in backup:
+                port.value = value
+                port.pre = pre
+            for entity, current in backup_states:
+                entity.current = current
+        return results
+
+    def _load_instance(self, instance):
+        for row, port in enumerate(self.ports):
+            port.value = self._to_port_value(port, self.values[row, instance])
+            port.pre = self._to_port_value(port, self.pre[row, instance])
+        for row, entity in enumerate(self.entities):
+            if self.state_lists[row]:
+                entity.current = self.state_lists[row][self.states[row, instance]]
+
+    def _to_port_value(self, port, value):
+        domain = self._domain(port)
+        if domain in (Types.INT, Types.INTEGER):
+            return int(value)
+        if domain in (Types.FLOAT, Types.REAL):
+            return float(value)
+        if domain is Types.BOOL:
+            return bool(value)
+        return value
+
+    def _apply(self, modifier, target, mask, dt=0):
+        value = self._evaluate(modifier, mask, dt)
+        np.copyto(self.values[self.port_rows[target]], value, where=mask, casting="unsafe")
+
+    """ - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - """
+    """ simulation """
+
+    def stabilise(self):
+        """Propagate the values and fire the enabled transitions in all instances, without advancing time."""
+        return self._advance_and_stabilise_system(0)
+
+    def stabilize(self):
+        """US spelling of :func:`stabilise`."""
+        return self.stabilise()
+
+    def set_values(self, port_value_map):
+        """
+        Modify port values (e.g. inputs) and stabilise.
+
+        Parameters
+        ----------
+        port_value_map: dict
+            Maps ports to a sequence of N values or a single value for all instances.
+        """
+        self._set(port_value_map, slice(None))
+        self.stabilise()
+
+    def advance(self, time_to_advance):
+        """
+        Advance all instances by a certain amount of time.
+        Each instance's steps end when one of its transitions becomes enabled,
+        and they are no larger than ``max_step_size``.
+
+        Parameters
+        ----------
+        time_to_advance: numeric
+            The time advance that should be simulated
+        """
+        if time_to_advance <= 0:
+            logger.warning("Advancing 0 is not allowed. Use stabilise() instead.")
+            return
+
+        remaining = np.full(self.instances, float(time_to_advance))
+        active = remaining > 0
+        while active.any():
+            dt = self._next_step(np.minimum(remaining, self.max_step_size), active)
+            self._advance_and_stabilise_system(dt, active)
+            remaining = np.where(active, remaining - dt, 0)
+            active = remaining > 0
+        self.global_time += time_to_advance
+
+    def _advance_and_stabilise_system(self, dt, mask=None, transitions=True):
+        mask = mask if mask is not None else np.ones(self.instances, dtype=bool)
+        for inp in get_inputs(self.system):
+            row = self.port_rows[inp]
+            np.copyto(self.pre[row], self.values[row], where=mask)
+        self._advance_and_stabilise(self.system, dt, mask, transitions)
+        return True
+
+    def _advance_and_stabilise(self, entity, dt, mask, transitions=True):
+        row = self.entity_rows[entity]
+        target_rows = [self.port_rows[port] for port in get_targets(entity)]
+        self._set_pre(target_rows, mask)
+
+        if self.state_lists[row]:
+            groups = [(code, mask & (self.states[row] == code)) for code in range(len(self.state_lists[row]))]
+        else:
+            groups = [(None, mask)]
+
+        for code, group in groups:
+            if not group.any():
+                continue
+            for mod in self._schedules[(entity, code)]:
+                if isinstance(mod, Entity):
+                    self._advance_and_stabilise(mod, dt, group, transitions)
+                else:
+                    self._apply(mod, mod.target, group, dt)
+
+        # set pre again, for the actions that are triggered after the transitions
+        self._set_pre(target_rows, mask)
+
+        if not transitions:
+            return
+        fired = self._transition(entity, mask)
+        if fired.any():
+            self._advance_and_stabilise(entity, 0, fired)
+
+    def _set_pre(self, rows, mask):
+        for row in rows:
+            np.copyto(self.pre[row], self.values[row], where=mask)
+
+    def _transition(self, entity, mask):
+        """Fires one enabled transition in each instance (if there is one). Returns the instances that fired."""
+        row = self.entity_rows[entity]
+        fired = np.zeros(self.instances, dtype=bool)
+        for code in range(len(self.state_lists[row])):
+            group = mask & (self.states[row] == code)
+            transitions = self._transitions[(entity, code)]
+            if not transitions or not group.any():
+                continue
+
+            enabled = np.array([np.broadcast_to(self._evaluate(t, group), (self.instances,)).astype(bool) & group
+                                for (t, target, actions) in transitions])
+            # choose one of the enabled transitions per instance, randomly
+            count = enabled.sum(axis=0)
+            choice = np.floor(self.random.random(self.instances) * count)
+            chosen = enabled & (enabled.cumsum(axis=0) - 1 == choice)
+
+            for (transition, target, actions), selected in zip(transitions, chosen):
+                if not selected.any():
+                    continue
+                self.states[row, selected] = target
+                for action in actions:
+                    self._apply(action, action.target, selected)
+                fired |= selected
+        return fired
+
+    """ - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - """
+    """ transition times """
+
+    def _next_step(self, step, active):
+        """
+        The step size of each active instance: ``step``, or the earlier time when one of its transitions becomes enabled.
+
+        The candidates are the roots of the guards' comparisons (where they change linearly during the step),
+        they are checked in order (each root also slightly after it, in case of rounding errors),
+        so guards that are only enabled within the step are found too.
+        For the other instances, the time is found by bisection if a transition is enabled at the end of the step.
+        """
+        dt = np.where(active, step, 0.)
+        guards = self._active_guards(active)
+        if len(guards) == 0:
+            return dt
+
+        # the comparisons' values at the start, middle and end of the step
+        samples = [self._probe(fraction * step, active, self._comparison_values, guards) for fraction in (0, 0.5, 1)]
+        covered = np.zeros(self.instances, dtype=bool)
+        linear = active.copy()
+        roots = []
+        for index, (transition, group) in enumerate(guards):
+            covered |= group
+            if self._comparisons[transition] is None:
+                linear &= ~group
+                continue
+            for start, middle, end in zip(*(sample[index] for sample in samples)):
+                linear &= ~group | (np.abs(middle - (start + end) / 2) <= LINEARITY_TOLERANCE * (np.abs(start) + np.abs(end) + 1))
+                with np.errstate(all="ignore"):
+                    root = start / (start - end) * step
+                    valid = group & (start != end) & (root > 0) & (root <= step)
+                roots.append(np.where(valid, root, np.inf))
+                roots.append(np.where(valid, np.minimum(root + ROOT_NUDGE * np.maximum(1, root), step), np.inf))
+
+        pending = covered & linear
+        for candidate in np.sort(np.array(roots + [step]), axis=0):
+            check = pending & np.isfinite(candidate)
+            if check.any():
+                enabled = self._probe(candidate, check, self._enabled, guards)
+                dt = np.where(enabled, candidate, dt)
+                pending &= ~enabled
+            if not pending.any():
+                break
+
+        bisect = covered & ~linear
+        if bisect.any():
+            bisect &= self._probe(step, bisect, self._enabled, guards)
+            low, high = np.zeros(self.instances), step.copy()
+            for _ in range(BISECTION_STEPS):
+                if not bisect.any() or np.max((high - low)[bisect]) <= ROOT_NUDGE * np.max(high[bisect]):
+                    break
+                middle = (low + high) / 2
+                enabled = self._probe(middle, bisect, self._enabled, guards)
+                high = np.where(bisect & enabled, middle, high)
+                low = np.where(bisect & ~enabled, middle, low)
+            dt = np.where(bisect, high, dt)
+        return dt
+
+    def _active_guards(self, mask):
+        """The (transition, instances) pairs of the transitions that leave the instances' current states."""
+        guards = []
+        for (entity, code), transitions in self._transitions.items():
+            group = mask & (self.states[self.entity_rows[entity]] == code)
+            if group.any():
+                guards.extend((transition, group) for (transition, target, actions) in transitions)
+        return guards
+
+    def _probe(self, dt, mask, evaluate, guards):
+        """Advances the instances in mask by dt (without transitions), evaluates and restores the values."""
+        values, pre = self.values.copy(), self.pre.copy()
+        try:
+            self._advance_and_stabilise_system(dt, mask, transitions=False)
+            return evaluate(guards, mask)
+        finally:
+            self.values, self.pre = values, pre
+
+    def _comparison_values(self, guards, mask):
+        results = []
+        for transition, group in guards:
+            kernels = self._comparisons[transition] or []
+            with np.errstate(all="ignore"):
+                results.append([np.broadcast_to(kernel(self.values, self.pre), (self.instances,)).astype(float)
+                                for kernel in kernels])
+        return results
+
+    def _enabled(self, guards, mask):
+        enabled = np.zeros(self.instances, dtype=bool)
+        for transition, group in guards:
+            group = group & mask
+            if group.any():
+                enabled |= np.broadcast_to(self._evaluate(transition, group), (self.instances,)).astype(bool) & group
+        return enabled
+
+    """ - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - """
+    """ results """
+
+    def get_values(self, port):
+        """The port's values in all instances."""
+        values = self.values[self.port_rows[port]]
+        domain = self._domain(port)
+        if domain in (Types.INT, Types.INTEGER):
+            return values.astype(np.int64)
+        if domain is Types.BOOL:
+            return values.astype(bool)
+        return values.copy()
+
+    def get_states(self, entity):
+        """The entity's current state in all instances."""
+        row = self.entity_rows[entity]
+        return np.array(self.state_lists[row], dtype=object)[self.states[row]]
+
+    def to_dataframe(self):
+        """
+        Returns
+        -------
+        pandas.DataFrame
+            One row per instance, with the port values and the state names (``<path>.current``) as columns.
+        """
+        data = dict()
+        for row, entity in enumerate(self.entities):
+            if self.state_lists[row]:
+                names = np.array([state._name for state in self.state_lists[row]], dtype=object)
+                data[get_column_name(self.system, entity)] = names[self.states[row]]
+        for port in self.ports:
+            data[get_column_name(self.system, port)] = self.get_values(port)
+        return pd.DataFrame(data)
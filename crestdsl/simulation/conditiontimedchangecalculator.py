@@ -1,11 +1,15 @@
-from crestdsl.model import Influence, get_updates, get_influences, get_transitions
+from crestdsl.config import config
+from crestdsl.model import Types, Influence, get_updates, get_influences, get_transitions, get_all_entities
 import crestdsl.model.api as api
 from crestdsl import sourcehelper as SH
 import ast
 from .to_z3 import Z3Converter, get_z3_variable, get_minimum_dt_of_several
-from .z3conditionchangecalculator import Z3ConditionChangeCalculator, get_behaviour_change_dt_from_constraintset
+from .z3conditionchangecalculator import Z3ConditionChangeCalculator, ConstraintSet, get_behaviour_change_dt_from_constraintset
 from .z3calculator import Z3Calculator, uses_dt_variable
+from .constraintcache import get_constraint_cache, constraint_key, BEHAVIOUR_CHANGE
+from .analytictime import AffineTransitionTime, NotAffine
 import z3
+from collections import OrderedDict
 from crestdsl.config import to_python
 from .epsilon import Epsilon, eps_string
 
@@ -21,8 +25,64 @@ def log_if_level(level, message):
         logger.log(level, message)
 
 
+class IncrementalQuery(object):
+    """
+    A solver that holds all constraints of a transition time / condition change query
+    except for the current (pre) values of the ports.
+    The pre values are added in a push/pop scope for each query.
+    """
+
+    def __init__(self, solver, modifier_map, z3_vars, objective=None, analytic=None):
+        self.solver = solver
+        self.modifier_map = modifier_map
+        self.z3_vars = z3_vars
+        self.objective = objective
+        self.analytic = analytic  # AffineTransitionTime, if the constraints can be solved without Z3
+
+
 class ConditionTimedChangeCalculator(Z3Calculator):
 
+    def __init__(self, system, timeunit=Types.REAL, use_integer_and_real=config.use_integer_and_real,
+                 incremental=None, max_queries=None):
+        """
+        Parameters
+        ----------
+        incremental: bool
+            Keep the solvers of the queries (per transition/modifier and combination of current states)
+            and only exchange the pre values of the ports on repeated calls.
+            (default: ``config.incremental_solving``)
+        max_queries: int
+            The maximum number of solvers that are kept (the least recently used ones are dropped).
+            (default: ``config.incremental_solving_max_queries``)
+        """
+        super().__init__(system, timeunit, use_integer_and_real)
+        self.incremental = config.incremental_solving if incremental is None else incremental
+        self.max_queries = config.incremental_solving_max_queries if max_queries is None else max_queries
+        self._queries = OrderedDict()
+        self.statistics = dict(analytic=0, solver=0)  # how many transition time queries were answered by which method
+
+    def _get_query(self, obj, build):
+        """Returns the IncrementalQuery for a transition/modifier (or None if it doesn't depend on time)."""
+        if not self.incremental:
+            return build(obj)
+
+        # the modifier map depends on the active updates, i.e. the current states
+        key = (obj, tuple(getattr(entity, "current", None) for entity in get_all_entities(self.entity)))
+        if key in self._queries:
+            self._queries.move_to_end(key)
+            return self._queries[key]
+
+        query = build(obj)
+        self._queries[key] = query
+        if len(self._queries) > self.max_queries:
+            _, dropped = self._queries.popitem(last=False)
+            self._drop_query(dropped)
+        return query
+
+    def _drop_query(self, query):
+        """Called when a query is removed from the cache."""
+        pass
+
     def get_next_behaviour_change_time(self, entity=None, excludes=None):
         """calculates the time until one of the  behaviours changes (transition fire or if/else change in update/influence)"""
         if not entity:
@@ -56,7 +116,8 @@ class ConditionTimedChangeCalculator(Z3Calculator):
             # this happens if there are no transitions fireable by increasing time only
             return None
 
-    def calculate_entity_hook(self, entity):
+    def get_entity_behaviour_changes(self, entity):
+        """The change times of the entity's active transitions and conditional updates/influences (unsorted)."""
         all_dts = []
         logger.debug(f"Calculating behaviour change for entity {entity._name} ({entity.__class__.__name__})")
         for influence in get_influences(entity):
@@ -79,6 +140,10 @@ class ConditionTimedChangeCalculator(Z3Calculator):
                 trans_dts = self.get_transition_time(trans)
                 if trans_dts is not None:
                     all_dts.append(trans_dts)
+        return all_dts
+
+    def calculate_entity_hook(self, entity):
+        all_dts = self.get_entity_behaviour_changes(entity)
 
         if logger.getEffectiveLevel() <= logging.DEBUG:
             if len(all_dts) == 0:
@@ -112,6 +177,29 @@ class ConditionTimedChangeCalculator(Z3Calculator):
     def get_condition_change_enablers(self, influence_update):
         """ Calculates if an if/else condition within the function can change its value """
         logger.debug(f"Calculating condition change time in '{influence_update._name}' in entity '{influence_update._parent._name}' ({influence_update._parent.__class__.__name__})")
+        query = self._get_query(influence_update, self._build_condition_change_query)
+        if query is None:
+            return None  # nobody uses dt, no point in trying to find out when things will change...
+
+        pre_value_constraints = self.get_pre_value_constraints(query.modifier_map, query.z3_vars)
+        return self._solve_condition_change_query(influence_update, query, pre_value_constraints)
+
+    def _solve_condition_change_query(self, influence_update, query, pre_value_constraints):
+        solver = query.solver
+        solver.push()  # the pre values only hold for this query
+        solver.add(pre_value_constraints)
+        constraints = influence_update._cached_z3_behaviour_change_constraints
+        min_dt, label = get_behaviour_change_dt_from_constraintset(solver, constraints, query.z3_vars['dt'])
+        solver.pop()
+
+        if min_dt is not None:
+            logger.info(f"Minimum condition change times in '{influence_update._name}' in entity '{influence_update._parent._name}' ({influence_update._parent.__class__.__name__}) is {min_dt} (at label {label})")
+            return (to_python(min_dt), influence_update, label)
+        else:
+            return None
+
+    def _build_condition_change_query(self, influence_update):
+        """Creates a solver with all constraints of an if/else condition analysis, except for the pre values."""
         solver = z3.Optimize()
 
         # build a mapping that shows the propagation of information to the influence/update source (what influences the guard)
@@ -122,7 +210,7 @@ class ConditionTimedChangeCalculator(Z3Calculator):
             read_ports.append(influence_update.target)
             modifier_map = self.get_modifier_map(read_ports)
 
-        z3var_constraints, z3_vars = self.get_z3_vars(modifier_map)
+        z3var_constraints, z3_vars = self.get_z3_vars(modifier_map, pre_values=False)
         solver.add(z3var_constraints)
         # NOTE: we do not add a "dt >= 0" or "dt == 0" constraint here, because it would break the solving
 
@@ -135,8 +223,7 @@ class ConditionTimedChangeCalculator(Z3Calculator):
 
         influence_update_uses_dt = uses_dt_variable(influence_update)
         if not influence_update_uses_dt and not any_modifier_uses_dt:
-            return None  # nobody uses dt, no point in trying to find out when things will change...
-
+            return None
 
         # create the constraints for updates and influences
         for port, modifiers in modifier_map.items():
@@ -145,8 +232,6 @@ class ConditionTimedChangeCalculator(Z3Calculator):
                     constraints = self._get_constraints_from_modifier(modifier, z3_vars)
                     solver.add(constraints)
 
-        # solver.push()  # backup
-
         # if it's an influence, we need to add the source param equation
         if isinstance(influence_update, Influence):
             z3_src = z3_vars[influence_update.source][influence_update.source._name]
@@ -161,19 +246,35 @@ class ConditionTimedChangeCalculator(Z3Calculator):
             log_if_level(logging.DEBUG, f"influence entry constraint: {z3_src} == {z3_param}")
             solver.add(z3_src == z3_param)
 
-        # solver.push()
-
         if not hasattr(influence_update, "_cached_z3_behaviour_change_constraints"):
-            conv = Z3ConditionChangeCalculator(z3_vars, entity=influence_update._parent, container=influence_update, use_integer_and_real=self.use_integer_and_real)
-            influence_update._cached_z3_behaviour_change_constraints = conv.calculate_constraints(influence_update.function)
-
-        constraints = influence_update._cached_z3_behaviour_change_constraints
-        min_dt, label = get_behaviour_change_dt_from_constraintset(solver, constraints, z3_vars['dt'])
-        if min_dt is not None:
-            logger.info(f"Minimum condition change times in '{influence_update._name}' in entity '{influence_update._parent._name}' ({influence_update._parent.__class__.__name__}) is {min_dt} (at label {label})")
-            return (to_python(min_dt), influence_update, label)
-        else:
-            return None
+            influence_update._cached_z3_behaviour_change_constraints = self._get_behaviour_change_constraints(influence_update, z3_vars)
+
+        return IncrementalQuery(solver, modifier_map, z3_vars)
+
+    def _get_behaviour_change_constraints(self, influence_update, z3_vars):
+        """Creates the ConstraintSets of the if/else conditions (or loads them from the persistent cache)"""
+        persistent_cache = get_constraint_cache()
+        if persistent_cache is not None:
+            key = constraint_key(influence_update, BEHAVIOUR_CHANGE, self.use_integer_and_real, z3_vars['dt'].type)
+            cached = persistent_cache.load(key, influence_update, z3_vars)
+            if cached is not None:
+                structure, expressions = cached
+                constraint_sets = []
+                for label, count in structure:
+                    cs = ConstraintSet(expressions[:count], expressions[count])
+                    cs.set_label(label)
+                    constraint_sets.append(cs)
+                    expressions = expressions[count + 1:]
+                return constraint_sets
+
+        conv = Z3ConditionChangeCalculator(z3_vars, entity=influence_update._parent, container=influence_update, use_integer_and_real=self.use_integer_and_real)
+        constraint_sets = conv.calculate_constraints(influence_update.function)
+
+        if persistent_cache is not None:
+            structure = [(cs.label, len(cs.constraints_until_condition)) for cs in constraint_sets]
+            expressions = [expr for cs in constraint_sets for expr in cs.constraints_until_condition + [cs.condition]]
+            persistent_cache.store(key, influence_update, z3_vars, expressions, structure)
+        return constraint_sets
 
     def get_transition_time(self, transition):
         """
@@ -182,6 +283,37 @@ class ConditionTimedChangeCalculator(Z3Calculator):
         - ports are influenced by Influences starting at other ports (find recursively)
         """
         logger.debug(f"Calculating the transition time of '{transition._name}' in entity '{transition._parent._name}' ({transition._parent.__class__.__name__})")
+        query = self._get_query(transition, self._build_transition_query)
+        if query is None:  # no modifier uses dt, the guard value can't change by time
+            currently_enabled = transition.guard(api.get_parent(transition))
+            return (0, transition) if currently_enabled else None
+
+        pre_value_constraints = self.get_pre_value_constraints(query.modifier_map, query.z3_vars)
+        if query.analytic is not None:
+            try:
+                min_dt = query.analytic.minimum_dt(pre_value_constraints)
+                self.statistics["analytic"] += 1
+                log_if_level(logging.DEBUG, f"Analytic transition time of '{transition._name}' in entity '{transition._parent._name}': {min_dt}")
+                return (min_dt, transition) if min_dt is not None else None
+            except NotAffine as exc:
+                log_if_level(logging.DEBUG, f"Cannot calculate the time of '{transition._name}' analytically, using Z3 instead: {exc}")
+
+        self.statistics["solver"] += 1
+        return self._solve_transition_query(transition, query, pre_value_constraints)
+
+    def _solve_transition_query(self, transition, query, pre_value_constraints):
+        solver = query.solver
+        solver.push()  # the pre values only hold for this query
+        solver.add(pre_value_constraints)
+        try:
+            description = f"transition '{transition._name}' in entity '{transition._parent._name}' ({transition._parent.__class__.__name__})"
+            min_dt = minimize_transition_time(solver, query.objective, query.z3_vars['dt'], description)
+        finally:
+            solver.pop()
+        return (min_dt, transition) if min_dt is not None else None
+
+    def _build_transition_query(self, transition):
+        """Creates a solver with all constraints of a transition time calculation, except for the pre values."""
         solver = z3.Optimize()
 
         # find the ports that influence the transition
@@ -190,7 +322,7 @@ class ConditionTimedChangeCalculator(Z3Calculator):
         # build a mapping that shows the propagation of information to the guard (what influences the guard)
         modifier_map = self.get_modifier_map(transition_ports)
 
-        z3var_constraints, z3_vars = self.get_z3_vars(modifier_map)
+        z3var_constraints, z3_vars = self.get_z3_vars(modifier_map, pre_values=False)
         solver.add(z3var_constraints)
         solver.add(z3_vars['dt'] >= 0)
 
@@ -199,10 +331,9 @@ class ConditionTimedChangeCalculator(Z3Calculator):
         for port, modifiers in modifier_map.items():
             for modifier in modifiers:
                 any_modifier_uses_dt = any_modifier_uses_dt or uses_dt_variable(modifier)
-                
+
         if not any_modifier_uses_dt:
-            currently_enabled = transition.guard(api.get_parent(transition))
-            return (0, transition) if currently_enabled else None
+            return None
 
         # create the constraints for updates and influences
         for port, modifiers in modifier_map.items():
@@ -210,9 +341,6 @@ class ConditionTimedChangeCalculator(Z3Calculator):
                 constraints = self._get_constraints_from_modifier(modifier, z3_vars)
                 solver.add(constraints)
 
-        # for port, modifiers in modifier_map.items():
-            # write pre value
-
         # logger.debug(f"adding constraints for transition guard: {transition._name}")
         conv = Z3Converter(z3_vars, entity=transition._parent, container=transition, use_integer_and_real=self.use_integer_and_real)
         guard_constraint = conv.to_z3(transition.guard)
@@ -223,33 +351,59 @@ class ConditionTimedChangeCalculator(Z3Calculator):
             guard_constraint = z3.And(guard_constraint)
         solver.add(guard_constraint)
 
-        # import pprint;pprint.pprint(z3_vars)
-
-        # log_if_level(logging.DEBUG, f"Constraints handed to solver:\n{solver}")
+        analytic = None
+        if config.analytic_transition_times:
+            try:
+                analytic = AffineTransitionTime(solver.assertions(), z3_vars['dt'])
+            except NotAffine as exc:
+                log_if_level(logging.DEBUG, f"Transition '{transition._name}' cannot be calculated analytically: {exc}")
 
         objective = solver.minimize(z3_vars['dt'])  # find minimal value of dt
-        check = solver.check()
-        # logger.debug("satisfiability: %s", check)
-        if solver.check() == z3.sat:
-            log_if_level(logging.INFO, f"Minimum time to enable transition '{transition._name}' in entity '{transition._parent._name}' ({transition._parent.__class__.__name__}) will be enabled in {to_python(objective.value())}")
-            # return (objective.value(), transition, as_epsilon_expr)
-            inf_coeff, numeric_coeff, eps_coeff = objective.lower_values()
-            return (Epsilon(numeric_coeff, eps_coeff), transition)
-        elif check == z3.unknown:
-            log_if_level(logging.WARNING, f"The calculation of the minimum transition time for '{transition._name}' in entity '{transition._parent._name}' ({transition._parent.__class__.__name__}) was UNKNOWN. This usually happening in the presence of non-linear constraints. Do we have any?")
-            std_solver = z3.Solver()
-            std_solver.add(solver.assertions())
-            std_solver_check = std_solver.check()
-            if std_solver_check == z3.sat:
-                min_dt = std_solver.model()[z3_vars['dt']]
-                log_if_level(logging.INFO, f"We did get a solution using the standard solver though: {to_python(min_dt)} Assuming that this is the smallest solution. CAREFUL THIS MIGHT BE WRONG (especially when the transition is an inequality constraint)!!!")
-                return (to_python(min_dt), transition)
-            elif std_solver_check == z3.unknown:
-                logger.error(f"The standard solver was also not able to decide if there is a solution or not. The constraints are too hard!!!")
-                return None
-            else:
-                logger.info("The standard solver says there is no solution to the constraints. This means we also couldn't minimize. Problem solved.")
-                return None
+        return IncrementalQuery(solver, modifier_map, z3_vars, objective, analytic)
+
+
+def minimize_transition_time(solver, objective, dt, description):
+    """
+    Finds the minimum dt that satisfies the solver's constraints.
+
+    Parameters
+    ----------
+    solver: z3.Optimize
+        Contains all constraints of the transition time query (including the pre values).
+    objective:
+        The handle of ``solver.minimize(dt)``.
+    dt: z3.ArithRef
+        The time variable.
+    description: str
+        Names the transition in log messages.
+
+    Returns
+    -------
+    Epsilon or numeric value or None
+        The minimum time, or None if the constraints are unsatisfiable.
+    """
+    check = solver.check()
+    # logger.debug("satisfiability: %s", check)
+    if check == z3.sat:
+        log_if_level(logging.INFO, f"Minimum time to enable {description} will be enabled in {to_python(objective.value())}")
+        # return (objective.value(), transition, as_epsilon_expr)
+        inf_coeff, numeric_coeff, eps_coeff = objective.lower_values()
+        return Epsilon(numeric_coeff, eps_coeff)
+    elif check == z3.unknown:
+        log_if_level(logging.WARNING, f"The calculation of the minimum transition time for {description} was UNKNOWN. This usually happening in the presence of non-linear constraints. Do we have any?")
+        std_solver = z3.Solver()
+        std_solver.add(solver.assertions())
+        std_solver_check = std_solver.check()
+        if std_solver_check == z3.sat:
+            min_dt = std_solver.model()[dt]
+            log_if_level(logging.INFO, f"We did get a solution using the standard solver though: {to_python(min_dt)} Assuming that this is the smallest solution. CAREFUL THIS MIGHT BE WRONG (especially when the transition is an inequality constraint)!!!")
+            return to_python(min_dt)
+        elif std_solver_check == z3.unknown:
+            logger.error(f"The standard solver was also not able to decide if there is a solution or not. The constraints are too hard!!!")
+            return None
         else:
-            logger.debug(f"Constraint set to enable transition '{transition._name}' in entity '{transition._parent._name}' ({transition._parent.__class__.__name__}) is unsatisfiable.")
+            logger.info("The standard solver says there is no solution to the constraints. This means we also couldn't minimize. Problem solved.")
             return None
+    else:
+        logger.debug(f"Constraint set to enable {description} is unsatisfiable.")
+        return None
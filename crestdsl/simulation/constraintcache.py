@@ -0,0 +1,273 @@
+"""
+A persistent (on-disk) cache for the Z3 constraints of updates and influences.
+
+Translating a modifier's source code into Z3 constraints (:class:`~crestdsl.simulation.to_z3.Z3Converter`)
+is done once per process and stored on the modifier object.
+For large systems this translation dominates the start-up time of simulations and verification.
+If ``config.constraint_cache`` is set to a directory, the constraints are additionally written to disk
+as SMT-LIB, so later processes can load them instead of translating again::
+
+    from crestdsl.config import config
+    config.constraint_cache = ".crest_cache"
+
+The cache key is a hash of the modifier's source code, its parameter names,
+the types of the ports it can access, the time unit and ``use_integer_and_real``.
+The variables in the stored constraints are renamed to placeholders (the path of the port, relative to the modifier's entity),
+and replaced by the current process's variables when they are loaded.
+Constraints that use enum (datatype) ports are not stored.
+"""
+
+from crestdsl.config import config
+from crestdsl.model import Port, Types, Influence, get_ports, get_entities
+from crestdsl import sourcehelper as SH
+
+import os
+import json
+import hashlib
+import tempfile
+from operator import attrgetter
+
+import z3
+
+import logging
+logger = logging.getLogger(__name__)
+
+CACHE_VERSION = 1
+
+# the kinds of constraints that are cached
+MODIFIER = "modifier"  # constraints of an update/influence function (z3calculator.get_constraints_from_modifier)
+BEHAVIOUR_CHANGE = "behaviour_change"  # the ConstraintSets of if/else conditions (ConditionTimedChangeCalculator)
+
+_VALUE = "crest!value!"
+_PRE = "crest!pre!"
+_SELF = "!crest!self"
+
+
+class NotCacheable(Exception):
+    """Raised if constraints contain something that we cannot store."""
+
+
+def _domain_string(domain):
+    return domain.name if isinstance(domain, Types) else repr(domain)
+
+
+def _visible_ports(entity):
+    """The ports that a modifier in the entity can access, by relative path."""
+    ports = {port._name: port for port in get_ports(entity)}
+    for sub in get_entities(entity):
+        ports.update({f"{sub._name}.{port._name}": port for port in get_ports(sub)})
+    return ports
+
+
+def _relative_path(entity, port):
+    for path, visible in _visible_ports(entity).items():
+        if visible is port:
+            return path
+    raise NotCacheable(f"Port {port._name} is not visible from entity {entity._name}")
+
+
+def constraint_key(modifier, kind, use_integer_and_real, timeunit):
+    """
+    Creates the cache key of a modifier's constraints.
+
+    Parameters
+    ----------
+    modifier: Update or Influence
+        The modifier whose constraints are cached.
+    kind: str
+        ``MODIFIER`` or ``BEHAVIOUR_CHANGE``
+    use_integer_and_real: bool
+        The setting that the constraints are created with.
+    timeunit: Types
+        The type of the dt variable.
+
+    Returns
+    -------
+    str
+        A hex digest that identifies the constraints.
+    """
+    entity = modifier._parent
+    ports = sorted((path, _domain_string(port.resource.domain)) for path, port in _visible_ports(entity).items())
+    connected = [_relative_path(entity, modifier.target)]
+    if isinstance(modifier, Influence):
+        connected.append(_relative_path(entity, modifier.source))
+
+    description = [
+        CACHE_VERSION, kind, modifier.__class__.__name__,
+        SH.getsource(modifier.function), SH.get_param_names(modifier.function),
+        connected, ports, bool(use_integer_and_real), _domain_string(timeunit),
+        z3.get_version_string(),
+    ]
+    return hashlib.sha256(json.dumps(description).encode("utf-8")).hexdigest()
+
+
+def _uninterpreted_constants(expressions):
+    """All variables in the expressions, by ast id."""
+    constants = {}
+    todo = list(expressions)
+    seen = set()
+    while todo:
+        expr = todo.pop()
+        if expr.get_id() in seen:
+            continue
+        seen.add(expr.get_id())
+        if expr.sort().kind() == z3.Z3_DATATYPE_SORT:
+            raise NotCacheable("Enum (datatype) ports cannot be cached")
+        if z3.is_const(expr) and expr.decl().kind() == z3.Z3_OP_UNINTERPRETED:
+            constants[expr.get_id()] = expr
+        else:
+            todo.extend(expr.children())
+    return constants
+
+
+def _port_variables(modifier, z3_vars):
+    """Maps (ast id) the z3 variables of the ports in z3_vars to (prefix, port)."""
+    variables = {}
+    for port, names in z3_vars.items():
+        if isinstance(port, Port):
+            variables[names[port._name].get_id()] = (_VALUE, port)
+            variables[names[port._name + "_0"].get_id()] = (_PRE, port)
+    return variables
+
+
+def to_smtlib(modifier, z3_vars, expressions):
+    """
+    Serializes the expressions with placeholder variables.
+
+    Raises
+    ------
+    NotCacheable
+        If there are variables that don't belong to a port, dt or the modifier itself.
+    """
+    if not all(isinstance(expr, z3.BoolRef) for expr in expressions):
+        raise NotCacheable("Only boolean z3 constraints can be cached")
+
+    suffix = f"_{id(modifier)}"
+    port_variables = _port_variables(modifier, z3_vars)
+    substitutions = []
+    for ast_id, const in _uninterpreted_constants(expressions).items():
+        name = const.decl().name()
+        if ast_id in port_variables:
+            prefix, port = port_variables[ast_id]
+            placeholder = prefix + _relative_path(modifier._parent, port)
+        elif name == "dt":
+            continue
+        elif name.endswith(suffix):  # the modifier's internal variables
+            placeholder = name[:-len(suffix)] + _SELF
+        else:
+            raise NotCacheable(f"Don't know how to store variable {name}")
+        substitutions.append((const, z3.Const(placeholder, const.sort())))
+
+    solver = z3.Solver()
+    for expr in expressions:
+        solver.add(z3.substitute(expr, *substitutions) if substitutions else expr)
+    return solver.sexpr()
+
+
+def from_smtlib(modifier, z3_vars, smtlib):
+    """Parses serialized expressions and replaces the placeholders with the current variables."""
+    expressions = list(z3.parse_smt2_string(smtlib))
+
+    substitutions = []
+    for const in _uninterpreted_constants(expressions).values():
+        name = const.decl().name()
+        if name.startswith(_VALUE) or name.startswith(_PRE):
+            is_pre = name.startswith(_PRE)
+            path = name[len(_PRE if is_pre else _VALUE):]
+            port = attrgetter(path)(modifier._parent)
+            variable = z3_vars[port][port._name + "_0" if is_pre else port._name]
+        elif name.endswith(_SELF):
+            variable = z3.Const(name[:-len(_SELF)] + f"_{id(modifier)}", const.sort())
+        else:
+            continue  # dt
+        if variable.sort() != const.sort():
+            raise NotCacheable(f"The type of {name} changed")
+        substitutions.append((const, variable))
+
+    if substitutions:
+        expressions = [z3.substitute(expr, *substitutions) for expr in expressions]
+    return expressions
+
+
+class ConstraintCache(object):
+    """
+    Stores serialized constraints in a directory, one JSON file per key.
+    Files are replaced atomically, so several processes can share a cache directory.
+
+    The ``stats`` dict counts the ``hits``, ``misses``, ``stores`` and ``uncacheable`` constraint sets.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.stats = dict(hits=0, misses=0, stores=0, uncacheable=0)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".json")
+
+    def load(self, key, modifier, z3_vars):
+        """
+        Returns
+        -------
+        tuple or None
+            The pair (structure, expressions) that was stored for the key, or None if there is none.
+        """
+        path = self._path(key)
+        try:
+            with open(path, "r") as cachefile:
+                entry = json.load(cachefile)
+            expressions = from_smtlib(modifier, z3_vars, entry["smtlib"])
+            if len(expressions) != entry["count"]:
+                raise NotCacheable("The number of stored constraints doesn't match")
+        except FileNotFoundError:
+            self.stats["misses"] += 1
+            return None
+        except Exception as exc:  # broken/outdated file, or variables that don't exist anymore
+            logger.info(f"Cannot use cached constraints {path} for {modifier._name}: {exc}")
+            self.stats["misses"] += 1
+            return None
+
+        self.stats["hits"] += 1
+        return entry["structure"], expressions
+
+    def store(self, key, modifier, z3_vars, expressions, structure=None):
+        """Serializes the expressions and writes them (and the structure information) to the cache."""
+        try:
+            smtlib = to_smtlib(modifier, z3_vars, expressions)
+        except NotCacheable as exc:
+            logger.debug(f"Not caching constraints of {modifier._name}: {exc}")
+            self.stats["uncacheable"] += 1
+            return False
+
+        entry = dict(structure=structure, count=len(expressions), smtlib=smtlib)
+        handle, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(handle, "w") as cachefile:
+            json.dump(entry, cachefile)
+        os.replace(tmp_path, self._path(key))
+        self.stats["stores"] += 1
+        return True
+
+    def clear(self):
+        """Deletes all cached constraints."""
+        for filename in os.listdir(self.directory):
+            if filename.endswith(".json"):
+                os.remove(os.path.join(self.directory, filename))
+
+
+_caches = {}
+
+
+def get_constraint_cache():
+    """
+    Returns
+    -------
+    ConstraintCache or None
+        The cache for the directory in ``config.constraint_cache``, or None if persistent caching is disabled.
+    """
+    directory = config.constraint_cache
+    if directory is None:
+        return None
+    directory = os.path.abspath(directory)
+    if directory not in _caches:
+        _caches[directory] = ConstraintCache(directory)
+    return _caches[directory]
@@ -104,34 +104,70 @@ def ordered_modifiers(entity):
 
 def get_entity_modifiers_in_dependency_order(entity):
     """
-    Uses [networkx](https://networkx.github.io/) functionality to find a linear order.
-    The algorithm is networkx' [topoligical_sort](https://networkx.github.io/documentation/networkx-1.9/reference/generated/networkx.algorithms.dag.topological_sort.html)
-    function.
-    Note, that this function is right now non-deterministic, it would be better if we replace the algorithm with a deterministic one.
+    Uses [networkx](https://networkx.github.io/) functionality to find a linear order
+    of the modifiers that are active in the entity's current state.
+    See :func:`compile_schedule`.
     """
-    # TODO: make deterministic? https://pypi.org/project/toposort/
-    
-    # access the mod_graph
-    try: 
-        orig_DG = entity._mod_graph
-    except AttributeError as atterr:
-         entity._mod_graph = entity_modifier_graph(entity)
-         orig_DG = entity._mod_graph
-         
-    # NetworkX is slow.
-    # Therefore, we cache if the entire graph is a DAG. 
-    # It usually is, but very rarely it isn't, 
-    # if it isn't we have to check over and over again. (performance loss)
-    try: 
-        is_dag = orig_DG._is_dag
+    return list(compile_schedule(entity, api.get_current(entity)))
+
+
+def get_modifier_graph(entity):
+    """Returns the (cached) modifier graph of the entity. (see :func:`entity_modifier_graph`)"""
+    try:
+        return entity._mod_graph
     except AttributeError:
-        orig_DG._is_dag = nx.is_directed_acyclic_graph(entity._mod_graph)
-        is_dag = orig_DG._is_dag
+        entity._mod_graph = entity_modifier_graph(entity)
+        # NetworkX is slow.
+        # Therefore, we cache if the entire graph is a DAG.
+        # It usually is, but very rarely it isn't,
+        # if it isn't we have to check the subgraph of every state.
+        entity._mod_graph._is_dag = nx.is_directed_acyclic_graph(entity._mod_graph)
+        return entity._mod_graph
+
+
+def _sort_key(graph):
+    """Orders independent nodes by name, so the schedule is the same in every run."""
+    def key(node):
+        data = graph.nodes[node]
+        if MODIFIER in data:
+            return ("modifier", api.get_name(data[MODIFIER]))
+        port = data["port"]
+        return ("port", api.get_name(api.get_parent(port)), api.get_name(port))
+    return key
+
+
+def compile_schedule(entity, state):
+    """
+    Creates the execution schedule of an entity in a certain state:
+    the influences, the updates of this state and the subentities, in dependency order.
+    A subentity can appear several times (if it has Dependencies that require it).
+
+    The algorithm is networkx' [lexicographical_topological_sort](https://networkx.github.io/documentation/stable/reference/algorithms/generated/networkx.algorithms.dag.lexicographical_topological_sort.html).
+    Independent modifiers are ordered by name, so the result is deterministic.
+
+    Parameters
+    ----------
+    entity: Entity
+        The entity whose modifiers should be ordered.
+    state: State
+        The state of the entity (the updates of other states are ignored).
+
+    Returns
+    -------
+    tuple
+        The modifiers (Influence, Update and Entity objects) in execution order.
+
+    Raises
+    ------
+    AssertionError
+        If the modifiers of this state have cyclic dependencies. (The cycles are logged.)
+    """
+    orig_DG = get_modifier_graph(entity)
 
     # create a subgraph_view so that the inactive states are filtered
     def node_filter(node):
         obj = orig_DG.nodes[node]
-        keep = not (MODIFIER in obj and isinstance(obj[MODIFIER], crest.Update) and obj[MODIFIER].state != api.get_current(obj[MODIFIER]._parent))
+        keep = not (MODIFIER in obj and isinstance(obj[MODIFIER], crest.Update) and obj[MODIFIER].state != state)
         return keep
 
     DG = nx.graphviews.subgraph_view(orig_DG, filter_node=node_filter)
@@ -139,7 +175,7 @@ def get_entity_modifiers_in_dependency_order(entity):
     # if the entire graph is not a DAG
     # and the subgraph also isn't a DAG
     # then find the cycle and inform the user
-    if not is_dag and not nx.is_directed_acyclic_graph(DG): 
+    if not orig_DG._is_dag and not nx.is_directed_acyclic_graph(DG): 
         def get_text(nodetype, modifier_or_port):
             description = "Port" if nodetype != MODIFIER else "Entity" if isinstance(modifier_or_port, crest.Entity) else modifier_or_port.__class__.__name__
             return f"{description}: {api.get_name(modifier_or_port)} ({api.get_name(api.get_parent(modifier_or_port))})"
@@ -152,14 +188,5 @@ def get_entity_modifiers_in_dependency_order(entity):
             logger.error(f"Cycle found: {as_text}")
         raise AssertionError("Cyclic dependencies discovered. This is not allowed in CREST.")
 
-    topo_list = list(nx.topological_sort(DG))
-    # topo_port_list = [DG.node[node]['port'] for node in topo_list]
-    # print([f"{port._parent._name}.{port._name}" for port in topo_port_list])
-
-    ordered_modifier_list = []
-    for node in topo_list:
-        if MODIFIER in DG.nodes[node]:
-            mod = DG.nodes[node][MODIFIER]
-            ordered_modifier_list.append(mod)
-
-    return ordered_modifier_list
+    topo_list = nx.lexicographical_topological_sort(DG, key=_sort_key(DG))
+    return tuple(DG.nodes[node][MODIFIER] for node in topo_list if MODIFIER in DG.nodes[node])
@@ -0,0 +1,302 @@
+"""
+Calculates the next behaviour change time with a pool of worker processes.
+
+The parent process translates the transitions and updates/influences into Z3 constraints
+(just like the ConditionTimedChangeCalculator) and sends the constraints of each query
+to one worker process once, as SMT-LIB.
+The worker keeps its own solver for the query.
+After that, only the current (pre) values of the ports are sent for each calculation.
+
+The result is identical to the sequential calculation:
+the workers run the same minimisation as the sequential calculator,
+and the results are collected in the same order before the minimum is chosen.
+"""
+
+from .conditiontimedchangecalculator import ConditionTimedChangeCalculator, minimize_transition_time
+from .z3conditionchangecalculator import ConstraintSet, get_behaviour_change_dt_from_constraintset
+from crestdsl.config import config, to_python
+from crestdsl.model import Types, get_all_entities
+
+import os
+import traceback
+import multiprocessing
+
+import z3
+
+import logging
+logger = logging.getLogger(__name__)
+
+TRANSITION = "transition"
+CONDITION_CHANGE = "condition_change"
+
+OK = "ok"
+ERROR = "error"
+
+LOCAL = "local"  # marks queries that cannot be sent to a worker
+
+
+def _to_smtlib(constraints):
+    solver = z3.Solver()
+    for constraint in constraints:
+        solver.add(constraint)
+    return solver.sexpr()
+
+
+def _from_smtlib(smtlib):
+    return list(z3.parse_smt2_string(smtlib)) if smtlib else []
+
+
+class _RemoteQuery(object):
+    """The worker's copy of an IncrementalQuery."""
+
+    def __init__(self, kind, dt_name, static, constraint_sets, description):
+        self.kind = kind
+        self.description = description
+        self.solver = z3.Optimize()
+        self.solver.add(_from_smtlib(static))
+
+        self.constraint_sets = []
+        for constraints, condition, label in constraint_sets:
+            constraint_set = ConstraintSet(_from_smtlib(constraints), _from_smtlib(condition)[0])
+            constraint_set.set_label(label)
+            self.constraint_sets.append(constraint_set)
+
+        self.dt = z3.Const(dt_name[0], z3.RealSort() if dt_name[1] == "Real" else z3.IntSort())
+        if kind == TRANSITION:
+            self.objective = self.solver.minimize(self.dt)
+
+    def solve(self, pre_values):
+        self.solver.push()
+        self.solver.add(_from_smtlib(pre_values))
+        try:
+            if self.kind == TRANSITION:
+                return minimize_transition_time(self.solver, self.objective, self.dt, self.description)
+            return get_behaviour_change_dt_from_constraintset(self.solver, self.constraint_sets, self.dt)
+        finally:
+            self.solver.pop()
+
+
+def _worker(connection):
+    """The main loop of a worker process. Receives (forget, jobs) and answers with one result per job."""
+    queries = {}
+    while True:
+        message = connection.recv()
+        if message is None:
+            break
+
+        forget, jobs = message
+        for remote_id in forget:
+            queries.pop(remote_id, None)
+
+        results = []
+        for remote_id, setup, pre_values, keep in jobs:
+            try:
+                if setup is not None:
+                    queries[remote_id] = _RemoteQuery(*setup)
+                query = queries[remote_id] if keep else queries.pop(remote_id)
+                results.append((OK, query.solve(pre_values)))
+            except Exception:
+                queries.pop(remote_id, None)
+                results.append((ERROR, traceback.format_exc()))
+        connection.send(results)
+    connection.close()
+
+
+class _Pending(object):
+    """A query that was sent to a worker. The result is filled in when the worker answers."""
+
+    def __init__(self, kind, obj, query, pre_value_constraints):
+        self.kind = kind
+        self.obj = obj
+        self.query = query
+        self.pre_value_constraints = pre_value_constraints
+        self.result = None
+
+
+class ParallelConditionTimedChangeCalculator(ConditionTimedChangeCalculator):
+    """
+    Distributes the behaviour change queries of all entities over worker processes.
+    Queries whose constraints cannot be serialized are calculated in this process.
+
+    Call :func:`close` (or use the calculator as context manager) to stop the workers.
+    They are also stopped when the calculator is garbage collected.
+    """
+
+    def __init__(self, system, timeunit=Types.REAL, use_integer_and_real=config.use_integer_and_real,
+                 incremental=None, max_queries=None, workers=None, min_parallel_queries=2):
+        """
+        Parameters
+        ----------
+        workers: int
+            The number of worker processes (default: the number of CPUs).
+        min_parallel_queries: int
+            If fewer queries need a solver, they are calculated in this process
+            (sending them to a worker would take longer).
+        """
+        super().__init__(system, timeunit, use_integer_and_real, incremental, max_queries)
+        self.workers = os.cpu_count() if workers is None else workers
+        assert self.workers >= 1, "We need at least one worker process"
+        self.min_parallel_queries = min_parallel_queries
+
+        self._connections = []
+        self._processes = []
+        self._next_remote_id = 0
+        self._forget = {}  # worker index -> list of remote ids to forget
+        self._pending = None
+
+    def _start_workers(self):
+        context = multiprocessing.get_context()
+        for _ in range(self.workers):
+            parent_end, worker_end = context.Pipe()
+            process = context.Process(target=_worker, args=(worker_end,), daemon=True)
+            process.start()
+            worker_end.close()
+            self._connections.append(parent_end)
+            self._processes.append(process)
+        self._forget = {index: [] for index in range(self.workers)}
+
+    def close(self):
+        """Stops the worker processes."""
+        for connection in self._connections:
+            try:
+                connection.send(None)
+                connection.close()
+            except (OSError, EOFError):
+                pass  # the worker is already gone
+        for process in self._processes:
+            process.join(timeout=1)
+        self._connections, self._processes = [], []
+        for query in self._queries.values():
+            if getattr(query, "_remote", None) != LOCAL:
+                query._remote = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+    def _drop_query(self, query):
+        remote = getattr(query, "_remote", None)
+        if remote is not None and remote != LOCAL:
+            worker, remote_id = remote
+            self._forget[worker].append(remote_id)
+
+    """ Collect the queries of all entities, then solve them in parallel. """
+
+    def calculate_system(self, entity=None, include_subentities=True):
+        logger.debug("PARALLEL: Calculating for all entities")
+        if not entity:
+            entity = self.entity
+        entities_to_calculate = get_all_entities(entity) if include_subentities else [entity]
+
+        self._pending = []
+        try:
+            all_dts = []
+            for e in entities_to_calculate:
+                all_dts.extend(self.get_entity_behaviour_changes(e))
+            pending, self._pending = self._pending, None
+        finally:
+            self._pending = None
+
+        self._solve_pending(pending)
+
+        results = []
+        for dts in all_dts:
+            if isinstance(dts, _Pending):
+                dts = dts.result
+            if dts is not None:
+                results.append(dts)
+        return results
+
+    def _solve_transition_query(self, transition, query, pre_value_constraints):
+        if self._pending is None:
+            return super()._solve_transition_query(transition, query, pre_value_constraints)
+        pending = _Pending(TRANSITION, transition, query, pre_value_constraints)
+        self._pending.append(pending)
+        return pending
+
+    def _solve_condition_change_query(self, influence_update, query, pre_value_constraints):
+        if self._pending is None:
+            return super()._solve_condition_change_query(influence_update, query, pre_value_constraints)
+        pending = _Pending(CONDITION_CHANGE, influence_update, query, pre_value_constraints)
+        self._pending.append(pending)
+        return pending
+
+    def _solve_locally(self, pending):
+        if pending.kind == TRANSITION:
+            pending.result = super()._solve_transition_query(pending.obj, pending.query, pending.pre_value_constraints)
+        else:
+            pending.result = super()._solve_condition_change_query(pending.obj, pending.query, pending.pre_value_constraints)
+
+    def _setup(self, pending):
+        """The serialized constraints of a query."""
+        query = pending.query
+        dt = query.z3_vars['dt']
+        dt_name = (dt.decl().name(), "Real" if z3.is_real(dt) else "Int")
+        description = f"{pending.kind} '{pending.obj._name}' in entity '{pending.obj._parent._name}'"
+        constraint_sets = []
+        if pending.kind == CONDITION_CHANGE:
+            for constraint_set in pending.obj._cached_z3_behaviour_change_constraints:
+                constraint_sets.append((_to_smtlib(constraint_set.constraints_until_condition),
+                                        _to_smtlib([constraint_set.condition]), constraint_set.label))
+        return (pending.kind, dt_name, _to_smtlib(query.solver.assertions()), constraint_sets, description)
+
+    def _solve_pending(self, pending):
+        remote = [p for p in pending if getattr(p.query, "_remote", None) != LOCAL]
+        if len(remote) < self.min_parallel_queries:
+            for p in pending:
+                self._solve_locally(p)
+            return
+
+        if not self._processes:
+            self._start_workers()
+
+        jobs = {index: [] for index in range(self.workers)}
+        sent = {index: [] for index in range(self.workers)}
+        for p in pending:
+            try:
+                setup = None
+                if getattr(p.query, "_remote", None) is None:
+                    setup = self._setup(p)
+                    p.query._remote = (self._next_remote_id % self.workers, self._next_remote_id)
+                    self._next_remote_id += 1
+                if p.query._remote == LOCAL:
+                    self._solve_locally(p)
+                    continue
+                worker, remote_id = p.query._remote
+                keep = self.incremental
+                jobs[worker].append((remote_id, setup, _to_smtlib(p.pre_value_constraints), keep))
+                sent[worker].append(p)
+            except Exception as exc:
+                logger.info(f"Cannot send {p.kind} '{p.obj._name}' to a worker, calculating it here: {exc}")
+                p.query._remote = LOCAL
+                self._solve_locally(p)
+
+        for worker, worker_jobs in jobs.items():
+            if worker_jobs or self._forget[worker]:
+                self._connections[worker].send((self._forget[worker], worker_jobs))
+                self._forget[worker] = []
+
+        for worker, worker_jobs in jobs.items():
+            if not worker_jobs:
+                continue
+            results = self._connections[worker].recv()
+            for p, (status, value) in zip(sent[worker], results):
+                if status == ERROR:
+                    logger.warning(f"A worker could not solve {p.kind} '{p.obj._name}', calculating it here:\n{value}")
+                    p.query._remote = LOCAL
+                    self._solve_locally(p)
+                elif p.kind == TRANSITION:
+                    p.result = (value, p.obj) if value is not None else None
+                else:
+                    min_dt, label = value
+                    p.result = (to_python(min_dt), p.obj, label) if min_dt is not None else None
+                if not self.incremental:
+                    p.query._remote = None
@@ -1,6 +1,6 @@
 from crestdsl.config import config, to_python
-from crestdsl.model import get_inputs, Influence, Update, Entity, Transition
-from crestdsl.model.api import get_targets, get_sources
+from crestdsl.model import get_inputs, get_all_entities, get_states, Influence, Update, Entity, Transition
+from crestdsl.model.api import get_targets, get_sources, get_current
 from .to_z3 import evaluate_to_bool
 from .basesimulator import BaseSimulator
 from crestdsl.simulation import dependencyOrder as DO
@@ -41,6 +41,46 @@ class Simulator(BaseSimulator):
     .. automethod:: plot
     """
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # (entity, state) -> execution schedule (or the AssertionError of a state with cyclic dependencies)
+        self._schedules = {}
+        self.compile_schedules()
+
+    def compile_schedules(self, entity=None):
+        """
+        Creates the execution schedules of all states of the entity and its subentities
+        (see :func:`~crestdsl.simulation.dependencyOrder.compile_schedule`).
+        This is done when the simulator is created.
+        Call it again if you modify the system's structure afterwards.
+
+        Parameters
+        ----------
+        entity: Entity
+            The entity whose schedules are created (default: the system).
+        """
+        if entity is None:
+            entity = self.system
+        for ent in get_all_entities(entity):
+            for state in (get_states(ent) or [None]):
+                self._schedules[(ent, state)] = self._compile_schedule(ent, state)
+
+    def _compile_schedule(self, entity, state):
+        try:
+            return DO.compile_schedule(entity, state)
+        except AssertionError as error:
+            return error  # we only complain if the entity actually is in this state
+
+    def get_schedule(self, entity):
+        """The modifiers of the entity's current state, in execution order."""
+        current = get_current(entity)
+        schedule = self._schedules.get((entity, current))
+        if schedule is None:  # the structure was modified after the simulator was created
+            schedule = self._schedules[(entity, current)] = self._compile_schedule(entity, current)
+        if isinstance(schedule, AssertionError):
+            raise schedule
+        return schedule
+
     def set_values(self, port_value_map):
         self._value_change(port_value_map)
         self.stabilise()
@@ -84,8 +124,9 @@ class Simulator(BaseSimulator):
         for port in get_targets(entity):  # + get_targets(entity):
             port.pre = port.value
 
-        ordered_modifiers = DO.get_entity_modifiers_in_dependency_order(entity)
-        logger.debug(f"Execution order of dependencies in {entity._name}: {[mod._name for mod in ordered_modifiers]}")
+        ordered_modifiers = self.get_schedule(entity)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Execution order of dependencies in {entity._name}: {[mod._name for mod in ordered_modifiers]}")
         for mod in ordered_modifiers:
             if isinstance(mod, Influence):
                 logger.debug(f"Time: {self.global_time} | Triggering influence {mod._name} in entity {entity._name} ({entity.__class__.__name__})")
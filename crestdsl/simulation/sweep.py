@@ -0,0 +1,358 @@
+"""
+Parameter sweeps run many independent simulations of a system in parallel processes.
+
+Each run creates a fresh system (by calling the system class or factory),
+assigns its initial values, stabilises it and executes an execution plan
+(the same format as :func:`PlanSimulator.run_plan <crestdsl.simulation.PlanSimulator.run_plan>`).
+The runs are distributed over a process pool, so every worker uses its own system objects and its own Z3 context.
+
+Ports, entities and transitions can be specified either by path (e.g. ``"tank.level"``)
+or as objects of any instance of the system. Objects are translated into paths
+before they are sent to the workers::
+
+    template = Tank()
+    assignments = grid({template.inflow: [1, 2, 3], template.level: [0, 5]})
+    for result in Sweep(Tank, assignments, plan=[10, {template.inflow: 0}, 10], workers=4):
+        print(result.index, result.status, result.trace.tail(1))
+
+The traces are returned as DataFrames whose columns are named by path (see :func:`get_column_name`).
+"""
+
+from crestdsl.model import Entity, Port, State, Transition, get_path_to_attribute
+from crestdsl.model.meta import CrestObject
+import crestdsl.model.api as api
+from .plansimulator import PlanSimulator
+from .tracesink import get_column_name, to_file_value
+
+import os
+import time
+import signal
+import itertools
+import threading
+import traceback
+import concurrent.futures
+from operator import attrgetter
+
+import logging
+logger = logging.getLogger(__name__)
+
+OK = "ok"
+ERROR = "error"
+TIMEOUT = "timeout"
+
+
+class Reference(object):
+    """The path of a port, entity or transition in a system. Can be sent to other processes."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def resolve(self, system):
+        return attrgetter(self.path)(system) if self.path != "" else system
+
+    def __eq__(self, other):
+        return isinstance(other, Reference) and self.path == other.path
+
+    def __hash__(self):
+        return hash(self.path)
+
+    def __repr__(self):
+        return f"Reference({self.path!r})"
+
+
+class RunTimeout(Exception):
+    """Raised inside a run that exceeded its time limit."""
+
+
+class RunResult(object):
+    """The outcome of one simulation run of a sweep."""
+
+    def __init__(self, index, assignment, status, trace=None, error=None, duration=None):
+        """
+        Parameters
+        ----------
+        index: int
+            The position of the run's assignment in the sweep.
+        assignment: dict
+            The initial values of the run ({path: value}).
+        status: str
+            ``"ok"``, ``"error"`` or ``"timeout"``.
+        trace: pandas.DataFrame
+            The recorded trace, with one column per path. (None if the run failed or traces are not recorded.)
+        error: str
+            The error message (including traceback) of failed runs.
+        duration: float
+            The wall-clock time of the run, in seconds.
+        """
+        self.index = index
+        self.assignment = assignment
+        self.status = status
+        self.trace = trace
+        self.error = error
+        self.duration = duration
+
+    @property
+    def ok(self):
+        return self.status == OK
+
+    def __repr__(self):
+        return f"RunResult(index={self.index}, status={self.status!r}, duration={self.duration})"
+
+
+def to_reference(obj):
+    """Replace ports, entities and transitions by their path. Strings are paths already."""
+    if isinstance(obj, (Port, Entity, Transition)):
+        return Reference(get_path_to_attribute(api.get_root(obj), obj))
+    if isinstance(obj, str):
+        return Reference(obj)
+    if isinstance(obj, Reference):
+        return obj
+    raise ValueError(f"Cannot refer to {obj!r}. Use ports, entities, transitions or their path.")
+
+
+def _portable_value(value):
+    """States and transitions (the values of entity keys) are referred to by their name in the entity."""
+    if isinstance(value, (State, Transition)):
+        return Reference(value._name)
+    return value
+
+
+def portable_assignment(assignment):
+    """Translates an assignment ({port: value, entity: state}) into paths."""
+    return {to_reference(key): _portable_value(value) for key, value in assignment.items()}
+
+
+def portable_plan(plan):
+    """Translates an execution plan's ports, entities and transitions into paths."""
+    portable = []
+    for item in plan or []:
+        if isinstance(item, dict):
+            portable.append(portable_assignment(item))
+        elif isinstance(item, tuple) and len(item) == 2 and isinstance(item[1], dict):
+            portable.append((item[0], portable_assignment(item[1])))
+        else:
+            portable.append(item)
+    return portable
+
+
+def grid(axes):
+    """
+    Creates the assignments of all value combinations (the cartesian product).
+
+    Parameters
+    ----------
+    axes: dict
+        Maps ports/entities (or paths) to a list of values.
+
+    Returns
+    -------
+    list of dict
+        One assignment per combination.
+    """
+    keys = list(axes.keys())
+    return [dict(zip(keys, values)) for values in itertools.product(*[axes[key] for key in keys])]
+
+
+def _resolve_assignment(system, assignment):
+    resolved = {}
+    for key, value in assignment.items():
+        obj = key.resolve(system)
+        if isinstance(obj, Entity):  # states/transitions are named relative to the entity
+            value = getattr(obj, value.path if isinstance(value, Reference) else value)
+        resolved[obj] = value
+    return resolved
+
+
+def _resolve_plan(system, plan):
+    resolved = []
+    for item in plan:
+        if isinstance(item, dict):
+            resolved.append(_resolve_assignment(system, item))
+        elif isinstance(item, tuple):
+            resolved.append((item[0], _resolve_assignment(system, item[1])))
+        else:
+            resolved.append(item)
+    return resolved
+
+
+def trace_frame(system, trace_data):
+    """Renames the columns of a trace DataFrame to paths and replaces states by their names."""
+    frame = trace_data.copy()
+    columns = {}
+    for column in frame.columns:
+        if isinstance(column, CrestObject):
+            columns[column] = get_column_name(system, column)
+            frame[column] = [to_file_value(value) for value in frame[column]]
+    return frame.rename(columns=columns)
+
+
+class _time_limit(object):
+    """Raises RunTimeout in the main thread after a number of seconds (where SIGALRM is available)."""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.active = seconds is not None and hasattr(signal, "SIGALRM") and \
+            threading.current_thread() is threading.main_thread()
+        if seconds is not None and not self.active:
+            logger.warning("Run timeouts need SIGALRM in the main thread. The time limit is ignored.")
+
+    def _handler(self, signum, frame):
+        raise RunTimeout(f"The run took longer than {self.seconds} seconds")
+
+    def __enter__(self):
+        if self.active:
+            self._previous = signal.signal(signal.SIGALRM, self._handler)
+            signal.setitimer(signal.ITIMER_REAL, self.seconds)
+
+    def __exit__(self, *args):
+        if self.active:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, self._previous)
+
+
+def execute_run(system_factory, index, assignment, plan, timeout=None, stabilise=True, simulator_kwargs=None):
+    """
+    Executes one run of a sweep. (This is what the workers call.)
+
+    Returns
+    -------
+    RunResult
+        The run's outcome. Errors are reported in the result, not raised.
+    """
+    simulator_kwargs = simulator_kwargs or {}
+    paths = {key.path: value for key, value in assignment.items()}
+    start = time.perf_counter()
+    try:
+        with _time_limit(timeout):
+            system = system_factory()
+            for obj, value in _resolve_assignment(system, assignment).items():
+                if isinstance(obj, Entity):
+                    obj.current = value
+                else:
+                    obj.value = value
+
+            simulator = PlanSimulator(system, **simulator_kwargs)
+            if stabilise:
+                simulator.stabilise()
+            simulator.run_plan(_resolve_plan(system, plan))
+
+            trace = trace_frame(system, simulator.trace.data) if simulator.record_traces else None
+        return RunResult(index, paths, OK, trace=trace, duration=time.perf_counter() - start)
+    except RunTimeout as exc:
+        logger.warning(f"Run {index} timed out: {exc}")
+        return RunResult(index, paths, TIMEOUT, error=str(exc), duration=time.perf_counter() - start)
+    except Exception:
+        logger.warning(f"Run {index} failed", exc_info=True)
+        return RunResult(index, paths, ERROR, error=traceback.format_exc(), duration=time.perf_counter() - start)
+
+
+def _execute_chunk(system_factory, runs, plan, timeout, stabilise, simulator_kwargs):
+    return [execute_run(system_factory, index, assignment, plan, timeout, stabilise, simulator_kwargs)
+            for (index, assignment) in runs]
+
+
+class Sweep(object):
+    """
+    Runs a simulation for each of a list of assignments, in a process pool.
+    Iterate over the sweep to receive the results as soon as they are finished
+    (in completion order), or call :func:`run` to get all of them, sorted by index.
+
+    .. automethod:: __init__
+    .. automethod:: run
+    """
+
+    def __init__(self, system_factory, assignments, plan=None, workers=None, chunksize=1,
+                 timeout=None, stabilise=True, simulator_kwargs=None, progress=None):
+        """
+        Parameters
+        ----------
+        system_factory: Entity class or callable
+            Creates a new system for each run. It has to be picklable (e.g. a class defined at module level).
+        assignments: list of dict
+            One {port: value, entity: state} dict per run (keys can also be paths). See :func:`grid`.
+        plan: list
+            The execution plan that each run executes after the assignment (see PlanSimulator.run_plan).
+        workers: int
+            The number of processes (default: the number of CPUs).
+            Use 0 to execute all runs in this process (e.g. for debugging).
+        chunksize: int
+            How many runs are sent to a worker at once. Larger chunks reduce the communication overhead for short runs.
+        timeout: float
+            Time limit (in seconds) of each run. Runs that exceed it are reported with status ``"timeout"``.
+            (Uses SIGALRM, long Z3 calls are only interrupted when they return.)
+        stabilise: bool
+            Stabilise the system after the assignment, before the plan is executed.
+        simulator_kwargs: dict
+            Keyword arguments for the PlanSimulator (e.g. ``record_traces="columnar"`` or ``max_step_size``).
+        progress: callable
+            Called as ``progress(finished, total, result)`` after each completed run.
+        """
+        assert chunksize >= 1, "The chunk size has to be at least 1"
+        self.system_factory = system_factory
+        self.assignments = [portable_assignment(assignment) for assignment in assignments]
+        self.plan = portable_plan(plan)
+        self.workers = os.cpu_count() if workers is None else workers
+        self.chunksize = chunksize
+        self.timeout = timeout
+        self.stabilise = stabilise
+        self.simulator_kwargs = dict(simulator_kwargs or {})
+        self.progress = progress
+
+    def __len__(self):
+        return len(self.assignments)
+
+    def __iter__(self):
+        return self.results()
+
+    def _chunks(self):
+        runs = list(enumerate(self.assignments))
+        return [runs[i:i + self.chunksize] for i in range(0, len(runs), self.chunksize)]
+
+    def results(self):
+        """
+        Yields the RunResults as soon as they are available.
+        """
+        args = (self.plan, self.timeout, self.stabilise, self.simulator_kwargs)
+        finished = 0
+        if self.workers == 0:
+            for chunk in self._chunks():
+                for result in _execute_chunk(self.system_factory, chunk, *args):
+                    finished += 1
+                    self._report(finished, result)
+                    yield result
+            return
+
+        with concurrent.futures.ProcessPoolExecutor(max_workers=self.workers) as executor:
+            futures = [executor.submit(_execute_chunk, self.system_factory, chunk, *args) for chunk in self._chunks()]
+            try:
+                for future in concurrent.futures.as_completed(futures):
+                    for result in future.result():
+                        finished += 1
+                        self._report(finished, result)
+                        yield result
+            finally:  # e.g. if the caller stops iterating
+                for future in futures:
+                    future.cancel()
+
+    def _report(self, finished, result):
+        logger.info(f"Sweep: finished run {result.index} ({result.status}) - {finished}/{len(self)}")
+        if self.progress is not None:
+            self.progress(finished, len(self), result)
+
+    def run(self):
+        """
+        Executes all runs.
+
+        Returns
+        -------
+        list of RunResult
+            The results, in the order of the assignments.
+        """
+        return sorted(self.results(), key=lambda result: result.index)
+
+
+def run_sweep(system_factory, assignments, plan=None, **kwargs):
+    """
+    Shortcut for ``Sweep(system_factory, assignments, plan, **kwargs).run()``.
+    """
+    return Sweep(system_factory, assignments, plan, **kwargs).run()
@@ -0,0 +1,160 @@
+"""
+Trace policies decide which values a :class:`~crestdsl.simulation.tracestore.TraceStore` records.
+
+By default, the simulator saves every entity state and every port value
+each time it saves a trace.
+For long simulations this is often much more than needed.
+Pass a policy to the TraceStore to only record a part of it, e.g.::
+
+    store = TraceStore(policy=CombinedPolicy(EveryDelta(5), OnChange()))
+    sim = Simulator(system, record_traces=store)
+"""
+
+from crestdsl.model import Entity, Port
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class TracePolicy(object):
+    """
+    The base policy. It records all entity states and port values every time.
+    Subclasses override :func:`select` and/or :func:`sample`.
+    """
+
+    partial = False
+    """If :func:`sample` can leave out some of the values (then the stores only keep the recorded ones)."""
+
+    def select(self, entities, ports):
+        """
+        Choose the entities and ports whose values can be recorded.
+
+        Parameters
+        ----------
+        entities: list of Entity
+            All entities of the system.
+        ports: list of Port
+            All ports of the system.
+
+        Returns
+        -------
+        tuple
+            A pair of (entities, ports) that should be considered.
+        """
+        return entities, ports
+
+    def sample(self, timestamp, values):
+        """
+        Decide what to record for one trace snapshot.
+
+        Parameters
+        ----------
+        timestamp: numeric
+            The (global) time of the snapshot.
+        values: dict
+            The {entity: state, port: value} map of the selected objects.
+
+        Returns
+        -------
+        dict or None
+            The values that should be recorded, or None if nothing should be recorded.
+        """
+        return values
+
+
+class OnChange(TracePolicy):
+    """
+    Only records the values that changed since they were last recorded.
+    The first snapshot is recorded completely,
+    snapshots without any changes are dropped.
+    """
+
+    partial = True
+
+    def __init__(self):
+        self._last = dict()
+
+    def sample(self, timestamp, values):
+        changed = {key: value for key, value in values.items()
+                   if key not in self._last or not bool(self._last[key] == value)}
+        if len(changed) == 0:
+            return None
+        self._last.update(changed)
+        return changed
+
+
+class EveryNth(TracePolicy):
+    """Records every n-th snapshot, starting with the first one."""
+
+    def __init__(self, n):
+        assert n >= 1, "The decimation factor has to be at least 1"
+        self.n = n
+        self._count = 0
+
+    def sample(self, timestamp, values):
+        record = self._count % self.n == 0
+        self._count += 1
+        return values if record else None
+
+
+class EveryDelta(TracePolicy):
+    """Records a snapshot if at least ``dt`` time units passed since the last recorded one."""
+
+    def __init__(self, dt):
+        assert dt > 0, "The sampling interval has to be positive"
+        self.dt = dt
+        self._last_timestamp = None
+
+    def sample(self, timestamp, values):
+        if self._last_timestamp is not None and timestamp - self._last_timestamp < self.dt:
+            return None
+        self._last_timestamp = timestamp
+        return values
+
+
+class Subset(TracePolicy):
+    """
+    Only records the states of the specified entities and the values of the specified ports.
+    """
+
+    def __init__(self, objects):
+        """
+        Parameters
+        ----------
+        objects: list of Entity and Port
+            The entities (their current state) and ports (their value) that should be recorded.
+        """
+        objects = list(objects)
+        assert all(isinstance(obj, (Entity, Port)) for obj in objects), "Subset can only record entities and ports"
+        self.objects = objects
+
+    def select(self, entities, ports):
+        selected = set(self.objects)
+        return [e for e in entities if e in selected], [p for p in ports if p in selected]
+
+
+class CombinedPolicy(TracePolicy):
+    """
+    Applies several policies one after the other.
+    A policy only sees the values that were accepted by the policies before it,
+    e.g. ``CombinedPolicy(OnChange(), EveryNth(10))`` records every tenth snapshot that contained a change.
+    """
+
+    def __init__(self, *policies):
+        self.policies = policies
+
+    @property
+    def partial(self):
+        return any(policy.partial for policy in self.policies)
+
+    def select(self, entities, ports):
+        for policy in self.policies:
+            entities, ports = policy.select(entities, ports)
+        return entities, ports
+
+    def sample(self, timestamp, values):
+        for policy in self.policies:
+            values = policy.sample(timestamp, values)
+            if values is None:
+                return None
+        return values
@@ -0,0 +1,322 @@
+"""
+Trace sinks stream the rows of a :class:`~crestdsl.simulation.tracestore.TraceStore` to a file,
+so that long simulations don't have to keep their traces in memory.
+
+The columns are named after the path of the port/entity in the system
+(e.g. ``sub.port``, or ``sub.current`` for the state of entity ``sub``),
+so the files can be read by other processes without having the system objects::
+
+    store = TraceStore(sink=ParquetSink("trace.parquet", batch_size=10000))
+    sim = Simulator(system, record_traces=store)
+    sim.advance(1000)
+    store.close()
+    df = read_trace("trace.parquet")
+
+Parquet and Arrow IPC need the ``pyarrow`` package, CSV is written by pandas.
+"""
+
+from crestdsl.model import Entity, Types, get_path_to_attribute, meta
+from crestdsl.config import to_python
+from .epsilon import Epsilon
+
+import os
+import queue
+import threading
+import numbers
+
+import pandas as pd
+
+import logging
+logger = logging.getLogger(__name__)
+
+# the column kinds of the files, based on the port domains
+FLOAT = "float"
+INT = "int"
+BOOL = "bool"
+STRING = "string"
+
+DOMAIN_KINDS = {
+    Types.INT: INT,
+    Types.INTEGER: INT,
+    Types.FLOAT: FLOAT,
+    Types.REAL: FLOAT,
+    Types.BOOL: BOOL,
+    Types.STRING: STRING,
+}
+
+
+def get_column_kind(port):
+    """Returns the kind of file column that can hold the values of a port."""
+    domain = getattr(port.resource, "domain", None)
+    return DOMAIN_KINDS.get(domain, STRING) if isinstance(domain, Types) else STRING
+
+
+def to_file_value(value):
+    """Converts a trace value (State, Epsilon, z3 value, ...) into something that we can write to a file."""
+    if value is None or isinstance(value, (bool, str)):
+        return value
+    if isinstance(value, meta.CrestObject):  # states are written by name
+        return value._name
+    if isinstance(value, Epsilon):
+        return value.to_number()
+    if isinstance(value, numbers.Number):
+        return value
+    return to_python(value)
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+        return pyarrow
+    except ImportError as exc:
+        raise ImportError("Writing and reading Parquet or Arrow traces requires the 'pyarrow' package.") from exc
+
+
+class TraceSink(object):
+    """
+    The base class of all sinks.
+    Rows are handed over in batches and written by a background thread
+    (unless ``background=False``).
+    Subclasses implement :func:`_open_file`, :func:`_write_frame` and :func:`_close_file`
+    (and :func:`_flush_file` if the file can be read while it is still open).
+    """
+
+    readable_while_open = False
+    """If the written rows can be read back before the sink is closed."""
+
+    def __init__(self, path, batch_size=1000, background=True):
+        """
+        Parameters
+        ----------
+        path: str
+            The file that the trace is written to. (It will be overwritten.)
+        batch_size: int
+            How many rows the TraceStore collects before handing them to the sink.
+        background: bool
+            Write the batches in a separate thread, so the simulation doesn't wait for the disk.
+        """
+        assert batch_size >= 1, "The batch size has to be at least 1"
+        self.path = path
+        self.batch_size = batch_size
+        self.background = background
+
+        self.columns = None
+        self.closed = False
+        self._queue = None
+        self._thread = None
+        self._error = None
+
+    def open(self, columns):
+        """
+        Create the file.
+
+        Parameters
+        ----------
+        columns: list of tuple
+            Pairs of (column name, column kind), in the order they should be written.
+        """
+        self.columns = list(columns)
+        self._open_file()
+        if self.background:
+            self._queue = queue.Queue()
+            self._thread = threading.Thread(target=self._run, name=f"TraceSink({self.path})", daemon=True)
+            self._thread.start()
+
+    def write(self, rows):
+        """Write a list of rows (dicts of column name to value)."""
+        if self.closed:
+            raise ValueError(f"The trace sink for {self.path} is already closed.")
+        self._raise_error()
+
+        frame = self._to_frame(rows)
+        if self.background:
+            self._queue.put(frame)
+        else:
+            self._write_frame(frame)
+
+    def flush(self):
+        """Block until all batches that were handed over are written."""
+        if self._queue is not None:
+            self._queue.join()
+        self._raise_error()
+        if self.columns is not None and not self.closed:
+            self._flush_file()
+
+    def close(self):
+        """Write the remaining batches and finalise the file."""
+        if self.closed:
+            return
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+        self.closed = True
+        if self.columns is not None:
+            self._close_file()
+        self._raise_error()
+
+    def read(self):
+        """Read the written trace back as DataFrame (only the batches that were flushed, if the sink is still open)."""
+        if self.columns is None:
+            return pd.DataFrame()
+        if not self.closed and not self.readable_while_open:
+            raise ValueError(f"The trace in {self.path} can only be read after the sink is closed. Call close() first.")
+        return read_trace(self.path)
+
+    def _run(self):
+        while True:
+            frame = self._queue.get()
+            try:
+                if frame is None:
+                    return
+                if self._error is None:  # after an error, we just drain the queue
+                    self._write_frame(frame)
+            except Exception as exc:
+                logger.exception(f"Error while writing trace batch to {self.path}")
+                self._error = exc
+            finally:
+                self._queue.task_done()
+
+    def _raise_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def _to_frame(self, rows):
+        names = [name for name, kind in self.columns]
+        frame = pd.DataFrame([[to_file_value(row.get(name, None)) for name in names] for row in rows], columns=names)
+        for name, kind in self.columns:
+            if kind == FLOAT:
+                frame[name] = frame[name].astype("float64")
+            elif kind == INT and frame[name].isna().any():
+                frame[name] = frame[name].astype("Int64")  # nullable ints, so we don't lose precision
+            elif kind == INT:
+                frame[name] = frame[name].astype("int64")
+            else:
+                frame[name] = frame[name].astype(object)
+        return frame
+
+    def _open_file(self):
+        raise NotImplementedError()
+
+    def _write_frame(self, frame):
+        raise NotImplementedError()
+
+    def _close_file(self):
+        raise NotImplementedError()
+
+    def _flush_file(self):
+        pass
+
+
+class CSVSink(TraceSink):
+    """Writes the trace as comma separated values. The file can be read while the trace is written."""
+
+    readable_while_open = True
+
+    def _open_file(self):
+        self._file = open(self.path, "w", newline="")
+        pd.DataFrame(columns=[name for name, kind in self.columns]).to_csv(self._file, index=False)
+
+    def _write_frame(self, frame):
+        frame.to_csv(self._file, header=False, index=False)
+
+    def _flush_file(self):
+        self._file.flush()
+
+    def _close_file(self):
+        self._file.close()
+
+
+class _ArrowSink(TraceSink):
+
+    def _arrow_schema(self):
+        pa = _import_pyarrow()
+        types = {FLOAT: pa.float64(), INT: pa.int64(), BOOL: pa.bool_(), STRING: pa.string()}
+        return pa.schema([(name, types[kind]) for name, kind in self.columns])
+
+    def _to_table(self, frame):
+        pa = _import_pyarrow()
+        for name, kind in self.columns:
+            if kind == STRING:  # e.g. list domains, allow any value
+                frame[name] = [None if val is None else str(val) for val in frame[name]]
+        return pa.Table.from_pandas(frame, schema=self._schema, preserve_index=False)
+
+
+class ParquetSink(_ArrowSink):
+    """Writes the trace as Parquet file (each batch becomes a row group). Requires pyarrow."""
+
+    def _open_file(self):
+        pa = _import_pyarrow()
+        self._schema = self._arrow_schema()
+        self._writer = pa.parquet.ParquetWriter(self.path, self._schema)
+
+    def _write_frame(self, frame):
+        self._writer.write_table(self._to_table(frame))
+
+    def _close_file(self):
+        self._writer.close()
+
+
+class ArrowSink(_ArrowSink):
+    """Writes the trace in the Arrow IPC file format. Requires pyarrow."""
+
+    def _open_file(self):
+        pa = _import_pyarrow()
+        self._schema = self._arrow_schema()
+        self._sink = pa.OSFile(self.path, "wb")
+        self._writer = pa.ipc.new_file(self._sink, self._schema)
+
+    def _write_frame(self, frame):
+        self._writer.write_table(self._to_table(frame))
+
+    def _close_file(self):
+        self._writer.close()
+        self._sink.close()
+
+
+SINK_FORMATS = {
+    ".csv": CSVSink,
+    ".parquet": ParquetSink,
+    ".arrow": ArrowSink,
+    ".feather": ArrowSink,
+}
+
+
+def read_trace(path):
+    """
+    Read a trace file that was written by a sink.
+    Parquet and Arrow files are memory-mapped (Arrow IPC files are then converted without reading them first).
+
+    Parameters
+    ----------
+    path: str
+        The trace file. The format is chosen by the file extension.
+
+    Returns
+    -------
+    pandas.DataFrame
+        The trace data, with one column per path.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in SINK_FORMATS:
+        raise ValueError(f"Don't know how to read trace file {path}. Supported extensions are {list(SINK_FORMATS.keys())}")
+
+    sink_class = SINK_FORMATS[extension]
+    if sink_class is CSVSink:
+        return pd.read_csv(path, memory_map=True)
+
+    pa = _import_pyarrow()
+    if sink_class is ParquetSink:
+        return pa.parquet.read_table(path, memory_map=True).to_pandas()
+
+    with pa.memory_map(path, "r") as source:
+        return pa.ipc.open_file(source).read_all().to_pandas()
+
+
+def get_column_name(root_entity, obj):
+    """The file column name of an entity's state or a port: the path from the root."""
+    path = get_path_to_attribute(root_entity, obj)
+    if isinstance(obj, Entity):
+        return f"{path}.{meta.CURRENT_IDENTIFIER}" if path != "" else meta.CURRENT_IDENTIFIER
+    return path
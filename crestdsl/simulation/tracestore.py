@@ -1,9 +1,15 @@
-from crestdsl.model import Port, Entity, get_all_ports, get_all_entities, get_states
+from crestdsl.model import Port, Entity, Types, get_all_ports, get_all_entities, get_states
 import numbers
+from collections import deque
 from collections.abc import Iterable
 
+import numpy as np
 import pandas as pd
 
+from .tracepolicy import TracePolicy
+from . import tracesink
+from .tracesink import get_column_name, get_column_kind
+
 
 import logging
 logger = logging.getLogger(__name__)
@@ -13,46 +19,100 @@ TIMESTAMP = "timestamp"
 
 class TraceStore(object):
 
-    def __init__(self):
-        # self.datastore = dict()
-        self._data = []
+    def __init__(self, policy=None, maxlen=None, sink=None):
+        """
+        Parameters
+        ----------
+        policy: TracePolicy
+            Decides which values are recorded when the simulator saves a trace.
+            By default, every entity state and port value is recorded every time.
+        maxlen: int
+            If set, only the last ``maxlen`` rows are kept (ring buffer).
+        sink: TraceSink
+            If set, the rows are written to the sink's file in batches
+            instead of being kept in memory.
+        """
+        assert sink is None or maxlen is None, "A trace can either be written to a sink or kept in a ring buffer"
+        self.policy = policy if policy is not None else TracePolicy()
+        self.maxlen = maxlen
+        self.sink = sink
+        self._data = deque(maxlen=maxlen)
         self._df = None
+        self._column_names = None
 
     @property
     def data(self):
-        as_df = pd.DataFrame(self._data) # merge data into df
-        
-        if self._df is not None:
-            as_df = pd.concat([self._df, as_df], ignore_index=True)
-        self._df = as_df
-        
-        return as_df
-        
-        newData = pd.concat(self._data, ignore_index=True)
-        self._data = [newData]  # make sure we dont' have to cancat this again
-        return newData
+        if self.sink is not None:  # read back what is written so far, the recording can continue
+            self.flush()
+            self.sink.flush()
+            return self.sink.read()
+
+        if self.maxlen is not None:  # the deque drops old rows, so we cannot cache them in the df
+            return pd.DataFrame(list(self._data))
+
+        if len(self._data) > 0 or self._df is None:
+            as_df = pd.DataFrame(list(self._data))  # merge data into df
+            if self._df is not None:
+                as_df = pd.concat([self._df, as_df], ignore_index=True, sort=False)
+            self._df = as_df
+            self._data.clear()  # make sure we don't have to concat this again
+
+        return self._df
 
     def add_data(self, data):
         self._data.append(data)
 
     def save_multiple(self, timestamp, data):
-        # for key, val in data.items():
-        #     self.save(key, timestamp, val)
+        if self.sink is not None:
+            self._save_to_sink(timestamp, data)
+            return
+
+        row = {TIMESTAMP: timestamp}
+        row.update(data)
+        self._data.append(row)
+
+    def _open_sink(self, root_entity, entities, ports):
+        self._column_names = {obj: get_column_name(root_entity, obj) for obj in list(entities) + list(ports)}
+        columns = [(TIMESTAMP, tracesink.FLOAT)]
+        columns.extend((self._column_names[entity], tracesink.STRING) for entity in entities)
+        columns.extend((self._column_names[port], get_column_kind(port)) for port in ports)
+        self.sink.open(columns)
 
-        data.update({"timestamp": timestamp})
-        self._data.append(pd.DataFrame(data, index=[0]))
+    def _save_to_sink(self, timestamp, data):
+        if self._column_names is None:
+            raise ValueError("The sink's columns are created by save_entity. Record a system before saving single values.")
+        if self.sink.closed:
+            raise ValueError(f"The trace sink for {self.sink.path} is already closed.")
+
+        row = {TIMESTAMP: timestamp}
+        row.update({self._column_names[key]: value for key, value in data.items()})
+        self._data.append(row)
+        if len(self._data) >= self.sink.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Hand the collected rows over to the sink (if there is one)."""
+        if self.sink is not None and len(self._data) > 0:
+            self.sink.write(list(self._data))
+            self._data.clear()
+
+    def close(self):
+        """Write the remaining rows and close the sink (if there is one)."""
+        if self.sink is not None and not self.sink.closed:
+            self.flush()
+            self.sink.close()
 
     def save_entity(self, root_entity, timestamp):
-        data = {"timestamp": timestamp}
-        data.update({entity: entity.current for entity in get_all_entities(root_entity)})
-        data.update({port: port.value for port in get_all_ports(root_entity)})
-        # print(self.data.shape)
-        # try:
-        self._data.append(data)
-        # except:
-        #     breakpoint()
-        #     pass
-        # print(self.data.shape)
+        entities, ports = self.policy.select(get_all_entities(root_entity), get_all_ports(root_entity))
+        if self.sink is not None and self._column_names is None:
+            self._open_sink(root_entity, entities, ports)
+
+        values = {entity: entity.current for entity in entities}
+        values.update({port: port.value for port in ports})
+
+        values = self.policy.sample(timestamp, values)
+        if values is not None:
+            self.save_multiple(timestamp, values)
 
     def plot(self, traces=None):
         try:
@@ -70,3 +130,351 @@ class TraceStore(object):
                 width=.5,zerolinecolor="black")
         except ImportError as exc:
             logger.exception("It appears there was a problem during plotting.")
+
+
+""" - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - """
+""" columnar backend """
+
+# numpy dtypes for the port domains that can be stored unboxed
+DOMAIN_DTYPES = {
+    Types.INT: np.int64,
+    Types.INTEGER: np.int64,
+    Types.FLOAT: np.float64,
+    Types.REAL: np.float64,
+    Types.BOOL: np.bool_,
+}
+
+# the initial capacity of the columns that only store the recorded values (they grow as needed)
+SPARSE_CAPACITY = 16
+
+# the python types we accept for each unboxed column without a second thought
+_ACCEPTED_TYPES = {
+    np.dtype(np.int64): (int,),
+    np.dtype(np.float64): (float, int),
+    np.dtype(np.bool_): (bool,),
+}
+
+
+def _ordered(array, length, start, copy=False):
+    """The first ``length`` entries of the (ring buffer) array, starting with the oldest one at ``start``."""
+    if start == 0:
+        return array[:length].copy() if copy else array[:length]
+    # the ring buffer wrapped around, the oldest row is at start
+    return np.concatenate((array[start:length], array[:start]))
+
+
+def _grow(array, capacity):
+    grown = np.empty(capacity, dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+class _Column(object):
+    """A growable, preallocated array that holds the values of one trace column."""
+
+    def __init__(self, dtype, capacity):
+        self.values = np.empty(capacity, dtype=dtype)
+        self.accepted = _ACCEPTED_TYPES.get(self.values.dtype, None)
+        self.missing = None  # marks the rows without value, created when the first value is missing
+
+    def set(self, row, value):
+        # bool is a subclass of int, so compare the exact type
+        if self.accepted is not None and type(value) not in self.accepted:
+            self.to_object()
+        try:
+            self.values[row] = value
+        except (OverflowError, TypeError, ValueError):
+            self.to_object()
+            self.values[row] = value
+        if self.missing is not None:
+            self.missing[row] = False  # the ring buffer reuses rows
+
+    def set_missing(self, row):
+        # a separate mask instead of NaN/None, so the column keeps its dtype
+        if self.missing is None:
+            self.missing = np.zeros(len(self.values), dtype=np.bool_)
+        self.missing[row] = True
+
+    def to_object(self):
+        """Upcast to object, e.g. when an int port suddenly holds a z3 value or an Epsilon."""
+        if self.values.dtype != object:
+            logger.debug(f"Upcasting trace column of dtype {self.values.dtype} to object")
+            self.values = self.values.astype(object)
+            self.accepted = None
+
+    def grow(self, capacity):
+        self.values = _grow(self.values, capacity)
+        if self.missing is not None:
+            self.missing = _grow(self.missing, capacity)
+
+    def view(self, length, start=0, copy=False):
+        missing = _ordered(self.missing, length, start, copy) if self.missing is not None else None
+        return self.series(_ordered(self.values, length, start, copy), missing)
+
+    def series(self, values, missing=None):
+        """The values as pandas Series. Missing values become NA (ints and bools use pandas' nullable types)."""
+        if missing is None or not missing.any():
+            # explicit dtype, so that pandas doesn't infer (and copy) object columns
+            return pd.Series(values, dtype=values.dtype, copy=False)
+        if values.dtype == np.int64:
+            return pd.Series(pd.arrays.IntegerArray(values, missing), copy=False)
+        if values.dtype == np.bool_:
+            return pd.Series(pd.arrays.BooleanArray(values, missing), copy=False)
+
+        values = values.copy()
+        values[missing] = np.nan if values.dtype == np.float64 else None
+        return pd.Series(values, dtype=values.dtype, copy=False)
+
+
+class _StateColumn(_Column):
+    """Stores an entity's current state as small-int code into the list of the entity's states."""
+
+    def __init__(self, entity, capacity):
+        super().__init__(np.int8, capacity)
+        self.categories = list(get_states(entity))
+        self.codes = {state: idx for idx, state in enumerate(self.categories)}
+        self._widen()
+
+    def _widen(self):
+        # use the same code width as pandas, so the Categorical can use our array directly
+        while len(self.categories) > np.iinfo(self.values.dtype).max:
+            wider = {np.dtype(np.int8): np.int16, np.dtype(np.int16): np.int32}[self.values.dtype]
+            self.values = self.values.astype(wider)
+
+    def set(self, row, value):
+        if value is None:
+            self.values[row] = -1
+            return
+
+        code = self.codes.get(value, None)
+        if code is None:  # a state that was added after the schema was created
+            code = len(self.categories)
+            self.categories.append(value)
+            self.codes[value] = code
+            self._widen()
+        self.values[row] = code
+
+    def set_missing(self, row):
+        self.values[row] = -1
+
+    def series(self, values, missing=None):
+        if missing is not None and missing.any():
+            values = values.copy()
+            values[missing] = -1
+        return pd.Series(pd.Categorical.from_codes(values, categories=self.categories), copy=False)
+
+
+class _SparseColumn(object):
+    """
+    Only keeps the rows that have a value, as (row number, value) pairs in the order of the rows.
+    Used for policies that record few values per row (see :attr:`TracePolicy.partial`),
+    so the memory grows with the recorded values, not with the rows times all columns.
+    """
+
+    def __init__(self, column):
+        self.column = column  # the values
+        self.rows = np.empty(len(column.values), dtype=np.int64)
+        self.count = 0
+
+    def set(self, row, value, first=0):
+        """
+        Parameters
+        ----------
+        row: int
+            The row's number, counted from the first recorded row (including the ones the ring buffer dropped).
+        first: int
+            The number of the oldest row that is still stored, the values of older rows can be dropped.
+        """
+        if self.count == len(self.rows):
+            self._compact(first)
+        if self.count == len(self.rows):
+            self.rows = _grow(self.rows, 2 * len(self.rows))
+            self.column.grow(len(self.rows))
+
+        self.rows[self.count] = row
+        self.column.set(self.count, value)
+        self.count += 1
+
+    def _compact(self, first):
+        dropped = np.searchsorted(self.rows[:self.count], first)
+        if dropped > 0:
+            kept = self.count - dropped
+            self.rows[:kept] = self.rows[dropped:self.count]
+            self.column.values[:kept] = self.column.values[dropped:self.count]
+            self.count = kept
+
+    def view(self, length, first=0):
+        rows = self.rows[:self.count]
+        dropped = np.searchsorted(rows, first)
+        positions = rows[dropped:] - first
+
+        values = np.empty(length, dtype=self.column.values.dtype)
+        values[positions] = self.column.values[dropped:self.count]
+        missing = np.ones(length, dtype=np.bool_)
+        missing[positions] = False
+        return self.column.series(values, missing)
+
+
+class ColumnarTraceStore(TraceStore):
+    """
+    A TraceStore that keeps each trace column in its own preallocated numpy array.
+
+    The column schema (timestamp, plus the entities and ports selected by the policy) is fixed
+    the first time a row is recorded.
+    Port values are stored unboxed if the port's domain allows it,
+    entity states are stored as small-int codes.
+    Appending a row is amortised O(1) (the arrays double their capacity when full)
+    and ``data`` returns a DataFrame on top of the arrays, without copying the values.
+    If ``maxlen`` is set, the arrays are allocated once and used as ring buffer
+    (then ``data`` copies the values, since the buffer's rows are overwritten).
+    Missing values are marked in a mask, so the columns keep their dtype.
+    If the policy is ``partial`` (e.g. :class:`OnChange`), the port and state columns only store the recorded values.
+    """
+
+    def __init__(self, initial_capacity=1024, policy=None, maxlen=None):
+        super().__init__(policy=policy, maxlen=maxlen)
+        self._capacity = maxlen if maxlen is not None else max(1, initial_capacity)
+        self._length = 0
+        self._start = 0  # index of the oldest row, once the ring buffer is full
+        self._written = 0  # the number of rows recorded so far, including those that the ring buffer dropped
+        self._columns = None
+        self._df = None
+
+    def _create_schema(self, root_entity):
+        self._timestamps = _Column(np.float64, self._capacity)
+        entities, ports = self.policy.select(get_all_entities(root_entity), get_all_ports(root_entity))
+        self._entities = list(entities)
+        self._ports = list(ports)
+
+        self._sparse = self.policy.partial  # only store the values that the policy records
+        capacity = SPARSE_CAPACITY if self._sparse else self._capacity
+        columns = {entity: _StateColumn(entity, capacity) for entity in self._entities}
+        for port in self._ports:
+            domain = getattr(port.resource, "domain", None)
+            dtype = DOMAIN_DTYPES.get(domain, object) if isinstance(domain, Types) else object
+            columns[port] = _Column(dtype, capacity)
+
+        # the columns that have a value in every row
+        self._dense = [self._timestamps] if self._sparse else [self._timestamps] + list(columns.values())
+        if self._sparse:
+            columns = {key: _SparseColumn(column) for key, column in columns.items()}
+        self._columns = {TIMESTAMP: self._timestamps}
+        self._columns.update(columns)
+
+    def _next_row(self):
+        self._df = None  # invalidate the cached view
+        self._written += 1
+        if self._length == self._capacity:
+            if self.maxlen is not None:  # overwrite the oldest row
+                row = self._start
+                self._start = (self._start + 1) % self._capacity
+                return row
+
+            self._capacity *= 2
+            for column in self._dense:
+                column.grow(self._capacity)
+        row = self._length
+        self._length += 1
+        return row
+
+    def __len__(self):
+        return self._length
+
+    @property
+    def data(self):
+        if self._columns is None:
+            return pd.DataFrame()
+
+        if self._df is None:
+            self._df = pd.DataFrame(
+                {key: self._view(column) for key, column in self._columns.items()},
+                columns=list(self._columns.keys()), copy=False)
+        return self._df
+
+    def _view(self, column):
+        if isinstance(column, _SparseColumn):
+            return column.view(self._length, self._written - self._length)
+        copy = self.maxlen is not None  # the ring buffer overwrites its rows, the data must not change with it
+        return column.view(self._length, self._start, copy)
+
+    def add_data(self, data):
+        data = dict(data)
+        timestamp = data.pop(TIMESTAMP)
+        self.save_multiple(timestamp, data)
+
+    def save_multiple(self, timestamp, data):
+        if self._columns is None:
+            raise ValueError("The columnar trace schema is created by save_entity. Record a system before saving single values.")
+
+        unknown = [key for key in data if key not in self._columns]
+        if len(unknown) > 0:
+            raise KeyError(f"The trace schema has no columns for {unknown}")
+
+        self._write_row(timestamp, data)
+
+    def _write_row(self, timestamp, data):
+        row = self._next_row()
+        self._timestamps.set(row, timestamp)
+        if self._sparse:
+            number, first = self._written - 1, self._written - self._length
+            for key, value in data.items():
+                self._columns[key].set(number, value, first)
+            return
+
+        for key in self._entities + self._ports:
+            if key in data:
+                self._columns[key].set(row, data[key])
+            else:
+                self._columns[key].set_missing(row)
+
+    def save_entity(self, root_entity, timestamp):
+        if self._columns is None:
+            self._create_schema(root_entity)
+
+        if type(self.policy) is not TracePolicy:  # let the policy decide what to write
+            values = {entity: getattr(entity, "current", None) for entity in self._entities}
+            values.update({port: port.value for port in self._ports})
+            values = self.policy.sample(timestamp, values)
+            if values is not None:
+                self._write_row(timestamp, values)
+            return
+
+        row = self._next_row()
+        columns = self._columns
+        self._timestamps.set(row, timestamp)
+        for entity in self._entities:
+            columns[entity].set(row, getattr(entity, "current", None))
+        for port in self._ports:
+            columns[port].set(row, port.value)
+
+
+TRACE_BACKENDS = {
+    "dict": TraceStore,
+    "columnar": ColumnarTraceStore,
+}
+"""The trace backends that can be selected by name in the simulators' ``record_traces`` parameter."""
+
+
+def create_tracestore(record_traces):
+    """
+    Create the TraceStore for a simulator's ``record_traces`` parameter.
+
+    Parameters
+    ----------
+    record_traces: bool or str or TraceStore
+        ``True`` and ``False`` create the default store,
+        a string selects one of the ``TRACE_BACKENDS`` by name
+        and a TraceStore object is used as it is.
+
+    Returns
+    -------
+    TraceStore
+        The object that the simulator should record its traces in.
+    """
+    if isinstance(record_traces, TraceStore):
+        return record_traces
+    if isinstance(record_traces, str):
+        if record_traces not in TRACE_BACKENDS:
+            raise ValueError(f"Unknown trace backend '{record_traces}'. Choose one of {list(TRACE_BACKENDS.keys())}.")
+        return TRACE_BACKENDS[record_traces]()
+    return TraceStore()
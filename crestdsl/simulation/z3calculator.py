@@ -2,6 +2,7 @@ from crestdsl.config import config
 from crestdsl.model import Types, get_all_entities, get_all_influences, get_all_updates, Influence, get_path_to_attribute
 from crestdsl import sourcehelper as SH
 from .to_z3 import Z3Converter, get_z3_variable, get_z3_value, get_z3_var
+from .constraintcache import get_constraint_cache, constraint_key, MODIFIER
 import z3
 
 from pprint import pformat
@@ -45,7 +46,7 @@ class Z3Calculator(object):
     def get_modifier_map(self, port_list, cache=True):
         return get_modifier_map(self.entity, port_list, cache=cache)
 
-    def get_z3_vars(self, modifier_map, cache=True):
+    def get_z3_vars(self, modifier_map, cache=True, pre_values=True):
         constraints = []
         z3_vars = {}
 
@@ -78,9 +79,10 @@ class Z3Calculator(object):
                 portname_with_parent + ".pre": pre_var,
             }
 
-            pre_value = get_z3_value(port, port._name + "_0")
-            # pre_var = z3_vars[port][port._name + "_0"]
-            constraints.append(pre_var == pre_value)  # init condition needs to be set
+            if pre_values:
+                pre_value = get_z3_value(port, port._name + "_0")
+                # pre_var = z3_vars[port][port._name + "_0"]
+                constraints.append(pre_var == pre_value)  # init condition needs to be set
 
             if len(modifiers) == 0:
                 # if it is not influenced by anything, add this as a constraint
@@ -89,6 +91,10 @@ class Z3Calculator(object):
 
         return constraints, z3_vars
 
+    def get_pre_value_constraints(self, modifier_map, z3_vars):
+        """The constraints that set the ports' pre variables to their current values."""
+        return [z3_vars[port][port._name + "_0"] == get_z3_value(port, port._name + "_0") for port in modifier_map]
+
 def get_modifier_map(root_entity, port_list, cache=True):
     """Creates a dict that has ports as keys and a list of influences/updates that influence those ports as values."""
 
@@ -147,6 +153,15 @@ def get_constraints_from_modifier(modifier, z3_vars, use_integer_and_real, cache
         logger.debug("serving constraints for {modifier._name} {modifier} from cache")
         return modifier._cached_z3_constraints
 
+    persistent_cache = get_constraint_cache() if cache else None
+    if persistent_cache is not None:
+        key = constraint_key(modifier, MODIFIER, use_integer_and_real, z3_vars['dt'].type)
+        cached = persistent_cache.load(key, modifier, z3_vars)
+        if cached is not None:
+            logger.debug(f"serving constraints for {modifier._name} {modifier} from the persistent cache")
+            modifier._cached_z3_constraints = cached[1]
+            return modifier._cached_z3_constraints
+
     conv = Z3Converter(z3_vars, entity=modifier._parent, container=modifier, use_integer_and_real=use_integer_and_real)
     conv.target = modifier.target  # the target of the influence/update
 
@@ -189,6 +204,8 @@ def get_constraints_from_modifier(modifier, z3_vars, use_integer_and_real, cache
         constraints.extend(modifierconstraints)  # it's a list here
 
     modifier._cached_z3_constraints = constraints  # save for later re-use
+    if persistent_cache is not None:
+        persistent_cache.store(key, modifier, z3_vars, constraints)
     return constraints
     
 def prettify_modifier_map(modifier_map):
@@ -3,7 +3,7 @@ from . import tctl
 from .normalform import normalform
 from .simplify import simplify
 
-from .statespace import StateSpace
+from .statespace import StateSpace, StateSpaceCache
 
 from .verifier import *
 from .modelchecker import ModelChecker
@@ -0,0 +1,310 @@
+"""
+Stores explored state spaces on disk (see :func:`StateSpace.save` and :func:`StateSpace.load`).
+
+A state space file is a numpy ``.npz`` archive of flat arrays, no pickled objects:
+
+- ``nodes``: one row per node, one column per entry of the nodes' encoding (see StateLayout).
+  Each column refers to a pool of the distinct values of that column.
+  The columns are identified by the path of their entity or port (e.g. ``heater.temp``),
+  so a state space can be loaded into any instance of the same system.
+- ``explored``, ``edge_source``, ``edge_target``, ``edge_weight``, ``edge_transitions``:
+  the explored flags and the edges (weights and transition paths also refer to value pools).
+- ``arrival``, ``expanded``, ``frontier_nodes``, ``frontier_times``:
+  the progress of :func:`StateSpace.explore_until_time`, so it can be resumed.
+- ``meta``: a JSON string with the column paths, the value pools, the root node and the node labels.
+"""
+
+from .statespace import SystemState, EXPLORED, MISSING, get_layout, _time_key
+from crestdsl.simulation.epsilon import Epsilon
+import crestdsl.model as model
+
+import gc
+import os
+import json
+import heapq
+import operator
+import itertools
+import tempfile
+import contextlib
+
+import numpy as np
+
+import logging
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+
+
+def _encode_value(value):
+    """Makes a value JSON-serializable, without mixing up 1, 1.0 and True."""
+    if value is MISSING:
+        return {"missing": True}
+    if isinstance(value, Epsilon):
+        return {"epsilon": [_encode_value(value.numeric), _encode_value(value.epsilon)]}
+    if isinstance(value, (bool, str)) or value is None:
+        return value
+    if isinstance(value, (int, float)):
+        return value
+    if isinstance(value, np.generic):
+        return _encode_value(value.item())
+    raise TypeError(f"Cannot store values of type {type(value)} in a state space file")
+
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        if "missing" in value:
+            return MISSING
+        numeric, epsilon = value["epsilon"]
+        return Epsilon(_decode_value(numeric), _decode_value(epsilon))
+    return value
+
+
+class _Pool(object):
+    """The distinct values of a column. Values are referred to by their index."""
+
+    def __init__(self):
+        self.values = []
+        self.codes = {}
+
+    def code(self, value):
+        key = (type(value), value) if type(value) is not Epsilon else (Epsilon, _time_key(value))
+        code = self.codes.get(key)
+        if code is None:
+            code = self.codes[key] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def code_all(self, values):
+        """The codes of many (hashable, non-Epsilon) values."""
+        codes, pool = self.codes, self.values
+        result = []
+        for value in values:
+            key = (type(value), value)
+            code = codes.get(key)
+            if code is None:
+                code = codes[key] = len(pool)
+                pool.append(value)
+            result.append(code)
+        return result
+
+    def encode(self):
+        return [_encode_value(value) for value in self.values]
+
+
+def _layout_paths(system):
+    layout = get_layout(system)
+    entities = [model.get_path_to_attribute(system, entity) for entity in layout.entities]
+    states = [[state._name for state in states] for states in layout.states]
+    ports = [model.get_path_to_attribute(system, port) for port in layout.ports]
+    return layout, entities, states, ports
+
+
+@contextlib.contextmanager
+def _gc_paused():
+    """Creating millions of objects triggers the cyclic garbage collector over and over (it doesn't find anything)."""
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def _int_array(values):
+    return np.array(values, dtype=np.int64).astype(np.int32 if len(values) < 2**31 else np.int64)
+
+
+def save_statespace(statespace, path):
+    """
+    Writes the state space to a file. The file is replaced atomically.
+
+    Parameters
+    ----------
+    statespace: StateSpace
+        The state space to store.
+    path: str
+        The file name.
+    """
+    with _gc_paused():
+        _save(statespace, path)
+
+
+def _save(statespace, path):
+    system = statespace.graph["system"]
+    layout, entity_paths, state_names, port_paths = _layout_paths(system)
+    node_data = statespace._node  # the NodeDataViews are slow for millions of nodes
+    nodes = list(node_data)
+    index = {node: i for i, node in enumerate(nodes)}
+
+    columns = len(nodes[0].key) if nodes else 0
+    pools = [_Pool() for _ in range(columns)]
+    node_codes = np.empty((len(nodes), columns), dtype=np.int32)
+    for column, (pool, values) in enumerate(zip(pools, zip(*[node.key for node in nodes]))):
+        node_codes[:, column] = pool.code_all(values)
+
+    times = _Pool()
+    transition_pool = _Pool()
+    transition_paths = {}  # id(transition) -> path
+    sources, targets, weights, transitions = [], [], [], []
+    for source, successors in statespace.adjacency():
+        source_index = index[source]
+        for target, data in successors.items():
+            sources.append(source_index)
+            targets.append(index[target])
+            weights.append(times.code(data["weight"]))
+            paths = []
+            for transition in data.get("transitions", []):
+                transition_path = transition_paths.get(id(transition))
+                if transition_path is None:
+                    transition_path = transition_paths[id(transition)] = model.get_path_to_attribute(system, transition)
+                paths.append(transition_path)
+            transitions.append(transition_pool.code(tuple(paths)))
+
+    arrays = dict(
+        nodes=node_codes,
+        explored=np.array([bool(data.get(EXPLORED, False)) for data in node_data.values()], dtype=bool),
+        edge_source=_int_array(sources),
+        edge_target=_int_array(targets),
+        edge_weight=_int_array(weights),
+        edge_transitions=_int_array(transitions),
+    )
+
+    # the progress of explore_until_time (only if it's up to date)
+    frontier_saved = getattr(statespace, "_frontier_edges", None) == statespace.number_of_edges()
+    if frontier_saved:
+        arrays["arrival"] = _int_array([times.code(statespace._arrival[node]) if node in statespace._arrival else -1 for node in nodes])
+        arrays["expanded"] = np.array([node in statespace._expanded for node in nodes], dtype=bool)
+        # outdated entries (a faster path was found later) are left out
+        frontier = [node for key, _, node in statespace._frontier if key == _time_key(statespace._arrival[node])]
+        arrays["frontier_nodes"] = _int_array([index[node] for node in frontier])
+        arrays["frontier_times"] = _int_array([times.code(statespace._arrival[node]) for node in frontier])
+
+    meta = dict(
+        version=FORMAT_VERSION,
+        entities=entity_paths,
+        states=state_names,
+        ports=port_paths,
+        pools=[pool.encode() for pool in pools],
+        times=times.encode(),
+        transitions=[list(paths) for paths in transition_pool.values],
+        root=index.get(statespace.graph.get("root"), -1),
+        labels={str(i): data["label"] for i, data in enumerate(node_data.values()) if data.get("label") is not None},
+        frontier=frontier_saved,
+    )
+    arrays["meta"] = np.array(json.dumps(meta))
+
+    directory = os.path.dirname(os.path.abspath(path))
+    handle, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(handle, "wb") as statespacefile:
+            np.savez_compressed(statespacefile, **arrays)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    logger.info(f"Saved state space with {len(nodes)} nodes and {len(sources)} edges to {path}")
+
+
+def _column_pools(meta, system):
+    """The value pools in the order of the system's layout (states are translated from names to indices)."""
+    layout, entity_paths, state_names, port_paths = _layout_paths(system)
+    if sorted(entity_paths) != sorted(meta["entities"]) or sorted(port_paths) != sorted(meta["ports"]):
+        raise ValueError("The state space was saved for a different system (the entities or ports differ).")
+
+    saved_entities = {path: i for i, path in enumerate(meta["entities"])}
+    saved_ports = {path: i for i, path in enumerate(meta["ports"])}
+    n_entities, n_ports = len(meta["entities"]), len(meta["ports"])
+
+    columns, pools = [], []
+    for path, names in zip(entity_paths, state_names):
+        column = saved_entities[path]
+        indices = {name: i for i, name in enumerate(names)}
+        try:
+            pools.append([indices[meta["states"][column][code]] for code in meta["pools"][column]])
+        except KeyError as exc:
+            raise ValueError(f"The state space was saved for a different system (entity '{path}' has no state {exc}).")
+        columns.append(column)
+    for offset in [n_entities, n_entities + n_ports]:  # port values, then pre values
+        for path in port_paths:
+            column = offset + saved_ports[path]
+            pools.append([_decode_value(value) for value in meta["pools"][column]])
+            columns.append(column)
+    return columns, pools
+
+
+def _object_array(values):
+    array = np.empty(len(values), dtype=object)
+    array[:] = values
+    return array
+
+
+def load_statespace(path, system, statespace_class):
+    """
+    Reads a state space file.
+
+    Parameters
+    ----------
+    path: str
+        The file name.
+    system: Entity
+        The system that the nodes should refer to.
+        This has to be an instance of the system that was explored.
+    statespace_class: type
+        The class of the created state space (a StateSpace subclass).
+
+    Returns
+    -------
+    StateSpace
+        The state space, ready to be explored further.
+    """
+    with _gc_paused():
+        return _load(path, system, statespace_class)
+
+
+def _load(path, system, statespace_class):
+    with np.load(path, allow_pickle=False) as archive:
+        arrays = {name: archive[name] for name in archive.files}
+    meta = json.loads(arrays["meta"].item())
+    if meta["version"] != FORMAT_VERSION:
+        raise ValueError(f"Unsupported state space file version {meta['version']}")
+
+    node_codes = arrays["nodes"]
+    if len(node_codes):
+        columns, pools = _column_pools(meta, system)
+        values = [_object_array(pool)[node_codes[:, column]].tolist() for column, pool in zip(columns, pools)]
+        nodes = SystemState.from_keys(system, zip(*values))
+    else:
+        nodes = []
+
+    statespace = statespace_class()
+    statespace.graph["system"] = system
+    if meta["root"] >= 0:
+        statespace.graph["root"] = nodes[meta["root"]]
+
+    # fill networkx's adjacency dicts directly, add_nodes_from/add_edges_from are too slow for millions of nodes
+    node_data, successors, predecessors = statespace._node, statespace._succ, statespace._pred
+    node_data.update({node: {EXPLORED: explored} for node, explored in zip(nodes, arrays["explored"].tolist())})
+    successors.update({node: {} for node in nodes})
+    predecessors.update({node: {} for node in nodes})
+    for i, label in meta["labels"].items():
+        node_data[nodes[int(i)]]["label"] = label
+
+    times = [_decode_value(value) for value in meta["times"]]
+    transitions = [[operator.attrgetter(p)(system) for p in paths] for paths in meta["transitions"]]
+    for source, target, weight, trans in zip(arrays["edge_source"].tolist(), arrays["edge_target"].tolist(),
+                                             arrays["edge_weight"].tolist(), arrays["edge_transitions"].tolist()):
+        source, target = nodes[source], nodes[target]
+        successors[source][target] = predecessors[target][source] = {"weight": times[weight], "transitions": list(transitions[trans])}
+
+    if meta["frontier"]:
+        statespace._arrival = {node: times[code] for node, code in zip(nodes, arrays["arrival"].tolist()) if code >= 0}
+        statespace._expanded = {node for node, expanded in zip(nodes, arrays["expanded"].tolist()) if expanded}
+        statespace._frontier = [(_time_key(times[code]), i, nodes[node])
+                                for i, (node, code) in enumerate(zip(arrays["frontier_nodes"].tolist(), arrays["frontier_times"].tolist()))]
+        heapq.heapify(statespace._frontier)
+        statespace._frontier_counter = itertools.count(len(statespace._frontier))
+        statespace._frontier_edges = len(arrays['edge_source'])
+
+    logger.info(f"Loaded state space with {len(nodes)} nodes and {len(arrays['edge_source'])} edges from {path}")
+    return statespace
@@ -4,6 +4,7 @@ import itertools
 import operator
 import networkx as nx
 import copy
+import numpy as np
 from functools import reduce
 
 from crestdsl.caching import Cache
@@ -15,7 +16,8 @@ from .small_normalform import small_normalform
 from .alpha_beta import alpha, beta
 from .simplify import simplify
 
-from .pointwise import PointwiseModelChecker, CREST_PROPS
+from .pointwise import PointwiseModelChecker, CREST_PROPS, memoized
+from .gammachains import GammaChains
 
 from crestdsl.simulation.epsilon import Epsilon
 
@@ -45,6 +47,22 @@ class ContinuousModelChecker(PointwiseModelChecker):
     WARNING: I guess this can be slow for very large state spaces!
     """
 
+    def __init__(self, statespace=None, workers=None, virtual_chains=True):
+        """
+        Parameters
+        ----------
+        statespace: StateSpace
+            The statespace (timed Kripke structure) that will be explored.
+        workers: int
+            Split the CREST Kripke structure's edges in this many worker processes
+            (default: in this process).
+        virtual_chains: bool
+            Represent the gcd/2-transformation's new nodes implicitly (see GammaChains),
+            instead of adding them to the CREST Kripke structure.
+        """
+        super().__init__(statespace, workers)
+        self.virtual_chains = virtual_chains
+
     def calculate_gcd_and_gamma(self, formula, crestKripke):
         # calculate GCD & gamma (it's half)
         edge_weights = {w for (u, v, w) in crestKripke.edges.data('weight') if w is not None}
@@ -119,6 +137,14 @@ class ContinuousModelChecker(PointwiseModelChecker):
         logger.info(f"Finished gcd/2-transformation, gcd/2 = {gamma}")
         return crestKripke
 
+    def gamma_transform(self, crestKripke):
+        """ Splits the edges into steps of self.gamma,
+        either virtually (GammaChains) or by adding the new nodes to the CREST Kripke structure (in place). """
+        if self.virtual_chains:
+            logger.info(f"Virtual gcd/2-transformation, gcd/2 = {self.gamma}")
+            return GammaChains(crestKripke, self.gamma)
+        return self.gamma_split_optimised(crestKripke, self.gamma)
+
     def make_CREST_Kripke(self, formula, crestKripke=None):
         logger.info(f"Adapting Kripke for continuous model checking (gcd/2-transformation)")
         crestKripke = super().make_CREST_Kripke(formula, crestKripke)
@@ -138,12 +164,10 @@ class ContinuousModelChecker(PointwiseModelChecker):
             # split each edge according to self.gamma
             # (don't worry about the repsective system states,
             #  we only care about properties for now)
-            GAMMA_Kripke = epsilon_replaced.copy()
-
-            self.gamma_split_optimised(GAMMA_Kripke, self.gamma)  # in place edit of the CK
+            GAMMA_Kripke = self.gamma_transform(epsilon_replaced)
 
             logger.debug(f"size before: {len(crestKripke.nodes())} nodes, {len(crestKripke.edges())} transitions")
-            logger.debug(f"size after: {len(GAMMA_Kripke.nodes())} nodes, {len(GAMMA_Kripke.edges())} transitions")
+            logger.debug(f"size after: {GAMMA_Kripke.number_of_nodes()} nodes")
             return GAMMA_Kripke
         else:
             return epsilon_replaced
@@ -164,7 +188,9 @@ class ContinuousModelChecker(PointwiseModelChecker):
 
     def get_satisfying_nodes(self, formula, systemstate=None):
         crestKripke = self.make_CREST_Kripke(formula)
+        return self.evaluate(formula, crestKripke)
 
+    def evaluate(self, formula, crestKripke):
         logger.info(f"Checking formula: {formula}")
         
         if self.need_transformation(formula):
@@ -192,9 +218,87 @@ class ContinuousModelChecker(PointwiseModelChecker):
             simplified = simplify(formula)
             sat_set = self.is_satisfiable(simplified, crestKripke)
 
-        if systemstate is None:
-            systemstate = crestKripke.graph["root"]
-
+        if isinstance(crestKripke, GammaChains):  # the original nodes (the chains' positions are not part of the result)
+            return sat_set.nodes, crestKripke.kripke
         return sat_set, crestKripke
 
+    """ virtual gamma chains (the procedures are in GammaChains) """
+
+    @memoized
+    def issatisfiable_boolean(self, formula, crestKripke):
+        if isinstance(crestKripke, GammaChains):
+            return crestKripke.uniform(np.full(len(crestKripke.arrays), bool(formula)))
+        return super().issatisfiable_boolean(formula, crestKripke)
+
+    @memoized
+    def issatisfiable_check_check(self, formula, crestKripke):
+        if isinstance(crestKripke, GammaChains):
+            nodes = super().issatisfiable_check_check(formula, crestKripke.kripke)
+            return crestKripke.uniform(crestKripke.arrays.mask(nodes))
+        return super().issatisfiable_check_check(formula, crestKripke)
+
+    @memoized
+    def issatisfiable_NamedAP(self, formula, crestKripke):
+        if isinstance(crestKripke, GammaChains):
+            nodes = super().issatisfiable_NamedAP(formula, crestKripke.kripke)
+            if formula is PA:  # PA alternates along the chains
+                return crestKripke.alternating(crestKripke.arrays.mask(nodes))
+            return crestKripke.uniform(crestKripke.arrays.mask(nodes))
+        return super().issatisfiable_NamedAP(formula, crestKripke)
+
+    @memoized
+    def issatisfiable_tctlAnd(self, formula, crestKripke):
+        if isinstance(crestKripke, GammaChains):
+            return self.is_satisfiable(formula.phi, crestKripke) & self.is_satisfiable(formula.psi, crestKripke)
+        return super().issatisfiable_tctlAnd(formula, crestKripke)
+
+    @memoized
+    def issatisfiable_tctlOr(self, formula, crestKripke):
+        if isinstance(crestKripke, GammaChains):
+            return self.is_satisfiable(formula.phi, crestKripke) | self.is_satisfiable(formula.psi, crestKripke)
+        return super().issatisfiable_tctlOr(formula, crestKripke)
+
+    def Sat_EU(self, formula, crestKripke, phi_set=None, psi_set=None):
+        if not isinstance(crestKripke, GammaChains):
+            return super().Sat_EU(formula, crestKripke, phi_set, psi_set)
+        Q1 = phi_set if (phi_set is not None) else self.is_satisfiable(formula.phi, crestKripke)
+        Q2 = psi_set if (psi_set is not None) else self.is_satisfiable(formula.psi, crestKripke)
+        return crestKripke.until(Q1, Q2)
+
+    def Sat_EG(self, formula, crestKripke):
+        if not isinstance(crestKripke, GammaChains):
+            return super().Sat_EG(formula, crestKripke)
+        return crestKripke.infinite_paths(self.is_satisfiable(formula.phi, crestKripke))
+
+    def Sat_EUb(self, formula, crestKripke):
+        if not isinstance(crestKripke, GammaChains):
+            return super().Sat_EUb(formula, crestKripke)
+        Q1 = self.is_satisfiable(formula.phi, crestKripke)
+        Q2 = self.is_satisfiable(formula.psi, crestKripke)
+        Qu = self.Sat_EU(formula, crestKripke, phi_set=Q1, psi_set=Q2)
+        return crestKripke.shortest_until(Q2, Qu, formula.interval)
+
+    def Sat_EUa(self, formula, crestKripke):
+        if not isinstance(crestKripke, GammaChains):
+            return super().Sat_EUa(formula, crestKripke)
+        Q1 = self.is_satisfiable(formula.phi, crestKripke)
+        Q2 = self.is_satisfiable(formula.psi, crestKripke)
+        Qu = self.Sat_EU(formula, crestKripke, phi_set=Q1, psi_set=Q2)
+        return crestKripke.longest_until(Q1, Q2, Qu, formula.interval)
+
+    def Sat_EUab(self, formula, crestKripke):
+        if not isinstance(crestKripke, GammaChains):
+            return super().Sat_EUab(formula, crestKripke)
+        Q1 = self.is_satisfiable(formula.phi, crestKripke)
+        Q2 = self.is_satisfiable(formula.psi, crestKripke)
+        Qu = self.Sat_EU(formula, crestKripke, phi_set=Q1, psi_set=Q2)
+        return crestKripke.between_until(Q1, Q2, Qu, formula.interval)
+
+    def Sat_AU0(self, formula, crestKripke):
+        if not isinstance(crestKripke, GammaChains):
+            return super().Sat_AU0(formula, crestKripke)
+        formula_I_0 = copy.copy(formula)
+        formula_I_0.interval >= 0
+        return crestKripke.positive_until(self.is_satisfiable(formula_I_0, crestKripke))
+
 
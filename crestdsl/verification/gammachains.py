@@ -0,0 +1,710 @@
+"""
+Virtual gamma chains for the continuous model checking (see :class:`ContinuousModelChecker`).
+
+The gcd/2 transformation (:func:`ContinuousModelChecker.gamma_split_optimised`) splits the outgoing edges
+of each node whose edges are longer than gamma into a chain of new nodes, one per gamma step.
+The chain's nodes (positions 1 to k) copy the node's propositions, only PA alternates (True at odd positions).
+The last position leads to the node's original successors.
+
+Here the chains are not created.
+Each node only stores the length of its chain and sets of nodes store, per chain,
+which positions belong to the set, as segments of positions.
+Each segment has a pattern that tells whether its odd and even positions are members.
+The model checking procedures evaluate the chains from their ends back to their starts.
+Where the input sets' patterns don't change, the evaluation becomes periodic after a while
+(the states of the procedures are bounded by the formula's interval),
+so each segment is only evaluated until the values repeat.
+Thus the memory and most of the work are proportional to the original Kripke structure and the formulas' bounds
+instead of the (often much longer) chains.
+
+The values along the chains are added up gamma by gamma, just like the searches on the materialized chains do,
+so the results are the same (including floating point rounding).
+"""
+
+from .kripkearrays import KripkeArrays
+
+import bisect
+import heapq
+import itertools
+import math
+import operator
+
+import numpy as np
+import networkx as nx
+
+import logging
+logger = logging.getLogger(__name__)
+
+ODD, EVEN, BOTH = 1, 2, 3  # position patterns: which positions of a segment are members
+
+_UNIFORM = [((1, pattern),) for pattern in range(4)]  # the chains with only one segment (shared)
+EMPTY, ODD_POSITIONS, FULL = _UNIFORM[0], _UNIFORM[ODD], _UNIFORM[BOTH]
+
+
+def _parity(position):
+    return ODD if position & 1 else EVEN
+
+
+def _pattern_at(segments, position):
+    """The pattern of the segment that contains the position."""
+    if len(segments) == 1:
+        return segments[0][1]
+    return segments[bisect.bisect_right(segments, (position, BOTH + 1)) - 1][1]
+
+
+def _member(segments, position):
+    return bool(_pattern_at(segments, position) & _parity(position))
+
+
+def _combine(first, second, operation):
+    """Applies a bitwise operation to the patterns of two chains."""
+    if len(first) == 1 and len(second) == 1:
+        return _UNIFORM[operation(first[0][1], second[0][1]) & BOTH]
+    starts = sorted({start for start, _ in first} | {start for start, _ in second})
+    segments = []
+    for start in starts:
+        pattern = operation(_pattern_at(first, start), _pattern_at(second, start)) & BOTH
+        if not segments or segments[-1][1] != pattern:
+            segments.append((start, pattern))
+    return _UNIFORM[segments[0][1]] if len(segments) == 1 else tuple(segments)
+
+
+def _difference(first, second):
+    return first & ~second
+
+
+def _count(segments, length):
+    """The number of member positions of a chain."""
+    count = 0
+    ends = [start - 1 for start, _ in segments[1:]] + [length]
+    for (start, pattern), end in zip(segments, ends):
+        if pattern & ODD:
+            count += (end + 1) // 2 - start // 2
+        if pattern & EVEN:
+            count += end // 2 - (start - 1) // 2
+    return count
+
+
+class _SegmentBuilder(object):
+    """Collects the member positions of a chain from its last position down to the first."""
+
+    def __init__(self):
+        self.segments = []  # (start, pattern), from the last segment to the first
+        self.start = None
+        self.pattern = 0
+        self.known = 0  # the parities that the current segment has positions of
+
+    def add(self, start, end, pattern):
+        """Adds the positions start to end (below the ones that were added before)."""
+        known = BOTH if end > start else _parity(start)
+        pattern &= known
+        if self.start is not None and (pattern ^ self.pattern) & known & self.known == 0:
+            self.start, self.pattern, self.known = start, self.pattern | pattern, self.known | known
+        else:
+            self._flush()
+            self.start, self.pattern, self.known = start, pattern, known
+
+    def _flush(self):
+        if self.start is None:
+            return
+        if self.segments and self.segments[-1][1] == self.pattern:
+            self.segments[-1] = (self.start, self.pattern)
+        else:
+            self.segments.append((self.start, self.pattern))
+
+    def result(self):
+        self._flush()
+        if len(self.segments) == 1:
+            return _UNIFORM[self.segments[0][1]]
+        return tuple(reversed(self.segments))
+
+
+def _scan(length, inputs, state, step, build=True):
+    """
+    Evaluates a chain from its last position down to the first.
+
+    Within a segment where none of the input patterns changes, the positions alternate between the same two inputs.
+    As soon as a position has the same state as the position two above it, all positions below repeat the last two
+    (the step is deterministic), so the rest of the segment is filled in without evaluating it.
+
+    Parameters
+    ----------
+    length: int
+        The number of positions of the chain.
+    inputs: tuple
+        The chain's segments in each of the input sets.
+    state: object
+        The state after the last position (calculated from the chain's successors).
+    step: callable
+        step(state of the next position, memberships of the position in the inputs) -> (state, member)
+        The states have to be comparable with ==.
+    build: bool
+        Whether to collect the member positions (otherwise only the first position's state is calculated).
+
+    Returns
+    -------
+    tuple
+        The chain's segments (or None) and the state of the first position.
+    """
+    builder = _SegmentBuilder() if build else None
+    starts = sorted({1} | {start for segments in inputs for start, _ in segments if start <= length})
+    end = length
+    for region_start in reversed(starts):
+        patterns = [_pattern_at(segments, region_start) for segments in inputs]
+        inputs_by_parity = {parity: tuple(bool(pattern & parity) for pattern in patterns) for parity in (ODD, EVEN)}
+        above = two_above = None  # (state, member) of the positions above
+        position = end
+        while position >= region_start:
+            parity = _parity(position)
+            state, member = step(state, inputs_by_parity[parity])
+            if two_above is not None and state == two_above[0]:
+                # the positions from here down to the segment's start repeat this one and the one above
+                if build:
+                    builder.add(region_start, position, (parity if member else 0) | ((BOTH ^ parity) if above[1] else 0))
+                if (position - region_start) % 2:
+                    state = above[0]
+                break
+            if build:
+                builder.add(position, position, BOTH if member else 0)
+            two_above, above = above, (state, member)
+            position -= 1
+        end = region_start - 1
+    return (builder.result() if build else None), state
+
+
+def _all_step(state, inputs):
+    """All positions from here to the end of the chain are in all inputs (and the state after the end is True)."""
+    member = state and all(inputs)
+    return member, member
+
+
+class ChainSet(object):
+    """
+    A set of nodes of a :class:`GammaChains` structure:
+    a boolean mask of the original nodes and, per chain, the segments of its member positions.
+    """
+
+    __slots__ = ("structure", "mask", "chains")
+
+    def __init__(self, structure, mask, chains):
+        self.structure = structure
+        self.mask = mask
+        self.chains = chains
+
+    def __len__(self):
+        return int(self.mask.sum()) + sum(_count(segments, length) for segments, length in zip(self.chains, self.structure.lengths))
+
+    def __contains__(self, node):
+        index = self.structure.arrays.index.get(node)
+        return index is not None and bool(self.mask[index])
+
+    def at(self, node, position):
+        """Whether the position of the node's chain is in the set."""
+        chain = self.structure.chain_of[self.structure.arrays.index[node]]
+        return _member(self.chains[chain], position)
+
+    @property
+    def nodes(self):
+        """The original nodes in the set."""
+        return self.structure.arrays.node_set(self.mask)
+
+    def _combine(self, other, mask, operation):
+        return ChainSet(self.structure, mask, [_combine(first, second, operation) for first, second in zip(self.chains, other.chains)])
+
+    def __and__(self, other):
+        return self._combine(other, self.mask & other.mask, operator.and_)
+
+    def __or__(self, other):
+        return self._combine(other, self.mask | other.mask, operator.or_)
+
+    def __sub__(self, other):
+        return self._combine(other, self.mask & ~other.mask, _difference)
+
+
+class GammaChains(object):
+    """
+    A CREST Kripke structure whose long edges are split into gamma steps virtually.
+
+    A node is chained if its outgoing edges are longer than gamma.
+    Its chain has ``round(weight / gamma) - 1`` positions and the last one leads to the node's successors.
+    (If that's less than one position, the node loses its edges, as in the materialized transformation.)
+    The model checking procedures are the ones of :class:`PointwiseModelChecker` (see the Sat_* methods there),
+    they return :class:`ChainSet` objects.
+    """
+
+    def __init__(self, crestKripke, gamma):
+        """
+        Parameters
+        ----------
+        crestKripke: nx.DiGraph
+            The CREST Kripke structure (with numeric edge weights), it is not modified.
+        gamma: numeric
+            The length of the chains' steps (half of the GCD of the edge weights).
+        """
+        self.kripke = crestKripke
+        self.gamma = gamma
+        self.arrays = arrays = KripkeArrays(crestKripke)
+        weights, succ_ptr = arrays.weights, arrays.succ_ptr.tolist()
+        split = np.zeros(len(arrays), dtype=bool)  # the nodes whose edges are replaced
+        self.chain_of = np.full(len(arrays), -1, dtype=np.intp)  # node number -> chain number
+        self.lengths = []  # chain number -> number of positions
+        for node in range(len(arrays)):
+            if succ_ptr[node] < succ_ptr[node + 1] and weights[succ_ptr[node]] > self.gamma:
+                split[node] = True
+                parts = int(round(weights[succ_ptr[node]] / self.gamma))
+                if parts > 1:
+                    self.chain_of[node] = len(self.lengths)
+                    self.lengths.append(parts - 1)
+        self.chained = self.chain_of >= 0
+        self.chain_nodes = np.flatnonzero(self.chained)  # chain number -> node number
+        self.direct = ~split[arrays.edge_source]  # the edges that are not replaced
+        self.exits = self.chained[arrays.edge_source]  # the edges that leave the chains' last positions
+
+    @property
+    def graph(self):
+        return self.kripke.graph
+
+    def number_of_nodes(self):
+        """The number of nodes of the materialized structure."""
+        return len(self.arrays) + sum(self.lengths)
+
+    def __len__(self):
+        return self.number_of_nodes()
+
+    """ sets """
+
+    def uniform(self, mask):
+        """The set of the nodes of the mask, where each position has the value of its chain's node."""
+        return ChainSet(self, mask, [FULL if value else EMPTY for value in mask[self.chain_nodes].tolist()])
+
+    def alternating(self, mask):
+        """The set of the nodes of the mask and the odd positions of all chains (this is PA)."""
+        return ChainSet(self, mask, [ODD_POSITIONS] * len(self.lengths))
+
+    def _per_node(self, values):
+        """A node mask from a list of per-chain booleans (False for the nodes without chain)."""
+        mask = np.zeros(len(self.arrays), dtype=bool)
+        mask[self.chain_nodes] = values
+        return mask
+
+    def _exits_to(self, mask):
+        """The chained nodes that have a successor in the mask."""
+        arrays = self.arrays
+        result = np.zeros(len(arrays), dtype=bool)
+        result[arrays.edge_source[self.exits & mask[arrays.edge_target]]] = True
+        return result
+
+    def _exit_targets(self, chain):
+        """The node numbers of the successors of a chain's last position."""
+        node = self.chain_nodes[chain]
+        return self.arrays.edge_target[self.arrays.succ_ptr[node]:self.arrays.succ_ptr[node + 1]].tolist()
+
+    def _scan_chains(self, inputs, tails, step):
+        """Evaluates each chain, with its inputs and state after its last position."""
+        return [_scan(length, chain_inputs, tail, step)[0] for length, chain_inputs, tail in zip(self.lengths, inputs, tails)]
+
+    def _all(self, *sets):
+        """Per chain: whether all positions are in all the sets."""
+        return [_scan(length, chain_inputs, True, _all_step, build=False)[1]
+                for length, chain_inputs in zip(self.lengths, zip(*[s.chains for s in sets]))]
+
+    """ procedures """
+
+    def until(self, Q1, Q2):
+        """
+        The nodes with a path of Q1 nodes to a Q2 node (Sat_EU).
+
+        A chain either reaches a Q2 position on its own (then its node is a start of the backward search)
+        or lets the search pass if all its positions are Q1 nodes.
+        """
+        arrays = self.arrays
+        inputs = list(zip(Q1.chains, Q2.chains))
+
+        def step(state, inputs):
+            phi, psi = inputs
+            member = psi or (phi and state)
+            return member, member
+
+        reaches = self._per_node([_scan(length, chain_inputs, False, step, build=False)[1] for length, chain_inputs in zip(self.lengths, inputs)])
+        passes = self._per_node(self._all(Q1))
+        sources = Q2.mask | (Q1.mask & reaches)
+        edges = self.direct | (self.exits & passes[arrays.edge_source])
+        mask = sources | arrays.ancestors(sources, Q1.mask, edges=edges)
+        tails = self._exits_to(mask)[self.chain_nodes].tolist()
+        return ChainSet(self, mask, self._scan_chains(inputs, tails, step))
+
+    def infinite_paths(self, Q1):
+        """The nodes with an infinite path of Q1 nodes (Sat_EG)."""
+        arrays = self.arrays
+        inputs = [(segments,) for segments in Q1.chains]
+        passes = self._per_node(self._all(Q1))
+        _, alive = arrays.peel(Q1.mask & (~self.chained | passes), edges=self.direct | self.exits)
+        tails = self._exits_to(alive)[self.chain_nodes].tolist()
+        return ChainSet(self, alive, self._scan_chains(inputs, tails, _all_step))
+
+    def shortest_until(self, Q2, Qu, interval):
+        """
+        The nodes of Qu whose shortest path (through Qu) to a Q2 node is in the interval [0, b] or [0, b) (Sat_EUb).
+
+        A chain with a Q2 position gives its node a fixed distance (the path to the first Q2 position),
+        a chain without Q2 positions (but all in Qu) adds its length to its successors' distances.
+        """
+        arrays = self.arrays
+        gamma, cutoff = self.gamma, interval.end
+        inputs = list(zip(Q2.chains, Qu.chains))
+
+        def step(state, inputs):
+            psi, inside = inputs
+            if not inside:
+                distance = None
+            elif psi:
+                distance = 0
+            elif state is None:
+                distance = None
+            else:
+                distance = state + gamma
+                if distance > cutoff:
+                    distance = None
+            return distance, distance is not None and interval.ininterval(distance)
+
+        def through_chain(chain, distance):
+            for _ in range(self.lengths[chain] + 1):  # the chain's positions and its node
+                distance = distance + gamma
+                if distance > cutoff:
+                    return None
+            return distance
+
+        passes = self._all(Qu - Q2)  # the chains that only add their length
+
+        _, edge_source, _, pred_ptr, pred_edges = arrays._as_lists()
+        weights, inside, is_direct = arrays.weights, Qu.mask.tolist(), self.direct.tolist()
+        chain_of = self.chain_of.tolist()
+        counter = itertools.count()
+
+        seen = {}
+        heap = []
+        for node in np.flatnonzero(Q2.mask & Qu.mask).tolist():
+            seen[node] = 0
+            heap.append((0, next(counter), node))
+        for chain, node in enumerate(self.chain_nodes.tolist()):
+            if inside[node] and node not in seen:
+                first = _scan(self.lengths[chain], inputs[chain], None, step, build=False)[1]
+                if first is not None and first + gamma <= cutoff:
+                    seen[node] = first + gamma
+                    heap.append((first + gamma, next(counter), node))
+        heapq.heapify(heap)
+
+        distances = {}
+        while heap:
+            distance, _, node = heapq.heappop(heap)
+            if node in distances:
+                continue
+            distances[node] = distance
+            for position in range(pred_ptr[node], pred_ptr[node + 1]):
+                edge = pred_edges[position]
+                predecessor = edge_source[edge]
+                if not inside[predecessor] or predecessor in distances:
+                    continue
+                if is_direct[edge]:
+                    new_distance = distance + weights[edge]
+                    if new_distance > cutoff:
+                        continue
+                elif chain_of[predecessor] >= 0 and passes[chain_of[predecessor]]:
+                    new_distance = through_chain(chain_of[predecessor], distance)
+                    if new_distance is None:
+                        continue
+                else:
+                    continue
+                if predecessor not in seen or new_distance < seen[predecessor]:
+                    seen[predecessor] = new_distance
+                    heapq.heappush(heap, (new_distance, next(counter), predecessor))
+
+        mask = np.zeros(len(arrays), dtype=bool)
+        mask[[node for node, distance in distances.items() if interval.ininterval(distance)]] = True
+        tails = []
+        for chain in range(len(self.lengths)):
+            reached = [distances[target] for target in self._exit_targets(chain) if target in distances]
+            tails.append(min(reached) if reached else None)
+        return ChainSet(self, mask, self._scan_chains(inputs, tails, step))
+
+    def _saturation(self, interval):
+        """
+        For the intervals [a, inf) and (a, inf): once a path weight is in the interval, so are all longer ones.
+        These weights are replaced by inf, so that the chains' states repeat.
+
+        Returns
+        -------
+        tuple
+            reached(weight): whether the weight is in the interval, and saturate(weight)
+        """
+        def reached(weight):
+            return weight is not None and (weight == math.inf or interval.ininterval(weight))
+
+        def saturate(weight):
+            return math.inf if reached(weight) else weight
+        return reached, saturate
+
+    def _max_tail(self, chain, values):
+        """The maximum value of the successors of a chain's last position (None if none has a value)."""
+        tail = None
+        for target in self._exit_targets(chain):
+            if target in values and (tail is None or values[target] > tail):
+                tail = values[target]
+        return tail
+
+    def longest_until(self, Q1, Q2, Qu, interval):
+        """
+        The nodes of Qu with a Q1 path to a Q2 node whose weight is in the interval [a, inf) or (a, inf)
+        (Sat_EUa of PointwiseModelChecker): the nodes with an infinite path of Q1 nodes in Qu,
+        and the other ones whose longest path to a Q2 node is long enough.
+        """
+        arrays = self.arrays
+        gamma = self.gamma
+        reached, saturate = self._saturation(interval)
+        Q = self.infinite_paths(Q1 & Qu)
+        dag = Qu - Q
+        inputs = list(zip(dag.chains, Q2.chains))
+
+        def step(state, inputs):  # the state is the maximum weight of the paths to a Q2 node
+            inside, psi = inputs
+            if not inside:
+                return None, False
+            best = None if state is None else saturate(gamma + state)
+            if psi:
+                return (best if best is not None and best > 0 else 0), reached(best)
+            return best, reached(best)
+
+        # the chains that depend on their successors are edges of the DAG, the others start new paths
+        complete = self._per_node(self._all(dag))
+        levels, cyclic = arrays.peel(dag.mask, edges=self.direct | (self.exits & complete[arrays.edge_source]))
+        if cyclic.any():
+            logger.warning("The graph has cycles. Enumerating all simple paths, this might take a while.")
+            return Q | self._longest_simple_paths(dag, Q2 & dag, interval)
+
+        succ_ptr, _, edge_target, _, _ = arrays._as_lists()
+        weights, is_direct, is_target = arrays.weights, self.direct.tolist(), Q2.mask.tolist()
+        chain_of = self.chain_of.tolist()
+        mask = np.zeros(len(arrays), dtype=bool)
+        to_target = {}
+        for level in levels:  # all successors of a level's nodes are in the previous levels
+            for node in level.tolist():
+                chain = chain_of[node]
+                best = None
+                if chain >= 0:
+                    tail = self._max_tail(chain, to_target) if complete[node] else None
+                    first = _scan(self.lengths[chain], inputs[chain], tail, step, build=False)[1]
+                    if first is not None:
+                        best = saturate(gamma + first)
+                else:
+                    for edge in range(succ_ptr[node], succ_ptr[node + 1]):
+                        successor = edge_target[edge]
+                        if is_direct[edge] and successor in to_target:
+                            weight = weights[edge] + to_target[successor]
+                            if best is None or weight > best:
+                                best = weight
+                    best = saturate(best)
+                mask[node] = reached(best)
+                if is_target[node]:
+                    to_target[node] = best if best is not None and best > 0 else 0
+                elif best is not None:
+                    to_target[node] = best
+
+        tails = [self._max_tail(chain, to_target) for chain in range(len(self.lengths))]
+        return Q | ChainSet(self, mask, self._scan_chains(inputs, tails, step))
+
+    def lepri_until(self, Q1, Q2, Qu, interval):
+        """
+        The nodes of Qu with a Q1 path to a Q2 node whose weight is in the interval [a, inf) or (a, inf)
+        (Sat_EUa of ModelChecker, the original procedure of Lepri et al.):
+        the nodes with an infinite path of Q1 nodes in Qu,
+        and the other ones whose longest Q1 path to a node without Q1 successors is long enough.
+        """
+        arrays = self.arrays
+        gamma = self.gamma
+        reached, saturate = self._saturation(interval)
+        Q = self.infinite_paths(Q1 & Qu)
+        dag = Qu - Q
+        inputs = list(zip(dag.chains, Q1.chains))
+
+        def step(state, inputs):  # the state is tau, the maximum weight of the Q1 paths in the DAG
+            inside, phi = inputs
+            if not inside:
+                return None, False
+            tau = saturate(gamma + state) if phi and state is not None else 0
+            return tau, reached(tau)
+
+        # the chains that depend on their successors are edges of the DAG, the others start new paths
+        transparent = self._per_node(self._all(dag, Q1))
+        edges_from_Q1 = Q1.mask[arrays.edge_source]
+        levels, _ = arrays.peel(dag.mask, edges=edges_from_Q1 & (self.direct | (self.exits & transparent[arrays.edge_source])))
+
+        succ_ptr, _, edge_target, _, _ = arrays._as_lists()
+        weights, is_direct, is_phi = arrays.weights, self.direct.tolist(), Q1.mask.tolist()
+        chain_of = self.chain_of.tolist()
+        mask = np.zeros(len(arrays), dtype=bool)
+        T = dict()
+        for level in levels:  # all successors of a level's nodes are in the previous levels
+            for node in level.tolist():
+                chain = chain_of[node]
+                tau = 0
+                if is_phi[node] and chain >= 0:
+                    tail = self._max_tail(chain, T) if transparent[node] else None
+                    first = _scan(self.lengths[chain], inputs[chain], tail, step, build=False)[1]
+                    if first is not None:
+                        tau = saturate(gamma + first)
+                elif is_phi[node]:
+                    for edge in range(succ_ptr[node], succ_ptr[node + 1]):
+                        if is_direct[edge] and edge_target[edge] in T and weights[edge] + T[edge_target[edge]] > tau:
+                            tau = weights[edge] + T[edge_target[edge]]
+                    tau = saturate(tau)
+                T[node] = tau
+                mask[node] = reached(tau)
+
+        tails = [self._max_tail(chain, T) for chain in range(len(self.lengths))]
+        return Q | ChainSet(self, mask, self._scan_chains(inputs, tails, step))
+
+    def between_until(self, Q1, Q2, Qu, interval):
+        """
+        The nodes of Qu with a Q1 path to a Q2 node whose weight is in the interval [a, b] (Sat_EUab).
+        The weights of the paths (up to b) are collected per node, the chains pass on their successors' weights.
+        """
+        arrays = self.arrays
+        gamma, end, end_operator = self.gamma, interval.end, interval.end_operator
+        source = Q1 & Qu  # the sources of the edges in Qu that continue the paths
+        inputs = list(zip(source.chains, Q2.chains, Qu.chains))
+        nothing = frozenset()
+
+        def step(state, inputs):  # the state is the set of path weights
+            phi, psi, inside = inputs
+            if not inside:
+                return nothing, False
+            taus = {0} if psi else set()
+            if phi:
+                taus.update(tau for tau in (previous + gamma for previous in state) if end_operator(tau, end))
+            return frozenset(taus), any(interval.ininterval(tau) for tau in taus)
+
+        def through_chain(chain, tau):
+            for _ in range(self.lengths[chain] + 1):  # the chain's positions and its node
+                tau = tau + gamma
+                if not end_operator(tau, end):
+                    return None
+            return tau
+
+        transparent = self._all(source)
+        is_source, is_direct = source.mask.tolist(), self.direct.tolist()
+        chain_of = self.chain_of.tolist()
+
+        todo = [(node, 0) for node in np.flatnonzero(Q2.mask & Qu.mask).tolist()]
+        for chain, node in enumerate(self.chain_nodes.tolist()):
+            if is_source[node]:  # the paths to the chain's own Q2 positions
+                first = _scan(self.lengths[chain], inputs[chain], nothing, step, build=False)[1]
+                todo.extend((node, tau + gamma) for tau in first if end_operator(tau + gamma, end))
+
+        _, edge_source, _, pred_ptr, pred_edges = arrays._as_lists()
+        weights = arrays.weights
+        configs = {}  # node number -> the visited path weights
+        while todo:
+            node, tau = todo.pop()
+            visited = configs.setdefault(node, set())
+            if tau in visited:
+                continue
+            visited.add(tau)
+            for position in range(pred_ptr[node], pred_ptr[node + 1]):
+                edge = pred_edges[position]
+                predecessor = edge_source[edge]
+                if not is_source[predecessor]:
+                    continue
+                if is_direct[edge]:
+                    new_tau = tau + weights[edge]
+                    if not end_operator(new_tau, end):
+                        continue
+                elif chain_of[predecessor] >= 0 and transparent[chain_of[predecessor]]:
+                    new_tau = through_chain(chain_of[predecessor], tau)
+                    if new_tau is None:
+                        continue
+                else:
+                    continue
+                if new_tau not in configs.get(predecessor, ()):
+                    todo.append((predecessor, new_tau))
+
+        mask = np.zeros(len(arrays), dtype=bool)
+        mask[[node for node, taus in configs.items() if any(interval.ininterval(tau) for tau in taus)]] = True
+        tails = [frozenset().union(*[configs.get(target, ()) for target in self._exit_targets(chain)])
+                 for chain in range(len(self.lengths))]
+        return ChainSet(self, mask, self._scan_chains(inputs, tails, step))
+
+    def positive_until(self, Qu):
+        """
+        The nodes of Qu that cannot reach a node without successors in Qu in zero time (Sat_AU0).
+        The chains' edges are never zero, so their positions only need a successor in Qu.
+        """
+        arrays = self.arrays
+        inside = Qu.mask
+        edges_inside = inside[arrays.edge_source] & inside[arrays.edge_target]
+
+        continues = np.zeros(len(arrays), dtype=bool)  # the nodes with a successor in Qu
+        continues[arrays.edge_source[self.direct & edges_inside]] = True
+        continues[self.chain_nodes] = [_member(segments, 1) for segments in Qu.chains]
+        Q = inside & ~continues
+        Qpre = arrays.ancestors(Q, inside, edges=self.direct & edges_inside & arrays.zero)
+
+        def step(state, inputs):  # the state is whether the position is in Qu
+            return inputs[0], inputs[0] and state
+
+        tails = self._exits_to(inside)[self.chain_nodes].tolist()
+        chains = self._scan_chains([(segments,) for segments in Qu.chains], tails, step)
+        return ChainSet(self, inside & ~(Q | Qpre), chains)
+
+    """ materialized chains """
+
+    def materialize(self, nodes):
+        """
+        The subgraph of the materialized structure that is induced by a set of nodes
+        (for the cases that the procedures cannot handle on the chains).
+
+        Parameters
+        ----------
+        nodes: ChainSet
+            The nodes of the subgraph.
+
+        Returns
+        -------
+        nx.DiGraph
+            The original nodes are node numbers, the chains' positions are (node number, position) tuples.
+        """
+        arrays = self.arrays
+        graph = nx.DiGraph()
+        graph.add_nodes_from(np.flatnonzero(nodes.mask).tolist())
+        for chain, node in enumerate(self.chain_nodes.tolist()):
+            length, segments = self.lengths[chain], nodes.chains[chain]
+            graph.add_nodes_from((node, position) for position in range(1, length + 1) if _member(segments, position))
+            path = [node] + [(node, position) for position in range(1, length + 1)]
+            graph.add_edges_from(((source, target) for source, target in zip(path, path[1:]) if source in graph and target in graph), weight=self.gamma)
+        for edge, (source, target) in enumerate(zip(arrays.edge_source.tolist(), arrays.edge_target.tolist())):
+            if self.exits[edge]:
+                last = (source, self.lengths[self.chain_of[source]])
+                if last in graph and target in graph:
+                    graph.add_edge(last, target, weight=self.gamma)
+            elif self.direct[edge] and source in graph and target in graph:
+                graph.add_edge(source, target, weight=arrays.weights[edge])
+        return graph
+
+    def _materialized_set(self, members):
+        """The ChainSet of a collection of nodes of :func:`materialize`."""
+        members = set(members)
+        mask = np.zeros(len(self.arrays), dtype=bool)
+        mask[[member for member in members if not isinstance(member, tuple)]] = True
+        chains = []
+        for chain, node in enumerate(self.chain_nodes.tolist()):
+            builder = _SegmentBuilder()
+            for position in range(self.lengths[chain], 0, -1):
+                builder.add(position, position, BOTH if (node, position) in members else 0)
+            chains.append(builder.result())
+        return ChainSet(self, mask, chains)
+
+    def _longest_simple_paths(self, nodes, targets, interval):
+        """Sat_EUa's longest paths on a subgraph with cycles, by enumerating the simple paths of the materialized subgraph."""
+        from .pointwise import _longest_simple_path_weights  # delayed import
+        graph = self.materialize(nodes)
+        longest = _longest_simple_path_weights(graph, list(self.materialize(targets).nodes))
+        return self._materialized_set(node for node, weight in longest.items() if interval.ininterval(weight))
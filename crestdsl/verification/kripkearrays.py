@@ -0,0 +1,259 @@
+"""
+An array representation of (CREST) Kripke structures for the model checking procedures.
+
+The nodes are numbered, sets of nodes are NumPy boolean masks over these numbers
+and the edges are stored as CSR (compressed sparse row) adjacency arrays, forwards and backwards.
+Graph searches then work on whole frontiers of nodes at once, instead of walking networkx subgraph views.
+
+The edge weights stay Python objects (they can be Epsilons),
+so the weighted searches (shortest and longest paths) loop over the arrays in Python.
+"""
+
+import heapq
+import itertools
+
+import numpy as np
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def _edge_positions(ptr, frontier):
+    """The positions (in the CSR arrays) of all edges of the frontier nodes."""
+    starts = ptr[frontier]
+    counts = ptr[frontier + 1] - starts
+    total = counts.sum()
+    if total == 0:
+        return np.empty(0, dtype=np.intp)
+    offsets = np.repeat(starts - np.cumsum(counts) + counts, counts)
+    return offsets + np.arange(total)
+
+
+class KripkeArrays(object):
+    """
+    A frozen copy of a Kripke structure's graph.
+
+    The edges are numbered in the order of their source nodes,
+    so the forward CSR arrays are ``succ_ptr`` and ``edge_target``
+    (the edges of node ``i`` are ``succ_ptr[i]`` to ``succ_ptr[i + 1] - 1``).
+    The backward CSR arrays ``pred_ptr`` and ``pred_edges`` refer to the edges by their number.
+    """
+
+    def __init__(self, crestKripke):
+        """
+        Parameters
+        ----------
+        crestKripke: nx.DiGraph
+            The Kripke structure (with "weight" edge attributes).
+            Later changes of the structure are not reflected in the arrays.
+        """
+        self.nodes = list(crestKripke.nodes)
+        self.index = {node: i for i, node in enumerate(self.nodes)}
+        size = len(self.nodes)
+
+        sources, targets, weights = [], [], []
+        for source, successors in crestKripke.adjacency():  # the adjacency is in node order
+            source_index = self.index[source]
+            for target, data in successors.items():
+                sources.append(source_index)
+                targets.append(self.index[target])
+                weights.append(data.get("weight"))
+
+        self.edge_source = np.array(sources, dtype=np.intp)
+        self.edge_target = np.array(targets, dtype=np.intp)
+        self.weights = weights
+        self.zero = np.array([weight == 0 for weight in weights], dtype=bool)
+
+        self.succ_ptr = np.zeros(size + 1, dtype=np.intp)
+        np.cumsum(np.bincount(self.edge_source, minlength=size), out=self.succ_ptr[1:])
+        self.pred_edges = np.argsort(self.edge_target, kind="stable")
+        self.pred_ptr = np.zeros(size + 1, dtype=np.intp)
+        np.cumsum(np.bincount(self.edge_target, minlength=size), out=self.pred_ptr[1:])
+        self._lists = None
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def mask(self, nodes):
+        """The boolean mask of a collection of nodes (nodes that are not in the structure are ignored)."""
+        mask = np.zeros(len(self.nodes), dtype=bool)
+        index = self.index
+        mask[[index[node] for node in nodes if node in index]] = True
+        return mask
+
+    def node_set(self, mask):
+        """The set of nodes of a boolean mask."""
+        nodes = self.nodes
+        return {nodes[i] for i in np.flatnonzero(mask).tolist()}
+
+    def _as_lists(self):
+        """The arrays as Python lists, for the loops of the weighted searches."""
+        if self._lists is None:
+            self._lists = (self.succ_ptr.tolist(), self.edge_source.tolist(), self.edge_target.tolist(),
+                           self.pred_ptr.tolist(), self.pred_edges.tolist())
+        return self._lists
+
+    def ancestors(self, sources, within, edges=None):
+        """
+        The nodes that reach one of the sources (with at least one edge) through nodes of ``within``.
+        This is a backward breadth-first search, one frontier at a time.
+
+        Parameters
+        ----------
+        sources: np.ndarray
+            Boolean node mask.
+        within: np.ndarray
+            Boolean node mask, the search only visits these nodes.
+        edges: np.ndarray
+            Boolean edge mask, the search only follows these edges (default: all).
+
+        Returns
+        -------
+        np.ndarray
+            Boolean node mask of the ancestors (a subset of ``within``).
+        """
+        found = np.zeros(len(self.nodes), dtype=bool)
+        frontier = np.flatnonzero(sources)
+        while frontier.size:
+            incoming = self.pred_edges[_edge_positions(self.pred_ptr, frontier)]
+            if edges is not None:
+                incoming = incoming[edges[incoming]]
+            predecessors = self.edge_source[incoming]
+            predecessors = np.unique(predecessors[within[predecessors] & ~found[predecessors]])
+            found[predecessors] = True
+            frontier = predecessors
+        return found
+
+    def peel(self, within, edges=None):
+        """
+        Removes the nodes without successors over and over again (sinks first),
+        i.e. a topological sort of the subgraph induced by ``within`` (backwards, one level at a time).
+
+        Parameters
+        ----------
+        within: np.ndarray
+            Boolean node mask of the subgraph.
+        edges: np.ndarray
+            Boolean edge mask, only these edges (between nodes of ``within``) are part of the subgraph (default: all).
+
+        Returns
+        -------
+        tuple
+            The list of removed levels (arrays of node numbers)
+            and the boolean mask of the remaining nodes,
+            i.e. those that have an infinite path in the subgraph (they are on or lead to cycles).
+        """
+        inside = within[self.edge_source] & within[self.edge_target]
+        if edges is not None:
+            inside &= edges
+        remaining = np.bincount(self.edge_source[inside], minlength=len(self.nodes))
+        alive = within.copy()
+        levels = []
+        level = np.flatnonzero(alive & (remaining == 0))
+        while level.size:
+            levels.append(level)
+            alive[level] = False
+            incoming = self.pred_edges[_edge_positions(self.pred_ptr, level)]
+            predecessors = self.edge_source[incoming[inside[incoming]]]
+            np.subtract.at(remaining, predecessors, 1)
+            predecessors = np.unique(predecessors)
+            level = predecessors[remaining[predecessors] == 0]
+        return levels, alive
+
+    def infinite_paths(self, within):
+        """
+        The nodes of ``within`` that have an infinite path through nodes of ``within``,
+        i.e. the nodes of nontrivial strongly connected components and their ancestors (in ``within``).
+        """
+        return self.peel(within)[1]
+
+    def shortest_path_weights(self, targets, within, cutoff=None):
+        """
+        Calculates the minimum weight of the paths from each node to one of the targets,
+        with one Dijkstra search backwards from all targets (the targets themselves have weight 0).
+
+        Parameters
+        ----------
+        targets: np.ndarray
+            Boolean node mask of the targets.
+        within: np.ndarray
+            Boolean node mask, the paths only visit these nodes (targets outside are ignored).
+        cutoff: number
+            Nodes that are further away than this are not in the result.
+
+        Returns
+        -------
+        dict
+            node number -> minimum path weight
+        """
+        _, edge_source, _, pred_ptr, pred_edges = self._as_lists()
+        weights, inside = self.weights, within.tolist()
+        counter = itertools.count()
+
+        distances = {}
+        seen = {}
+        heap = []
+        for target in np.flatnonzero(targets & within).tolist():
+            seen[target] = 0
+            heap.append((0, next(counter), target))
+        heapq.heapify(heap)
+        while heap:
+            distance, _, node = heapq.heappop(heap)
+            if node in distances:
+                continue
+            distances[node] = distance
+            for position in range(pred_ptr[node], pred_ptr[node + 1]):
+                edge = pred_edges[position]
+                predecessor = edge_source[edge]
+                if not inside[predecessor] or predecessor in distances:
+                    continue
+                new_distance = distance + weights[edge]
+                if cutoff is not None and new_distance > cutoff:
+                    continue
+                if predecessor not in seen or new_distance < seen[predecessor]:
+                    seen[predecessor] = new_distance
+                    heapq.heappush(heap, (new_distance, next(counter), predecessor))
+        return distances
+
+    def longest_path_weights(self, targets, within):
+        """
+        Calculates the maximum weight of the paths from each node to one of the targets.
+        Only paths with at least one edge count, nodes that cannot reach a target are not in the result.
+        This is a dynamic program over the levels of :func:`peel` (every edge is visited once).
+
+        Parameters
+        ----------
+        targets: np.ndarray
+            Boolean node mask of the targets.
+        within: np.ndarray
+            Boolean node mask, the paths only visit these nodes.
+
+        Returns
+        -------
+        dict
+            node number -> maximum path weight, or None if the subgraph has cycles
+        """
+        levels, cyclic = self.peel(within)
+        if cyclic.any():
+            return None
+
+        succ_ptr, _, edge_target, _, _ = self._as_lists()
+        weights, is_target = self.weights, targets.tolist()
+        to_target = {}  # node -> maximum weight of a path to a target (including the empty path of a target)
+        longest = {}
+        for level in levels:  # all successors of a level's nodes are in the previous levels
+            for node in level.tolist():
+                best = None
+                for edge in range(succ_ptr[node], succ_ptr[node + 1]):
+                    successor = edge_target[edge]
+                    if successor in to_target:
+                        weight = weights[edge] + to_target[successor]
+                        if best is None or weight > best:
+                            best = weight
+                if best is not None:
+                    longest[node] = best
+                if is_target[node]:
+                    to_target[node] = best if best is not None and best > 0 else 0
+                elif best is not None:
+                    to_target[node] = best
+        return longest
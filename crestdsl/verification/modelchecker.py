@@ -1,8 +1,8 @@
 import itertools
-import networkx as nx
 from functools import reduce
 
 from .continuous import ContinuousModelChecker
+from .gammachains import GammaChains
 from .pointwise import CREST_PROPS
 
 
@@ -27,6 +27,8 @@ class ModelChecker(ContinuousModelChecker):
     def make_CREST_Kripke(self, formula, crestKripke=None):
         logger.info(f"Adapting Kripke for model checking (remove epsilon, gcd/2-transformation)")
         crestKripke = super().make_CREST_Kripke(formula, crestKripke)
+        if isinstance(crestKripke, GammaChains):
+            crestKripke = crestKripke.kripke  # the chains are created again below, after adding the self-loops
 
         # INFO: What to do with explored leaf nodes (where time advance infinitely, but properties don't change)
         # We should add a self-loop to indicate that time advances
@@ -52,7 +54,7 @@ class ModelChecker(ContinuousModelChecker):
 
         # split again (if necessary)
         if self.need_transformation(formula):
-            self.gamma_split_optimised(crestKripke, self.gamma)
+            crestKripke = self.gamma_transform(crestKripke)
 
         return crestKripke
 
@@ -61,7 +63,7 @@ class ModelChecker(ContinuousModelChecker):
     def issatisfiable_tctlAnd(self, formula, crestKripke):
         if formula.phi is False or formula.psi is False:
             # logger.debug(f"And Shortcut {formula}")
-            return set()
+            return self.is_satisfiable(False, crestKripke)
         if formula.phi is True:
             # logger.debug(f"And Shortcut {formula}")
             return self.is_satisfiable(formula.psi, crestKripke)
@@ -74,7 +76,7 @@ class ModelChecker(ContinuousModelChecker):
     def issatisfiable_tctlOr(self, formula, crestKripke):
         if formula.phi is True or formula.psi is True:
             # logger.debug(f"Or Shortcut {formula}")
-            return crestKripke.nodes
+            return self.is_satisfiable(True, crestKripke)
         if formula.phi is False:
             # logger.debug(f"Or Shortcut {formula}")
             return self.is_satisfiable(formula.psi, crestKripke)
@@ -84,98 +86,42 @@ class ModelChecker(ContinuousModelChecker):
         # Default
         return super().issatisfiable_tctlOr(formula, crestKripke)
 
-    def Sat_EU(self, formula, crestKripke, phi_set=None, psi_set=None):
-        """ Original implementation of Lepri et al """
-        Q1 = phi_set if (phi_set is not None) else self.is_satisfiable(formula.phi, crestKripke)
-        Q2 = psi_set if (psi_set is not None) else self.is_satisfiable(formula.psi, crestKripke)
-        Q = set(Q2)  # convert to set for set operations
-        
-        # Q_pre = predecessors of Q2 who are Q1 states
-        Q_pre = set().union(*[crestKripke.predecessors(s) for s in Q]) & set(Q1)  
-        Q |= Q_pre  # add the predecessors to the solution set
-        
-        # now search iteratively for the predecessors of those predecessors
-        # remain in Q1_view, to decrese the size of nodes to search
-        Q1_view = crestKripke.subgraph(Q1)
-        Q_todo = set(Q_pre)  # not yet visited
-
-        while len(Q_todo) > 0:
-            q = Q_todo.pop()  # take one of the nodes on our list
-            Q.add(q)  # say that we visited it and add it to the solution
-
-            # search for new predecessors and the ones  we haven't seen yet to
-            # the todo list
-            Q_todo |= set(Q1_view.predecessors(q)) - Q 
-        return Q
-        
     # procedure 6
     def Sat_EUa(self, formula, crestKripke):
         """ Original implementation of Lepri et al """
-        def is_trivial(nodes):
-            view = crestKripke.subgraph(nodes)
-            return view.number_of_edges() == 0
-
-        def path_weight(G, path):
-            return sum(G[path[i]][path[i+1]]['weight'] for i in range(len(path)-1))
-
         Q1 = self.is_satisfiable(formula.phi, crestKripke)
         Q2 = self.is_satisfiable(formula.psi, crestKripke)
 
         Qu = self.Sat_EU(formula, crestKripke, phi_set=Q1, psi_set=Q2)  # this is a shortcut, we use Sat_EU directly instead of adapting the formula and calling generic is_satisfiable
 
-        # a) states in SSCs that are also solutions
-        Q1_view = nx.graphviews.subgraph_view(crestKripke, filter_node=(lambda x: x in Q1)) # subgraph with only Q1 nodes
-        Qssc = set().union(*[comp for comp in nx.strongly_connected_components(Q1_view) if not is_trivial(comp)]) # states in strongly connected components in Q1
+        if isinstance(crestKripke, GammaChains):
+            return crestKripke.lepri_until(Q1, Q2, Qu, formula.interval)
+
+        arrays = self._kripke_arrays(crestKripke)
+        Q1_mask, Qu_mask = arrays.mask(Q1), arrays.mask(Qu)
 
-        Q = Qu & Qssc  # states that where EU(phi, psi) is valid and that are in a strongly connected component (thus satisfy the formula)
-        Q_pre = set().union(*[nx.ancestors(Q1_view, node) for node in Q]) # the ancestors of all nodes in Q (i.e. the ones leading to the SCC-Q states)
-        Q = Q | Q_pre  # extend Q by the predecessors Q_pre
+        # a) states in SSCs that are also solutions, and their Q1-ancestors
+        # (i.e. the states with an infinite path through Q1 & Qu states, see PointwiseModelChecker.Sat_EUa)
+        Q = arrays.infinite_paths(Q1_mask & Qu_mask)
 
         # b)
-        Q_DAG = Qu - Q  # all states that can reach Qu but are not yet in Q
-        Q_DAG_view = crestKripke.subgraph(Q_DAG)  # the subgraph induced by those states
-        
-        edges_from_Q1 = [e for e in Q_DAG_view.edges(data=True) if e[0] in Q1]
-        # TR_DAG_view = Q_DAG_view.edge_subgraph(edges_from_Q1)
-
-        # T* holds nodes without outgoing edges
-        T_star = []
-        for s in Q_DAG:
-            out_edges_from_s = [e for e in edges_from_Q1 if e[0] == s]
-            if len(out_edges_from_s) == 0:
-                T_star.append( (s, 0) )
-            
-        # T_star = [(s, 0) for s in Q_DAG if TR_DAG_view.out_degree(s) == 0]
-        T = list()
-        
-        # iterate over nodes without outgoing edges
-        while len(T_star) > 0:
-            (s, tau) = T_star.pop()
-            if formula.interval.ininterval(tau):  # if it's a solution, then add it
-                Q.add(s)
-            
-            # iterate over incoming edges to s
-            for edge in [e for e in edges_from_Q1 if e[1] == s]: 
-                (sprime, tgt, data) = edge
-                tauprime = edge[2]["weight"]
-                edges_from_Q1.remove(edge)
-                taumax = None
-                
-                # if there exists already an entry in T
-                sprime_entries = [entry for entry in T if entry[0] is sprime]
-                if len(sprime_entries) > 0:
-                    tauprimeprime = sprime_entries[0][1]
-                    if tauprime + tau > tauprimeprime:
-                        taumax = tauprime + tau
-                        T.remove(sprime_entries[0])
-                        T.append( (sprime, taumax) )
-                    else:
-                        taumax = tauprimeprime
-                else:  # this is a new node, not already in T
-                    taumax = tauprime + tau
-                    T.append( (sprime, taumax) )
-                
-                if len([e for e in edges_from_Q1 if e[0] == sprime]) == 0:
-                    T_star.append( (sprime, taumax) )
-
-        return Q
+        Q_DAG = Qu_mask & ~Q  # all states that can reach Qu but are not yet in Q
+        edges_from_Q1 = Q1_mask[arrays.edge_source]
+
+        # T* holds nodes without outgoing edges, then the nodes whose outgoing edges were all visited.
+        # tau is the maximum weight of the paths to such a node without outgoing edges
+        levels, _ = arrays.peel(Q_DAG, edges=edges_from_Q1)
+        in_TR = (edges_from_Q1 & Q_DAG[arrays.edge_source] & Q_DAG[arrays.edge_target]).tolist()
+        succ_ptr, edge_target, weights = arrays.succ_ptr.tolist(), arrays.edge_target.tolist(), arrays.weights
+        T = dict()
+        for level in levels:  # all successors of a level's nodes are in the previous levels
+            for s in level.tolist():
+                tau = 0
+                for edge in range(succ_ptr[s], succ_ptr[s + 1]):
+                    if in_TR[edge] and weights[edge] + T[edge_target[edge]] > tau:
+                        tau = weights[edge] + T[edge_target[edge]]
+                T[s] = tau
+                if formula.interval.ininterval(tau):  # if it's a solution, then add it
+                    Q[s] = True
+
+        return arrays.node_set(Q)
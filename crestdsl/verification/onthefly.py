@@ -0,0 +1,175 @@
+"""
+On-the-fly model checking of reachability and invariant properties (see :class:`OnTheFlyChecker`).
+
+``EF check`` and ``AG check`` (with intervals that start at 0) only ask if a state is reachable in time
+where a check holds (or fails, for AG).
+So we don't need the whole state space:
+the states are explored in the order of their earliest arrival time (like :func:`StateSpace.explore_until_time`),
+each explored node's outgoing edge is refined for the check (like in :func:`PointwiseModelChecker.make_CREST_Kripke`)
+and the search stops at the first state that is a witness (EF) or counterexample (AG).
+"""
+
+import heapq
+import itertools
+
+from .statespace import SystemState, _time_key
+from .refinement import KripkeRefinement
+from .tctl import EF, AG, Not
+from . import checklib
+
+from crestdsl.caching import Cache
+from crestdsl.simulation.epsilon import Epsilon
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def _to_number(time):
+    """Epsilons count as zero (as in the CREST Kripke structures of the model checkers)."""
+    return time.to_number(eps_value=0) if isinstance(time, Epsilon) else time
+
+
+class OnTheFlyChecker(object):
+    """
+    Checks ``EF check`` and ``AG check`` formulas while the state space is explored.
+
+    After :func:`check`, ``path`` is the path to the witness (EF) or counterexample (AG)
+    and ``time`` is the time at which its last state is reached.
+    """
+
+    def __init__(self, statespace):
+        """
+        Parameters
+        ----------
+        statespace: StateSpace
+            The state space, it is explored further where necessary.
+        """
+        self.statespace = statespace
+        self.path = None
+        self.time = None
+
+    @staticmethod
+    def target(formula):
+        """
+        The check and the value that the search looks for.
+
+        Parameters
+        ----------
+        formula: TCTLFormula
+            An EF or AG formula over a Check (or a negated Check), whose interval starts at 0.
+
+        Returns
+        -------
+        tuple
+            (check, value) or None if the formula cannot be checked on the fly.
+        """
+        if not isinstance(formula, (EF, AG)):
+            return None
+        interval = formula.interval
+        if not interval.ininterval(0):
+            return None  # the interval has to start at 0, then the earliest arrival times are enough
+
+        check, value = formula.phi, isinstance(formula, EF)  # AG: look for a state where the check fails
+        while isinstance(check, Not):
+            check, value = check.phi, not value
+        if not isinstance(check, checklib.Check):
+            return None
+        return check, value
+
+    def check(self, formula):
+        """
+        Checks the formula on the statespace's root.
+
+        Parameters
+        ----------
+        formula: TCTLFormula
+            An EF or AG formula over a Check (see :func:`target`).
+
+        Returns
+        -------
+        bool
+            If the formula holds.
+        """
+        target = self.target(formula)
+        if target is None:
+            raise ValueError(f"Formula {formula} cannot be checked on the fly. Only EF and AG of checks (with intervals that start at 0) can.")
+        check, value = target
+
+        found = self.search(check, value, formula.interval)
+        if found:
+            logger.info(f"Found a {'witness' if isinstance(formula, EF) else 'counterexample'} after {self.time} time units ({len(self.path)} states)")
+        return found if isinstance(formula, EF) else not found
+
+    def search(self, check, value, interval):
+        """
+        Searches a state in which the check has the value, and which is reached at a time inside the interval.
+        The nodes are expanded in the order of their earliest arrival time,
+        so the first state that is found is the earliest one.
+
+        Returns
+        -------
+        bool
+            If there is such a state. (Then ``path`` and ``time`` are set.)
+        """
+        statespace = self.statespace
+        system = statespace.graph["system"]
+        root = statespace.graph["root"]
+        horizon = _time_key(interval.end)
+        self.path, self.time = None, None
+
+        arrival = {root: 0}
+        previous = dict()  # node -> predecessor on the fastest path
+        done = set()
+        counter = itertools.count(1)  # tie breaker, SystemStates are not ordered
+        frontier = [(_time_key(0), 0, root)]
+
+        current_system_state_backup = SystemState(system).save()
+        refinement = KripkeRefinement(system, [check])
+        try:
+            with Cache():
+                while frontier:
+                    key, _, node = heapq.heappop(frontier)
+                    if node in done:
+                        continue  # outdated entry, we found a faster path in the meantime
+                    time = arrival[node]
+                    if not interval.ininterval(_to_number(time)):
+                        break  # the remaining nodes are reached even later
+                    done.add(node)
+
+                    if key <= horizon:  # like explore_until_time, leaves after the horizon stay unexplored
+                        statespace.expand(node)
+                    successors = statespace[node]
+                    max_dt = next(iter(successors.values()))["weight"] if successors else None
+                    (node_value,), splits = refinement.refine(node, max_dt)
+
+                    if node_value == value:
+                        return self._found(previous, node, [], time)
+                    elapsed, states = time, []
+                    for dt, newnode, (new_value,) in splits:
+                        elapsed = elapsed + dt
+                        states.append(newnode)
+                        if not interval.ininterval(_to_number(elapsed)):
+                            break
+                        if new_value == value:
+                            return self._found(previous, node, states, elapsed)
+
+                    for successor, data in successors.items():
+                        new_time = time + data["weight"]
+                        if successor not in arrival or _time_key(new_time) < _time_key(arrival[successor]):
+                            arrival[successor] = new_time
+                            previous[successor] = node
+                            heapq.heappush(frontier, (_time_key(new_time), next(counter), successor))
+        finally:
+            current_system_state_backup.apply()
+
+        logger.info(f"Searched {len(done)} nodes, none of them (or their splits) has the value {value} for {check}")
+        return False
+
+    def _found(self, previous, node, splits, time):
+        """Stores the path from the root to the node and the splits of its edge."""
+        path = [node]
+        while path[-1] in previous:
+            path.append(previous[path[-1]])
+        self.path = path[::-1] + splits
+        self.time = _to_number(time)
+        return True
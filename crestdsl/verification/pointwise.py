@@ -3,17 +3,20 @@ import time
 import math
 import copy
 import itertools
+import weakref
 import networkx as nx
+import numpy as np
 
-from functools import reduce, lru_cache, wraps
+from functools import reduce, wraps
 from crestdsl.caching import Cache
 
 from . import checklib
 from .tctl import *  # I know, I know...  but otherwise the formulas become unreadable !!
-from .tctl import NamedAtomicProposition, TCTLFormula  # * in tctl only offers some of the classes, we need all !
-from .statespace import SystemState
+from .tctl import NamedAtomicProposition, TCTLFormula, FormulaTable  # * in tctl only offers some of the classes, we need all !
+from .statespace import SystemState, StateSpace
 from crestdsl.ui import plotly_statespace
-from .reachabilitycalculator import ReachabilityCalculator
+from .refinement import refine_kripke, CREST_PROPS
+from .kripkearrays import KripkeArrays
 
 from crestdsl.simulation.epsilon import eps
 from crestdsl.simulation.simulator import Simulator
@@ -42,7 +45,35 @@ def mc_tracing(func):
     return wrapper
 
 
-CREST_PROPS = "crest_props"
+def memoized(func):
+    """
+    This decorator looks up the satisfying nodes of formulas that were already evaluated on the same Kripke structure.
+    Formulas are identified by their canonical formula (see FormulaTable),
+    so each distinct subformula is only evaluated once, no matter how often the rewrites produce it.
+    """
+    @wraps(func)
+    def wrapper(self, formula, crestKripke):
+        memo = self._satisfying_sets(crestKripke)
+        canonical = self._formulas.intern(formula)
+        entry = memo.get(id(canonical))
+        if entry is None:
+            entry = memo[id(canonical)] = (canonical, func(self, formula, crestKripke))  # keep the canonical formula (and its id) alive
+        else:
+            logger.debug(f"{func.__name__} reuses {len(entry[1])} nodes for formula {str(formula)}")
+        return entry[1]
+    return wrapper
+
+
+def _longest_simple_path_weights(graph, targets):
+    def path_weight(path):
+        return sum(graph[path[i]][path[i+1]]['weight'] for i in range(len(path)-1))
+
+    longest = {}
+    for source in graph.nodes():
+        weights = [path_weight(path) for target in targets for path in nx.all_simple_paths(graph, source, target)]
+        if weights:
+            longest[source] = max(weights)
+    return longest
 
 
 class PointwiseModelChecker(methoddispatch.SingleDispatch):
@@ -60,14 +91,43 @@ class PointwiseModelChecker(methoddispatch.SingleDispatch):
     This ModelChecker implements POINTWISE semantics, which is enough for checking system states
     """
 
-    def __init__(self, statespace=None):
+    def __init__(self, statespace=None, workers=None):
         """
         Parameters
         ----------
         statespace: StateSpace
             The statespace (timed Kripke structure) that will be explored.
+        workers: int
+            Split the CREST Kripke structure's edges in this many worker processes
+            (default: in this process).
         """
-        self.statespace = statespace.copy()  # operate on a copy of the state space
+        # operate on a copy of the state space (copy-on-write, it's only copied when it's explored further)
+        self.statespace = statespace.view() if isinstance(statespace, StateSpace) else statespace.copy()
+        self.workers = workers
+        self._formulas = FormulaTable()
+        self._satisfying = weakref.WeakKeyDictionary()  # Kripke structure -> (number of nodes, memo table)
+        self._arrays = weakref.WeakKeyDictionary()  # Kripke structure -> KripkeArrays
+
+    def _satisfying_sets(self, crestKripke):
+        """
+        The memo table of the satisfying nodes of the (canonical) formulas that were evaluated on the Kripke structure.
+        It is dropped when nodes were added to or removed from the structure since.
+        """
+        size = crestKripke.number_of_nodes()
+        entry = self._satisfying.get(crestKripke)
+        if entry is None or entry[0] != size:
+            entry = self._satisfying[crestKripke] = (size, dict())
+        return entry[1]
+
+    def _kripke_arrays(self, crestKripke):
+        """
+        The array representation of the Kripke structure that the procedures work on (see KripkeArrays).
+        It is created again when nodes or edges were added or removed since.
+        """
+        arrays = self._arrays.get(crestKripke)
+        if arrays is None or len(arrays) != crestKripke.number_of_nodes() or len(arrays.weights) != crestKripke.number_of_edges():
+            arrays = self._arrays[crestKripke] = KripkeArrays(crestKripke)
+        return arrays
 
     def has_zero_cycles(self, Graph, values=None):
         if values is None:
@@ -93,70 +153,12 @@ class PointwiseModelChecker(methoddispatch.SingleDispatch):
         if formula is None:  # early exit, e.g. if we only want to test mechanisms without splitting
             return crestKripke
 
-        with Cache() as c:
-            props = formula.get_propositions()
-            filtered_props = [prop for prop in props if not isinstance(prop, checklib.StateCheck)]  # remove statechecks, they're fine already
-            sorted_props = sorted(props, key=lambda x: order.get(getattr(x, "operator", None), 100))
-
-            logger.debug(f"Adapting the CREST Kripke structure for properties in formula:\n {formula}")
-            logger.debug("crestKripke is split in this prop order: " + ", ".join([str(sp)for sp in sorted_props]))
-            for prop in sorted_props:
-                # logger.debug(f"Expanding for {prop}")
-                stack_of_nodes = list(crestKripke.nodes)
-                while len(stack_of_nodes) > 0:
-                    node = stack_of_nodes.pop(0)
-                    # logger.debug(f"Analysing node {id(node)}, {len(stack_of_nodes)} nodes remaining")
-
-                    node.apply()
+        props = formula.get_propositions()
+        sorted_props = sorted(props, key=lambda x: order.get(getattr(x, "operator", None), 100))
 
-                    # test if check is satisfiable
-                    current_prop_value = prop.check()
-                    # logger.debug(f"Prop value for node {id(node)} is {current_prop_value}")
-
-                    # annotate node with current state
-                    if CREST_PROPS not in crestKripke.nodes[node]:
-                        crestKripke.nodes[node][CREST_PROPS] = dict()
-                    crestKripke.nodes[node][CREST_PROPS][prop] = current_prop_value
-
-                    node_successors = list(crestKripke.neighbors(node))
-                    if len(node_successors) <= 0:  # skip because we didn't find any successors
-                        # logger.debug(f"Node {id(node)} has no successors. Stop.")
-                        continue
-
-                    max_dt = crestKripke[node][node_successors[0]]['weight']
-                    # logger.debug(f"Node {id(node)} has {len(node_successors)} successors. Their distance is {max_dt}")
-
-                    # find if prop can change
-                    rc = ReachabilityCalculator(crestKripke.graph["system"])
-                    interval = Interval()
-                    interval < max_dt
-
-                    if current_prop_value is False:
-                        reachable = rc.isreachable(prop, interval)
-                    else:
-                        reachable = rc.isreachable(checklib.NotCheck(prop), interval)
-
-                    # logger.debug(f"Poperty changes value after {reachable} time units.")
-
-                    # prop can change
-                    if reachable is not False:  # it can change
-                        # create a new node, calculate its port values
-                        sim = Simulator(node.system, record_traces=False)
-                        node.apply()
-                        sim.stabilise()
-                        sim.advance(reachable)
-
-                        newnode = SystemState(node.system).save()
-
-                        for succ in node_successors:
-                            crestKripke.remove_edge(node, succ)  # remove old edge
-                            crestKripke.add_edge(newnode, succ, weight=max_dt-reachable)  # add new edge
-
-                        # connect new node
-                        crestKripke.add_edge(node, newnode, weight=reachable)
-
-                        # put new node up for exploration
-                        stack_of_nodes.append(newnode)
+        logger.debug(f"Adapting the CREST Kripke structure for properties in formula:\n {formula}")
+        logger.debug("crestKripke is split for these props: " + ", ".join([str(sp)for sp in sorted_props]))
+        refine_kripke(crestKripke, sorted_props, workers=self.workers)
 
         logger.debug(f"finished analysing all nodes. CREST Kripke structure has {len(crestKripke)} states and {len(crestKripke.edges())}")
         return crestKripke
@@ -198,9 +200,57 @@ class PointwiseModelChecker(methoddispatch.SingleDispatch):
 
     def get_satisfying_nodes(self, formula):
         crestKripke = self.make_CREST_Kripke(formula)
+        return self.evaluate(formula, crestKripke)
+
+    def evaluate(self, formula, crestKripke):
+        """
+        Finds the nodes that satisfy the formula in a CREST Kripke structure
+        that was made (by make_CREST_Kripke) for this formula or for more.
+
+        Returns
+        -------
+        tuple
+            The satisfying nodes and the CREST Kripke structure they belong to.
+        """
         sat_set = self.is_satisfiable(formula, crestKripke)
         return sat_set, crestKripke
 
+    def check_all(self, formulas, systemstate=None):
+        """
+        Checks several formulas on one CREST Kripke structure.
+        It is refined once, for the atomic propositions (and interval bounds) of all formulas,
+        and the satisfying nodes of common subformulas are only calculated once.
+
+        Parameters
+        ----------
+        formulas: list
+            The tctl formulas (or bools).
+        systemstate: SystemState
+            In case you want to execute the formulas on a different state than the statespace's root.
+
+        Returns
+        -------
+        list
+            (result, seconds) for each formula.
+            The time is the formula's own evaluation, the preparation of the Kripke structure is shared.
+        """
+        tctl_formulas = [formula for formula in formulas if isinstance(formula, TCTLFormula)]
+        start = time.time()
+        crestKripke = self.make_CREST_Kripke(reduce(And, tctl_formulas)) if tctl_formulas else None
+        logger.info(f"Prepared the CREST Kripke structure for {len(tctl_formulas)} formulas in {time.time() - start} seconds")
+
+        results = []
+        for formula in formulas:
+            start = time.time()
+            if isinstance(formula, TCTLFormula):
+                sat_set, kripke = self.evaluate(formula, crestKripke)
+                result = (systemstate if systemstate is not None else kripke.graph["root"]) in sat_set
+            else:
+                result = self.check(formula, systemstate)
+            results.append((result, time.time() - start))
+            logger.info(f"Formula {str(formula)} is satisfiable: {result}")
+        return results
+
     def draw(self, formula, systemstate=None):
         # crestKripke is an optional parameter. if it's provided, we use it, otherwise it's fine
         # crestKripke = self.make_CREST_Kripke(formula, crestKripke)
@@ -221,7 +271,7 @@ class PointwiseModelChecker(methoddispatch.SingleDispatch):
         raise ValueError(msg)
 
     @is_satisfiable.register(bool)
-    # @lru_cache(maxsize=None, typed=True)
+    @memoized
     @mc_tracing
     def issatisfiable_boolean(self, formula, crestKripke):
         if formula:
@@ -231,7 +281,7 @@ class PointwiseModelChecker(methoddispatch.SingleDispatch):
         return retval
 
     @is_satisfiable.register(checklib.Check)
-    # @lru_cache(maxsize=None, typed=True)
+    @memoized
     @mc_tracing
     def issatisfiable_check_check(self, formula, crestKripke):
         retval = list()
@@ -247,7 +297,7 @@ class PointwiseModelChecker(methoddispatch.SingleDispatch):
         return set(retval)
 
     @is_satisfiable.register(NamedAtomicProposition)
-    # @lru_cache(maxsize=None, typed=True)
+    @memoized
     @mc_tracing
     def issatisfiable_NamedAP(self, formula, crestKripke):
         retval = list()
@@ -258,14 +308,14 @@ class PointwiseModelChecker(methoddispatch.SingleDispatch):
         return set(retval)
 
     @is_satisfiable.register(Not)
-    # @lru_cache(maxsize=None, typed=True)
+    @memoized
     @mc_tracing
     def issatisfiable_tctlNot(self, formula, crestKripke):
         retval = self.is_satisfiable(True, crestKripke) - self.is_satisfiable(formula.phi, crestKripke)
         return retval
 
     @is_satisfiable.register(And)
-    # @lru_cache(maxsize=None, typed=True)
+    @memoized
     @mc_tracing
     def issatisfiable_tctlAnd(self, formula, crestKripke):
         phi_res = self.is_satisfiable(formula.phi, crestKripke)
@@ -275,7 +325,7 @@ class PointwiseModelChecker(methoddispatch.SingleDispatch):
         return retval
 
     @is_satisfiable.register(Or)
-    # @lru_cache(maxsize=None, typed=True)
+    @memoized
     @mc_tracing
     def issatisfiable_tctlOr(self, formula, crestKripke):
         # shortcut for 4.2 Not(And(Not(form1), Not(form2))
@@ -284,7 +334,7 @@ class PointwiseModelChecker(methoddispatch.SingleDispatch):
         return set.union(set(phi_res), set(psi_res))
 
     @is_satisfiable.register(Implies)
-    # @lru_cache(maxsize=None, typed=True)
+    @memoized
     @mc_tracing
     def issatisfiable_tctlImplies(self, formula, crestKripke):
         # 4.3 rewrite implies
@@ -292,7 +342,7 @@ class PointwiseModelChecker(methoddispatch.SingleDispatch):
         return self.is_satisfiable(new_formula, crestKripke)
 
     @is_satisfiable.register(Equality)
-    # @lru_cache(maxsize=None, typed=True)
+    @memoized
     @mc_tracing
     def issatisfiable_tctlEquality(self, formula, crestKripke):
         # 4.4 rewrite equality
@@ -302,7 +352,7 @@ class PointwiseModelChecker(methoddispatch.SingleDispatch):
         return self.is_satisfiable(new_formula, crestKripke)
 
     @is_satisfiable.register(EF)
-    # @lru_cache(maxsize=None, typed=True)
+    @memoized
     @mc_tracing
     def issatisfiable_tctlEF(self, formula, crestKripke):
         # 4.5 rewrite EF_I
@@ -310,7 +360,7 @@ class PointwiseModelChecker(methoddispatch.SingleDispatch):
         return self.is_satisfiable(new_formula, crestKripke)
 
     @is_satisfiable.register(AF)
-    # @lru_cache(maxsize=None, typed=True)
+    @memoized
     @mc_tracing
     def issatisfiable_tctlAF(self, formula, crestKripke):
         # 4.6 rewrite AF_I
@@ -318,7 +368,7 @@ class PointwiseModelChecker(methoddispatch.SingleDispatch):
         return self.is_satisfiable(new_formula, crestKripke)
 
     @is_satisfiable.register(EG)
-    # @lru_cache(maxsize=None, typed=True)
+    @memoized
     @mc_tracing
     def issatisfiable_tctlEG(self, formula, crestKripke):
         intvl = formula.interval
@@ -349,7 +399,7 @@ class PointwiseModelChecker(methoddispatch.SingleDispatch):
         raise ValueError("I cannot transform an EG-formula because the interval is invalid. Formula \n {str(formula)}")
 
     @is_satisfiable.register(AG)
-    # @lru_cache(maxsize=None, typed=True)
+    @memoized
     @mc_tracing
     def issatisfiable_tctlAG(self, formula, crestKripke):
         # 4.10 rewrite AG_I
@@ -357,7 +407,7 @@ class PointwiseModelChecker(methoddispatch.SingleDispatch):
         return self.is_satisfiable(new_formula, crestKripke)
 
     @is_satisfiable.register(EU)
-    @lru_cache(maxsize=None, typed=True)
+    @memoized
     @mc_tracing
     def issatisfiable_tctlEU(self, formula, crestKripke):
         """ Procedure 2 - selection """
@@ -380,7 +430,7 @@ class PointwiseModelChecker(methoddispatch.SingleDispatch):
         raise AttributeError(f"Don't know which procedure to choose for formula {formula}")
 
     @is_satisfiable.register(AU)
-    # @lru_cache(maxsize=None, typed=True)
+    @memoized
     @mc_tracing
     def issatisfiable_tctlAU(self, formula, crestKripke):
         """ Procedure 2 - selection """
@@ -476,104 +526,60 @@ class PointwiseModelChecker(methoddispatch.SingleDispatch):
         Q1 = phi_set if (phi_set is not None) else self.is_satisfiable(formula.phi, crestKripke)
         Q2 = psi_set if (psi_set is not None) else self.is_satisfiable(formula.psi, crestKripke)
 
-        Q2_pre = set().union(*[crestKripke.predecessors(s) for s in Q2]) & set(Q1)  # phi nodes who are predecessors of Q2
-
-        Q1_view = crestKripke.subgraph(Q1)  # only phi nodes
-        Q2_pre_pre = set().union(*[nx.ancestors(Q1_view, p) for p in Q2_pre])  # all phi-ancestors of Q2_pre nodes
-
-        return set().union(Q2, Q2_pre, Q2_pre_pre)
+        arrays = self._kripke_arrays(crestKripke)
+        Q2_mask = arrays.mask(Q2)
+        Q2_pre = arrays.ancestors(Q2_mask, arrays.mask(Q1))  # phi nodes with a phi path to a Q2 node
+        return set(Q2) | arrays.node_set(Q2_pre)
 
     # procedure 4
     def Sat_EG(self, formula, crestKripke):
-
-        def is_trivial(nodes):
-            view = crestKripke.subgraph(nodes)
-            return view.number_of_edges() == 0
-
         Q1 = self.is_satisfiable(formula.phi, crestKripke)
-        Q1_view = nx.graphviews.subgraph_view(crestKripke, filter_node=(lambda x: x in Q1))
-
-        Q = set.union(*[comp for comp in nx.strongly_connected_components(Q1_view) if not is_trivial(comp)])
-        Q_pre = set().union(*[(set(crestKripke.predecessors(s)) & Q1) - Q for s in Q])
-
-        while len(Q_pre) > 0:
-            Q = set.union(Q, Q_pre)
-            Q_pre = set().union(*[(set(crestKripke.predecessors(s)) & Q1) - Q for s in Q])
-
-        alt_Q = set.union(*[comp for comp in nx.strongly_connected_components(Q1_view) if not is_trivial(comp)])
-        alt_Q_pre = set().union(*[nx.ancestors(Q1_view, node) for node in Q])
-
-        assert alt_Q | alt_Q_pre == Q, "New way and old way are equal"
 
-        return Q
+        # the states of the nontrivial strongly connected components in Q1 and their Q1-ancestors,
+        # i.e. the ones that are left if we remove the states without Q1-successors over and over again
+        arrays = self._kripke_arrays(crestKripke)
+        return arrays.node_set(arrays.infinite_paths(arrays.mask(Q1)))
 
     # procedure 5
     def Sat_EUb(self, formula, crestKripke):
         Q1 = self.is_satisfiable(formula.phi, crestKripke)
         Q2 = self.is_satisfiable(formula.psi, crestKripke)
         Qu = self.Sat_EU(formula, crestKripke, phi_set=Q1, psi_set=Q2)  # this is a shortcut, we use Sat_EU directly instead of adapting the formula and calling generic is_satisfiable
-        # print("Qu")
-        # plotly_statespace(crestKripke, highlight=Qu)
-
-        # # subgraph only with edges between nodes that satisfy the untimed formula
-        # TR = [ e for e in crestKripke.subgraph(Qu).edges() if e[0] not in Q1 - Q2]
-        # edge_subgraph = crestKripke.edge_subgraph(TR)
-        # print("edge_subgraph")
-        # plotly_statespace(crestKripke, highlight=edge_subgraph.nodes())
-        limit = formula.interval.end
-        shortest_paths = nx.all_pairs_dijkstra_path_length(crestKripke.subgraph(Qu), cutoff=limit)
-
-        filtered_paths = []  # (source, target, length)
-        for (source, target_lengths) in shortest_paths:
-            for target, length in target_lengths.items():
-                if formula.interval.ininterval(length) and target in Q2:
-                    filtered_paths.append((source, target, length))
-        # for (source, target, length) in filtered_paths:
-        #     assert source in Q1 | Q2, "source is either a Phi or a Psi node"
-        #     assert target in Q2, "Target is a Psi node"
-        #     assert length <= limit, "The path length is in the interval"
-
-        return {fp[0] for fp in filtered_paths}
+
+        # the interval starts at 0, so a node is a solution if its closest psi node is close enough
+        arrays = self._kripke_arrays(crestKripke)
+        distances = arrays.shortest_path_weights(arrays.mask(Q2), arrays.mask(Qu), cutoff=formula.interval.end)
+        return {arrays.nodes[source] for source, length in distances.items() if formula.interval.ininterval(length)}
 
     # procedure 6
     def Sat_EUa(self, formula, crestKripke):
-        def is_trivial(nodes):
-            view = crestKripke.subgraph(nodes)
-            return view.number_of_edges() == 0
-
-        def path_weight(G, path):
-            return sum(G[path[i]][path[i+1]]['weight'] for i in range(len(path)-1))
-
         Q1 = self.is_satisfiable(formula.phi, crestKripke)
         Q2 = self.is_satisfiable(formula.psi, crestKripke)
 
         Qu = self.Sat_EU(formula, crestKripke, phi_set=Q1, psi_set=Q2)  # this is a shortcut, we use Sat_EU directly instead of adapting the formula and calling generic is_satisfiable
 
-        # a) states in SSCs that are also solutions
-        Q1_view = nx.graphviews.subgraph_view(crestKripke, filter_node=(lambda x: x in Q1)) # subgraph with only Q1 nodes
-        Qssc = set.union(*[comp for comp in nx.strongly_connected_components(Q1_view) if not is_trivial(comp)]) # states in strongly connected components in Q1
+        arrays = self._kripke_arrays(crestKripke)
+        Q1_mask, Q2_mask, Qu_mask = arrays.mask(Q1), arrays.mask(Q2), arrays.mask(Qu)
 
-        Q = Qu & Qssc  # states that where EU(phi, psi) is valid and that are in a strongly connected component (thus satisfy the formula)
-        Q_pre = set.union(*[nx.ancestors(Q1_view, node) for node in Q]) # the ancestors of all nodes in Q (i.e. the ones leading to the SCC-Q states)
-        Q = Q | Q_pre  # extend Q by the predecessors Q_pre
+        # a) states in SSCs that are also solutions, and their Q1-ancestors
+        # (the whole cycle of a Qu state in a Q1 SCC is in Qu, and so are its Q1-ancestors.
+        #  So these are the states with an infinite path through Q1 & Qu states)
+        Q = arrays.infinite_paths(Q1_mask & Qu_mask)
 
         # b)
-        Q_DAG = Qu - Q  # all states that can reach Qu but are not yet in Q
-        Q_DAG_view = crestKripke.subgraph(Q_DAG)  # the subgraph induced by those states
-
-
-        paths = []  # (source, target, length) for paths that are longer than minimum
-        logger.debug(f"Todo list len {len(Q_DAG)}")
-        logger.debug(f"Q2 & Q_DAG len {len(Q2 & Q_DAG)}")
-        for idx, phi in enumerate(Q_DAG):
-            logger.debug(f"beat {idx}")
-            for psi in (Q2 & Q_DAG):
-                max_weight = max([path_weight(crestKripke, path) for path in nx.all_simple_paths(Q_DAG_view, phi, psi)], default=False)
-                if max_weight is not False and formula.interval.ininterval(max_weight):
-                    paths.append(phi)
-                    break  # break inner loop, go to next psi node
-
-        return Q | set(paths)
+        Q_DAG = Qu_mask & ~Q  # all states that can reach Qu but are not yet in Q
+        logger.debug(f"Todo list len {Q_DAG.sum()}")
+        logger.debug(f"Q2 & Q_DAG len {(Q2_mask & Q_DAG).sum()}")
+        # the interval is [a, inf) or (a, inf), so a phi state is a solution if its longest path to a psi state is long enough
+        longest = arrays.longest_path_weights(Q2_mask & Q_DAG, Q_DAG)
+        if longest is None:
+            logger.warning("The graph has cycles. Enumerating all simple paths, this might take a while.")
+            longest = _longest_simple_path_weights(crestKripke.subgraph(arrays.node_set(Q_DAG)), arrays.node_set(Q2_mask & Q_DAG))
+            longest = {arrays.index[node]: weight for node, weight in longest.items()}
+        paths = [phi for phi, max_weight in longest.items() if formula.interval.ininterval(max_weight)]
+        Q[paths] = True
+
+        return arrays.node_set(Q)
 
     # procedure 7
     def Sat_EUab(self, formula, crestKripke):
@@ -582,25 +588,30 @@ class PointwiseModelChecker(methoddispatch.SingleDispatch):
         Q2 = self.is_satisfiable(formula.psi, crestKripke)
         Qu = self.Sat_EU(formula, crestKripke, phi_set=Q1, psi_set=Q2)  # this is a shortcut, we use Sat_EU directly instead of adapting the formula and calling generic is_satisfiable
 
-        Qu_view = crestKripke.subgraph(Qu)
-        TR = [edge for edge in Qu_view.edges() if edge[0] in Q1]  # the edges in Qu where the start is a Q1 node
+        arrays = self._kripke_arrays(crestKripke)
+        Qu_mask = arrays.mask(Qu)
+        # the edges in Qu where the start is a Q1 node
+        TR = (arrays.mask(Q1) & Qu_mask)[arrays.edge_source] & Qu_mask[arrays.edge_target]
+        pred_ptr, pred_edges = arrays.pred_ptr.tolist(), arrays.pred_edges.tolist()
+        edge_source, weights, in_TR = arrays.edge_source.tolist(), arrays.weights, TR.tolist()
 
         Q = set()  # the nodes that we already found
         Tv = set()  # visited configs
-        T = [(s, 0) for s in Q2]  # configurations we still have to try
+        T = [(s, 0) for s in np.flatnonzero(arrays.mask(Q2) & Qu_mask).tolist()]  # configurations we still have to try
         while len(T) > 0:
             (s, tau) = T.pop()  # take one of the todo list
             Tv.add( (s, tau) )  # remember that we visited this one already
 
             Tpre = set()   # the predecessors of the current config
-            for pre, s, tau_pre in Qu_view.in_edges(s, data="weight"):
-                if intvl.end_operator(tau + tau_pre, intvl.end) and pre in Q1:
-                    Tpre.add( (pre, tau + tau_pre))
+            for position in range(pred_ptr[s], pred_ptr[s + 1]):
+                edge = pred_edges[position]
+                if in_TR[edge] and intvl.end_operator(tau + weights[edge], intvl.end):
+                    Tpre.add( (edge_source[edge], tau + weights[edge]))
             T.extend(Tpre - Tv)  # add the new predecessors to the todo list, if we  haven't visited yet
 
             if intvl.ininterval(tau):
                 Q.add(s)
-        return Q
+        return {arrays.nodes[s] for s in Q}
 
     # procedure 8
     def Sat_AU0(self, formula, crestKripke):
@@ -610,15 +621,12 @@ class PointwiseModelChecker(methoddispatch.SingleDispatch):
         Q1 = self.is_satisfiable(formula.phi, crestKripke)
         Qu = self.is_satisfiable(formula_I_0, crestKripke)
 
-        Qu_view = crestKripke.subgraph(Qu)
-
-        Q = {s for s in Qu_view.nodes() if Qu_view.out_degree(s) == 0}  # the nodes that have no outgoing transition
+        arrays = self._kripke_arrays(crestKripke)
+        Qu_mask = arrays.mask(Qu)
+        Qu_edges = Qu_mask[arrays.edge_source] & Qu_mask[arrays.edge_target]
 
-        shortest_paths = nx.all_pairs_dijkstra_path_length(crestKripke.subgraph(Qu), cutoff=0)  # find all paths of length 0
-        Qpre = []
-        for (source, target_lengths) in shortest_paths:
-            for target, length in target_lengths.items():
-                if length == 0 and target in Q:  # the ones that can reach Q in 0
-                    Qpre.append(source)
+        out_degree = np.bincount(arrays.edge_source[Qu_edges], minlength=len(arrays))
+        Q = Qu_mask & (out_degree == 0)  # the nodes that have no outgoing transition
 
-        return Qu - (Q | set(Qpre))  # subtract the ones that reach in 0 time from the ones for I_0
+        Qpre = arrays.ancestors(Q, Qu_mask, edges=Qu_edges & arrays.zero)  # the ones that can reach Q in 0
+        return arrays.node_set(Qu_mask & ~(Q | Qpre))  # subtract the ones that reach in 0 time from the ones for I_0
@@ -7,6 +7,10 @@ from crestdsl import sourcehelper as SH
 from crestdsl.simulation.epsilon import Epsilon
 from crestdsl.config import to_python
 from crestdsl.simulation.z3calculator import Z3Calculator
+from crestdsl.simulation.conditiontimedchangecalculator import IncrementalQuery
+from crestdsl.simulation.analytictime import AffineTransitionTime, NotAffine
+from crestdsl.model import Types, get_all_entities
+from crestdsl.model.api import get_current
 from crestdsl.verification import checklib
 
 import math  # for infinity
@@ -20,6 +24,19 @@ logger = logging.getLogger(__name__)
 
 class ReachabilityCalculator(methoddispatch.SingleDispatch, Z3Calculator):
 
+    def __init__(self, system, timeunit=Types.REAL, use_integer_and_real=config.use_integer_and_real, incremental=False):
+        """
+        Parameters
+        ----------
+        incremental: bool
+            Keep the solvers of the queries (per check and combination of current states)
+            and only exchange the pre values of the ports and the interval on repeated calls.
+            Only use this if the system's structure doesn't change in between.
+        """
+        super().__init__(system, timeunit, use_integer_and_real)
+        self.incremental = incremental
+        self._queries = {}
+
     def create_system_constraints(self):
         logger.info("creating system constraints")
 
@@ -41,6 +58,55 @@ class ReachabilityCalculator(methoddispatch.SingleDispatch, Z3Calculator):
     @isreachable.register(checklib.Check)
     def isreachable_check(self, check, interval=None):
         logger.debug(f"Calculating whether all of the checks are reachable")
+        query = self._get_query(check)
+        dt = query.z3_vars['dt']
+
+        pre_value_constraints = self.get_pre_value_constraints(query.modifier_map, query.z3_vars)
+        interval_constraints = self._get_interval_constraints(interval, dt)
+        if query.analytic is not None:
+            try:
+                min_dt = query.analytic.minimum_dt(pre_value_constraints + interval_constraints)
+                logger.debug(f"Analytic minimum time to reach passing checks is {min_dt}")
+                return min_dt if min_dt is not None else False
+            except NotAffine as exc:
+                logger.debug(f"Cannot calculate the reachability analytically, using Z3 instead: {exc}")
+
+        solver = query.solver
+        solver.push()  # the pre values and the interval only hold for this query
+        solver.add(pre_value_constraints)
+        solver.add(interval_constraints)
+        try:
+            return self._minimize(solver, query.objective, dt)
+        finally:
+            solver.pop()
+
+    def _get_interval_constraints(self, interval, dt):
+        if interval is None:
+            logger.debug(f"Adding time start constraint: dt >= 0")
+            return [dt >= 0]
+
+        interval = interval.resolve_infinitesimal()
+        constraints = [interval.start_operator(dt, interval.start)]
+        # logger.debug(f"Adding time start constraint: {interval.start_operator(dt, interval.start)}")
+        if interval.end is not math.inf:  # if it's infinity, just drop it...
+            constraints.append(interval.end_operator(dt, interval.end))
+            # logger.debug(f"Adding time end constraint: {interval.end_operator(dt, interval.end)}")
+        return constraints
+
+    def _get_query(self, check):
+        """Returns the solver for the check (cached per check and combination of current states, if incremental)."""
+        if not self.incremental:
+            return self._build_query(check)
+
+        # the modifier map depends on the active updates, i.e. the current states
+        key = (check, tuple(get_current(entity) for entity in get_all_entities(self.entity)))
+        query = self._queries.get(key)
+        if query is None:
+            query = self._queries[key] = self._build_query(check)
+        return query
+
+    def _build_query(self, check):
+        """Creates a solver with all constraints of a reachability query, except for the pre values and the interval."""
         solver = z3.Optimize()
 
         check_ports = check.get_ports()
@@ -48,21 +114,9 @@ class ReachabilityCalculator(methoddispatch.SingleDispatch, Z3Calculator):
         # build a mapping that shows the propagation of information to the guard (what influences the guard)
         modifier_map = self.get_modifier_map(check_ports)
 
-        z3var_constraints, z3_vars = self.get_z3_vars(modifier_map)
+        z3var_constraints, z3_vars = self.get_z3_vars(modifier_map, pre_values=False)
         solver.add(z3var_constraints)
 
-        if interval is None:
-            solver.add(z3_vars['dt'] >= 0)
-            logger.debug(f"Adding time start constraint: dt >= 0")
-        else:
-            interval = interval.resolve_infinitesimal()
-            solver.add(interval.start_operator(z3_vars['dt'], interval.start))
-            # logger.debug(f"Adding time start constraint: {interval.start_operator(z3_vars['dt'], interval.start)}")
-            if interval.end is not math.inf:  # if it's infinity, just drop it...
-                end = interval.end
-                solver.add(interval.end_operator(z3_vars['dt'], end))
-                # logger.debug(f"Adding time end constraint: {interval.end_operator(z3_vars['dt'], end)}")
-
         # create the constraints for updates and influences
         for port, modifiers in modifier_map.items():
             for modifier in modifiers:
@@ -75,10 +129,20 @@ class ReachabilityCalculator(methoddispatch.SingleDispatch, Z3Calculator):
             logger.debug(f"Check constraints: {check_constraints}")
         solver.add(check_constraints)
 
+        analytic = None
+        if config.analytic_transition_times:
+            try:
+                analytic = AffineTransitionTime(solver.assertions(), z3_vars['dt'])
+            except NotAffine as exc:
+                logger.debug(f"The reachability of {check} cannot be calculated analytically: {exc}")
+
         objective = solver.minimize(z3_vars['dt'])  # find minimal value of dt
+        return IncrementalQuery(solver, modifier_map, z3_vars, objective, analytic)
+
+    def _minimize(self, solver, objective, dt):
         check = solver.check()
         # logger.debug("satisfiability: %s", check)
-        if solver.check() == z3.sat:
+        if check == z3.sat:
             inf_coeff, numeric_coeff, eps_coeff = objective.lower_values()
             returnvalue = Epsilon(numeric_coeff, eps_coeff)
             logger.info(f"Minimum time to reach passing checks is {returnvalue}")
@@ -89,7 +153,7 @@ class ReachabilityCalculator(methoddispatch.SingleDispatch, Z3Calculator):
             std_solver.add(solver.assertions())
             std_solver_check = std_solver.check()
             if std_solver_check == z3.sat:
-                min_dt = std_solver.model()[z3_vars['dt']]
+                min_dt = std_solver.model()[dt]
                 as_python = to_python(min_dt)
                 logger.info(f"We did get a solution using the standard solver though: {as_python} Assuming that this is the smallest solution. CAREFUL THIS MIGHT BE WRONG!!!")
                 return as_python
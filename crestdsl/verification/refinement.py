@@ -0,0 +1,228 @@
+"""
+Splits the edges of a CREST Kripke structure where the value of an atomic proposition changes
+(see :func:`PointwiseModelChecker.make_CREST_Kripke`).
+
+The nodes are independent of each other: an edge is split at the times when one of the propositions
+changes its value, and the new nodes only lead to the node's successors.
+Thus each node is refined on its own (and the nodes can be distributed over worker processes).
+All propositions of a node are handled together:
+the edge is split at the earliest change of any proposition, then the refinement continues from the new node.
+The change times of the other propositions are reused (shifted by the split time),
+so each split only needs one or two new reachability queries.
+
+The reachability queries keep their solvers (per proposition and combination of current states)
+and only exchange the pre values and the time interval.
+One Simulator calculates all new nodes.
+"""
+
+from .statespace import SystemState
+from .reachabilitycalculator import ReachabilityCalculator
+from .tctl import Interval
+from . import checklib
+
+from crestdsl.caching import Cache
+from crestdsl.simulation.simulator import Simulator
+
+import os
+import math
+import multiprocessing
+
+import logging
+logger = logging.getLogger(__name__)
+
+CREST_PROPS = "crest_props"
+
+
+class KripkeRefinement(object):
+    """Calculates the prop values and splits of nodes of one system."""
+
+    def __init__(self, system, props):
+        """
+        Parameters
+        ----------
+        system: Entity
+            The system of the nodes.
+        props: list
+            The atomic propositions (Checks) that the Kripke structure is refined for.
+        """
+        self.system = system
+        self.props = props
+        self.negated_props = [checklib.NotCheck(prop) for prop in props]
+        self.reachability = ReachabilityCalculator(system, incremental=True)
+        self.simulator = Simulator(system, record_traces=False)
+
+    def prop_values(self):
+        """The values of the propositions in the system's current state."""
+        return tuple(prop.check() for prop in self.props)
+
+    def change_time(self, index, value, max_dt):
+        """The earliest time (less than max_dt) at which the proposition changes its value, or False."""
+        check = self.negated_props[index] if value else self.props[index]
+        return self.reachability.isreachable(check, Interval() < max_dt)
+
+    def refine(self, node, max_dt):
+        """
+        Calculates the splits of a node's outgoing edges.
+
+        Along the edge, the system evolves without behaviour changes.
+        So if a proposition changes after t, it changes after t - dt when we split at dt.
+        These predictions are only recalculated (from the current node) if they are the earliest.
+
+        Parameters
+        ----------
+        node: SystemState
+            The node.
+        max_dt: numeric
+            The weight of the node's outgoing edges (None if the node has no successors).
+
+        Returns
+        -------
+        tuple
+            The node's prop values and a list of (dt, new node, prop values) for each split
+            (dt is relative to the previous node).
+        """
+        node.apply()
+        values = self.prop_values()
+        splits = []
+        if max_dt is None:
+            return values, splits
+
+        changes = [self.change_time(index, value, max_dt) for index, value in enumerate(values)]
+        exact = [True] * len(changes)  # False for the predictions
+        current, current_values = node, values
+        while True:
+            pending = [(time, index) for index, time in enumerate(changes) if time is not False]
+            if not pending:
+                return values, splits
+
+            dt, index = min(pending, key=lambda pair: pair[0])
+            current.apply()
+            if not exact[index]:
+                changes[index] = self.change_time(index, current_values[index], max_dt)
+                exact[index] = True
+                continue
+            if dt >= max_dt:  # rounding, the change is at the end of the edge (i.e. in the successors)
+                logger.debug(f"The change after {dt} is not before the end of the edge ({max_dt}), stop splitting the node")
+                return values, splits
+
+            # create a new node, calculate its port values
+            # (the edge leads to the next behaviour change, so there is none before dt: we don't need to look for one)
+            self.simulator.stabilise()
+            self.simulator._actually_advance(dt, logging.DEBUG)
+            newnode = SystemState(self.system).save()
+            if newnode is current:  # dt is too small to change the port values (rounding), there is nothing to split
+                logger.debug(f"Advancing {dt} doesn't change the state, stop splitting the node")
+                return values, splits
+            new_values = self.prop_values()
+            splits.append((dt, newnode, new_values))
+            max_dt = max_dt - dt
+
+            for i, (time, old_value, new_value) in enumerate(zip(changes, current_values, new_values)):
+                if i == index or old_value != new_value:
+                    changes[i], exact[i] = self.change_time(i, new_value, max_dt), True
+                elif time is not False:
+                    changes[i], exact[i] = time - dt, False
+            current, current_values = newnode, new_values
+
+
+def refine_kripke(crestKripke, props, workers=None):
+    """
+    Splits the edges of a CREST Kripke structure where the value of one of the propositions changes
+    and annotates each node with the values of the propositions (in the ``CREST_PROPS`` dict).
+
+    Parameters
+    ----------
+    crestKripke: StateSpace
+        The Kripke structure, it is modified.
+    props: list
+        The atomic propositions (Checks).
+    workers: int
+        Refine the nodes in this many worker processes (default: in this process).
+    """
+    system = crestKripke.graph["system"]
+    jobs = []
+    for node in list(crestKripke.nodes):
+        successors = list(crestKripke.neighbors(node))
+        max_dt = crestKripke[node][successors[0]]['weight'] if successors else None
+        jobs.append((node, successors, max_dt))
+
+    if workers:
+        with RefinementPool(system, props, workers) as pool:
+            results = pool.refine([(node.serialize(), max_dt) for node, _, max_dt in jobs])
+        results = [(values, [(dt, SystemState.from_key(system, serialized.key), split_values) for dt, serialized, split_values in splits])
+                   for values, splits in results]
+    else:
+        current_system_state_backup = SystemState(system).save()  # the refinement applies the nodes' states
+        with Cache():
+            refinement = KripkeRefinement(system, props)
+            results = [refinement.refine(node, max_dt) for node, _, max_dt in jobs]
+        current_system_state_backup.apply()
+
+    for (node, successors, max_dt), (values, splits) in zip(jobs, results):
+        _annotate(crestKripke, node, props, values)
+        for dt, newnode, newvalues in splits:
+            for succ in successors:
+                crestKripke.remove_edge(node, succ)  # remove old edge
+                crestKripke.add_edge(newnode, succ, weight=max_dt - dt)  # add new edge
+            crestKripke.add_edge(node, newnode, weight=dt)  # connect new node
+            _annotate(crestKripke, newnode, props, newvalues)
+            node, max_dt = newnode, max_dt - dt
+    logger.debug(f"Refined {len(jobs)} nodes, {sum(len(splits) for _, splits in results)} new nodes")
+
+
+def _annotate(crestKripke, node, props, values):
+    node_props = crestKripke.nodes[node].setdefault(CREST_PROPS, dict())
+    node_props.update(zip(props, values))
+
+
+# the refinement of a worker process
+_worker_refinement = None
+
+
+def _init_refinement_worker(system, props):
+    global _worker_refinement
+    Cache().activate()  # this process only refines this one system, the structure doesn't change
+    _worker_refinement = KripkeRefinement(system, props)
+
+
+def _refine_chunk(jobs):
+    """Returns (prop values, [(dt, serialized new node, prop values)]) for each node."""
+    results = []
+    for serialized, max_dt in jobs:
+        node = serialized.deserialize(_worker_refinement.system)
+        values, splits = _worker_refinement.refine(node, max_dt)
+        results.append((values, [(dt, newnode.serialize(), newvalues) for dt, newnode, newvalues in splits]))
+    return results
+
+
+class RefinementPool(object):
+    """
+    Worker processes that refine Kripke structure nodes.
+    The workers are forked and inherit a copy of the system and the propositions
+    (the propositions refer to the system's ports, so they cannot be sent separately).
+    """
+
+    def __init__(self, system, props, workers=None):
+        self.workers = workers or os.cpu_count()
+        if "fork" not in multiprocessing.get_all_start_methods():
+            raise ValueError("Parallel refinement needs processes that can be forked.")
+        context = multiprocessing.get_context("fork")
+        self._pool = context.Pool(self.workers, initializer=_init_refinement_worker, initargs=(system, props))
+
+    def refine(self, jobs, chunksize=None):
+        """Returns the refinement of each (serialized node, max_dt) job, in the order of the jobs."""
+        if chunksize is None:
+            chunksize = max(1, math.ceil(len(jobs) / (self.workers * 4)))
+        chunks = [jobs[i:i + chunksize] for i in range(0, len(jobs), chunksize)]
+        logger.debug(f"Sending {len(jobs)} nodes to {self.workers} workers in {len(chunks)} chunks")
+        return [result for chunk_results in self._pool.map(_refine_chunk, chunks) for result in chunk_results]
+
+    def close(self):
+        self._pool.close()
+        self._pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -1,17 +1,22 @@
 import networkx as nx
 import math
+import heapq
 import operator
+import itertools
 
 from datetime import datetime
 import os
-import queue
 import copy
-import threading
+import weakref
+import multiprocessing
+from collections import OrderedDict
 
 import crestdsl.model as model
 import crestdsl.model.api as api
+from crestdsl import sourcehelper as SH
+from crestdsl.config import config
 from crestdsl.simulation.simulator import Simulator
-import crestdsl.simulation.dependencyOrder as DO
+from crestdsl.simulation.epsilon import Epsilon
 
 from crestdsl.caching import Cache
 
@@ -22,6 +27,14 @@ logger = logging.getLogger(__name__)
 
 EXPLORED = "explored"
 
+
+def _time_key(time):
+    """Makes numbers and Epsilons comparable: (numeric, epsilon)."""
+    if isinstance(time, Epsilon):
+        return (time.numeric, time.epsilon)
+    return (time, 0)
+
+
 class StateSpace(nx.DiGraph):
     """
     Creates a graph of initial node + stabilised nodes.
@@ -43,21 +56,109 @@ class StateSpace(nx.DiGraph):
             Arguments that are passed on to the underlying networkx structure.
         """
         super().__init__(*args, **kwargs)
+        self._views = weakref.WeakSet()
+        self._expanded = set()  # the nodes whose successors were calculated by expand
+        self.explored_until = None  # the horizon of explore_until_time
         if system:
             self.graph["system"] = system
             sysstate = SystemState(system).save()
             self.graph["root"] = sysstate
             self.add_node(sysstate, label="INIT", explored=False)  # initial node
 
-    def explore_until_time(self, time):
+    def view(self):
+        """
+        A read-only view of the state space as it is now (copy-on-write).
+
+        The view shares the graph with the state space.
+        Only when the state space is explored further, the views get a copy of the graph as it was.
+        (Other changes, e.g. calling add_edge directly, are visible in the views.)
+
+        Returns
+        -------
+        StateSpace
+            A frozen state space, use its copy method to get a modifiable one.
+        """
+        view = nx.freeze(self.__class__())
+        view._share(self)
+        self._views.add(view)
+        return view
+
+    def _share(self, other):
+        """Uses the other state space's graph."""
+        self.graph, self._node, self._adj, self._succ, self._pred = other.graph, other._node, other._adj, other._succ, other._pred
+
+    def _detach_views(self):
+        """Gives the views a copy of the graph (one for all of them), before the state space is changed."""
+        if len(self._views) > 0:
+            snapshot = self.copy()
+            for view in list(self._views):
+                view._share(snapshot)
+            self._views.clear()
+
+    def save(self, path):
+        """
+        Writes the state space to a file (see :mod:`crestdsl.verification.checkpoint`).
+
+        Parameters
+        ----------
+        path: str
+            The file name. An existing file is replaced.
+        """
+        from .checkpoint import save_statespace
+        save_statespace(self, path)
+
+    @classmethod
+    def load(cls, path, system):
+        """
+        Reads a state space that was written by :func:`save`.
+        The exploration can be continued with :func:`explore` or :func:`explore_until_time`.
+
+        Parameters
+        ----------
+        path: str
+            The file name.
+        system: Entity
+            An instance of the system that was explored. The nodes refer to this system.
+
+        Returns
+        -------
+        StateSpace
+        """
+        from .checkpoint import load_statespace
+        return load_statespace(path, system, cls)
+
+    def _start_checkpoints(self, path, interval):
+        self._checkpoint_settings = (path, interval) if path is not None else None
+        self._last_checkpoint = datetime.now()
+
+    def _checkpoint(self, force=False):
+        """Saves the state space if checkpoints are on and the interval has passed (or if forced)."""
+        settings = getattr(self, "_checkpoint_settings", None)
+        if settings is None:
+            return
+        path, interval = settings
+        if force or (datetime.now() - self._last_checkpoint).total_seconds() >= interval:
+            self.save(path)
+            self._last_checkpoint = datetime.now()
+
+    def explore_until_time(self, time, checkpoint=None, checkpoint_interval=600):
         """
         Asserts that the graph is expanded so all paths have a minimum length
         i.e. the length to the leaves is at least a amount
+
+        The nodes are expanded in the order of their earliest arrival time (Dijkstra's algorithm on the growing graph).
+        The arrival times and the frontier are kept,
+        so a later call with a larger time continues where this one stopped.
         
         Parameters
         ----------
         time: numeric
             The minimum length of all paths between root and the nodes
+        checkpoint: str
+            If set, the state space is saved to this file periodically and at the end.
+            Use :func:`load` to continue the exploration after a crash.
+        checkpoint_interval: numeric
+            The seconds between checkpoints.
         """
         system = self.graph["system"]
 
@@ -65,32 +166,79 @@ class StateSpace(nx.DiGraph):
         current_system_state_backup = SystemState(system).save()
 
         logger.info(f"Expanding until all leaves have a minimum path of more than {time} time units.")
-        leaves = [v for v, d in self.out_degree() if d == 0]
+        self._start_checkpoints(checkpoint, checkpoint_interval)
+        if getattr(self, "_frontier_edges", None) != self.number_of_edges():
+            self._reset_frontier()  # first call, or the graph was changed by someone else
+
+        horizon = _time_key(time)
+        frontier, arrival = self._frontier, self._arrival
         i = 0
-        while len(leaves) > 0:
+        while frontier and frontier[0][0] <= horizon:
+            key, _, node = heapq.heappop(frontier)
+            if key > _time_key(arrival[node]):
+                continue  # outdated entry, we found a faster path in the meantime
             i += 1
             if i % 100 == 0:
-                logger.info(f"There are {len(leaves)} leaf nodes left to explore. (State space size: {len(self)} nodes)")
-            
-            leaf = leaves.pop()
-            if self.out_degree(leaf) == 0 and not self.nodes(data=EXPLORED, default=False)[leaf]:
-                try:
-                    length, path = nx.single_source_dijkstra(self, source=self.graph["root"], target=leaf, cutoff=time)
-                    logger.debug(f"Leaf {leaf} reachable in {length} time units. Calculating successors.")
-                    successors_transitions, dt = self.calculate_successors_for_node(leaf)
-                    for successor, transitions in successors_transitions:
-                        transitions = [operator.attrgetter(trans)(system) for trans in transitions]
-                        successor = successor.deserialize(system)
-                        self.add_edge(leaf, successor, weight=dt, transitions=transitions)
-                        leaves.append(successor)
-                except nx.NetworkXNoPath:
-                    logger.debug(f"No path to node {leaf} within {time} time units. That's okay.")
-
+                logger.info(f"There are {len(frontier)} nodes in the frontier. (State space size: {len(self)} nodes)")
+
+            logger.debug(f"Node {node} reachable in {arrival[node]} time units.")
+            self.expand(node)
+            self._relax(node)
+            self._frontier_edges = self.number_of_edges()
+            self._checkpoint()
+
+        self._frontier_edges = self.number_of_edges()
+        if self.explored_until is None or _time_key(time) > _time_key(self.explored_until):
+            self.explored_until = time
+        self._checkpoint(force=True)
+        self._checkpoint_settings = None
         logger.info(f"Total size of statespace: {len(self)} nodes")
         # revert system back to original state
         current_system_state_backup.apply()
 
-    def explore(self, iterations_left=1, iteration_counter=1, parallel=False):
+    def expand(self, node):
+        """
+        Calculates the successors of a node and adds them to the state space,
+        unless the node was expanded or explored before.
+        (The system is left in some state, restore it if necessary.)
+
+        Parameters
+        ----------
+        node: SystemState
+            A node of the state space.
+        """
+        if node in self._expanded:
+            return
+        if self.out_degree(node) == 0 and not self.nodes[node].get(EXPLORED, False):
+            logger.debug(f"Calculating successors of node {node}.")
+            system = self.graph["system"]
+            successors_transitions, dt = self.calculate_successors_for_node(node)
+            if successors_transitions:
+                self._detach_views()
+            for successor, transitions in successors_transitions:
+                transitions = [operator.attrgetter(trans)(system) for trans in transitions]
+                successor = successor.deserialize(system)
+                self.add_edge(node, successor, weight=dt, transitions=transitions)
+        self._expanded.add(node)
+
+    def _reset_frontier(self):
+        """Restarts the arrival time calculation at the root. Already explored nodes are not explored again."""
+        root = self.graph["root"]
+        self._arrival = {root: 0}
+        self._frontier = [(_time_key(0), 0, root)]
+        self._frontier_counter = itertools.count(1)  # tie breaker, SystemStates are not ordered
+
+    def _relax(self, node):
+        """Updates the arrival times of the node's successors."""
+        arrival = self._arrival
+        for successor, dt in self[node].items():
+            time = arrival[node] + dt["weight"]
+            if successor not in arrival or _time_key(time) < _time_key(arrival[successor]):
+                arrival[successor] = time
+                heapq.heappush(self._frontier, (_time_key(time), next(self._frontier_counter), successor))
+
+    def explore(self, iterations_left=1, iteration_counter=1, parallel=False, workers=None, system_factory=None,
+                checkpoint=None, checkpoint_interval=600):
         """
         Asserts that the graph is expanded so all paths have a minimum length
         i.e. the length to the leaves is at least a amount
@@ -102,13 +250,32 @@ class StateSpace(nx.DiGraph):
         iteration_counter: int
             Don't specify it. It's for logging purposes only.
         parallel: bool
-            Unstable. Don't use it!
+            Calculate the successors of each frontier in worker processes (see :class:`ExplorationPool`).
+            Worth it for wide frontiers (many unexplored nodes per iteration).
+        workers: int
+            The number of worker processes (default: the number of CPUs).
+        system_factory: callable
+            Creates a copy of the system in the workers. Only needed where processes cannot be forked.
+        checkpoint: str
+            If set, the state space is saved to this file periodically (after an iteration) and at the end.
+            Use :func:`load` to continue the exploration after a crash.
+        checkpoint_interval: numeric
+            The minimum number of seconds between checkpoints.
         """
         # save state for later
         current_system_state_backup = SystemState(self.graph["system"]).save()
-
-        with Cache() as c:
-            final_counter = self._explore(iterations_left, iteration_counter, parallel=parallel)
+        self._start_checkpoints(checkpoint, checkpoint_interval)
+
+        if parallel:
+            self._pool = ExplorationPool(self.graph["system"], workers, system_factory)
+        try:
+            with Cache() as c:
+                final_counter = self._explore(iterations_left, iteration_counter, parallel=parallel)
+        finally:
+            self._checkpoint_settings = None
+            if parallel:
+                self._pool.close()
+                self._pool = None
 
         # reset system state
         current_system_state_backup.apply()
@@ -121,9 +288,11 @@ class StateSpace(nx.DiGraph):
 
         logger.info(f"Expanding. (Current iteration: #{iteration_counter}, Iterations left: {iterations_left}) (Time now: {datetime.now().strftime('%H:%M:%S')})")
         if iterations_left > 0 and self.calculate_successors(parallel):  # returns if we should reiterate
+            self._checkpoint()
             return self._explore(iterations_left=iterations_left - 1, iteration_counter=iteration_counter+1, parallel=parallel)
         else:
             logger.info(f"Nothing more to expand. Stop now. Exploration cycles left: {iterations_left}")
+            self._checkpoint(force=True)
             return iteration_counter
 
     def calculate_successors(self, parallel=False):
@@ -134,7 +303,9 @@ class StateSpace(nx.DiGraph):
         logger.info(f"Calculating successors of {len(unexplored)} unexplored nodes")
 
         system = self.graph["system"]
-        
+        if unexplored:
+            self._detach_views()
+
         continue_exploration = False
         for ssnode in unexplored:
             logger.debug(f"calculating successors of node {ssnode}")
@@ -160,132 +331,201 @@ class StateSpace(nx.DiGraph):
         successor_transitions, dt = ssc.advance_to_nbct()
         return successor_transitions, dt
     
-    def calculate_successors_parallel(self):  
-        system = self.graph["system"]  
-        unexplored = [n for (n, exp) in self.nodes(data=EXPLORED, default=False) if not exp]
-        logger.info(f"Calculating successors of {len(unexplored)} unexplored nodes")
+    def calculate_successors_parallel(self, workers=None, chunksize=None):
+        """
+        Calculates the successors of all unexplored nodes in worker processes.
+        Returns True if new leaf nodes were added.
 
-        NUM_theads = 1  #min(1, len(unexplored))
-        # q = queue.Queue(maxsize=0)
-        # [q.put(n) for n in unexplored]
-        
-        logger.info(f"Launching {NUM_theads} thread(s) to find the successors")
-        
-        job_queue = queue.Queue()
-        for unex in unexplored:
-            job_queue.put(unex)
-        
-        results = []
-        thread_workers = []
-        for i in range(NUM_theads):
-            thread_worker = CrawlerThread(job_queue, results, system)
-            # thread_worker = threading.Thread(target=thread_crawler, args=(job_queue, results, system))
-            thread_workers.append(thread_worker)
-            thread_worker.setDaemon(True)
-            thread_worker.start()
-        
-        job_queue.join()
-        
-        # stop all threads, so they don't run infinitely long
-        for tw in thread_workers:
-            tw.stop()
-            
-        logger.info(f"Done, the results are in!")
-        # print(results)
-        # DEAL WITH RESULTS !!
+        Parameters
+        ----------
+        workers: int
+            The number of processes (default: the number of CPUs).
+            Ignored if the exploration's process pool is already running (see :func:`explore`).
+        chunksize: int
+            How many nodes are sent to a worker at once.
+            (default: the frontier is split in four chunks per worker)
+        """
+        system = self.graph["system"]
+        unexplored = [n for (n, exp) in self.nodes(data=EXPLORED, default=False) if not exp]
+        logger.info(f"Calculating successors of {len(unexplored)} unexplored nodes in parallel")
+        if len(unexplored) == 0:
+            return False
+
+        pool = getattr(self, "_pool", None)
+        own_pool = pool is None
+        if own_pool:
+            pool = ExplorationPool(system, workers)
+        try:
+            results = pool.calculate_successors([node.serialize() for node in unexplored], chunksize)
+        finally:
+            if own_pool:
+                pool.close()
+
+        self._detach_views()
         continue_exploration = False
-        for (ssnode, successors_transitions, dt) in results:
+        for ssnode, (successors_transitions, dt) in zip(unexplored, results):
             self.nodes[ssnode][EXPLORED] = True
-            
             for successor, transitions in successors_transitions:
                 transitions = [operator.attrgetter(trans)(system) for trans in transitions]
-                successor_node = successor.deserialize(system)
-                self.add_edge(ssnode, successor_node, weight=dt, transitions=transitions)
+                successor = SystemState.from_key(system, successor.key)  # no need to apply it to the system
+                self.add_edge(ssnode, successor, weight=dt, transitions=transitions)
                 continue_exploration = True  # successors found, meaning that we should continue exploring
         return continue_exploration
-    
-    def calculate_successors_parallel_process(self):
-        PROCESSORS = len(os.sched_getaffinity(0))  #os.cpu_count()  # how many CPUs can we use?
-        
-        unexplored = [n for (n, exp) in self.nodes(data=EXPLORED, default=False) if not exp]
-        logger.info(f"Calculating successors of {len(unexplored)} unexplored nodes")
-        
-        continue_exploration = False
-        with multiprocessing.Pool(PROCESSORS) as pool:
-            systempickle = pickle.dumps(self.graph["system"])
-            mapresult = pool.map_async(parallel_calc, [(u.serialize(), systempickle) for u in unexplored])
-            listof_succ_transitions_pairs = mapresult.get()
-            pool.close()
-            pool.join()
-            print("Result:", listof_succ_transitions_pairs)
-            for successors_transitions in listof_succ_transitions_pairs:
-                for successor, transitions in successors_transitions:
-                    self.add_edge(ssnode, successor, weight=dt, transitions=transitions)
-                    continue_exploration = True  # successors found, meaning that we should continue exploring
-        return continue_exploration
 
-def run_in_thread(ssnode, results):
-    system_copy = ssnode.create()  # creates a copy of the system with the encoded state
-    system_copy._constraint_cache = None
-    ssc = StateSpaceCalculator(system_copy, own_context=False)  # returns serialized stuff
-    successor_transitions, dt = ssc.advance_to_nbct()
-    results.append( (ssnode, successor_transitions, dt) )
-    return True
 
-class CrawlerThread(threading.Thread):
-    
-    def __init__(self, job_queue, results, system, timeout=3):
-        super().__init__()
-        self._run = True
-        
-        self.job_queue = job_queue
-        self.results = results
-        self.system = system
-        self.timeout = timeout
-    
-    def run(self):
-        system_copy = copy.deepcopy(self.system)
-        system_copy._constraint_cache = None
-        ssc = StateSpaceCalculator(system_copy, own_context=True)  # returns serialized stuff
-
-        while self._run:
-            try:
-                ssnode = self.job_queue.get(timeout=self.timeout) #fetch new work from the Queue, wait at most 1 second
-                ssnode.serialize().deserialize(system_copy)  # creates a copy of the system with the encoded state
-                successor_transitions, dt = ssc.advance_to_nbct()
-                self.results.append( (ssnode, successor_transitions, dt) )
-                self.job_queue.task_done()
-            except queue.Empty as e:
-                logger.debug(f"Nothing new for {self.timeout} seconds. I'm stopping thread now.")
-                return True
-        return True
-        
-    def stop(self):
-        self._run = False
-    
+# the system and calculator of an exploration worker process
+_worker_calculator = None
 
-def thread_crawler(job_queue, results, system):
-    system_copy = copy.deepcopy(system)
-    system_copy._constraint_cache = None
-    ssc = StateSpaceCalculator(system_copy, own_context=False)  # returns serialized stuff
 
-    while True:
-        ssnode = job_queue.get() #fetch new work from the Queue
-        logger.debug(f"Calculating successors of node {ssnode}")
-        ssnode.serialize().deserialize(system_copy)  # creates a copy of the system with the encoded state
-        successor_transitions, dt = ssc.advance_to_nbct()
-        results.append( (ssnode, successor_transitions, dt) )
-        
-        job_queue.task_done()
-    return True
+def _init_exploration_worker(system, system_factory):
+    global _worker_calculator
+    if system_factory is not None:
+        system = system_factory()
+    Cache().activate()  # this process only explores this one system, the structure doesn't change
+    _worker_calculator = StateSpaceCalculator(system, own_context=False)
+
+
+def _calculate_successors_chunk(serialized_nodes):
+    """Returns ([(serialized successor, transition paths)], dt) for each node."""
+    results = []
+    for serialized in serialized_nodes:
+        serialized.deserialize(_worker_calculator.system)
+        results.append(_worker_calculator.advance_to_nbct())
+    return results
+
+
+class ExplorationPool(object):
+    """
+    Worker processes that calculate the successors of state space nodes.
+    Each worker has its own copy of the system and its own StateSpaceCalculator.
+    Nodes and successors are sent as SerializedSystemStates.
+
+    By default the workers are forked and inherit a copy of the system.
+    Where fork is not available, pass a ``system_factory`` (a picklable callable
+    that creates the same system, e.g. the system's class).
+    """
+
+    def __init__(self, system, workers=None, system_factory=None):
+        self.workers = workers or os.cpu_count()
+        if system_factory is None and "fork" not in multiprocessing.get_all_start_methods():
+            raise ValueError("Parallel exploration needs a system_factory if processes cannot be forked.")
+        context = multiprocessing.get_context("fork" if system_factory is None else None)
+        initargs = (system if system_factory is None else None, system_factory)
+        self._pool = context.Pool(self.workers, initializer=_init_exploration_worker, initargs=initargs)
+
+    def calculate_successors(self, serialized_nodes, chunksize=None):
+        """Returns the (successors_transitions, dt) pair of each node, in the order of the nodes."""
+        if chunksize is None:
+            chunksize = max(1, math.ceil(len(serialized_nodes) / (self.workers * 4)))
+        chunks = [serialized_nodes[i:i + chunksize] for i in range(0, len(serialized_nodes), chunksize)]
+        logger.debug(f"Sending {len(serialized_nodes)} nodes to {self.workers} workers in {len(chunks)} chunks")
+        return [result for chunk_results in self._pool.map(_calculate_successors_chunk, chunks) for result in chunk_results]
+
+    def close(self):
+        self._pool.close()
+        self._pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class StateSpaceCache(object):
+    """
+    Explored state spaces, shared by the verifications of a system (see :class:`~crestdsl.verification.Verifier`).
+
+    The state spaces are stored per system, and for each system by their root
+    (the system's initial SystemState, without the pre values).
+    The cache doesn't keep the systems alive: when a system isn't used anymore, its state spaces are freed too.
+    A state space is only explored further when a check needs a longer time horizon.
+    In addition, the least recently used state spaces are dropped when there are more than ``maxsize``.
+    """
+
+    def __init__(self, maxsize=8):
+        self.maxsize = maxsize
+        self._recent = OrderedDict()  # (weak reference to the system, root key), the least recently used first
+
+    def _statespaces(self, system):
+        """
+        The system's {root key: StateSpace} dict of this cache.
+        The state spaces reference their system, so the dict is stored in the system
+        (in a WeakKeyDictionary of the caches, like the system's StateLayout) and the cache only references the system weakly.
+        """
+        caches = getattr(system, "_statespace_caches", None)
+        if caches is None:
+            caches = system._statespace_caches = weakref.WeakKeyDictionary()
+        return caches.setdefault(self, dict())
+
+    def get(self, system, time):
+        """
+        Returns the system's state space (from its current state), explored until ``time``.
+
+        Parameters
+        ----------
+        system: Entity
+            The system to explore.
+        time: numeric
+            The minimum length of all paths between root and the leaves (see :func:`StateSpace.explore_until_time`).
+            None if it doesn't need to be explored (further).
+
+        Returns
+        -------
+        StateSpace
+            The shared state space. Don't modify it, use :func:`StateSpace.view` or a copy.
+        """
+        root = SystemState(system).save()
+        key = root.key[:root.layout.pre_offset]  # exploring leaves pre values behind, they don't count
+        statespaces = self._statespaces(system)
+        statespace = statespaces.get(key, None)
+        if statespace is None:
+            logger.info(f"No explored state space for this system state yet. Creating a new one.")
+            statespace = statespaces[key] = StateSpace(system)
+
+        recent = (weakref.ref(system), key)
+        self._recent.pop(recent, None)
+        self._recent[recent] = None  # most recently used
+        self._forget_dropped_systems()
+        while len(self._recent) > self.maxsize:
+            (system_ref, old_key), _ = self._recent.popitem(last=False)
+            self._statespaces(system_ref()).pop(old_key, None)
+
+        if time is None:
+            return statespace
+        if statespace.explored_until is None or _time_key(time) > _time_key(statespace.explored_until):
+            statespace.explore_until_time(time)
+        else:
+            logger.info(f"Reusing the state space, it is explored until {statespace.explored_until} time units.")
+        return statespace
+
+    def _forget_dropped_systems(self):
+        for recent in [recent for recent in self._recent if recent[0]() is None]:
+            del self._recent[recent]
+
+    def clear(self):
+        """Drops all state spaces."""
+        for system_ref, key in self._recent:
+            system = system_ref()
+            if system is not None:
+                self._statespaces(system).pop(key, None)
+        self._recent.clear()
+
+    def __len__(self):
+        self._forget_dropped_systems()
+        return len(self._recent)
+
+
+statespaces = StateSpaceCache()  # shared by the Verifiers
+
 
 def as_dataframe(statespace):
     node_vals = []
 
     for node in statespace.nodes:
         new_dict = {}
-        new_dict.update(node.systemstate.states)
-        new_dict.update(node.systemstate.ports)
+        new_dict.update(node.states)
+        new_dict.update(node.ports)
         node_vals.append(new_dict)
 
     import pandas
@@ -293,60 +533,187 @@ def as_dataframe(statespace):
     return df
 
 
-class SystemState(object):
-    """ An encoding of the system. Stores current state, current port values and pre port values"""
+class _Missing(object):
+    """Marks ports that don't have a pre value (yet)."""
+
+    def __repr__(self):
+        return "MISSING"
+
+    def __reduce__(self):
+        return "MISSING"  # unpickles to the module's singleton
+
+
+MISSING = _Missing()
+
+
+class StateLayout(object):
+    """
+    The fixed order of a system's entities and ports.
+    A system state is encoded as one flat tuple in this order:
+    the index of each entity's current state, the port values and the port pre values (or MISSING).
+    """
 
     def __init__(self, system):
         self.system = system
-        self.states = {}
-        self.ports = {}
-        self.pre = {}
+        self.entities = model.get_all_entities(system)
+        self.states = [model.get_states(entity) for entity in self.entities]
+        self.state_indices = [{state: index for index, state in enumerate(states)} for states in self.states]
+        self.ports = model.get_all_ports(system)
+
+        self.value_offset = len(self.entities)
+        self.pre_offset = self.value_offset + len(self.ports)
+
+    def encode(self):
+        """Encodes the system's current state."""
+        current = tuple(indices[entity.current] for entity, indices in zip(self.entities, self.state_indices))
+        values = tuple(port.value for port in self.ports)
+        pre = tuple(getattr(port, "pre", MISSING) for port in self.ports)
+        return current + values + pre
+
+    def apply(self, key):
+        """Sets the system to the encoded state."""
+        for entity, states, index in zip(self.entities, self.states, key):
+            entity.current = states[index]
+        for port, value in zip(self.ports, key[self.value_offset:self.pre_offset]):
+            port.value = value
+        for port, value in zip(self.ports, key[self.pre_offset:]):
+            if value is not MISSING:
+                port.pre = value
 
-    def save(self):
-        """Creates two maps, one with <entity: current>, the other one with <port, value>"""
-        current_states = {entity: entity.current for entity in model.get_all_entities(self.system)}
-        self.states.update(current_states)
 
-        port_values = {port: port.value for port in model.get_all_ports(self.system)}
-        self.ports.update(port_values)
+def get_layout(system):
+    """Returns the (cached) StateLayout of a system."""
+    layout = getattr(system, "_state_layout", None)
+    if layout is None or layout.system is not system:
+        layout = StateLayout(system)
+        system._state_layout = layout
+    return layout
+
+
+# identical states share one SystemState object (as long as it's used somewhere)
+class _StateRef(weakref.ref):
+    __slots__ = ("key",)
+
+
+class _InternTable(object):
+    """
+    Identical states share one SystemState object (as long as it's used somewhere).
+    Works like a WeakValueDictionary, but is cheaper to fill
+    (e.g. when a million states are loaded from a file).
+    """
+
+    def __init__(self):
+        refs = self._refs = {}
+
+        def remove(ref):
+            if refs.get(ref.key) is ref:
+                del refs[ref.key]
+        self._remove = remove
 
-        pre_values = {port: port.pre for port in model.get_all_ports(self.system) if hasattr(port, "pre")}
-        self.pre.update(pre_values)
+    def intern(self, state):
+        """Returns the existing state with the same layout and key, or registers this one."""
+        # the layout's id, a reference would keep the system alive (the layout is alive as long as its states)
+        key = (id(state.layout), state.key)
+        ref = self._refs.get(key)
+        if ref is not None:
+            existing = ref()
+            if existing is not None:
+                return existing
+        ref = _StateRef(state, self._remove)
+        ref.key = key
+        self._refs[key] = ref
+        return state
 
-        return self  # to be able to do state = CrestState(system).save()
+    def __len__(self):
+        return len(self._refs)
+
+
+_interned = _InternTable()
+
+
+class SystemState(object):
+    """
+    An encoding of the system. Stores current state, current port values and pre port values.
+
+    The encoding is a tuple (see StateLayout) whose hash is calculated once.
+    Saved states are immutable and interned, i.e. saving the same system state twice returns the same object.
+    """
+
+    __slots__ = ("system", "layout", "key", "_hash", "__weakref__")
+
+    def __init__(self, system):
+        self.system = system
+        self.layout = get_layout(system) if system is not None else None
+        self.key = None
+        self._hash = None
+
+    @classmethod
+    def from_key(cls, system, key):
+        """Returns the (interned) state with the given encoding."""
+        state = cls(system)
+        state.key = tuple(key)
+        state._hash = hash(state.key)
+        return _interned.intern(state)
+
+    @classmethod
+    def from_keys(cls, system, keys):
+        """Returns the (interned) states with the given encodings (tuples). Faster than from_key for many states."""
+        layout = get_layout(system)
+        refs, remove = _interned._refs, _interned._remove  # _InternTable.intern, inlined
+        new = object.__new__
+        states = []
+        layout_id = id(layout)
+        for key in keys:
+            ref = refs.get((layout_id, key))
+            state = ref() if ref is not None else None
+            if state is None:
+                state = new(cls)
+                state.system, state.layout, state.key, state._hash = system, layout, key, hash(key)
+                ref = refs[(layout_id, key)] = _StateRef(state, remove)
+                ref.key = (layout_id, key)
+            states.append(state)
+        return states
+
+    def save(self):
+        """
+        Stores the system's current entity states, port values and pre values.
+
+        Returns
+        -------
+        SystemState
+            The interned state. (Use the return value: ``state = SystemState(system).save()``)
+        """
+        if self.key is not None:  # saved states don't change, create a new one
+            return SystemState(self.system).save()
+        return SystemState.from_key(self.system, self.layout.encode())
 
     def update(self):
-        self._hash = None  # reset hash
-        self.save()
+        """Returns the system's current state. (The state objects are immutable, this one is not modified.)"""
+        return SystemState(self.system).save()
 
     def apply(self, system=None):
         """Applies the stored state to the stored system"""
-        for entity, state in self.states.items():
-            try:
-                entity.current = state
-            except:
-                print(entity)
-                breakpoint()
-
-        for port, value in self.ports.items():
-            port.value = value
+        self.layout.apply(self.key)
 
-        for port, value in self.pre.items():
-            port.pre = value
+    @property
+    def states(self):
+        """{entity: current state}"""
+        return {entity: states[index] for entity, states, index in zip(self.layout.entities, self.layout.states, self.key)}
+
+    @property
+    def ports(self):
+        """{port: value}"""
+        return dict(zip(self.layout.ports, self.key[self.layout.value_offset:self.layout.pre_offset]))
+
+    @property
+    def pre(self):
+        """{port: pre value} (only ports that have a pre value)"""
+        return {port: value for port, value in zip(self.layout.ports, self.key[self.layout.pre_offset:]) if value is not MISSING}
 
     def create(self):
         """Creates a copy of the system with the given state"""
         newsys = copy.deepcopy(self.system)
-        for entity, state in self.states.items():
-            model.get_equivalent_in_system(self.system, entity, newsys).current = \
-                model.get_equivalent_in_system(self.system, state, newsys)
-
-        for port, value in self.ports.items():
-            model.get_equivalent_in_system(self.system, port, newsys).value = value
-
-        for port, value in self.pre.items():
-            model.get_equivalent_in_system(self.system, port, newsys).pre = value
-
+        get_layout(newsys).apply(self.key)
         return newsys
 
     def __eq__(self, other):
@@ -354,20 +721,23 @@ class SystemState(object):
         Returns if the state is the same,
         i.e. if the other's entities's states are the same and if the values are the same.
         """
-        # TODO: should this use the hash function?
+        if self is other:
+            return True
         if isinstance(other, model.Entity):
             other = SystemState(other).save()
 
         if isinstance(other, SystemState):
-            states_match = all(item in self.states.items() for item in other.states.items())
-            ports_match = all(item in self.ports.items() for item in other.ports.items())
-            pres_match = all(item in self.pre.items() for item in other.pre.items())
-            return states_match and ports_match and pres_match
+            return self.layout is other.layout and self._hash == other._hash and self.key == other.key
+        return NotImplemented
 
     def __hash__(self):
-        """Hashing the three dictionaries, so we can quickly decide whether they're the same"""
-        big_dict = list(self.states.items()) + list(self.ports.items()) + list(self.pre.items())
-        return hash(frozenset(big_dict))
+        return self._hash
+
+    def __getstate__(self):
+        return (self.system, self.layout, self.key, self._hash)
+
+    def __setstate__(self, state):
+        self.system, self.layout, self.key, self._hash = state
 
     def diff(self, other):
         """
@@ -378,53 +748,143 @@ class SystemState(object):
 
         We probably need to add a means to distinguish port and pre values...
         """
-        states = [(entity, state, other.states[entity]) for entity, state in self.states.items() if state is not other.states[entity]]
-        ports = [(port, value, other.ports.get(port, None)) for port, value in self.ports.items() if value != other.ports.get(port, None)]
-        pre = [(port, value, other.pre.get(port, None)) for port, value in self.pre.items() if value is not other.pre.get(port, None)]
+        other_states, other_ports, other_pre = other.states, other.ports, other.pre
+        states = [(entity, state, other_states[entity]) for entity, state in self.states.items() if state is not other_states[entity]]
+        ports = [(port, value, other_ports.get(port, None)) for port, value in self.ports.items() if value != other_ports.get(port, None)]
+        pre = [(port, value, other_pre.get(port, None)) for port, value in self.pre.items() if value is not other_pre.get(port, None)]
         return states, ports, pre
-    
+
     def serialize(self):
-        if len(self.states) == 0:  # this means we haven't saved yet
-            self.save()
-        
-        ss = SystemState(None)
-        ss.states = {model.get_path_to_attribute(self.system, entity): model.get_path_to_attribute(self.system, state) for entity, state in self.states.items()}
-        ss.ports = {model.get_path_to_attribute(self.system, port): value for port, value in self.ports.items()}
-        ss.pre = {model.get_path_to_attribute(self.system, port): value for port, value in self.pre.items()}
-        
-        return ss
-        
+        """Returns the state without references to the system's objects (e.g. to send it to another process)."""
+        if self.key is None:  # this means we haven't saved yet
+            return self.save().serialize()
+        return SerializedSystemState(self.key)
+
+
+class SerializedSystemState(object):
+    """The encoding of a SystemState, without the system. Any system with the same structure can decode it."""
+
+    __slots__ = ("key",)
+
+    def __init__(self, key):
+        self.key = key
+
+    def __getstate__(self):
+        return self.key
+
+    def __setstate__(self, key):
+        self.key = key
+
+    def __eq__(self, other):
+        return isinstance(other, SerializedSystemState) and self.key == other.key
+
+    def __hash__(self):
+        return hash(self.key)
+
     def deserialize(self, system):
-        for entity, state in self.states.items():
-            if entity == "":
-                system.current = operator.attrgetter(state)(system)
-            else:
-                operator.attrgetter(entity)(system).current = operator.attrgetter(state)(system)
-        
-        for port, value in self.ports.items():
-            operator.attrgetter(port)(system).value = value
-        
-        for port, value in self.pre.items():
-            operator.attrgetter(port)(system).value = value
-        
-        return SystemState(system).save()
-        
+        """Sets the system to this state and returns the corresponding SystemState."""
+        state = SystemState.from_key(system, self.key)
+        state.apply()
+        return state
+
 
 class StateSpaceCalculator(Simulator):
+    """
+    Calculates the successors of a system state, i.e. all combinations of the enabled transitions.
 
-    def __init__(self, *args, **kwargs):
+    With partial order reduction, subentities are advanced independently of the branches of the other modifiers:
+    a subentity only reads and modifies its footprint (the ports and states of its subtree, see :func:`footprint`),
+    so branches that only differ outside of it have the same outcome, which is calculated once and copied into them.
+    Branches that reach the same system state are merged (only the first one's transitions are kept).
+    The successor states are the same, only the transitions that are stored for an edge can be different ones.
+    """
+
+    def __init__(self, *args, partial_order_reduction=None, **kwargs):
+        """
+        Parameters
+        ----------
+        partial_order_reduction: bool
+            Use partial order reduction (default: ``config.partial_order_reduction``).
+        """
         super().__init__(*args, **kwargs)
         self.record_traces = False  # don't do logging here, we don't need it
-        self.dependencyOrder_cache = {}
-
-    def get_DO_cached(self, entity):
-        if entity not in self.dependencyOrder_cache:
-            self.dependencyOrder_cache[entity] = {}
-        if entity.current not in self.dependencyOrder_cache[entity]:
-            # the dependency order is defined by the state we're in. Nothing else.
-            self.dependencyOrder_cache[entity][entity.current] = DO.get_entity_modifiers_in_dependency_order(entity)
-            
-        return self.dependencyOrder_cache[entity][entity.current]
+        if partial_order_reduction is None:
+            partial_order_reduction = config.partial_order_reduction
+        self.partial_order_reduction = partial_order_reduction
+        self._footprints = {}  # entity -> positions in the SystemState keys
+
+    def footprint(self, entity):
+        """
+        The positions of the system state encoding (see :class:`StateLayout`) that an entity reads or modifies:
+        the states of the entity and its descendants
+        and the values and pre values of their ports and of the ports their modifiers access.
+
+        The entity is connected to its parent by its inputs and outputs (see :func:`~crestdsl.simulation.dependencyOrder.entity_modifier_graph`),
+        its modifiers only access the ports of their entity and its subentities (see :func:`~crestdsl.sourcehelper.get_accessed_ports`).
+        """
+        positions = self._footprints.get(entity)
+        if positions is None:
+            layout = get_layout(self.system)
+            entities = model.get_all_entities(entity)
+            ports = set(model.get_all_ports(entity))
+            for ent in entities:
+                for influence in model.get_influences(ent):
+                    ports.update((influence.source, influence.target))
+                for modifier in model.get_updates(ent) + model.get_actions(ent):
+                    ports.add(modifier.target)
+                    ports.update(SH.get_accessed_ports(modifier.function, modifier, exclude_pre=False))
+
+            entity_index = {ent: index for index, ent in enumerate(layout.entities)}
+            port_index = {port: index for index, port in enumerate(layout.ports)}
+            positions = sorted([entity_index[ent] for ent in entities] +
+                               [layout.value_offset + port_index[port] for port in ports] +
+                               [layout.pre_offset + port_index[port] for port in ports])
+            positions = self._footprints[entity] = tuple(positions)
+        return positions
+
+    def advance_subentity(self, entity, time, systemstates):
+        """
+        Advances and stabilises a subentity in each branch,
+        but only once for all branches that have the same values in the subentity's footprint.
+
+        Parameters
+        ----------
+        entity: Entity
+            The subentity.
+        time: numeric
+            The time to advance.
+        systemstates: list
+            The branches, (SystemState, transitions) pairs.
+
+        Returns
+        -------
+        list
+            The new branches.
+        """
+        positions = self.footprint(entity)
+        outcomes = {}  # footprint values -> [(footprint values after, transitions)]
+        new_systemstates = []
+        for (sysstate, transitions) in systemstates:
+            key = sysstate.key
+            before = tuple(key[position] for position in positions)
+            if before not in outcomes:
+                sysstate.apply()
+                outcomes[before] = [(tuple(new_state.key[position] for position in positions), new_trans)
+                                    for (new_state, new_trans) in self.advance_and_stabilise(entity, time)]
+            for after, new_trans in outcomes[before]:
+                new_key = list(key)
+                for position, value in zip(positions, after):
+                    new_key[position] = value
+                new_systemstates.append((SystemState.from_key(self.system, new_key), transitions + new_trans))
+        return new_systemstates
+
+    @staticmethod
+    def merge(systemstates):
+        """Keeps one branch per system state (the first one's transitions)."""
+        merged = dict()
+        for (sysstate, transitions) in systemstates:
+            merged.setdefault(sysstate, transitions)
+        return list(merged.items())
     
     def advance_and_stabilise(self, entity, time):
         """ saves the transitions in a list """
@@ -434,9 +894,10 @@ class StateSpaceCalculator(Simulator):
 
         systemstates = [ (SystemState(self.system).save(), []) ]
 
-        for mod in self.get_DO_cached(entity):  #DO.get_entity_modifiers_in_dependency_order(entity):
+        for mod in self.get_schedule(entity):
             if isinstance(mod, model.Influence):
                 # logger.debug(f"Time: {self.global_time} | Triggering influence {mod._name} in entity {entity._name} ({entity.__class__.__name__})")
+                new_systemstates = []
                 for (sysstate, transitions) in systemstates:
                     sysstate.apply()  # restores the captured state
                     newval = self._get_influence_function_value(mod)
@@ -444,9 +905,11 @@ class StateSpaceCalculator(Simulator):
                         # logger.info(f"Time: {self.global_time} | Port value changed: {mod.target._name} ({mod.target._parent._name}) {mod.target.value} -> {newval}")
                         mod.target.value = newval
                     # self.stategraph.add_edge(sysstate, SystemState(self.system).save(), modtype="influence", modifier=mod, time=time, entity=entity)
-                    sysstate.update()  # store the current values
+                    new_systemstates.append((sysstate.update(), transitions))  # store the current values
+                systemstates = new_systemstates
             elif isinstance(mod, model.Update):
                 # logger.debug(f"Triggering update {mod._name} in entity {entity._name} ({entity.__class__.__name__})")
+                new_systemstates = []
                 for (sysstate, transitions) in systemstates:
                     sysstate.apply()
                     newval = self._get_update_function_value(mod, time)
@@ -454,7 +917,10 @@ class StateSpaceCalculator(Simulator):
                         # logger.info(f"Time: {self.global_time} | Port value changed: {mod.target._name} ({mod.target._parent._name}) {mod.target.value} -> {newval}")
                         mod.target.value = newval
                     # self.stategraph.add_edge(sysstate, SystemState(self.system).save(), modtype="update", modifier=mod, time=time, entity=entity)
-                    sysstate.update()
+                    new_systemstates.append((sysstate.update(), transitions))
+                systemstates = new_systemstates
+            elif isinstance(mod, model.Entity) and self.partial_order_reduction:
+                systemstates = self.merge(self.advance_subentity(mod, time, systemstates))
             elif isinstance(mod, model.Entity):
                 new_systemstates = []
                 for (sysstate, transitions) in systemstates:
@@ -465,12 +931,14 @@ class StateSpaceCalculator(Simulator):
                 systemstates = new_systemstates  # the returned states are the new ones
 
         """ store pre's """
+        new_systemstates = []
         for (sysstate, transitions) in systemstates:
             sysstate.apply()
             # set pre again, for the actions that are triggered after the transitions
             for port in api.get_targets(entity):  # + api.get_targets(entity):
                 port.pre = port.value
-            sysstate.update()
+            new_systemstates.append((sysstate.update(), transitions))
+        systemstates = new_systemstates
 
         """ check if transitions are enabled and do them """
         new_systemstates = []
@@ -489,6 +957,8 @@ class StateSpaceCalculator(Simulator):
             else:
                 new_systemstates.append( (sysstate, transitions) )  # nothing changed, so keep this state
 
+        if self.partial_order_reduction:
+            new_systemstates = self.merge(new_systemstates)
         # logger.debug(f"Finished advancing {time} and stabilising entity {entity._name} ({entity.__class__.__name__})")
         return new_systemstates
 
@@ -39,6 +39,18 @@ class TCTLFormula(object):
     def eq(self, other):
         return type(self) is type(other) and self.phi.eq(other.phi)
 
+    def key(self, intern):
+        """
+        A hashable key of the formula, equal for formulas that are eq.
+
+        Parameters
+        ----------
+        intern: callable
+            Returns the canonical formula of a subformula (see FormulaTable).
+            The key refers to the subformulas by the identity of their canonical formulas.
+        """
+        return (type(self), id(intern(self.phi)))
+
 """
 - - - - - - - - - - - -
   D E C O R A T O R S
@@ -66,6 +78,46 @@ def tctl_create_tctlFormula(formula, interval=None):
 class TCTLBoolFormula(TCTLFormula):
     pass
 
+
+class FormulaTable(object):
+    """
+    Hash-consing of TCTL formulas:
+    formulas that are eq are replaced by one canonical formula,
+    so a formula becomes a DAG in which every distinct subformula exists only once.
+
+    The formulas are looked up by their identity first,
+    so they must not be modified after they were interned.
+    """
+
+    def __init__(self):
+        self._canonical = dict()  # key -> canonical formula
+        self._interned = dict()  # id(formula) -> (formula, canonical formula), keeps the formula (and its id) alive
+
+    def __len__(self):
+        return len(self._canonical)
+
+    def intern(self, formula):
+        """
+        Parameters
+        ----------
+        formula: TCTLFormula
+            A formula, Check or bool.
+
+        Returns
+        -------
+        TCTLFormula
+            The canonical formula that is eq to the formula.
+            Atomic propositions (and Checks) and bools are their own canonical formulas.
+        """
+        if not isinstance(formula, TCTLFormula) or isinstance(formula, AtomicProposition):
+            return formula
+        entry = self._interned.get(id(formula))
+        if entry is not None:
+            return entry[1]
+        canonical = self._canonical.setdefault(formula.key(self.intern), formula)
+        self._interned[id(formula)] = (formula, canonical)
+        return canonical
+
 class AtomicProposition(TCTLFormula):
 
     def get_propositions(self):
@@ -77,6 +129,9 @@ class AtomicProposition(TCTLFormula):
     def eq(self, other):
         return self is other
 
+    def key(self, intern):
+        return (id(self),)
+
 class NamedAtomicProposition(AtomicProposition):
 
     def __init__(self, name):
@@ -136,6 +191,9 @@ class BinaryTCTLFormula(TCTLFormula):
     def eq(self, other):
         return super().eq(other) and self.psi.eq(other.psi)
 
+    def key(self, intern):
+        return super().key(intern) + (id(intern(self.psi)),)
+
 class And(BinaryTCTLFormula):
     pass
 
@@ -207,6 +265,9 @@ class IntervalFormula(TCTLFormula):
     def eq(self, other):
         return super().eq(other) and self.interval == other.interval
 
+    def key(self, intern):
+        return super().key(intern) + (self.interval.key(),)
+
 class U(IntervalFormula):
     def __init__(self, phi, psi, interval=None):
         """
@@ -255,7 +316,10 @@ class U(IntervalFormula):
 
     def eq(self, other):
         return super().eq(other) and self.psi.eq(other.psi)
-        
+
+    def key(self, intern):
+        return super().key(intern) + (id(intern(self.psi)),)
+
 class F(IntervalFormula):
     pass
 
@@ -435,6 +499,11 @@ class Interval(object):
         self.end += value
         return self
 
+    def key(self):
+        """A hashable key of the interval's bounds and operators."""
+        return tuple((value.numeric, value.epsilon) if isinstance(value, Epsilon) else value
+                     for value in (self.start, self.start_operator, self.end, self.end_operator))
+
     def compare(self, other):
         return all([
             self.start == other.start,
@@ -1,12 +1,15 @@
 import math
 import copy
+import time
+from collections import namedtuple
 
 import crestdsl.model as crest
 import crestdsl.model.api as api
 
 from . import tctl
 from .modelchecker import ModelChecker
-from .statespace import StateSpace
+from .onthefly import OnTheFlyChecker
+from .statespace import statespaces
 from .checklib import StateCheck, PortCheck
 
 import logging
@@ -156,6 +159,53 @@ def forever(check):
     return Verifier().forever(check)
     
 
+VerificationResult = namedtuple("VerificationResult", ["formula", "result", "time"])
+VerificationResult.__doc__ = """The result of one formula of :func:`verify_all` and the seconds its evaluation took."""
+
+
+def verify_all(verifiers, statespace_cache=None):
+    """
+    Checks many properties at once.
+    
+    The verifiers are grouped by system.
+    Each system's state space is explored once (until the latest end time of its formulas),
+    the CREST Kripke structure is refined once for all of its formulas' propositions
+    and common subformulas are only evaluated once.
+    
+    Parameters
+    ----------
+    verifiers: list
+        Verifier objects with a formula (e.g. created by :func:`always` or :func:`never`).
+    statespace_cache: StateSpaceCache
+        Where the explored state spaces are kept (default: the cache that is shared by all Verifiers).
+    
+    Returns
+    -------
+    list
+        A :class:`VerificationResult` (formula, result and evaluation time in seconds) for each verifier, in the same order.
+    """
+    statespace_cache = statespace_cache if statespace_cache is not None else statespaces
+    groups = dict()  # system -> indices of its verifiers
+    for index, verifier in enumerate(verifiers):
+        groups.setdefault(verifier.system, []).append(index)
+
+    results = [None] * len(verifiers)
+    for system, indices in groups.items():
+        formulas = [verifiers[index].formula for index in indices]
+        start = time.time()
+        explore_time = max(formula.interval.end for formula in formulas)
+        if explore_time == math.inf:
+            logger.warning(f"Caution: No end time set for a formula. This means statespace will be explored until exhausted (possibly forever !!)")
+        statespace = statespace_cache.get(system, explore_time)
+        logger.info(f"Explored the state space for {len(formulas)} formulas in {time.time() - start} seconds")
+
+        checked = ModelChecker(statespace).check_all(formulas)
+        for index, formula, (result, seconds) in zip(indices, formulas, checked):
+            verifiers[index].statespace = statespace
+            results[index] = VerificationResult(formula, result, seconds)
+    return results
+
+
 class Verifier(object):
     """
     This class hosts the functionality for the verification API.
@@ -166,10 +216,19 @@ class Verifier(object):
     Use the convenience API methods instead (e.g. :func:`ispossible` or :func:`always`).
     """
 
-    def __init__(self, system=None):
+    def __init__(self, system=None, statespace_cache=None):
+        """
+        Parameters
+        ----------
+        statespace_cache: StateSpaceCache
+            Where the explored state spaces are kept between checks
+            (default: the cache that is shared by all Verifiers).
+        """
         self._formula = None
         self._before = None
         self._after = None
+        self.statespace_cache = statespace_cache if statespace_cache is not None else statespaces
+        self.path = None
         
         self.explored = False
     
@@ -224,14 +283,19 @@ New formula is: {self.formula}""")
 
 
     def explore(self):
-        self.statespace = StateSpace(self.system)
+        """
+        Explores the system's state space until the formula's end time.
+        The state space is shared with the other checks of the system (see :class:`StateSpaceCache`),
+        so it is only explored further if this formula needs a longer time horizon.
+        """
         explore_time = self.formula.interval.end
         if explore_time == math.inf:
             logger.warning(f"Caution: No end time set for formula. This means statespace will be explored until exhausted (possibly forever !!)")
-        self.statespace.explore_until_time(explore_time)
+        self.statespace = self.statespace_cache.get(self.system, explore_time)
+        self.explored = True
     
     
-    def check(self, draw_result=False):
+    def check(self, draw_result=False, on_the_fly=False):
         """
         Triggers the verification.
         This includes the compiling the tctl formula,
@@ -243,6 +307,12 @@ New formula is: {self.formula}""")
         draw_result: bool
             The verifier can draw the statespace and highlight the nodes that satisfy the formula.
             This is VERY slow though. So don't run it if the statespace is bigger than a few dozen nodes.
+        on_the_fly: bool
+            Check :func:`is_possible`, :func:`always` and :func:`never` properties (without :func:`after`)
+            while the statespace is explored (see :class:`OnTheFlyChecker`).
+            The exploration stops at the first witness or counterexample,
+            the path to it is stored in the Verifier's ``path`` attribute.
+            Other formulas are checked as usual.
             
         Returns
         -------
@@ -250,6 +320,17 @@ New formula is: {self.formula}""")
             The result of the model checking. I.e. if the formula holds on the root state of the state space.
         """
         logger.info(f"Evaluating satisfiability of formula {self.formula}")
+        self.path = None
+        if on_the_fly and OnTheFlyChecker.target(self.formula) is not None:
+            self.statespace = self.statespace_cache.get(self.system, None)  # explored by the checker
+            checker = OnTheFlyChecker(self.statespace)
+            result = checker.check(self.formula)
+            self.path = checker.path
+            logger.info(f"Formula {self.formula} is satisfiable: {result}")
+            return result
+        elif on_the_fly:
+            logger.warning(f"Formula {self.formula} cannot be checked on the fly, exploring the statespace first.")
+
         self.explore()
         mc = ModelChecker(self.statespace)
         result = mc.check(self.formula)
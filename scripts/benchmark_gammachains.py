@@ -0,0 +1,68 @@
+"""
+Compares the virtual gamma chains (GammaChains) of the ModelChecker procedures with the materialized gcd/2-transformation.
+
+The Kripke structures are random graphs whose nodes have long edges (multiples of the GCD),
+with a few propositions, so gamma is small compared to the edges and the materialized chains are long.
+
+Usage: python scripts/benchmark_gammachains.py [number of nodes] [maximum edge weight (in GCDs)]
+"""
+
+import sys
+import time
+import random
+import logging
+
+import networkx as nx
+
+from crestdsl.verification import tctl
+from crestdsl.verification.tctl import NamedAtomicProposition, Interval
+from crestdsl.verification.continuous import ContinuousModelChecker, PA
+from crestdsl.verification.modelchecker import ModelChecker
+from crestdsl.verification.gammachains import GammaChains
+from crestdsl.verification.pointwise import CREST_PROPS
+
+
+def random_kripke(nodes, max_weight, rng):
+    phi, psi = NamedAtomicProposition("phi"), NamedAtomicProposition("psi")
+    graph = nx.gnm_random_graph(nodes, 2 * nodes, seed=rng.randint(0, 10**6), directed=True)
+    kripke = nx.DiGraph()
+    name = "node{}".format  # (the materialized chains' nodes are numbers)
+    for node in graph:
+        kripke.add_node(name(node), **{CREST_PROPS: {phi: rng.random() < 0.8, psi: rng.random() < 0.1}})
+    for node in graph:
+        weight = 2 * rng.randint(1, max_weight)  # gamma is 1
+        kripke.add_edges_from(((name(node), name(successor)) for successor in graph.successors(node)), weight=weight)
+    return kripke, phi, psi
+
+
+def run(nodes, max_weight, seed=0):
+    rng = random.Random(seed)
+    kripke, phi, psi = random_kripke(nodes, max_weight, rng)
+    formulas = {
+        "EU [0,b]": tctl.EU(phi, psi, Interval() <= 10),
+        "EU [a,inf)": tctl.EU(tctl.Or(phi, PA), psi, Interval() >= 30),
+        "EU [a,b]": tctl.EU(phi, tctl.And(psi, tctl.Not(PA)), (Interval() >= 5) <= 20),
+        "EG": tctl.EG(tctl.Or(phi, PA)),
+    }
+
+    start = time.time()
+    chains = GammaChains(kripke, 1)
+    print(f"{nodes} nodes: virtual chains in {time.time() - start:.2f} s, {len(chains)} nodes when materialized")
+    start = time.time()
+    materialized = ContinuousModelChecker.gamma_split_optimised(None, kripke.copy(), 1)
+    print(f"{nodes} nodes: materialized chains in {time.time() - start:.2f} s, {len(materialized)} nodes")
+
+    for name, formula in formulas.items():
+        start = time.time()
+        ModelChecker(kripke).is_satisfiable(formula, chains)
+        virtual = time.time() - start
+        start = time.time()
+        ModelChecker(kripke, virtual_chains=False).is_satisfiable(formula, materialized)
+        print(f"  {name:<12} virtual {virtual:.2f} s, materialized {time.time() - start:.2f} s")
+
+
+if __name__ == "__main__":
+    logging.disable(logging.WARNING)
+    nodes = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    max_weight = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    run(nodes, max_weight)
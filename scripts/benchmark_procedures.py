@@ -0,0 +1,50 @@
+"""
+Measures the model checking procedures of PointwiseModelChecker (Sat_EU, Sat_EG, Sat_EUb, Sat_EUa, Sat_AU0)
+on large random Kripke structures (layered DAGs with a few cycles, see benchmark_sat_eua.py).
+
+Usage: python scripts/benchmark_procedures.py [number of nodes ...]
+"""
+
+import sys
+import time
+import random
+import operator
+
+from crestdsl.verification import tctl
+from crestdsl.verification.tctl import NamedAtomicProposition
+from crestdsl.verification.pointwise import PointwiseModelChecker
+
+from benchmark_sat_eua import layered_kripke
+
+
+def run(nodes, seed=0):
+    rng = random.Random(seed)
+    kripke = layered_kripke(nodes, rng)
+    Q1 = {n for n in kripke if rng.random() < 0.9}
+    Q2 = {n for n in kripke if rng.random() < 0.05}
+
+    phi, psi = NamedAtomicProposition("phi"), NamedAtomicProposition("psi")
+    checker = PointwiseModelChecker(kripke)
+    checker.is_satisfiable = lambda f, k: {phi: Q1, psi: Q2, True: Q1}.get(f, Q2)
+
+    procedures = [
+        ("Sat_EU", tctl.EU(phi, psi)),
+        ("Sat_EG", tctl.EG(phi)),
+        ("Sat_EUb", tctl.EU(phi, psi, tctl.Interval() <= 5)),
+        ("Sat_EUa", tctl.EU(phi, psi, tctl.Interval() >= 10)),
+        ("Sat_AU0", tctl.AU(True, False, tctl.Interval() > 0)),
+    ]
+    start = time.time()
+    checker._kripke_arrays(kripke)
+    timings = [f"arrays {time.time() - start:.2f} s"]
+    for name, formula in procedures:
+        start = time.time()
+        getattr(checker, name)(formula, kripke)
+        timings.append(f"{name} {time.time() - start:.2f} s")
+    print(f"{nodes:>8} nodes: " + ", ".join(timings))
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1000, 10000, 100000]
+    for size in sizes:
+        run(size)
@@ -0,0 +1,74 @@
+"""
+Measures PointwiseModelChecker.make_CREST_Kripke, i.e. the splitting of the state space's edges
+where the value of an atomic proposition changes.
+
+The system has several heaters (with different powers) that switch between heating and cooling.
+Each heater contributes one proposition on its temperature.
+
+Usage: python scripts/benchmark_refinement.py [heaters] [exploration iterations] [workers]
+"""
+
+import sys
+import time
+import logging
+
+import crestdsl.model as crest
+from crestdsl.verification import StateSpace, tctl
+from crestdsl.verification.checklib import check
+from crestdsl.verification.pointwise import PointwiseModelChecker
+
+
+def create_system(heaters):
+    res = crest.Resource("temp", crest.REAL)
+
+    class Heater(crest.Entity):
+        power = crest.Input(res, 3)
+        temp = crest.Local(res, 20)
+
+        heating = current = crest.State()
+        cooling = crest.State()
+
+        too_hot = crest.Transition(source=heating, target=cooling, guard=(lambda self: self.temp.value >= 100))
+        too_cold = crest.Transition(source=cooling, target=heating, guard=(lambda self: self.temp.value <= 30))
+
+        @crest.update(state=heating, target=temp)
+        def heat(self, dt):
+            return self.temp.pre + self.power.value * dt
+
+        @crest.update(state=cooling, target=temp)
+        def cool(self, dt):
+            return self.temp.pre - 5 * dt
+
+    class System(crest.Entity):
+        state = current = crest.State()
+
+    for i in range(heaters):
+        heater = Heater()
+        heater.power.value = 2 + i
+        setattr(System, f"heater{i}", heater)
+    return System()
+
+
+def run(heaters, iterations, workers=None):
+    system = create_system(heaters)
+    statespace = StateSpace(system)
+    statespace.explore(iterations)
+
+    props = [check(getattr(system, f"heater{i}").temp) >= 40 + 10 * i for i in range(heaters)]
+    formula = props[0]
+    for prop in props[1:]:
+        formula = tctl.And(formula, tctl.EF(prop))
+
+    checker = PointwiseModelChecker(statespace, workers=workers)
+    start = time.time()
+    kripke = checker.make_CREST_Kripke(formula)
+    duration = time.time() - start
+    print(f"{heaters} heaters, {len(statespace)} nodes -> {len(kripke)} nodes in {duration:.2f} s")
+
+
+if __name__ == "__main__":
+    logging.disable(logging.WARNING)
+    heaters = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else None
+    run(heaters, iterations, workers)
@@ -0,0 +1,57 @@
+"""
+Measures PointwiseModelChecker.Sat_EUa (EU with an interval [a, inf)) on large random Kripke structures.
+
+The structures are layered DAGs (every edge goes to one of the next layers)
+with a few phi-loops, so both parts of the procedure are exercised:
+the strongly connected components and the longest paths through the acyclic rest.
+
+Usage: python scripts/benchmark_sat_eua.py [number of nodes ...]
+"""
+
+import sys
+import time
+import random
+import operator
+
+import networkx as nx
+
+from crestdsl.verification import tctl
+from crestdsl.verification.tctl import NamedAtomicProposition
+from crestdsl.verification.pointwise import PointwiseModelChecker
+
+
+def layered_kripke(nodes, rng, width=50, out_degree=3, loops=10):
+    kripke = nx.DiGraph()
+    kripke.add_nodes_from(range(nodes))
+    for node in range(nodes - width):
+        layer_start = (node // width + 1) * width
+        for _ in range(out_degree):
+            target = rng.randrange(layer_start, min(nodes, layer_start + 2 * width))
+            kripke.add_edge(node, target, weight=rng.choice([0.5, 1, 2, 3]))
+    for _ in range(loops):  # a few cycles back to an earlier layer
+        node = rng.randrange(2 * width, nodes)
+        kripke.add_edge(node, node - rng.randrange(width, 2 * width), weight=1)
+    return kripke
+
+
+def run(nodes, seed=0):
+    rng = random.Random(seed)
+    kripke = layered_kripke(nodes, rng)
+    Q1 = {n for n in kripke if rng.random() < 0.9}
+    Q2 = {n for n in kripke if rng.random() < 0.05}
+
+    phi, psi = NamedAtomicProposition("phi"), NamedAtomicProposition("psi")
+    formula = tctl.EU(phi, psi, tctl.Interval(start=10, start_op=operator.ge))
+    checker = PointwiseModelChecker(kripke)
+    checker.is_satisfiable = lambda f, k: {phi: Q1, psi: Q2}[f]
+
+    start = time.time()
+    result = checker.Sat_EUa(formula, kripke)
+    duration = time.time() - start
+    print(f"{nodes:>8} nodes {kripke.number_of_edges():>8} edges: {len(result):>8} satisfying nodes in {duration:.2f} s")
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1000, 10000, 100000]
+    for size in sizes:
+        run(size)
@@ -0,0 +1,89 @@
+import unittest
+import crestdsl.model as crest
+import crestdsl.model.api as api
+from crestdsl.model.entity import get_structure
+
+res = crest.Resource("Resource", crest.REAL)
+
+
+class Sub(crest.Entity):
+    inp = crest.Input(resource=res, value=0)
+    out = crest.Output(resource=res, value=0)
+    state = current = crest.State()
+
+
+class Test(crest.Entity):
+    inp = crest.Input(resource=res, value=0)
+    local = crest.Local(resource=res, value=0)
+    one = current = crest.State()
+    two = crest.State()
+    trans = crest.Transition(source=one, target=two, guard=(lambda self: True))
+    sub = Sub()
+
+
+class EntityStructureTest(unittest.TestCase):
+
+    def test_index_is_built_at_construction(self):
+        instance = Test()
+        self.assertIsNotNone(instance._structure_index)
+        self.assertIs(get_structure(instance), get_structure(instance))
+
+    def test_typed_tuples(self):
+        instance = Test()
+        index = get_structure(instance)
+        self.assertCountEqual(index.ports, [instance.inp, instance.local])
+        self.assertCountEqual(index.inputs, [instance.inp])
+        self.assertCountEqual(index.locals, [instance.local])
+        self.assertCountEqual(index.outputs, [])
+        self.assertCountEqual(index.states, [instance.one, instance.two])
+        self.assertCountEqual(index.transitions, [instance.trans])
+        self.assertCountEqual(index.entities, [instance.sub])
+
+    def test_current_and_parent_are_not_cached(self):
+        instance = Test()
+        self.assertEqual(crest.get_states(instance, as_dict=True)["current"], instance.one)
+        instance.current = instance.two
+        self.assertEqual(crest.get_states(instance, as_dict=True)["current"], instance.two)
+        self.assertIn(instance, crest.get_crest_objects(instance.sub))
+
+    def test_setattr_invalidates(self):
+        instance = Test()
+        instance.out = crest.Output(resource=res, value=0)
+        self.assertCountEqual(crest.get_ports(instance), [instance.inp, instance.local, instance.out])
+        self.assertCountEqual(crest.get_outputs(instance), [instance.out])
+
+    def test_api_add_invalidates(self):
+        instance = Test()
+        api.add(instance, "connect", crest.Influence(source="inp", target="sub.inp"))
+        self.assertCountEqual(crest.get_influences(instance), [instance.connect])
+
+    def test_current_does_not_invalidate(self):
+        instance = Test()
+        index = get_structure(instance)
+        instance.current = instance.two
+        self.assertIs(get_structure(instance), index)
+
+    def test_recursive_collectors_see_subentity_changes(self):
+        instance = Test()
+        self.assertEqual(len(crest.get_all_ports(instance)), 4)
+        instance.sub.extra = crest.Local(resource=res, value=0)
+        self.assertIn(instance.sub.extra, crest.get_all_ports(instance))
+        self.assertEqual(len(crest.get_all_ports(instance)), 5)
+
+    def test_recursive_collectors_see_new_subentities(self):
+        instance = Test()
+        self.assertEqual(len(crest.get_all_entities(instance)), 2)
+        instance.sub2 = Sub()
+        self.assertCountEqual(crest.get_all_entities(instance), [instance, instance.sub, instance.sub2])
+        self.assertIn(instance.sub2.inp, crest.get_all_ports(instance))
+
+    def test_returned_lists_are_copies(self):
+        instance = Test()
+        crest.get_ports(instance).append("something")
+        crest.get_all_ports(instance).append("something")
+        self.assertNotIn("something", crest.get_ports(instance))
+        self.assertNotIn("something", crest.get_all_ports(instance))
+
+
+if __name__ == '__main__':
+    unittest.main()
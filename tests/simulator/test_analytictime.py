@@ -0,0 +1,99 @@
+import unittest
+
+import crestdsl.model as crest
+from crestdsl.config import config
+from crestdsl.simulation import Simulator
+from crestdsl.simulation.conditiontimedchangecalculator import ConditionTimedChangeCalculator
+from crestdsl.simulation.epsilon import Epsilon
+
+
+def create_system(guard, domain=crest.REAL, start=20, linear=True):
+    res = crest.Resource("temp", domain)
+
+    class Heater(crest.Entity):
+        power = crest.Input(res, 3)
+        temp = crest.Local(res, start)
+
+        heating = current = crest.State()
+        done = crest.State()
+
+        finished = crest.Transition(source=heating, target=done, guard=guard)
+
+        if linear:
+            @crest.update(state=heating, target=temp)
+            def heat(self, dt):
+                rate = self.power.value
+                if self.temp.pre > 50:
+                    rate = rate * 2
+                else:
+                    rate = rate + 1
+                return self.temp.pre + rate * dt
+        else:
+            @crest.update(state=heating, target=temp)
+            def heat(self, dt):
+                return self.temp.pre + self.power.value * dt * dt
+
+    return Heater()
+
+
+class AnalyticTransitionTimeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.previous = config.analytic_transition_times
+
+    def tearDown(self):
+        config.analytic_transition_times = self.previous
+
+    def transition_time(self, system, analytic):
+        config.analytic_transition_times = analytic
+        sim = Simulator(system, record_traces=False)
+        sim.stabilise()
+        calculator = ConditionTimedChangeCalculator(system, sim.timeunit)
+        result = calculator.get_transition_time(system.finished)
+        return (result[0] if result is not None else None), calculator.statistics
+
+    def assert_same_as_z3(self, guard, **kwargs):
+        analytic, stats = self.transition_time(create_system(guard, **kwargs), True)
+        z3_result, z3_stats = self.transition_time(create_system(guard, **kwargs), False)
+        self.assertEqual(analytic, z3_result)
+        self.assertEqual(stats, dict(analytic=1, solver=0))
+        self.assertEqual(z3_stats, dict(analytic=0, solver=1))
+        return analytic
+
+    def assert_falls_back(self, guard, **kwargs):
+        _, stats = self.transition_time(create_system(guard, **kwargs), True)
+        self.assertEqual(stats, dict(analytic=0, solver=1))
+
+    def test_greater_equal(self):
+        self.assertEqual(self.assert_same_as_z3(lambda self: self.temp.value >= 100), 20)
+
+    def test_strict_comparison_gives_epsilon(self):
+        self.assertEqual(self.assert_same_as_z3(lambda self: self.temp.value > 100), Epsilon(20, 0.25))
+
+    def test_flipped_comparison(self):
+        self.assertEqual(self.assert_same_as_z3(lambda self: 100 - self.temp.value <= 0), 20)
+
+    def test_unreachable(self):
+        self.assertIsNone(self.assert_same_as_z3(lambda self: self.temp.value <= 10))
+
+    def test_conjunction(self):
+        self.assertEqual(self.assert_same_as_z3(lambda self: self.temp.value >= 30 and self.temp.value < 40), 2.5)
+
+    def test_empty_conjunction(self):
+        self.assertIsNone(self.assert_same_as_z3(lambda self: self.temp.value > 40 and self.temp.value < 40))
+
+    def test_if_else_on_pre_value(self):
+        self.assertEqual(self.assert_same_as_z3(lambda self: self.temp.value >= 100, start=60), 20 / 3)
+
+    def test_non_linear_falls_back(self):
+        self.assert_falls_back(lambda self: self.temp.value >= 100, linear=False)
+
+    def test_disjunction_falls_back(self):
+        self.assert_falls_back(lambda self: self.temp.value >= 100 or self.temp.value <= 10)
+
+    def test_integer_ports_fall_back(self):
+        self.assert_falls_back(lambda self: self.temp.value >= 100, domain=crest.INT)
+
+
+if __name__ == '__main__':
+    unittest.main()
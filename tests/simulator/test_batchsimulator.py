@@ -0,0 +1,287 @@
+import unittest
+import math
+import numpy as np
+import crestdsl.model as crest
+from crestdsl.simulation import Simulator
+from crestdsl.simulation.batchsimulator import BatchSimulator, compile_kernel, compile_guard_comparisons, NotVectorizable, DT_NAME
+
+
+def external_call(value):
+    return value
+
+
+class BatchSimulatorTest(unittest.TestCase):
+
+    def setUp(self):
+        res = crest.Resource("level", crest.REAL)
+        counter = crest.Resource("counter", crest.INT)
+
+        class Tank(crest.Entity):
+            inflow = crest.Input(res, 1)
+            level = crest.Local(res, 0)
+            drains = crest.Local(counter, 0)
+            out = crest.Output(res, 0)
+
+            filling = current = crest.State()
+            draining = crest.State()
+
+            to_drain = crest.Transition(source=filling, target=draining, guard=(lambda self: self.level.value >= 10))
+            to_fill = crest.Transition(source=draining, target=filling, guard=(lambda self: not self.level.value > 2))
+
+            out_inf = crest.Influence(source=level, target=out, function=(lambda value: value * 2))
+
+            @crest.update(state=filling, target=level)
+            def fill(self, dt):
+                return self.level.pre + self.inflow.value * dt
+
+            @crest.update(state=draining, target=level)
+            def drain(self, dt):
+                rate = 2
+                if self.level.pre > 5:
+                    rate += 1
+                return max(self.level.pre - rate * dt, 0)
+
+            @crest.action(transition=to_drain, target=drains)
+            def count_drains(self):
+                return self.drains.value + 1
+
+        self.Tank = Tank
+
+    def test_all_modifiers_are_compiled(self):
+        bsim = BatchSimulator(self.Tank(), instances=3)
+        self.assertEqual(bsim.python_fallbacks, [])
+
+    def test_values_are_2d_arrays(self):
+        tank = self.Tank()
+        bsim = BatchSimulator(tank, {tank.inflow: [1, 2, 3, 4]})
+        self.assertEqual(bsim.values.shape, (len(crest.get_all_ports(tank)), 4))
+        self.assertEqual(bsim.states.shape, (1, 4))
+        np.testing.assert_array_equal(bsim.get_values(tank.inflow), [1, 2, 3, 4])
+
+    def test_initial_values_per_instance(self):
+        tank = self.Tank()
+        bsim = BatchSimulator(tank, [{tank.level: 3}, {tank.level: 4, tank: tank.draining}])
+        np.testing.assert_array_equal(bsim.get_values(tank.level), [3, 4])
+        self.assertEqual(list(bsim.get_states(tank)), [tank.filling, tank.draining])
+
+    def test_steps_end_at_transitions(self):
+        tank = self.Tank()
+        bsim = BatchSimulator(tank, {tank.inflow: [1, 3]})
+        bsim.stabilise()
+        bsim.advance(4)  # the second tank reaches 10 after 10/3 time units and drains afterwards
+        np.testing.assert_array_almost_equal(bsim.get_values(tank.level), [4, 10 - 3 * (4 - 10 / 3)])
+        self.assertEqual([s._name for s in bsim.get_states(tank)], ["filling", "draining"])
+        self.assertEqual(bsim.global_time, 4)
+
+    def test_to_dataframe(self):
+        tank = self.Tank()
+        bsim = BatchSimulator(tank, {tank.inflow: [1, 5]})
+        bsim.stabilise()
+        bsim.advance(2)
+        df = bsim.to_dataframe()
+        self.assertEqual(len(df), 2)
+        self.assertEqual(list(df["level"]), [2, 10])
+        self.assertEqual(list(df["current"]), ["filling", "draining"])
+        self.assertEqual(list(df["drains"]), [0, 1])
+
+    def test_set_values(self):
+        tank = self.Tank()
+        bsim = BatchSimulator(tank, instances=2)
+        bsim.set_values({tank.level: [1, 12]})
+        np.testing.assert_array_equal(bsim.get_values(tank.out), [2, 24])
+        self.assertEqual([s._name for s in bsim.get_states(tank)], ["filling", "draining"])
+
+    def test_python_fallback(self):
+        res = crest.Resource("level", crest.REAL)
+
+        class Calling(crest.Entity):
+            x = crest.Local(res, 1)
+            state = current = crest.State()
+
+            @crest.update(state=state, target=x)
+            def call(self, dt):
+                return external_call(self.x.pre) + dt
+
+        calling = Calling()
+        bsim = BatchSimulator(calling, {calling.x: [1, 2, 3]})
+        bsim.advance(2)
+        self.assertEqual(bsim.python_fallbacks, [calling.call])
+        np.testing.assert_array_equal(bsim.get_values(calling.x), [3, 4, 5])
+        self.assertEqual(calling.x.value, 1, "The system itself is not modified")
+
+    def test_nondeterminism_is_resolved_per_instance(self):
+        res = crest.Resource("level", crest.REAL)
+
+        class Choice(crest.Entity):
+            x = crest.Local(res, 0)
+            start = current = crest.State()
+            left = crest.State()
+            right = crest.State()
+            to_left = crest.Transition(source=start, target=left, guard=(lambda self: True))
+            to_right = crest.Transition(source=start, target=right, guard=(lambda self: True))
+
+        choice = Choice()
+        bsim = BatchSimulator(choice, instances=200, seed=1)
+        bsim.stabilise()
+        names = {state._name for state in bsim.get_states(choice)}
+        self.assertEqual(names, {"left", "right"})
+
+
+class SimulatorComparisonTest(unittest.TestCase):
+    """The batch simulator has to find the same transition times as Simulator.advance."""
+
+    def setUp(self):
+        res = crest.Resource("level", crest.REAL)
+        flag = crest.Resource("flag", crest.BOOL)
+
+        class Reservoir(crest.Entity):
+            inflow = crest.Input(res, 1)
+            level = crest.Local(res, 0)
+            high = crest.Local(flag, False)
+
+            filling = current = crest.State()
+            draining = crest.State()
+            stopped = crest.State()
+
+            to_drain = crest.Transition(source=filling, target=draining, guard=(lambda self: self.level.value >= 10))
+            to_fill = crest.Transition(source=draining, target=filling, guard=(lambda self: self.level.value <= 2))
+            to_stop = crest.Transition(source=filling, target=stopped, guard=(lambda self: 5 <= self.level.value <= 5.5 and self.inflow.value > 4))
+
+            is_high = crest.Influence(source=level, target=high, function=(lambda value: value > 6))
+
+            @crest.update(state=filling, target=level)
+            def fill(self, dt):
+                return self.level.pre + self.inflow.value * dt
+
+            @crest.update(state=draining, target=level)
+            def drain(self, dt):
+                return self.level.pre - 2 * dt
+
+            @crest.update(state=stopped, target=level)
+            def keep(self, dt):
+                return self.level.pre
+
+        class Alarm(crest.Entity):
+            inflow = crest.Input(res, 1)
+            level = crest.Local(res, 0)
+            high = crest.Local(flag, False)
+
+            rising = current = crest.State()
+            alarm = crest.State()
+
+            # not a comparison, the transition time is found by bisection
+            to_alarm = crest.Transition(source=rising, target=alarm, guard=(lambda self: self.high.value))
+
+            is_high = crest.Influence(source=level, target=high, function=(lambda value: value > 6))
+
+            @crest.update(state=rising, target=level)
+            def rise(self, dt):
+                return self.level.pre + self.inflow.value * dt
+
+            @crest.update(state=alarm, target=level)
+            def keep(self, dt):
+                return self.level.pre
+
+        self.Reservoir = Reservoir
+        self.Alarm = Alarm
+
+    def compare(self, entity_class, inflows, advances, **kwargs):
+        system = entity_class()
+        bsim = BatchSimulator(system, {system.inflow: inflows}, **kwargs)
+        bsim.stabilise()
+        for time in advances:
+            bsim.advance(time)
+
+        for idx, inflow in enumerate(inflows):
+            single = entity_class()
+            single.inflow.value = inflow
+            simulator = Simulator(single, record_traces=False)
+            simulator.stabilise()
+            for time in advances:
+                simulator.advance(time)
+
+            with self.subTest(inflow=inflow):
+                self.assertAlmostEqual(bsim.get_values(system.level)[idx], single.level.value)
+                self.assertEqual(bsim.get_states(system)[idx]._name, single.current._name)
+
+    def test_advance_matches_simulator(self):
+        self.compare(self.Reservoir, [0.5, 1, 2, 3, 4.5], [1] * 12)
+
+    def test_long_advance_matches_simulator(self):
+        self.compare(self.Reservoir, [0.5, 1, 2, 3, 4.5], [100])
+
+    def test_max_step_size(self):
+        self.compare(self.Reservoir, [0.5, 1, 3, 4.5], [100], max_step_size=0.3)
+
+    def test_bisection_matches_simulator(self):
+        self.compare(self.Alarm, [0.5, 1, 3], [20])
+
+
+class KernelCompilerTest(unittest.TestCase):
+
+    def setUp(self):
+        res = crest.Resource("res", crest.REAL)
+
+        class Test(crest.Entity):
+            a = crest.Local(res, 0)
+            b = crest.Local(res, 0)
+
+        self.entity = Test()
+        self.rows = {self.entity.a: 0, self.entity.b: 1}
+        self.values = np.array([[1., 5., -3.], [2., 2., 2.]])
+
+    def evaluate(self, function, params=None):
+        kernel = compile_kernel(function, self.rows, params or [self.entity, DT_NAME])
+        return np.broadcast_to(kernel(self.values, self.values, 2), (3,))
+
+    def test_chained_comparison(self):
+        result = self.evaluate(lambda self: 0 < self.a.value < 3)
+        np.testing.assert_array_equal(result, [True, False, False])
+
+    def test_boolean_operators(self):
+        result = self.evaluate(lambda self: self.a.value > 0 and not self.a.value > 3 or self.b.value > 5)
+        np.testing.assert_array_equal(result, [True, False, False])
+
+    def test_if_without_else(self):
+        def func(self, dt):
+            if self.a.value < 0:
+                return abs(self.a.value)
+            x = self.a.value * dt
+            x += self.b.value
+            return x
+
+        np.testing.assert_array_equal(self.evaluate(func), [4, 12, 3])
+
+    def test_conditional_expression_and_math(self):
+        result = self.evaluate(lambda self: math.sqrt(self.b.value) if self.a.value > 2 else min(self.a.value, 0))
+        np.testing.assert_array_almost_equal(result, [0, math.sqrt(2), -3])
+
+    def test_influence_parameter(self):
+        result = self.evaluate(lambda value: value + 1, [self.entity.b])
+        np.testing.assert_array_equal(result, [3, 3, 3])
+
+    def test_entity_access_is_not_vectorizable(self):
+        with self.assertRaises(NotVectorizable):
+            compile_kernel(lambda self: self.current, self.rows, [self.entity])
+
+    def test_guard_comparisons(self):
+        kernels = compile_guard_comparisons(lambda self: 0 < self.a.value < 3 or self.b.value >= 5, self.rows, self.entity)
+        results = [np.broadcast_to(kernel(self.values, self.values), (3,)) for kernel in kernels]
+        np.testing.assert_array_equal(results, [[-1, -5, 3], [-2, 2, -6], [-3, -3, -3]])
+
+    def test_guard_without_comparison(self):
+        with self.assertRaises(NotVectorizable):
+            compile_guard_comparisons(lambda self: self.a.value, self.rows, self.entity)
+
+    def test_loops_are_not_vectorizable(self):
+        def func(self, dt):
+            for i in range(3):
+                pass
+            return 0
+
+        with self.assertRaises(NotVectorizable):
+            compile_kernel(func, self.rows, [self.entity, DT_NAME])
+
+
+if __name__ == '__main__':
+    unittest.main()
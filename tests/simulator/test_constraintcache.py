@@ -0,0 +1,118 @@
+import unittest
+import unittest.mock as mock
+import tempfile
+import shutil
+import os
+
+import z3
+import crestdsl.model as crest
+from crestdsl.config import config
+from crestdsl.simulation import Simulator
+from crestdsl.simulation import constraintcache
+
+
+def create_system():
+    res = crest.Resource("temp", crest.REAL)
+
+    class Heater(crest.Entity):
+        power = crest.Input(res, 3)
+        temp = crest.Local(res, 20)
+        out = crest.Output(res, 0)
+
+        heating = current = crest.State()
+        done = crest.State()
+
+        finished = crest.Transition(source=heating, target=done, guard=(lambda self: self.temp.value >= 100))
+
+        out_inf = crest.Influence(source=temp, target=out, function=(lambda value: value / 3))
+
+        @crest.update(state=heating, target=temp)
+        def heat(self, dt):
+            rate = self.power.value
+            if self.temp.pre > 50:
+                rate = rate * 2
+            else:
+                rate = rate + 1
+            return self.temp.pre + rate * dt
+
+    return Heater()
+
+
+class ConstraintCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.previous = config.constraint_cache
+        config.constraint_cache = self.directory
+        self.cache = constraintcache.get_constraint_cache()
+
+    def tearDown(self):
+        config.constraint_cache = self.previous
+        shutil.rmtree(self.directory)
+
+    def next_behaviour_change(self):
+        system = create_system()
+        sim = Simulator(system, record_traces=False)
+        sim.stabilise()
+        return sim.next_behaviour_change_time()
+
+    def test_cache_disabled_by_default(self):
+        config.constraint_cache = None
+        self.assertIsNone(constraintcache.get_constraint_cache())
+
+    def test_warm_cache_skips_translation(self):
+        cold = self.next_behaviour_change()
+        self.assertGreater(self.cache.stats["stores"], 0)
+        self.assertEqual(self.cache.stats["hits"], 0)
+        stores = self.cache.stats["stores"]
+
+        # on a warm cache, neither the modifier constraints nor the if/else constraints are translated
+        no_translation = mock.MagicMock(side_effect=AssertionError("no translation expected"))
+        with mock.patch("crestdsl.simulation.z3calculator.Z3Converter", no_translation), \
+                mock.patch("crestdsl.simulation.conditiontimedchangecalculator.Z3ConditionChangeCalculator", no_translation):
+            warm = self.next_behaviour_change()
+
+        self.assertEqual(cold[0], warm[0])
+        self.assertEqual(self.cache.stats["hits"], stores)
+
+    def test_warm_cache_gives_same_result(self):
+        cold = self.next_behaviour_change()
+        warm = self.next_behaviour_change()
+        self.assertGreater(self.cache.stats["hits"], 0)
+        self.assertEqual(cold[0], warm[0])
+        self.assertEqual(cold[1]._name, warm[1]._name)
+
+    def test_roundtrip_uses_current_variables(self):
+        system = create_system()
+        dt = z3.Real("dt")
+        z3_vars = {"dt": dt}
+        for port in crest.get_ports(system):
+            z3_vars[port] = {port._name: z3.Real(f"{port._name}_{id(port)}"), port._name + "_0": z3.Real(f"{port._name}_0_{id(port)}")}
+        temp, temp_0 = z3_vars[system.temp][system.temp._name], z3_vars[system.temp][system.temp._name + "_0"]
+        internal = z3.Real(f"rate_{id(system.heat)}")
+        expressions = [temp == temp_0 + internal * dt, internal == z3.RealVal(1) / 3]
+
+        smtlib = constraintcache.to_smtlib(system.heat, z3_vars, expressions)
+        self.assertNotIn(str(id(system.temp)), smtlib)
+        loaded = constraintcache.from_smtlib(system.heat, z3_vars, smtlib)
+        for original, reloaded in zip(expressions, loaded):
+            self.assertTrue(original.eq(reloaded))
+
+    def test_source_change_changes_key(self):
+        system = create_system()
+        key = constraintcache.constraint_key(system.heat, constraintcache.MODIFIER, True, crest.REAL)
+        self.assertEqual(key, constraintcache.constraint_key(create_system().heat, constraintcache.MODIFIER, True, crest.REAL))
+        self.assertNotEqual(key, constraintcache.constraint_key(system.heat, constraintcache.MODIFIER, False, crest.REAL))
+        self.assertNotEqual(key, constraintcache.constraint_key(system.heat, constraintcache.BEHAVIOUR_CHANGE, True, crest.REAL))
+
+    def test_broken_file_is_a_miss(self):
+        self.next_behaviour_change()
+        for filename in os.listdir(self.directory):
+            with open(os.path.join(self.directory, filename), "w") as broken:
+                broken.write("{")
+        self.next_behaviour_change()
+        self.assertEqual(self.cache.stats["hits"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,9 @@
 import unittest
+import unittest.mock as mock
 import crestdsl.model as crest
-from crestdsl.simulation.dependencyOrder import ordered_modifiers
+from crestdsl.simulation import Simulator
+from crestdsl.simulation import dependencyOrder as DO
+from crestdsl.simulation.dependencyOrder import ordered_modifiers, compile_schedule
 
 testRes = crest.Resource("float-resource", crest.Types.REAL)
 class TestSubEntity(crest.Entity):
@@ -103,3 +106,43 @@ class Test_getDependencyOrder(unittest.TestCase):
         ]
 
         self.assertListEqual([ent.up_active, ent.sub, ent.inf, ent.sub, ent.influence2, ent.sub2], ordered_modifiers(ent))
+
+
+class Test_compileSchedule(unittest.TestCase):
+
+    def create_entity(self):
+        class TestEntity(crest.Entity):
+            sub = TestSubEntity()
+            sub2 = TestSubEntity()
+
+            active = current = crest.State()
+            cyclic = crest.State()
+
+            up_active = crest.Update(state=active, target=sub.in1, function=(lambda self, dt: 0))
+            up_cyclic = crest.Update(state=cyclic, target=sub.in1, function=(lambda self, dt: self.sub.out1.value))
+
+        return TestEntity()
+
+    def test_independent_modifiers_are_ordered_by_name(self):
+        ent = self.create_entity()
+        self.assertEqual((ent.up_active, ent.sub, ent.sub2), compile_schedule(ent, ent.active))
+
+    def test_schedule_of_other_state(self):
+        ent = self.create_entity()
+        self.assertRaises(AssertionError, compile_schedule, ent, ent.cyclic)
+        self.assertIs(ent.current, ent.active)
+
+    def test_simulator_compiles_all_states(self):
+        ent = self.create_entity()
+        sim = Simulator(ent, record_traces=False)  # doesn't complain about the cyclic state, we're not in it
+        self.assertEqual(sim.get_schedule(ent), (ent.up_active, ent.sub, ent.sub2))
+        self.assertIsInstance(sim._schedules[(ent, ent.cyclic)], AssertionError)
+        self.assertEqual(sim._schedules[(ent.sub, None)], ())
+
+        with mock.patch.object(DO, "compile_schedule") as compile:
+            sim.stabilise()
+            sim.advance(2)
+        compile.assert_not_called()
+
+        ent.current = ent.cyclic
+        self.assertRaises(AssertionError, sim.stabilise)
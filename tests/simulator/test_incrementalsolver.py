@@ -0,0 +1,82 @@
+import unittest
+import unittest.mock as mock
+
+import crestdsl.model as crest
+from crestdsl.simulation import Simulator
+from crestdsl.simulation.conditiontimedchangecalculator import ConditionTimedChangeCalculator
+
+
+def create_system():
+    res = crest.Resource("temp", crest.REAL)
+
+    class Heater(crest.Entity):
+        power = crest.Input(res, 3)
+        temp = crest.Local(res, 20)
+        out = crest.Output(res, 0)
+
+        heating = current = crest.State()
+        cooling = crest.State()
+
+        too_hot = crest.Transition(source=heating, target=cooling, guard=(lambda self: self.temp.value >= 100))
+        too_cold = crest.Transition(source=cooling, target=heating, guard=(lambda self: self.temp.value <= 30))
+
+        out_inf = crest.Influence(source=temp, target=out, function=(lambda value: value / 3))
+
+        @crest.update(state=heating, target=temp)
+        def heat(self, dt):
+            rate = self.power.value
+            if self.temp.pre > 50:
+                rate = rate * 2
+            else:
+                rate = rate + 1
+            return self.temp.pre + rate * dt
+
+        @crest.update(state=cooling, target=temp)
+        def cool(self, dt):
+            return self.temp.pre - 5 * dt
+
+    return Heater()
+
+
+class IncrementalSolverTest(unittest.TestCase):
+
+    def run_simulation(self, incremental, steps=8):
+        system = create_system()
+        sim = Simulator(system, record_traces=False)
+        sim.conditionchangecalculator = ConditionTimedChangeCalculator(system, sim.timeunit, incremental=incremental)
+        sim.stabilise()
+        changes = []
+        for _ in range(steps):
+            dt, obj = sim.next_behaviour_change_time()
+            changes.append((dt, obj._name))
+            sim.advance(dt)
+        return changes, sim
+
+    def test_same_results_as_fresh_solvers(self):
+        fresh, _ = self.run_simulation(incremental=False)
+        incremental, _ = self.run_simulation(incremental=True)
+        self.assertEqual(fresh, incremental)
+
+    def test_solvers_are_reused(self):
+        with mock.patch.object(ConditionTimedChangeCalculator, "_build_transition_query",
+                               autospec=True, side_effect=ConditionTimedChangeCalculator._build_transition_query) as build:
+            _, sim = self.run_simulation(incremental=True)
+        # one solver per transition and state, no matter how often we ask
+        self.assertEqual(build.call_count, 2)
+        self.assertLessEqual(len(sim.conditionchangecalculator._queries), 4)
+
+    def test_max_queries(self):
+        system = create_system()
+        sim = Simulator(system, record_traces=False)
+        sim.conditionchangecalculator = ConditionTimedChangeCalculator(system, sim.timeunit, incremental=True, max_queries=1)
+        sim.stabilise()
+        sim.next_behaviour_change_time()
+        self.assertEqual(len(sim.conditionchangecalculator._queries), 1)
+
+    def test_disabled(self):
+        _, sim = self.run_simulation(incremental=False, steps=2)
+        self.assertEqual(len(sim.conditionchangecalculator._queries), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
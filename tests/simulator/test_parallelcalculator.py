@@ -0,0 +1,98 @@
+import unittest
+import unittest.mock as mock
+
+import crestdsl.model as crest
+from crestdsl.config import config
+from crestdsl.simulation import Simulator
+from crestdsl.simulation.parallelconditiontimedchangecalculator import ParallelConditionTimedChangeCalculator, LOCAL
+
+
+def create_system(heaters=4):
+    res = crest.Resource("temp", crest.REAL)
+
+    class Heater(crest.Entity):
+        power = crest.Input(res, 3)
+        temp = crest.Local(res, 20)
+
+        heating = current = crest.State()
+        cooling = crest.State()
+
+        too_hot = crest.Transition(source=heating, target=cooling, guard=(lambda self: self.temp.value >= 100))
+        too_cold = crest.Transition(source=cooling, target=heating, guard=(lambda self: self.temp.value <= 30))
+
+        @crest.update(state=heating, target=temp)
+        def heat(self, dt):
+            rate = self.power.value
+            if self.temp.pre > 50:
+                rate = rate * 2
+            else:
+                rate = rate + 1
+            return self.temp.pre + rate * dt
+
+        @crest.update(state=cooling, target=temp)
+        def cool(self, dt):
+            return self.temp.pre - 5 * dt
+
+    class System(crest.Entity):
+        state = current = crest.State()
+
+    for i in range(heaters):
+        heater = Heater()
+        heater.power.value = i + 1
+        setattr(System, f"heater{i}", heater)
+    return System()
+
+
+class ParallelCalculatorTest(unittest.TestCase):
+
+    def setUp(self):
+        # make sure that the queries are actually sent to the workers
+        self.previous = config.analytic_transition_times
+        config.analytic_transition_times = False
+
+    def tearDown(self):
+        config.analytic_transition_times = self.previous
+
+    def run_simulation(self, workers, steps=6):
+        system = create_system()
+        sim = Simulator(system, record_traces=False, workers=workers)
+        sim.stabilise()
+        changes = []
+        for _ in range(steps):
+            dt, obj = sim.next_behaviour_change_time()[:2]
+            changes.append((dt, obj._name, obj._parent._name))
+            sim.advance(dt)
+        return changes, sim
+
+    def test_same_result_as_sequential(self):
+        sequential, _ = self.run_simulation(workers=None)
+        parallel, sim = self.run_simulation(workers=2)
+        calculator = sim.conditionchangecalculator
+        try:
+            self.assertIsInstance(calculator, ParallelConditionTimedChangeCalculator)
+            self.assertEqual(sequential, parallel)
+            self.assertTrue(any(query._remote not in (None, LOCAL) for query in calculator._queries.values() if query is not None))
+        finally:
+            calculator.close()
+
+    def test_unserializable_queries_are_solved_locally(self):
+        sequential, _ = self.run_simulation(workers=None, steps=2)
+        with mock.patch.object(ParallelConditionTimedChangeCalculator, "_setup", side_effect=ValueError("not serializable")):
+            parallel, sim = self.run_simulation(workers=2, steps=2)
+        sim.conditionchangecalculator.close()
+        self.assertEqual(sequential, parallel)
+        self.assertTrue(all(query._remote == LOCAL for query in sim.conditionchangecalculator._queries.values() if query is not None))
+
+    def test_close(self):
+        system = create_system()
+        with ParallelConditionTimedChangeCalculator(system, workers=2) as calculator:
+            Simulator(system, record_traces=False).stabilise()
+            calculator.get_next_behaviour_change_time()
+            processes = list(calculator._processes)
+            self.assertEqual(len(processes), 2)
+        self.assertEqual(calculator._processes, [])
+        self.assertFalse(any(process.is_alive() for process in processes))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import unittest
+import crestdsl.model as crest
+from crestdsl.simulation import PlanSimulator
+from crestdsl.simulation.sweep import Sweep, run_sweep, grid, execute_run, portable_assignment, \
+    Reference, OK, ERROR, TIMEOUT
+
+res = crest.Resource("level", crest.REAL)
+
+
+class Tank(crest.Entity):
+    inflow = crest.Input(res, 1)
+    level = crest.Local(res, 0)
+    out = crest.Output(res, 0)
+
+    filling = current = crest.State()
+    full = crest.State()
+
+    to_full = crest.Transition(source=filling, target=full, guard=(lambda self: self.level.value >= 10))
+    out_inf = crest.Influence(source=level, target=out)
+
+    @crest.update(state=filling, target=level)
+    def fill(self, dt):
+        return self.level.pre + self.inflow.value * dt
+
+
+class System(crest.Entity):
+    tank = Tank()
+    state = current = crest.State()
+
+
+class SweepTest(unittest.TestCase):
+
+    def test_grid(self):
+        template = Tank()
+        assignments = grid({template.inflow: [1, 2], template.level: [0, 5, 7]})
+        self.assertEqual(len(assignments), 6)
+        self.assertIn({template.inflow: 2, template.level: 5}, assignments)
+
+    def test_portable_assignment_uses_paths(self):
+        template = System()
+        portable = portable_assignment({template.tank.level: 3, template.tank: template.tank.full, "tank.inflow": 2})
+        self.assertEqual(portable, {Reference("tank.level"): 3, Reference("tank"): Reference("full"), Reference("tank.inflow"): 2})
+
+    def test_sweep_matches_plansimulator(self):
+        template = Tank()
+        plan = [5, {template.inflow: 0}, 5]
+        results = run_sweep(Tank, grid({template.inflow: [0.5, 1, 3]}), plan, workers=2)
+
+        self.assertEqual([r.index for r in results], [0, 1, 2])
+        for result, inflow in zip(results, [0.5, 1, 3]):
+            self.assertEqual(result.status, OK)
+
+            tank = Tank()
+            tank.inflow.value = inflow
+            psim = PlanSimulator(tank)
+            psim.stabilise()
+            psim.run_plan([5, {tank.inflow: 0}, 5])
+
+            self.assertEqual(len(result.trace), len(psim.trace.data))
+            self.assertAlmostEqual(float(result.trace["level"].iloc[-1]), float(tank.level.value))
+            self.assertEqual(result.trace["current"].iloc[-1], tank.current._name)
+
+    def test_results_stream_with_progress(self):
+        template = System()
+        progress = []
+        sweep = Sweep(System, [{template.tank.level: level} for level in range(4)], [2], workers=2, chunksize=3,
+                      progress=lambda finished, total, result: progress.append((finished, total)))
+        results = list(sweep)
+        self.assertEqual(sorted(r.index for r in results), [0, 1, 2, 3])
+        self.assertEqual(progress, [(1, 4), (2, 4), (3, 4), (4, 4)])
+        self.assertIn("tank.level", results[0].trace.columns)
+        self.assertIn("tank.current", results[0].trace.columns)
+
+    def test_failing_run_is_reported(self):
+        results = run_sweep(Tank, [{"level": 1}, {"does_not_exist": 1}], [1], workers=0)
+        self.assertEqual([r.status for r in results], [OK, ERROR])
+        self.assertIn("does_not_exist", results[1].error)
+
+    def test_timeout(self):
+        result = execute_run(Tank, 0, portable_assignment({}), [1] * 100000, timeout=0.2)
+        self.assertEqual(result.status, TIMEOUT)
+        self.assertIsNone(result.trace)
+
+    def test_no_traces(self):
+        results = run_sweep(Tank, [{}], [1], workers=0, simulator_kwargs=dict(record_traces=False))
+        self.assertIsNone(results[0].trace)
+
+
+if __name__ == '__main__':
+    unittest.main()
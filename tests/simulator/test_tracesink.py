@@ -0,0 +1,160 @@
+import unittest
+import os
+import tempfile
+import crestdsl.model as crest
+import crestdsl.simulation as sim
+from crestdsl.simulation.tracestore import TraceStore
+from crestdsl.simulation.tracepolicy import OnChange
+from crestdsl.simulation.tracesink import CSVSink, ParquetSink, ArrowSink, read_trace, get_column_name
+
+try:
+    import pyarrow
+    has_pyarrow = True
+except ImportError:
+    has_pyarrow = False
+
+
+res = crest.Resource("watt", crest.REAL)
+counts = crest.Resource("count", crest.INT)
+switch = crest.Resource("switch", ["on", "off"])
+
+
+class SubEntity(crest.Entity):
+    inp = crest.Input(res, 0)
+    one = current = crest.State()
+    two = crest.State()
+
+
+class TestEntity(crest.Entity):
+    sw = crest.Input(switch, "on")
+    level = crest.Local(res, 0)
+    count = crest.Local(counts, 0)
+
+    state = current = crest.State()
+    other = crest.State()
+
+    sub = SubEntity()
+
+
+class TraceSinkTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def record(self, sink, rows=5):
+        self.entity = entity = TestEntity()
+        store = TraceStore(sink=sink)
+        for time in range(rows):
+            entity.level.value = time * 1.5
+            entity.count.value = time
+            entity.sw.value = "on" if time % 2 == 0 else "off"
+            entity.current = entity.state if time < 3 else entity.other
+            store.save_entity(entity, time)
+        return store
+
+    def check_data(self, data, rows=5):
+        self.assertEqual(len(data), rows)
+        self.assertEqual(set(data.columns), {"timestamp", "current", "sw", "level", "count", "sub.current", "sub.inp"})
+        self.assertEqual(list(data["timestamp"]), list(range(rows)))
+        self.assertEqual(list(data["level"]), [t * 1.5 for t in range(rows)])
+        self.assertEqual(list(data["count"]), list(range(rows)))
+        self.assertEqual(list(data["current"])[:4], ["state", "state", "state", "other"])
+        self.assertEqual(list(data["sw"])[:2], ["on", "off"])
+        self.assertEqual(list(data["sub.current"]), ["one"] * rows)
+
+    def test_column_names_are_paths(self):
+        entity = TestEntity()
+        self.assertEqual(get_column_name(entity, entity), "current")
+        self.assertEqual(get_column_name(entity, entity.sub), "sub.current")
+        self.assertEqual(get_column_name(entity, entity.sub.inp), "sub.inp")
+
+    def test_csv(self):
+        path = os.path.join(self.tmpdir.name, "trace.csv")
+        store = self.record(CSVSink(path, batch_size=2))
+        self.check_data(store.data)
+        self.check_data(read_trace(path))
+
+    def test_csv_synchronous(self):
+        path = os.path.join(self.tmpdir.name, "trace.csv")
+        store = self.record(CSVSink(path, batch_size=2, background=False))
+        store.close()
+        self.check_data(read_trace(path))
+
+    def test_rows_are_flushed_in_batches(self):
+        path = os.path.join(self.tmpdir.name, "trace.csv")
+        store = self.record(CSVSink(path, batch_size=2, background=False), rows=5)
+        self.assertEqual(len(store._data), 1)  # only the incomplete batch is in memory
+        store.close()
+        self.assertEqual(len(read_trace(path)), 5)
+
+    def test_data_can_be_read_during_the_simulation(self):
+        path = os.path.join(self.tmpdir.name, "trace.csv")
+        store = TraceStore(sink=CSVSink(path, batch_size=2))
+        s = sim.Simulator(TestEntity(), record_traces=store)
+        s.advance(1)
+        first = store.data
+        self.assertGreater(len(first), 0)
+
+        s.advance(1)
+        self.assertFalse(store.sink.closed)
+        self.assertGreater(len(store.data), len(first))
+        store.close()
+        self.assertEqual(len(read_trace(path)), len(store.data))
+
+    def test_write_after_close_raises(self):
+        path = os.path.join(self.tmpdir.name, "trace.csv")
+        store = self.record(CSVSink(path, batch_size=1))
+        store.close()
+        with self.assertRaises(ValueError):
+            store.save_entity(self.entity, 10)
+
+    def test_sparse_rows(self):
+        path = os.path.join(self.tmpdir.name, "trace.csv")
+        entity = TestEntity()
+        store = TraceStore(policy=OnChange(), sink=CSVSink(path))
+        store.save_entity(entity, 0)
+        entity.level.value = 3
+        store.save_entity(entity, 1)
+
+        data = store.data
+        self.assertEqual(list(data["level"]), [0, 3])
+        self.assertTrue(data["count"].isna().iloc[1])
+
+    def test_unknown_extension_raises(self):
+        with self.assertRaises(ValueError):
+            read_trace("trace.xyz")
+
+    @unittest.skipIf(not has_pyarrow, "pyarrow is not installed")
+    def test_parquet(self):
+        path = os.path.join(self.tmpdir.name, "trace.parquet")
+        store = self.record(ParquetSink(path, batch_size=2))
+        with self.assertRaises(ValueError):
+            store.data  # parquet files are only complete after close
+        store.close()
+        self.check_data(store.data)
+
+    @unittest.skipIf(not has_pyarrow, "pyarrow is not installed")
+    def test_arrow(self):
+        path = os.path.join(self.tmpdir.name, "trace.arrow")
+        store = self.record(ArrowSink(path, batch_size=2))
+        store.close()
+        self.check_data(read_trace(path))
+
+    @unittest.skipIf(not has_pyarrow, "pyarrow is not installed")
+    def test_simulator_streams_to_sink(self):
+        path = os.path.join(self.tmpdir.name, "trace.parquet")
+        store = TraceStore(sink=ParquetSink(path, batch_size=3))
+        s = sim.Simulator(TestEntity(), record_traces=store)
+        s.stabilise()
+        s.advance(5)
+        store.close()
+        data = store.data
+        self.assertGreater(len(data), 0)
+        self.assertIn("sub.inp", data.columns)
+
+
+if __name__ == '__main__':
+    unittest.main()
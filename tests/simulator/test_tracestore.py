@@ -0,0 +1,270 @@
+import unittest
+import crestdsl.model as crest
+import crestdsl.simulation as sim
+from crestdsl.simulation.tracestore import TraceStore, ColumnarTraceStore, create_tracestore
+from crestdsl.simulation.tracepolicy import OnChange, EveryNth, EveryDelta, Subset, CombinedPolicy
+
+
+res = crest.Resource("watt", crest.REAL)
+counts = crest.Resource("count", crest.INT)
+switch = crest.Resource("switch", ["on", "off"])
+
+
+class TestEntity(crest.Entity):
+    inp = crest.Input(switch, "on")
+    level = crest.Local(res, 0)
+    count = crest.Local(counts, 0)
+    out = crest.Output(res, 0)
+
+    low = current = crest.State()
+    high = crest.State()
+
+    up = crest.Transition(source=low, target=high, guard=(lambda self: self.level.value >= 10))
+    down = crest.Transition(source=high, target=low, guard=(lambda self: self.level.value <= 0))
+
+    @crest.update(state=low, target=level)
+    def rise(self, dt):
+        return self.level.value + dt
+
+    @crest.update(state=high, target=level)
+    def fall(self, dt):
+        return self.level.value - 2 * dt
+
+    @crest.influence(source=level, target=out)
+    def forward(value):
+        return value
+
+
+class ColumnarTraceStoreTest(unittest.TestCase):
+
+    def test_create_tracestore_by_name(self):
+        self.assertIsInstance(create_tracestore(True), TraceStore)
+        self.assertIsInstance(create_tracestore(False), TraceStore)
+        self.assertIsInstance(create_tracestore("dict"), TraceStore)
+        self.assertIsInstance(create_tracestore("columnar"), ColumnarTraceStore)
+
+    def test_create_tracestore_passes_objects(self):
+        store = ColumnarTraceStore()
+        self.assertIs(create_tracestore(store), store)
+
+    def test_create_tracestore_unknown_name_raises(self):
+        with self.assertRaises(ValueError):
+            create_tracestore("abcdefg")
+
+    def test_simulator_selects_backend(self):
+        s = sim.Simulator(TestEntity(), record_traces="columnar")
+        self.assertIsInstance(s.trace, ColumnarTraceStore)
+        self.assertEqual(len(s.trace), 1)
+
+    def test_columnar_data_matches_dict_data(self):
+        dict_sim = sim.Simulator(TestEntity(), record_traces=True)
+        dict_sim.advance(30)
+        col_sim = sim.Simulator(TestEntity(), record_traces="columnar")
+        col_sim.advance(30)
+
+        dict_data = dict_sim.trace.data
+        col_data = col_sim.trace.data
+        self.assertEqual(dict_data.shape, col_data.shape)
+
+        # columns are keyed by the objects of each system, so compare by name
+        for dict_col, col_col in zip(sorted(dict_data.columns, key=str), sorted(col_data.columns, key=str)):
+            self.assertEqual(str(dict_col), str(col_col))
+            for dict_val, col_val in zip(dict_data[dict_col], col_data[col_col]):
+                if isinstance(dict_val, crest.State):
+                    self.assertEqual(str(dict_val), str(col_val))
+                else:
+                    self.assertEqual(dict_val, col_val)
+
+    def test_states_are_stored_as_codes(self):
+        entity = TestEntity()
+        store = ColumnarTraceStore()
+        store.save_entity(entity, 0)
+        entity.current = entity.high
+        store.save_entity(entity, 1)
+
+        self.assertEqual(store.data[entity].dtype.name, "category")
+        self.assertEqual(store.data[entity].cat.codes.dtype.name, "int8")
+        self.assertEqual(list(store.data[entity]), [entity.low, entity.high])
+
+    def test_port_columns_are_unboxed(self):
+        entity = TestEntity()
+        store = ColumnarTraceStore()
+        store.save_entity(entity, 0)
+
+        self.assertEqual(store.data[entity.level].dtype.name, "float64")
+        self.assertEqual(store.data[entity.count].dtype.name, "int64")
+        self.assertEqual(store.data[entity.inp].dtype.name, "object")
+
+    def test_unexpected_value_upcasts_column(self):
+        entity = TestEntity()
+        store = ColumnarTraceStore()
+        store.save_entity(entity, 0)
+        store.save_entity(entity, sim.Epsilon(0, 1))
+
+        self.assertEqual(store.data["timestamp"].dtype.name, "object")
+        self.assertEqual(list(store.data["timestamp"]), [0, sim.Epsilon(0, 1)])
+
+    def test_arrays_grow(self):
+        entity = TestEntity()
+        store = ColumnarTraceStore(initial_capacity=2)
+        for i in range(10):
+            entity.level.value = i
+            store.save_entity(entity, i)
+
+        self.assertEqual(len(store), 10)
+        self.assertEqual(list(store.data[entity.level]), list(range(10)))
+        self.assertEqual(list(store.data["timestamp"]), list(range(10)))
+
+    def test_data_view_is_cached_until_next_row(self):
+        entity = TestEntity()
+        store = ColumnarTraceStore()
+        store.save_entity(entity, 0)
+        self.assertIs(store.data, store.data)
+
+        first = store.data
+        store.save_entity(entity, 1)
+        self.assertEqual(len(first), 1)
+        self.assertEqual(len(store.data), 2)
+
+    def test_save_multiple_marks_missing_values(self):
+        entity = TestEntity()
+        store = ColumnarTraceStore()
+        store.save_entity(entity, 0)
+        store.save_multiple(1, {entity.count: 5})
+
+        self.assertEqual(list(store.data[entity.count]), [0, 5])
+        self.assertTrue(store.data[entity.level].isna().iloc[1])
+        self.assertIsNone(store.data[entity.inp].iloc[1])
+        self.assertTrue(store.data[entity].isna().iloc[1])
+
+    def test_missing_values_keep_the_dtype(self):
+        entity = TestEntity()
+        store = ColumnarTraceStore(initial_capacity=1)
+        entity.count.value = 2**60 + 1
+        store.save_entity(entity, 0)
+        store.save_multiple(1, {entity.level: 3})
+        store.save_entity(entity, 2)
+
+        data = store.data
+        self.assertEqual(data[entity.count].dtype.name, "Int64")
+        self.assertEqual(list(data[entity.count].isna()), [False, True, False])
+        self.assertEqual(data[entity.count].iloc[0], 2**60 + 1)
+        self.assertEqual(data[entity.level].dtype.name, "float64")
+
+    def test_save_multiple_unknown_column_raises(self):
+        entity = TestEntity()
+        store = ColumnarTraceStore()
+        store.save_entity(entity, 0)
+        with self.assertRaises(KeyError):
+            store.save_multiple(1, {TestEntity().count: 5})
+
+
+class TracePolicyTest(unittest.TestCase):
+
+    def save_levels(self, store, entity, levels):
+        for time, level in enumerate(levels):
+            entity.level.value = level
+            store.save_entity(entity, time)
+
+    def test_dict_store_data_can_be_read_twice(self):
+        entity = TestEntity()
+        store = TraceStore()
+        self.save_levels(store, entity, [1, 2])
+        self.assertEqual(len(store.data), 2)
+        self.assertEqual(len(store.data), 2)
+        self.save_levels(store, entity, [3])
+        self.assertEqual(list(store.data[entity.level]), [1, 2, 3])
+
+    def test_on_change_only_records_changed_values(self):
+        for store_class in [TraceStore, ColumnarTraceStore]:
+            entity = TestEntity()
+            store = store_class(policy=OnChange())
+            self.save_levels(store, entity, [1, 1, 2])
+
+            data = store.data
+            self.assertEqual(list(data["timestamp"]), [0, 2])
+            self.assertEqual(list(data[entity.level]), [1, 2])
+            self.assertTrue(data[entity.count].isna().iloc[1])
+
+    def test_on_change_stores_only_changed_values(self):
+        entity = TestEntity()
+        store = ColumnarTraceStore(policy=OnChange())
+        entity.count.value = 2**60 + 1
+        self.save_levels(store, entity, range(100))
+
+        data = store.data
+        self.assertEqual(list(data[entity.level]), list(range(100)))
+        self.assertEqual(data[entity.count].dtype.name, "Int64")
+        self.assertEqual(data[entity.count].iloc[0], 2**60 + 1)
+        self.assertEqual(data[entity.count].isna().sum(), 99)
+        self.assertEqual(store._columns[entity.count].count, 1)
+        self.assertEqual(store._columns[entity].count, 1)
+        self.assertEqual(store._columns[entity.level].count, 100)
+
+    def test_on_change_ring_buffer(self):
+        entity = TestEntity()
+        store = ColumnarTraceStore(policy=OnChange(), maxlen=3)
+        self.save_levels(store, entity, range(50))
+
+        data = store.data
+        self.assertEqual(list(data["timestamp"]), [47, 48, 49])
+        self.assertEqual(list(data[entity.level]), [47, 48, 49])
+        self.assertTrue(data[entity.count].isna().all())
+        self.assertLessEqual(len(store._columns[entity.level].rows), 16)
+
+    def test_every_nth(self):
+        for store_class in [TraceStore, ColumnarTraceStore]:
+            entity = TestEntity()
+            store = store_class(policy=EveryNth(3))
+            self.save_levels(store, entity, range(7))
+            self.assertEqual(list(store.data[entity.level]), [0, 3, 6])
+
+    def test_every_delta(self):
+        entity = TestEntity()
+        store = TraceStore(policy=EveryDelta(2.5))
+        for time in [0, 1, 2, 2.5, 3, 4, 5, 6]:
+            store.save_entity(entity, time)
+        self.assertEqual(list(store.data["timestamp"]), [0, 2.5, 5])
+
+    def test_subset(self):
+        for store_class in [TraceStore, ColumnarTraceStore]:
+            entity = TestEntity()
+            store = store_class(policy=Subset([entity.level, entity]))
+            self.save_levels(store, entity, [1, 2])
+            self.assertEqual(set(store.data.columns), {"timestamp", entity, entity.level})
+
+    def test_combined_policy_applies_in_order(self):
+        entity = TestEntity()
+        store = TraceStore(policy=CombinedPolicy(Subset([entity.level]), OnChange(), EveryNth(2)))
+        self.save_levels(store, entity, [1, 1, 2, 2, 3, 4])
+        self.assertEqual(list(store.data[entity.level]), [1, 3])
+
+    def test_ring_buffer(self):
+        for store_class in [TraceStore, ColumnarTraceStore]:
+            entity = TestEntity()
+            store = store_class(maxlen=3)
+            self.save_levels(store, entity, range(5))
+            self.assertEqual(list(store.data[entity.level]), [2, 3, 4])
+            self.assertEqual(list(store.data["timestamp"]), [2, 3, 4])
+
+    def test_ring_buffer_data_is_not_overwritten(self):
+        entity = TestEntity()
+        store = ColumnarTraceStore(maxlen=3)
+        self.save_levels(store, entity, range(3))
+        old = store.data
+        self.save_levels(store, entity, [7, 8])
+        self.assertEqual(list(old[entity.level]), [0, 1, 2])
+        self.assertEqual(list(old["timestamp"]), [0, 1, 2])
+        self.assertEqual(list(store.data[entity.level]), [2, 7, 8])
+
+    def test_simulator_with_policy(self):
+        store = TraceStore(policy=OnChange())
+        s = sim.Simulator(TestEntity(), record_traces=store)
+        s.advance(30)
+        full = sim.Simulator(TestEntity())
+        full.advance(30)
+        self.assertLess(len(store.data), len(full.trace.data))
+
+
+if __name__ == '__main__':
+    unittest.main()
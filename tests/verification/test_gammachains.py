@@ -0,0 +1,145 @@
+from crestdsl.verification import tctl, StateSpace
+from crestdsl.verification.tctl import NamedAtomicProposition, Interval
+from crestdsl.verification.checklib import check
+from crestdsl.verification.continuous import ContinuousModelChecker, PA
+from crestdsl.verification.modelchecker import ModelChecker
+from crestdsl.verification.gammachains import GammaChains
+from crestdsl.verification.refinement import CREST_PROPS
+
+import crestdsl.model as crest
+
+import random
+
+import networkx as nx
+
+import unittest
+
+import logging
+logging.disable(logging.WARNING)
+
+phi, psi = NamedAtomicProposition("phi"), NamedAtomicProposition("psi")
+
+
+def random_kripke(rng, weights, nodes=8, edges=13):
+    """A Kripke structure where all edges of a node have the same weight (and without cycles of zero edges)."""
+    graph = nx.gnm_random_graph(nodes, edges, seed=rng.randint(0, 10**6), directed=True)
+    graph.add_edges_from((node, node) for node in rng.sample(range(nodes), 2))
+    kripke = nx.DiGraph()
+    for node in graph:
+        kripke.add_node(f"node{node}", **{CREST_PROPS: {phi: rng.random() < 0.7, psi: rng.random() < 0.35}})
+    for node in graph:
+        weight = rng.choice(weights)
+        kripke.add_edges_from(((f"node{node}", f"node{successor}") for successor in graph.successors(node)), weight=weight)
+    zero_edges = [(u, v) for u, v, weight in kripke.edges(data="weight") if weight == 0]
+    if not nx.is_directed_acyclic_graph(kripke.edge_subgraph(zero_edges)):
+        kripke.remove_edges_from(zero_edges)
+    return kripke
+
+
+FORMULAS = [
+    tctl.EU(phi, psi),
+    tctl.EG(tctl.Or(phi, tctl.Not(PA))),
+    tctl.EU(phi, psi, Interval() <= 3),
+    tctl.EU(phi, psi, Interval() < 5),
+    tctl.EU(phi, psi, Interval() >= 3),
+    tctl.EU(PA, tctl.Not(phi), Interval() > 4),
+    tctl.EU(phi, psi, (Interval() >= 3) <= 3),
+    tctl.EU(tctl.Or(phi, PA), tctl.And(psi, tctl.Not(PA)), (Interval() >= 1) <= 5),
+    tctl.EU(tctl.EG(tctl.Or(phi, PA)), tctl.EU(phi, tctl.And(psi, PA), Interval() <= 4), Interval() >= 5),
+    tctl.EU(tctl.Not(PA), tctl.EU(phi, psi, Interval() >= 2), Interval() <= 7),
+    # (Sat_AU0 copies the formula and NamedAtomicPropositions can't be copied, so they are wrapped)
+    tctl.AU(tctl.Not(tctl.And(tctl.Not(phi), PA)), tctl.Not(tctl.EU(phi, psi, (Interval() >= 1) <= 4)), Interval() > 0),
+]
+
+
+class GammaChainsTest(unittest.TestCase):
+
+    def test_chains(self):
+        kripke = nx.DiGraph()
+        kripke.add_edge("a", "b", weight=4)
+        kripke.add_edge("a", "c", weight=4)
+        kripke.add_edge("b", "c", weight=0.5)
+        kripke.add_edge("c", "a", weight=2)
+        chains = GammaChains(kripke, 0.5)
+        self.assertEqual([chains.lengths[chains.chain_of[chains.arrays.index[node]]] for node in "ac"], [7, 3])
+        self.assertEqual(len(chains), len(ContinuousModelChecker.gamma_split_optimised(None, kripke.copy(), 0.5)))
+
+        pa = chains.alternating(chains.arrays.mask({"b"}))
+        self.assertEqual([pa.at("a", position) for position in range(1, 8)], [True, False] * 3 + [True])
+        self.assertEqual(pa.nodes, {"b"})
+        self.assertEqual(len(pa), 1 + 4 + 2)
+        self.assertEqual(len(chains.uniform(chains.arrays.mask({"a"})) - pa), 1 + 3)
+
+    def assertSameAsMaterialized(self, checker_class, seed, weights, gamma, graphs):
+        rng = random.Random(seed)
+        for i in range(graphs):
+            kripke = random_kripke(rng, weights)
+            materialized = ContinuousModelChecker.gamma_split_optimised(None, kripke.copy(), gamma)
+            chains = GammaChains(kripke, gamma)
+            for formula in FORMULAS:
+                expected = checker_class(nx.DiGraph(), virtual_chains=False).is_satisfiable(formula, materialized)
+                result = checker_class(nx.DiGraph()).is_satisfiable(formula, chains)
+                with self.subTest(graph=i, formula=str(formula)):
+                    self.assertEqual(result.nodes, {node for node in kripke if node in expected})
+                    for chain, node in enumerate(chains.chain_nodes.tolist()):
+                        name = chains.arrays.nodes[node]
+                        positions = range(1, chains.lengths[chain] + 1)
+                        self.assertEqual([result.at(name, position) for position in positions],
+                                         [hash(name) + position in expected for position in positions])
+                    self.assertEqual(len(result), len(expected))
+
+    def test_continuous_same_as_materialized(self):
+        self.assertSameAsMaterialized(ContinuousModelChecker, 0, [0, 1, 2, 4, 6, 10], 1, 30)
+
+    def test_lepri_same_as_materialized(self):
+        self.assertSameAsMaterialized(ModelChecker, 1, [0, 1, 2, 4, 6, 10], 1, 30)
+
+    def test_long_chains_same_as_materialized(self):
+        self.assertSameAsMaterialized(ContinuousModelChecker, 3, [0, 0.2, 1.2, 3.3, 6.0], 0.1, 3)
+        self.assertSameAsMaterialized(ModelChecker, 4, [0, 0.2, 1.2, 3.3, 6.0], 0.1, 10)
+
+
+class Heater(crest.Entity):
+    res = crest.Resource("temp", crest.REAL)
+    temp = crest.Local(res, 20)
+
+    heating = current = crest.State()
+    cooling = crest.State()
+
+    too_hot = crest.Transition(source=heating, target=cooling, guard=(lambda self: self.temp.value >= 100))
+    too_cold = crest.Transition(source=cooling, target=heating, guard=(lambda self: self.temp.value <= 30))
+
+    @crest.update(state=heating, target=temp)
+    def heat(self, dt):
+        return self.temp.pre + 4 * dt
+
+    @crest.update(state=cooling, target=temp)
+    def cool(self, dt):
+        return self.temp.pre - 5 * dt
+
+
+class ModelCheckerVirtualChainsTest(unittest.TestCase):
+
+    def test_same_as_materialized(self):
+        system = Heater()
+        statespace = StateSpace(system)
+        statespace.explore(4)
+        formulas = [
+            tctl.EF(check(system.temp) >= 90, interval=Interval() <= 18),
+            tctl.EF(check(system.temp) <= 40, interval=Interval() > 25),
+            tctl.AG(check(system.temp) >= 25, interval=(Interval() >= 4) <= 40),
+            tctl.EG(check(system.temp) < 95, interval=Interval() < 30),
+        ]
+        for formula in formulas:
+            virtual = ModelChecker(statespace)
+            materialized = ModelChecker(statespace, virtual_chains=False)
+            with self.subTest(formula=str(formula)):
+                nodes, kripke = virtual.get_satisfying_nodes(formula)
+                expected, materialized_kripke = materialized.get_satisfying_nodes(formula)
+                self.assertLess(len(kripke), len(materialized_kripke))
+                self.assertEqual(nodes, {node for node in kripke if node in expected})
+                self.assertEqual(virtual.check(formula), materialized.check(formula))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,208 @@
+from crestdsl.verification import tctl
+from crestdsl.verification.tctl import NamedAtomicProposition
+from crestdsl.verification.kripkearrays import KripkeArrays
+from crestdsl.verification.pointwise import PointwiseModelChecker
+from crestdsl.verification.modelchecker import ModelChecker
+from crestdsl.simulation.epsilon import Epsilon
+
+import operator
+import random
+
+import networkx as nx
+
+import unittest
+
+import logging
+logging.disable(logging.WARNING)
+
+
+def random_kripke(rng, nodes=14, edges=28, weights=(0, 0, 1, 2, 3.5)):
+    kripke = nx.gnm_random_graph(nodes, edges, seed=rng.randint(0, 10**6), directed=True)
+    kripke.add_edges_from((node, node) for node in rng.sample(range(nodes), 2))  # a few self-loops
+    for u, v in kripke.edges():
+        kripke[u][v]["weight"] = rng.choice(weights)
+    Q1 = {n for n in kripke if rng.random() < 0.7}
+    Q2 = {n for n in kripke if rng.random() < 0.3}
+    return kripke, Q1, Q2
+
+
+class KripkeArraysTest(unittest.TestCase):
+
+    def test_masks(self):
+        kripke = nx.DiGraph()
+        kripke.add_edge("a", "b", weight=1)
+        kripke.add_node("c")
+        arrays = KripkeArrays(kripke)
+        mask = arrays.mask({"c", "a", "unknown"})
+        self.assertEqual(mask.tolist(), [True, False, True])
+        self.assertEqual(arrays.node_set(mask), {"a", "c"})
+
+    def test_adjacency(self):
+        rng = random.Random(0)
+        kripke, _, _ = random_kripke(rng)
+        arrays = KripkeArrays(kripke)
+        for i, node in enumerate(arrays.nodes):
+            successors = arrays.edge_target[arrays.succ_ptr[i]:arrays.succ_ptr[i + 1]]
+            predecessors = arrays.edge_source[arrays.pred_edges[arrays.pred_ptr[i]:arrays.pred_ptr[i + 1]]]
+            self.assertCountEqual([arrays.nodes[s] for s in successors], kripke.successors(node))
+            self.assertCountEqual([arrays.nodes[p] for p in predecessors], kripke.predecessors(node))
+        for edge, (source, target) in enumerate(zip(arrays.edge_source, arrays.edge_target)):
+            self.assertEqual(arrays.weights[edge], kripke[arrays.nodes[source]][arrays.nodes[target]]["weight"])
+
+    def test_ancestors(self):
+        rng = random.Random(1)
+        for i in range(50):
+            kripke, within, sources = random_kripke(rng)
+            arrays = KripkeArrays(kripke)
+            predecessors = {pre for source in sources for pre in kripke.predecessors(source) if pre in within}
+            expected = predecessors.union(*[nx.ancestors(kripke.subgraph(within), pre) for pre in predecessors])
+            with self.subTest(graph=i):
+                self.assertEqual(arrays.node_set(arrays.ancestors(arrays.mask(sources), arrays.mask(within))), expected)
+
+    def test_infinite_paths(self):
+        rng = random.Random(2)
+        for i in range(50):
+            kripke, within, _ = random_kripke(rng)
+            arrays = KripkeArrays(kripke)
+            view = kripke.subgraph(within)
+            cycles = {node for component in nx.strongly_connected_components(view)
+                      for node in component if len(component) > 1 or view.has_edge(node, node)}
+            expected = cycles.union(*[nx.ancestors(view, node) for node in cycles])
+            with self.subTest(graph=i):
+                self.assertEqual(arrays.node_set(arrays.infinite_paths(arrays.mask(within))), expected)
+
+    def test_shortest_path_weights_with_epsilons(self):
+        kripke = nx.DiGraph()
+        kripke.add_edge("a", "b", weight=Epsilon(0, 1))
+        kripke.add_edge("b", "c", weight=2)
+        kripke.add_edge("a", "c", weight=2)
+        kripke.add_edge("d", "c", weight=3)
+        arrays = KripkeArrays(kripke)
+        within = arrays.mask({"a", "b", "c"})
+        distances = arrays.shortest_path_weights(arrays.mask({"c"}), within, cutoff=2)
+        self.assertEqual({arrays.nodes[node]: distance for node, distance in distances.items()}, {"a": 2, "b": 2, "c": 0})
+        distances = arrays.shortest_path_weights(arrays.mask({"c"}), within)
+        self.assertEqual(distances[arrays.index["b"]], 2)
+        self.assertEqual(distances[arrays.index["a"]], 2)
+
+    def test_longest_path_weights(self):
+        kripke = nx.DiGraph()
+        nx.add_path(kripke, range(4), weight=1)
+        kripke.add_edge(0, 3, weight=2.5)
+        kripke.add_edge(3, 4, weight=0)
+        arrays = KripkeArrays(kripke)
+        longest = arrays.longest_path_weights(arrays.mask({3}), arrays.mask(range(5)))
+        self.assertEqual(longest, {0: 3, 1: 2, 2: 1})
+
+        kripke.add_edge(4, 3, weight=1)
+        self.assertIsNone(KripkeArrays(kripke).longest_path_weights(arrays.mask({3}), arrays.mask(range(5))))
+
+
+class ArrayProceduresTest(unittest.TestCase):
+    """Compares the array-based procedures with the set- and networkx-based ones they replace."""
+
+    @staticmethod
+    def reference_Sat_EU(crestKripke, Q1, Q2):
+        Q2_pre = set().union(*[crestKripke.predecessors(s) for s in Q2]) & set(Q1)
+        Q1_view = crestKripke.subgraph(Q1)
+        Q2_pre_pre = set().union(*[nx.ancestors(Q1_view, node) for node in Q2_pre])
+        return set().union(Q2, Q2_pre, Q2_pre_pre)
+
+    @staticmethod
+    def reference_Sat_EG(crestKripke, Q1):
+        Q1_view = crestKripke.subgraph(Q1)
+        Q = set().union(*[comp for comp in nx.strongly_connected_components(Q1_view) if Q1_view.subgraph(comp).number_of_edges() > 0])
+        return Q | set().union(*[nx.ancestors(Q1_view, node) for node in Q])
+
+    @staticmethod
+    def reference_Sat_EUab(formula, crestKripke, Q1, Q2, Qu):
+        intvl = formula.interval
+        Qu_view = crestKripke.subgraph(Qu)
+        Q, Tv = set(), set()
+        T = [(s, 0) for s in Q2]
+        while len(T) > 0:
+            (s, tau) = T.pop()
+            Tv.add((s, tau))
+            Tpre = set()
+            for pre, s, tau_pre in Qu_view.in_edges(s, data="weight"):
+                if intvl.end_operator(tau + tau_pre, intvl.end) and pre in Q1:
+                    Tpre.add((pre, tau + tau_pre))
+            T.extend(Tpre - Tv)
+            if intvl.ininterval(tau):
+                Q.add(s)
+        return Q
+
+    @staticmethod
+    def reference_Lepri_Sat_EUa(formula, crestKripke, Q1, Q2, Qu):
+        Q1_view = crestKripke.subgraph(Q1)
+        Qssc = set().union(*[comp for comp in nx.strongly_connected_components(Q1_view) if Q1_view.subgraph(comp).number_of_edges() > 0])
+        Q = Qu & Qssc
+        Q = Q | set().union(*[nx.ancestors(Q1_view, node) for node in Q])
+
+        Q_DAG = Qu - Q
+        edges_from_Q1 = [e for e in crestKripke.subgraph(Q_DAG).edges(data=True) if e[0] in Q1]
+        T_star = [(s, 0) for s in Q_DAG if not [e for e in edges_from_Q1 if e[0] == s]]
+        T = list()
+        while len(T_star) > 0:
+            (s, tau) = T_star.pop()
+            if formula.interval.ininterval(tau):
+                Q.add(s)
+            for edge in [e for e in edges_from_Q1 if e[1] == s]:
+                sprime = edge[0]
+                tauprime = edge[2]["weight"]
+                edges_from_Q1.remove(edge)
+                sprime_entries = [entry for entry in T if entry[0] is sprime]
+                if len(sprime_entries) > 0:
+                    tauprimeprime = sprime_entries[0][1]
+                    if tauprime + tau > tauprimeprime:
+                        taumax = tauprime + tau
+                        T.remove(sprime_entries[0])
+                        T.append((sprime, taumax))
+                    else:
+                        taumax = tauprimeprime
+                else:
+                    taumax = tauprime + tau
+                    T.append((sprime, taumax))
+                if len([e for e in edges_from_Q1 if e[0] == sprime]) == 0:
+                    T_star.append((sprime, taumax))
+        return Q
+
+    def checker(self, checker_class, kripke, Q1, Q2):
+        phi, psi = NamedAtomicProposition("phi"), NamedAtomicProposition("psi")
+        mc = checker_class(kripke)
+        mc.is_satisfiable = lambda f, k: {phi: Q1, psi: Q2}[f]
+        return mc, phi, psi
+
+    def test_Sat_EU_and_Sat_EG(self):
+        rng = random.Random(3)
+        for i in range(100):
+            kripke, Q1, Q2 = random_kripke(rng)
+            mc, phi, psi = self.checker(PointwiseModelChecker, kripke, Q1, Q2)
+            with self.subTest(graph=i):
+                self.assertEqual(mc.Sat_EU(tctl.EU(phi, psi), kripke), self.reference_Sat_EU(kripke, Q1, Q2))
+                self.assertEqual(mc.Sat_EG(tctl.EG(phi), kripke), self.reference_Sat_EG(kripke, Q1))
+
+    def test_Sat_EUab(self):
+        rng = random.Random(4)
+        for i in range(100):
+            kripke, Q1, Q2 = random_kripke(rng, weights=(1, 2, 3.5))
+            mc, phi, psi = self.checker(PointwiseModelChecker, kripke, Q1, Q2)
+            formula = tctl.EU(phi, psi, tctl.Interval(start=2, end=6, end_op=operator.le))
+            Qu = self.reference_Sat_EU(kripke, Q1, Q2)
+            with self.subTest(graph=i):
+                self.assertEqual(mc.Sat_EUab(formula, kripke), self.reference_Sat_EUab(formula, kripke, Q1, Q2, Qu))
+
+    def test_Lepri_Sat_EUa(self):
+        rng = random.Random(5)
+        for i in range(100):
+            kripke, Q1, Q2 = random_kripke(rng)
+            mc, phi, psi = self.checker(ModelChecker, kripke, Q1, Q2)
+            Qu = self.reference_Sat_EU(kripke, Q1, Q2)
+            for start_op in [operator.ge, operator.gt]:
+                formula = tctl.EU(phi, psi, tctl.Interval(start=3, start_op=start_op))
+                with self.subTest(graph=i, start_op=start_op):
+                    self.assertEqual(mc.Sat_EUa(formula, kripke), self.reference_Lepri_Sat_EUa(formula, kripke, Q1, Q2, Qu))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+import unittest
+
+import crestdsl.model as crest
+import crestdsl.verification as verif
+from crestdsl.verification import tctl, StateSpace, ModelChecker, check
+from crestdsl.verification.tctl import Interval
+from crestdsl.verification.onthefly import OnTheFlyChecker
+
+import logging
+logging.disable(logging.WARNING)
+
+
+class Heater(crest.Entity):
+    res = crest.Resource("temp", crest.REAL)
+    power = crest.Input(res, 3)
+    temp = crest.Local(res, 20)
+
+    heating = current = crest.State()
+    cooling = crest.State()
+
+    too_hot = crest.Transition(source=heating, target=cooling, guard=(lambda self: self.temp.value >= 100))
+    too_cold = crest.Transition(source=cooling, target=heating, guard=(lambda self: self.temp.value <= 30))
+
+    @crest.update(state=heating, target=temp)
+    def heat(self, dt):
+        return self.temp.pre + self.power.value * dt
+
+    @crest.update(state=cooling, target=temp)
+    def cool(self, dt):
+        return self.temp.pre - 5 * dt
+
+
+class System(crest.Entity):
+    one = Heater()
+    two = Heater()
+    state = current = crest.State()
+
+
+class OnTheFlyCheckerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.system = System()
+        self.system.two.power.value = 7
+
+    def formulas(self):
+        one, two = self.system.one.temp, self.system.two.temp
+        return [
+            tctl.EF(check(one) >= 90, interval=Interval() <= 20),
+            tctl.EF(check(one) >= 90, interval=Interval() <= 30),
+            tctl.EF(check(one) >= 90, interval=Interval() < 23.3),
+            tctl.EF(check(one) >= 90, interval=Interval() <= 23.4),
+            tctl.EF((check(one) >= 50) & (check(two) <= 40), interval=Interval() <= 60),
+            tctl.AG(check(two) <= 100, interval=Interval() <= 60),
+            tctl.AG(check(one) > 20, interval=Interval() <= 40),
+            tctl.AG(tctl.Not(check(two) < 30), interval=Interval() <= 50),
+            tctl.AG(tctl.Not(check(one) >= 95), interval=Interval() <= 20),
+        ]
+
+    def test_same_as_model_checker(self):
+        for formula in self.formulas():
+            statespace = StateSpace(self.system)
+            statespace.explore_until_time(formula.interval.end)
+            expected = ModelChecker(statespace).check(formula)
+            with self.subTest(formula=str(formula)):
+                self.assertEqual(OnTheFlyChecker(StateSpace(self.system)).check(formula), expected)
+
+    def test_path(self):
+        statespace = StateSpace(self.system)
+        checker = OnTheFlyChecker(statespace)
+        self.assertFalse(checker.check(tctl.AG(check(self.system.one.temp) <= 80, interval=Interval() <= 100)))
+        self.assertEqual(checker.path[0], statespace.graph["root"])
+        for source, target in zip(checker.path, checker.path[1:]):
+            if target in statespace:
+                self.assertTrue(statespace.has_edge(source, target))
+        self.assertAlmostEqual(checker.path[-1].ports[self.system.one.temp], 80)
+        self.assertAlmostEqual(checker.time, 20)
+
+    def test_stops_early(self):
+        explored = StateSpace(self.system)
+        explored.explore_until_time(200)
+        statespace = StateSpace(self.system)
+        checker = OnTheFlyChecker(statespace)
+        self.assertTrue(checker.check(tctl.EF(check(self.system.two.temp) >= 90, interval=Interval() <= 200)))
+        self.assertLess(len(statespace), len(explored) / 2)
+        self.assertLess(len(statespace._expanded), len(explored._expanded) / 2)
+
+    def test_unsupported_formulas(self):
+        temp = self.system.one.temp
+        self.assertIsNone(OnTheFlyChecker.target(tctl.EF(check(temp) >= 90, interval=Interval() > 5)))
+        self.assertIsNone(OnTheFlyChecker.target(tctl.EG(check(temp) >= 90)))
+        self.assertIsNone(OnTheFlyChecker.target(tctl.EF(tctl.EG(check(temp) >= 90))))
+        with self.assertRaises(ValueError):
+            OnTheFlyChecker(StateSpace(self.system)).check(tctl.AF(check(temp) >= 90))
+
+
+class VerifierOnTheFlyTest(unittest.TestCase):
+
+    def test_verifier(self):
+        system = System()
+        cache = verif.StateSpaceCache()
+        never = verif.Verifier(statespace_cache=cache).never(check(system.one.temp) >= 100).before(100)
+        self.assertFalse(never.check(on_the_fly=True))
+        self.assertAlmostEqual(never.path[-1].ports[system.one.temp], 100)
+        self.assertIs(never.statespace, cache.get(system, None))
+
+        possible = verif.Verifier(statespace_cache=cache).is_possible(check(system.one.temp) >= 100).after(10).before(100)
+        self.assertTrue(possible.check(on_the_fly=True))  # not on the fly, because of the lower bound
+        self.assertIsNone(possible.path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -243,4 +243,153 @@ class PointwiseModelChecker_check_Test(unittest.TestCase):
         
         
         
-        
\ No newline at end of file
+        
+
+class Sat_EUaTest(unittest.TestCase):
+    """Compares the longest-path implementation of Sat_EUa with the enumeration of all simple paths."""
+
+    @staticmethod
+    def reference_Sat_EUa(formula, crestKripke, Q1, Q2, mc):
+        """The previous implementation (exponential)."""
+        def is_trivial(nodes):
+            return crestKripke.subgraph(nodes).number_of_edges() == 0
+
+        def path_weight(G, path):
+            return sum(G[path[i]][path[i+1]]['weight'] for i in range(len(path)-1))
+
+        Qu = mc.Sat_EU(formula, crestKripke, phi_set=Q1, psi_set=Q2)
+        Q1_view = nx.graphviews.subgraph_view(crestKripke, filter_node=(lambda x: x in Q1))
+        Qssc = set().union(*[comp for comp in nx.strongly_connected_components(Q1_view) if not is_trivial(comp)])
+        Q = Qu & Qssc
+        Q = Q | set().union(*[nx.ancestors(Q1_view, node) for node in Q])
+
+        Q_DAG = Qu - Q
+        Q_DAG_view = crestKripke.subgraph(Q_DAG)
+        paths = []
+        for phi in Q_DAG:
+            for psi in (Q2 & Q_DAG):
+                max_weight = max([path_weight(crestKripke, path) for path in nx.all_simple_paths(Q_DAG_view, phi, psi)], default=False)
+                if max_weight is not False and formula.interval.ininterval(max_weight):
+                    paths.append(phi)
+                    break
+        return Q | set(paths)
+
+    def random_kripke(self, rng, nodes=14, edges=28):
+        kripke = nx.gnm_random_graph(nodes, edges, seed=rng.randint(0, 10**6), directed=True)
+        for u, v in kripke.edges():
+            kripke[u][v]["weight"] = rng.choice([0, 1, 2, 3.5, 5])
+        Q1 = {n for n in kripke if rng.random() < 0.7}
+        Q2 = {n for n in kripke if rng.random() < 0.3}
+        return kripke, Q1, Q2
+
+    def assert_same_as_reference(self, kripke, Q1, Q2, start_op):
+        phi, psi = NamedAtomicProposition("phi"), NamedAtomicProposition("psi")
+        formula = tctl.EU(phi, psi, tctl.Interval(start=4, start_op=start_op))
+        mc = PointwiseModelChecker(kripke)
+        mc.is_satisfiable = lambda f, k: {phi: Q1, psi: Q2}[f]
+        self.assertEqual(self.reference_Sat_EUa(formula, kripke, Q1, Q2, mc), mc.Sat_EUa(formula, kripke))
+
+    def test_random_graphs(self):
+        import random
+        rng = random.Random(1)
+        for i in range(150):
+            kripke, Q1, Q2 = self.random_kripke(rng)
+            for start_op in [operator.ge, operator.gt]:
+                with self.subTest(graph=i, start_op=start_op):
+                    self.assert_same_as_reference(kripke, Q1, Q2, start_op)
+
+    def test_chain(self):
+        kripke = nx.DiGraph()
+        nx.add_path(kripke, range(6), weight=1)
+        kripke.add_edge(0, 5, weight=1)  # the long way around is the one that counts
+        # (0 -> 5 is one time unit, 0 -> 1 -> ... -> 5 is five)
+        self.assert_same_as_reference(kripke, set(range(5)), {5}, operator.ge)
+        formula = tctl.EU(NamedAtomicProposition("phi"), NamedAtomicProposition("psi"), tctl.Interval(start=4, start_op=operator.ge))
+        mc = PointwiseModelChecker(kripke)
+        mc.is_satisfiable = lambda f, k: set(range(5)) if f.name == "phi" else {5}
+        self.assertEqual(mc.Sat_EUa(formula, kripke), {0, 1})
+
+
+class ShortestPathProceduresTest(unittest.TestCase):
+    """Compares the backward searches of Sat_EUb and Sat_AU0 with the all-pairs shortest paths they replace."""
+
+    @staticmethod
+    def reference_Sat_EUb(formula, crestKripke, Q2, Qu):
+        shortest_paths = nx.all_pairs_dijkstra_path_length(crestKripke.subgraph(Qu), cutoff=formula.interval.end)
+        return {source for source, target_lengths in shortest_paths
+                for target, length in target_lengths.items() if formula.interval.ininterval(length) and target in Q2}
+
+    @staticmethod
+    def reference_Sat_AU0(crestKripke, Qu):
+        Qu_view = crestKripke.subgraph(Qu)
+        Q = {s for s in Qu_view.nodes() if Qu_view.out_degree(s) == 0}
+        shortest_paths = nx.all_pairs_dijkstra_path_length(Qu_view, cutoff=0)
+        Qpre = {source for source, target_lengths in shortest_paths
+                for target, length in target_lengths.items() if length == 0 and target in Q}
+        return Qu - (Q | Qpre)
+
+    def random_kripke(self, rng, nodes=30, edges=60):
+        kripke = nx.gnm_random_graph(nodes, edges, seed=rng.randint(0, 10**6), directed=True)
+        for u, v in kripke.edges():
+            kripke[u][v]["weight"] = rng.choice([0, 0, 1, 2, 3.5])
+        Q1 = {n for n in kripke if rng.random() < 0.7}
+        Q2 = {n for n in kripke if rng.random() < 0.2}
+        return kripke, Q1, Q2
+
+    def test_Sat_EUb(self):
+        import random
+        rng = random.Random(2)
+        phi, psi = NamedAtomicProposition("phi"), NamedAtomicProposition("psi")
+        for i in range(100):
+            kripke, Q1, Q2 = self.random_kripke(rng)
+            mc = PointwiseModelChecker(kripke)
+            mc.is_satisfiable = lambda f, k: {phi: Q1, psi: Q2}[f]
+            for end_op in [operator.le, operator.lt]:
+                formula = tctl.EU(phi, psi, tctl.Interval(end=4, end_op=end_op))
+                Qu = mc.Sat_EU(formula, kripke, phi_set=Q1, psi_set=Q2)
+                with self.subTest(graph=i, end_op=end_op):
+                    self.assertEqual(self.reference_Sat_EUb(formula, kripke, Q2, Qu), mc.Sat_EUb(formula, kripke))
+
+    def test_Sat_AU0(self):
+        import random
+        rng = random.Random(3)
+        for i in range(100):
+            kripke, Q1, Qu = self.random_kripke(rng)
+            Qu = Qu | Q1
+            mc = PointwiseModelChecker(kripke)
+            mc.is_satisfiable = lambda f, k: Q1 if f is True else Qu  # Sat_AU0 copies the formula, so phi and psi are booleans
+            formula = tctl.AU(True, False, tctl.Interval(start=0, start_op=operator.gt))
+            with self.subTest(graph=i):
+                self.assertEqual(self.reference_Sat_AU0(kripke, Qu), mc.Sat_AU0(formula, kripke))
+
+
+class MemoizationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.kripke = nx.DiGraph()
+        nx.add_path(self.kripke, range(4), weight=1)
+        self.phi, self.psi = NamedAtomicProposition("phi"), NamedAtomicProposition("psi")
+        for node, props in zip(range(4), [{self.phi: True}, {self.phi: True}, {}, {self.psi: True}]):
+            self.kripke.nodes[node]["crest_props"] = props
+        self.mc = PointwiseModelChecker(self.kripke)
+
+    def test_equal_subformulas_are_evaluated_once(self):
+        formula = tctl.And(tctl.EF(tctl.Not(self.phi)), tctl.AG(tctl.Not(self.phi)))
+        with mock.patch.object(PointwiseModelChecker, "Sat_EU", autospec=True, side_effect=PointwiseModelChecker.Sat_EU) as sat_EU:
+            self.assertEqual(self.mc.is_satisfiable(formula, self.kripke), {2, 3})
+            # EF(Not(phi)) and AG's rewrite Not(EF(Not(Not(phi)))) are different formulas
+            self.assertEqual(sat_EU.call_count, 2)
+
+            other_formula = tctl.Or(tctl.AG(tctl.Not(self.phi)), tctl.EF(tctl.Not(self.phi)))
+            self.assertEqual(self.mc.is_satisfiable(other_formula, self.kripke), {0, 1, 2, 3})
+            self.assertEqual(sat_EU.call_count, 2)
+
+    def test_results_are_per_kripke_structure(self):
+        formula = tctl.EF(self.psi)
+        self.assertEqual(self.mc.is_satisfiable(formula, self.kripke), {0, 1, 2, 3})
+        other = self.kripke.copy()
+        other.remove_edge(1, 2)
+        self.assertEqual(self.mc.is_satisfiable(formula, other), {2, 3})
+
+        self.kripke.add_node(4, crest_props={self.psi: True})  # the memo table is dropped after changes of the nodes
+        self.assertEqual(self.mc.is_satisfiable(formula, self.kripke), {0, 1, 2, 3, 4})
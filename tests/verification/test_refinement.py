@@ -0,0 +1,118 @@
+import unittest
+
+import crestdsl.model as crest
+from crestdsl.config import config
+from crestdsl.verification import StateSpace
+from crestdsl.verification.checklib import check, NotCheck
+from crestdsl.verification.tctl import Interval
+from crestdsl.verification.reachabilitycalculator import ReachabilityCalculator
+from crestdsl.verification.refinement import refine_kripke, CREST_PROPS
+
+
+class Heater(crest.Entity):
+    res = crest.Resource("temp", crest.REAL)
+    power = crest.Input(res, 3)
+    temp = crest.Local(res, 20)
+
+    heating = current = crest.State()
+    cooling = crest.State()
+
+    too_hot = crest.Transition(source=heating, target=cooling, guard=(lambda self: self.temp.value >= 100))
+    too_cold = crest.Transition(source=cooling, target=heating, guard=(lambda self: self.temp.value <= 30))
+
+    @crest.update(state=heating, target=temp)
+    def heat(self, dt):
+        return self.temp.pre + self.power.value * dt
+
+    @crest.update(state=cooling, target=temp)
+    def cool(self, dt):
+        return self.temp.pre - 5 * dt
+
+
+class System(crest.Entity):
+    one = Heater()
+    two = Heater()
+    state = current = crest.State()
+
+
+def explored_system(iterations=6):
+    system = System()
+    system.two.power.value = 7
+    statespace = StateSpace(system)
+    statespace.explore(iterations)
+    return system, statespace
+
+
+def describe(kripke):
+    nodes = {node.key: tuple(sorted((str(prop), value) for prop, value in props.items()))
+             for node, props in kripke.nodes(data=CREST_PROPS)}
+    edges = {(source.key, target.key, str(weight)) for source, target, weight in kripke.edges(data="weight")}
+    return nodes, edges
+
+
+class ReachabilityCalculatorTest(unittest.TestCase):
+
+    def test_incremental_same_as_fresh(self):
+        system, statespace = explored_system()
+        checks = [check(system.one.temp) >= 50, NotCheck(check(system.two.temp) <= 40)]
+        incremental = ReachabilityCalculator(system, incremental=True)
+        previous = config.analytic_transition_times
+        try:
+            for analytic in [True, False]:
+                config.analytic_transition_times = analytic
+                incremental._queries.clear()
+                for node in statespace.nodes:
+                    node.apply()
+                    for chk in checks:
+                        with self.subTest(node=node.key, check=str(chk), analytic=analytic):
+                            expected = ReachabilityCalculator(system).isreachable(chk, Interval() < 5)
+                            self.assertEqual(str(incremental.isreachable(chk, Interval() < 5)), str(expected))
+        finally:
+            config.analytic_transition_times = previous
+        # one solver per check and combination of the heaters' states
+        state_combinations = set()
+        for node in statespace.nodes:
+            node.apply()
+            state_combinations.add((system.one.current, system.two.current))
+        self.assertEqual(len(incremental._queries), 2 * len(state_combinations))
+
+
+class RefineKripkeTest(unittest.TestCase):
+
+    def test_split_where_prop_changes(self):
+        system = System()
+        statespace = StateSpace(system)
+        statespace.explore(1)  # 20 -> 100 in 80/3 time units
+        prop = check(system.one.temp) >= 50
+
+        kripke = statespace.copy()
+        refine_kripke(kripke, [prop])
+        self.assertEqual(len(kripke), 3)
+        root = kripke.graph["root"]
+        (split, weight), = [(target, weight) for _, target, weight in kripke.out_edges(root, data="weight")]
+        self.assertEqual(weight, 10)
+        self.assertEqual(split.ports[system.one.temp], 50)
+        self.assertFalse(kripke.nodes[root][CREST_PROPS][prop])
+        self.assertTrue(kripke.nodes[split][CREST_PROPS][prop])
+
+    def test_all_nodes_annotated(self):
+        system, statespace = explored_system()
+        props = [check(system.one.temp) >= 50, check(system.two.temp) <= 40, check(system.one.temp) > 80]
+        kripke = statespace.copy()
+        refine_kripke(kripke, props)
+        self.assertGreater(len(kripke), len(statespace))
+        for node, node_props in kripke.nodes(data=CREST_PROPS):
+            node.apply()
+            self.assertEqual(node_props, {prop: prop.check() for prop in props})
+
+    def test_parallel_same_as_sequential(self):
+        system, statespace = explored_system()
+        props = [check(system.one.temp) >= 50, check(system.two.temp) <= 40]
+        sequential, parallel = statespace.copy(), statespace.copy()
+        refine_kripke(sequential, props)
+        refine_kripke(parallel, props, workers=2)
+        self.assertEqual(describe(sequential), describe(parallel))
+
+
+if __name__ == '__main__':
+    unittest.main()
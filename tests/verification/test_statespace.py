@@ -0,0 +1,423 @@
+import unittest
+import copy
+import gc
+import weakref
+import pickle
+import unittest.mock as mock
+import os
+import tempfile
+
+import crestdsl.model as crest
+from crestdsl.simulation.epsilon import Epsilon
+from crestdsl.verification.statespace import SystemState, StateSpace, StateSpaceCache, StateSpaceCalculator, ExplorationPool, get_layout, MISSING, EXPLORED, _time_key
+from crestdsl.config import config
+
+
+class Heater(crest.Entity):
+    res = crest.Resource("temp", crest.REAL)
+    power = crest.Input(res, 3)
+    temp = crest.Local(res, 20)
+
+    heating = current = crest.State()
+    cooling = crest.State()
+
+    too_hot = crest.Transition(source=heating, target=cooling, guard=(lambda self: self.temp.value >= 100))
+    too_cold = crest.Transition(source=cooling, target=heating, guard=(lambda self: self.temp.value <= 30))
+
+    @crest.update(state=heating, target=temp)
+    def heat(self, dt):
+        return self.temp.pre + self.power.value * dt
+
+    @crest.update(state=cooling, target=temp)
+    def cool(self, dt):
+        return self.temp.pre - 5 * dt
+
+
+class System(crest.Entity):
+    heater = Heater()
+    state = current = crest.State()
+
+
+class SystemStateTest(unittest.TestCase):
+
+    def test_identical_states_are_interned(self):
+        system = System()
+        first = SystemState(system).save()
+        second = SystemState(system).save()
+        self.assertIs(first, second)
+        self.assertEqual(hash(first), hash(second))
+
+    def test_different_states(self):
+        system = System()
+        before = SystemState(system).save()
+        system.heater.temp.value = 50
+        after = SystemState(system).save()
+        self.assertNotEqual(before, after)
+        self.assertIsNot(before, after)
+        self.assertEqual(after, system)
+
+    def test_saved_states_are_immutable(self):
+        system = System()
+        state = SystemState(system).save()
+        key = state.key
+        system.heater.current = system.heater.cooling
+        self.assertIsNot(state.save(), state)
+        self.assertEqual(state.key, key)
+
+    def test_apply(self):
+        system = System()
+        system.heater.temp.pre = 10
+        state = SystemState(system).save()
+        system.heater.current = system.heater.cooling
+        system.heater.temp.value = 77
+        system.heater.temp.pre = 70
+
+        state.apply()
+        self.assertIs(system.heater.current, system.heater.heating)
+        self.assertEqual(system.heater.temp.value, 20)
+        self.assertEqual(system.heater.temp.pre, 10)
+
+    def test_dict_views(self):
+        system = System()
+        state = SystemState(system).save()
+        self.assertEqual(state.states[system.heater], system.heater.heating)
+        self.assertEqual(state.ports[system.heater.temp], 20)
+        self.assertNotIn(system.heater.power, state.pre)
+        self.assertIn(MISSING, state.key)
+
+    def test_serialize_into_copy(self):
+        system = System()
+        system.heater.current = system.heater.cooling
+        system.heater.temp.value = 42
+        serialized = pickle.loads(pickle.dumps(SystemState(system).serialize()))
+
+        other = copy.deepcopy(System())
+        restored = serialized.deserialize(other)
+        self.assertIs(other.heater.current, other.heater.cooling)
+        self.assertEqual(other.heater.temp.value, 42)
+        self.assertEqual(restored.key, SystemState(system).save().key)
+        self.assertIs(restored.system, other)
+
+    def test_layout_of_deepcopy(self):
+        system = System()
+        get_layout(system)
+        copied = copy.deepcopy(system)
+        self.assertIs(get_layout(copied).system, copied)
+        self.assertIn(copied.heater.temp, get_layout(copied).ports)
+
+    def test_statespace_nodes(self):
+        system = System()
+        statespace = StateSpace(system)
+        statespace.explore(4)
+        self.assertEqual(len(statespace), 3)  # heating -> cooling -> heating (30) -> cooling (100) again
+        self.assertTrue(all(isinstance(node, SystemState) for node in statespace.nodes))
+        self.assertEqual(len({node.key for node in statespace.nodes}), len(statespace))
+
+
+class ParallelExplorationTest(unittest.TestCase):
+
+    def explore(self, **kwargs):
+        system = System()
+        statespace = StateSpace(system)
+        statespace.explore(None, **kwargs)
+        edges = {(source.key, target.key, str(data["weight"]), tuple(t._name for t in data["transitions"]))
+                 for source, target, data in statespace.edges(data=True)}
+        return statespace, edges
+
+    def test_same_statespace_as_sequential(self):
+        sequential, sequential_edges = self.explore()
+        parallel, parallel_edges = self.explore(parallel=True, workers=2)
+        self.assertEqual({node.key for node in sequential.nodes}, {node.key for node in parallel.nodes})
+        self.assertEqual(sequential_edges, parallel_edges)
+        self.assertIsNone(parallel._pool)
+
+    def test_successor_nodes_belong_to_the_system(self):
+        statespace, _ = self.explore(parallel=True, workers=2)
+        system = statespace.graph["system"]
+        self.assertTrue(all(node.system is system for node in statespace.nodes))
+        for _, _, transitions in statespace.edges(data="transitions"):
+            self.assertTrue(all(transition._parent is system.heater for transition in transitions))
+
+    def test_chunks_keep_the_node_order(self):
+        system = System()
+        nodes = []
+        for temp in [25, 50, 75, 99]:
+            system.heater.temp.value = temp
+            nodes.append(SystemState(system).save())
+        with ExplorationPool(system, workers=2) as pool:
+            results = pool.calculate_successors([node.serialize() for node in nodes], chunksize=1)
+        self.assertEqual([dt for _, dt in results], [(100 - temp) / 3 for temp in [25, 50, 75, 99]])
+
+
+class ExploreUntilTimeTest(unittest.TestCase):
+
+    def test_explores_within_horizon(self):
+        statespace = StateSpace(System())
+        statespace.explore_until_time(30)  # heating until 80/3, then cooling until 80/3 + 14
+        self.assertEqual(len(statespace), 3)
+        self.assertEqual(statespace.number_of_edges(), 2)
+
+    def test_resume_with_larger_horizon(self):
+        fresh = StateSpace(System())
+        fresh.explore_until_time(100)
+
+        resumed = StateSpace(System())
+        resumed.explore_until_time(30)
+        with mock.patch.object(StateSpace, "calculate_successors_for_node", autospec=True,
+                               side_effect=StateSpace.calculate_successors_for_node) as calculate:
+            resumed.explore_until_time(100)
+        self.assertEqual({node.key for node in fresh.nodes}, {node.key for node in resumed.nodes})
+        self.assertEqual(fresh.number_of_edges(), resumed.number_of_edges())
+        expanded_nodes = [call[0][1] for call in calculate.call_args_list]
+        self.assertEqual(len(expanded_nodes), len(set(expanded_nodes)))
+        self.assertNotIn(resumed.graph["root"], expanded_nodes)
+
+    def test_epsilon_arrival_times(self):
+        self.assertLess(_time_key(5), _time_key(Epsilon(5, 1)))
+        self.assertLess(_time_key(Epsilon(5, -1)), _time_key(5))
+        self.assertLess(_time_key(Epsilon(5, 100)), _time_key(5.5))
+
+
+class StateSpaceViewTest(unittest.TestCase):
+
+    def test_view_shares_the_graph(self):
+        statespace = StateSpace(System())
+        statespace.explore_until_time(30)
+        view = statespace.view()
+        self.assertIs(view._succ, statespace._succ)
+        self.assertEqual(view.graph["root"], statespace.graph["root"])
+        with self.assertRaises(Exception):
+            view.add_edge(*statespace.edges())
+
+    def test_view_is_copied_before_exploration(self):
+        statespace = StateSpace(System())
+        statespace.explore_until_time(30)
+        nodes, edges = set(statespace.nodes), set(statespace.edges)
+        views = [statespace.view(), statespace.view()]
+        statespace.explore_until_time(100)
+        self.assertGreater(statespace.number_of_edges(), len(edges))
+        for view in views:
+            self.assertEqual(set(view.nodes), nodes)
+            self.assertEqual(set(view.edges), edges)
+        self.assertIs(views[0]._succ, views[1]._succ)  # one copy for all views
+        self.assertEqual(len(views[0].copy()), len(nodes))
+
+    def test_iterations_copy_views(self):
+        statespace = StateSpace(System())
+        view = statespace.view()
+        statespace.explore(2)
+        self.assertEqual(len(view), 1)
+        self.assertFalse(view.nodes[view.graph["root"]][EXPLORED])
+
+
+class StateSpaceCacheTest(unittest.TestCase):
+
+    def test_extends_the_horizon(self):
+        system = System()
+        cache = StateSpaceCache()
+        statespace = cache.get(system, 30)
+        self.assertEqual(len(statespace), 3)
+        with mock.patch.object(StateSpace, "explore_until_time", autospec=True) as explore:
+            self.assertIs(cache.get(system, 10), statespace)
+            self.assertIs(cache.get(system, 30), statespace)
+        explore.assert_not_called()
+        self.assertIs(cache.get(system, 100), statespace)
+        self.assertEqual(statespace.explored_until, 100)
+
+        fresh = StateSpace(System())
+        fresh.explore_until_time(100)
+        self.assertEqual({node.key for node in fresh.nodes}, {node.key for node in statespace.nodes})
+
+    def test_keyed_by_system_and_initial_state(self):
+        cache = StateSpaceCache(maxsize=2)
+        system, other = System(), System()
+        first = cache.get(system, 10)
+        self.assertIsNot(cache.get(other, 10), first)
+        system.heater.temp.value = 50
+        changed = cache.get(system, 10)
+        self.assertIsNot(changed, first)
+        self.assertEqual(changed.graph["root"].ports[system.heater.temp], 50)
+        self.assertEqual(len(cache), 2)  # the least recently used one was dropped
+        system.heater.temp.value = 20
+        self.assertIsNot(cache.get(system, 10), first)
+
+    def test_does_not_keep_systems_alive(self):
+        cache = StateSpaceCache()
+        system = System()
+        statespace = weakref.ref(cache.get(system, 10))
+        system = weakref.ref(system)
+        gc.collect()
+        self.assertIsNone(system())
+        self.assertIsNone(statespace())
+        self.assertEqual(len(cache), 0)
+
+    def test_caches_are_separate(self):
+        system = System()
+        first, second = StateSpaceCache(), StateSpaceCache()
+        self.assertIsNot(first.get(system, 10), second.get(system, 10))
+        first.clear()
+        self.assertEqual(len(first), 0)
+        self.assertEqual(len(second), 1)
+
+
+class Switch(crest.Entity):
+    res = crest.Resource("real", crest.REAL)
+    clock = crest.Local(res, 0)
+    position = crest.Output(res, 0)
+
+    off = current = crest.State()
+    left = crest.State()
+    right = crest.State()
+
+    go_left = crest.Transition(source=off, target=left, guard=(lambda self: self.clock.value >= 5))
+    go_right = crest.Transition(source=off, target=right, guard=(lambda self: self.clock.value >= 5))
+    back_left = crest.Transition(source=left, target=off, guard=(lambda self: self.clock.value >= 3))
+    back_right = crest.Transition(source=right, target=off, guard=(lambda self: self.clock.value >= 3))
+
+    @crest.update(state=[off, left, right], target=clock)
+    def tick(self, dt):
+        return self.clock.pre + dt
+
+    @crest.action(transition=[go_left, go_right, back_left, back_right], target=clock)
+    def reset(self):
+        return 0
+
+    @crest.action(transition=go_left, target=position)
+    def to_left(self):
+        return -1
+
+    @crest.action(transition=go_right, target=position)
+    def to_right(self):
+        return 1
+
+
+class Follower(crest.Entity):
+    res = crest.Resource("real", crest.REAL)
+    leader = crest.Input(res, 0)
+
+    waiting = current = crest.State()
+    following = crest.State()
+    follow = crest.Transition(source=waiting, target=following, guard=(lambda self: self.leader.value > 0))
+
+
+class Switches(crest.Entity):
+    one = Switch()
+    two = Switch()
+    three = Switch()
+    follower = Follower()
+    state = current = crest.State()
+    lead = crest.Influence(source=one.position, target=follower.leader)
+
+
+class PartialOrderReductionTest(unittest.TestCase):
+
+    def explore(self, partial_order_reduction):
+        previous = config.partial_order_reduction
+        config.partial_order_reduction = partial_order_reduction
+        try:
+            with mock.patch.object(StateSpaceCalculator, "advance_and_stabilise", autospec=True,
+                                   side_effect=StateSpaceCalculator.advance_and_stabilise) as advance:
+                statespace = StateSpace(Switches())
+                statespace.explore_until_time(20)
+        finally:
+            config.partial_order_reduction = previous
+        edges = {(source.key, target.key, str(weight)) for source, target, weight in statespace.edges(data="weight")}
+        return edges, advance.call_count
+
+    def test_same_statespace(self):
+        edges, calls = self.explore(False)
+        reduced_edges, reduced_calls = self.explore(True)
+        self.assertEqual(edges, reduced_edges)
+        self.assertLess(reduced_calls, calls)
+
+    def test_subentity_advanced_once_per_footprint(self):
+        system = Switches()
+        for switch in [system.one, system.two, system.three]:
+            switch.clock.value = 5
+        calculator = StateSpaceCalculator(system, own_context=False, partial_order_reduction=True)
+        with mock.patch.object(StateSpaceCalculator, "advance_and_stabilise", autospec=True,
+                               side_effect=StateSpaceCalculator.advance_and_stabilise) as advance:
+            successors, dt = calculator.advance_to_nbct()
+        self.assertEqual(len(successors), 8)
+        advanced = [call[0][1] for call in advance.call_args_list]
+        self.assertEqual(advanced.count(system.three), 3)  # once, then after each of its two transitions
+        followers = [SystemState.from_key(system, successor.key).states[system.follower] for successor, _ in successors]
+        self.assertEqual(followers.count(system.follower.following), 4)  # the follower depends on switch one
+
+    def test_footprint(self):
+        system = Switches()
+        calculator = StateSpaceCalculator(system, own_context=False)
+        layout = get_layout(system)
+        positions = calculator.footprint(system.follower)
+        self.assertEqual(len(positions), 1 + 2)  # its state and the input's value and pre value
+        self.assertIn(layout.value_offset + layout.ports.index(system.follower.leader), positions)
+
+
+class CheckpointTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "statespace.npz")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def assert_same_statespace(self, first, second):
+        def edges(statespace):
+            return {(source.key, target.key, str(data["weight"]), tuple(t._name for t in data["transitions"]))
+                    for source, target, data in statespace.edges(data=True)}
+        self.assertEqual({node.key for node in first.nodes}, {node.key for node in second.nodes})
+        self.assertEqual(edges(first), edges(second))
+        self.assertEqual(first.graph["root"].key, second.graph["root"].key)
+
+    def test_save_and_load(self):
+        statespace = StateSpace(System())
+        statespace.explore(2)
+        statespace.save(self.path)
+
+        system = System()
+        loaded = StateSpace.load(self.path, system)
+        self.assert_same_statespace(statespace, loaded)
+        self.assertTrue(all(node.system is system for node in loaded.nodes))
+        self.assertEqual({node.key: explored for node, explored in statespace.nodes(data=EXPLORED, default=False)},
+                         {node.key: explored for node, explored in loaded.nodes(data=EXPLORED)})
+        for _, _, transitions in loaded.edges(data="transitions"):
+            self.assertTrue(all(transition._parent is system.heater for transition in transitions))
+
+    def test_continue_explore_after_load(self):
+        full = StateSpace(System())
+        full.explore(4)
+
+        partial = StateSpace(System())
+        partial.explore(1)
+        partial.save(self.path)
+        loaded = StateSpace.load(self.path, System())
+        loaded.explore(3)
+        self.assert_same_statespace(full, loaded)
+
+    def test_resume_explore_until_time_after_load(self):
+        full = StateSpace(System())
+        full.explore_until_time(100)
+
+        StateSpace(System()).explore_until_time(30, checkpoint=self.path)
+        loaded = StateSpace.load(self.path, System())
+        with mock.patch.object(StateSpace, "_reset_frontier", autospec=True) as reset:
+            loaded.explore_until_time(100)
+        reset.assert_not_called()
+        self.assert_same_statespace(full, loaded)
+
+    def test_periodic_checkpoints(self):
+        statespace = StateSpace(System())
+        with mock.patch.object(StateSpace, "save", autospec=True) as save:
+            statespace.explore(3, checkpoint=self.path, checkpoint_interval=0)
+        self.assertEqual(save.call_count, 4)  # three iterations and the end
+        self.assertIsNone(statespace._checkpoint_settings)
+
+    def test_load_into_other_system(self):
+        StateSpace(System()).save(self.path)
+        with self.assertRaises(ValueError):
+            StateSpace.load(self.path, Heater())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -315,3 +315,32 @@ class IntervalTest(unittest.TestCase):
         exp <= 7
 
         self.assertEqual(i.resolve_infinitesimal(), exp)
+
+
+class FormulaTableTest(unittest.TestCase):
+
+    def test_equal_formulas_share_canonical_formula(self):
+        ap, ap2 = tctl.AtomicProposition(None), tctl.AtomicProposition(None)
+        table = tctl.FormulaTable()
+        first = tctl.And(tctl.Not(ap), tctl.EF(ap2, interval=tctl.Interval() <= 5))
+        second = tctl.And(tctl.Not(ap), tctl.EF(ap2, interval=tctl.Interval() <= 5))
+        self.assertIs(table.intern(first), first)
+        self.assertIs(table.intern(second), first)
+        self.assertIs(table.intern(second.phi), first.phi)
+        self.assertEqual(len(table), 3)
+
+    def test_different_formulas_are_kept_apart(self):
+        ap, ap2 = tctl.AtomicProposition(None), tctl.AtomicProposition(None)
+        table = tctl.FormulaTable()
+        formulas = [tctl.Not(ap), tctl.Not(ap2), tctl.And(ap, ap2), tctl.Or(ap, ap2), tctl.And(ap2, ap),
+                    tctl.EF(ap), tctl.EF(ap, interval=tctl.Interval() < 5), tctl.EF(ap, interval=tctl.Interval() <= 5),
+                    tctl.EF(ap, interval=tctl.Interval() <= Epsilon(5, 1)), tctl.AF(ap), tctl.EU(ap, ap2), tctl.EU(ap2, ap)]
+        self.assertEqual(len({id(table.intern(formula)) for formula in formulas}), len(formulas))
+
+    def test_leaves_are_their_own_canonical_formula(self):
+        ap = tctl.AtomicProposition(None)
+        table = tctl.FormulaTable()
+        self.assertIs(table.intern(ap), ap)
+        self.assertIs(table.intern(True), True)
+        self.assertIs(table.intern(tctl.Not(True)), table.intern(tctl.Not(True)))
+        self.assertEqual(len(table), 1)
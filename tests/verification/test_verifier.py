@@ -1,10 +1,12 @@
 import unittest
+import unittest.mock as mock
 
 import crestdsl.model as crest
 
 import crestdsl.verification as verif
 from crestdsl.verification import tctl, StateSpace, check
 from crestdsl.verification.tctl import AtomicProposition, NamedAtomicProposition
+from crestdsl.verification.refinement import refine_kripke
 
 
 class TestEntity(crest.Entity):
@@ -16,6 +18,25 @@ class TestEntity(crest.Entity):
     state2 = crest.State()
 
 
+class Heater(crest.Entity):
+    res = crest.Resource("temp", crest.REAL)
+    temp = crest.Local(res, 20)
+
+    heating = current = crest.State()
+    cooling = crest.State()
+
+    too_hot = crest.Transition(source=heating, target=cooling, guard=(lambda self: self.temp.value >= 100))
+    too_cold = crest.Transition(source=cooling, target=heating, guard=(lambda self: self.temp.value <= 30))
+
+    @crest.update(state=heating, target=temp)
+    def heat(self, dt):
+        return self.temp.pre + 4 * dt
+
+    @crest.update(state=cooling, target=temp)
+    def cool(self, dt):
+        return self.temp.pre - 5 * dt
+
+
 class VerifierTest(unittest.TestCase):
         
     def test_formula_attribute_getting(self):
@@ -118,6 +139,71 @@ class VerifierTest(unittest.TestCase):
         verifier = verif.Verifier()
         self.assertFalse(verifier.is_possible(chk).check())
 
+    def test_checks_share_the_statespace(self):
+        heater = Heater()
+        cache = verif.StateSpaceCache()
+        first = verif.Verifier(statespace_cache=cache).is_possible(check(heater.temp) >= 90).before(25)
+        self.assertTrue(first.check())
+        second = verif.Verifier(statespace_cache=cache).never(check(heater.temp) < 20).before(60)
+        self.assertTrue(second.check())
+        third = verif.Verifier(statespace_cache=cache).is_possible(check(heater.temp) <= 40).after(25).before(40)
+        self.assertTrue(third.check())
+        self.assertIs(first.statespace, second.statespace)
+        self.assertIs(second.statespace, third.statespace)
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(first.statespace.explored_until, 60)
+
+        statespace = StateSpace(heater)
+        statespace.explore_until_time(60)
+        describe = lambda statespace: {(source.ports[heater.temp], target.ports[heater.temp], str(weight))
+                                       for source, target, weight in statespace.edges(data="weight")}
+        self.assertEqual(describe(statespace), describe(first.statespace))
+
+
+class VerifyAllTest(unittest.TestCase):
+
+    def verifiers(self, heater):
+        return [
+            verif.is_possible(check(heater.temp) >= 90).before(25),
+            verif.is_possible(check(heater.temp) >= 90).before(15),
+            verif.never(check(heater.temp) < 20).before(60),
+            verif.always(check(heater.temp) <= 100).before(60),
+            verif.is_possible(check(heater.temp) <= 40).after(25).before(40),
+            verif.forever(check(heater.temp) >= 20).before(40),
+            verif.always_possible(check(heater) == heater.cooling, within=50).before(50),
+            verif.always(check(heater.temp) > 20).after(1).before(45),
+        ]
+
+    def test_same_as_separate_checks(self):
+        heater = Heater()
+        expected = [verifier.check() for verifier in self.verifiers(heater)]
+        self.assertEqual(expected, [True, False, True, True, True, True, True, True])
+
+        verifiers = self.verifiers(heater)
+        results = verif.verify_all(verifiers, statespace_cache=verif.StateSpaceCache())
+        self.assertEqual([result.result for result in results], expected)
+        self.assertEqual([result.formula for result in results], [verifier.formula for verifier in verifiers])
+        self.assertTrue(all(result.time >= 0 for result in results))
+
+    def test_refine_once(self):
+        heater = Heater()
+        with mock.patch("crestdsl.verification.pointwise.refine_kripke", autospec=True,
+                        side_effect=refine_kripke) as refine:
+            verif.verify_all(self.verifiers(heater), statespace_cache=verif.StateSpaceCache())
+        refine.assert_called_once()
+        self.assertEqual(len(refine.call_args[0][1]), 8)  # all the check objects
+
+    def test_several_systems(self):
+        heater, other = Heater(), Heater()
+        other.temp.value = 95
+        verifiers = [verif.is_possible(check(heater.temp) >= 90).before(15),
+                     verif.is_possible(check(other.temp) >= 90).before(15),
+                     verif.never(check(heater.temp) > 100).before(30)]
+        results = verif.verify_all(verifiers, statespace_cache=verif.StateSpaceCache())
+        self.assertEqual([result.result for result in results], [False, True, True])
+        self.assertIsNot(verifiers[0].statespace, verifiers[1].statespace)
+        self.assertIs(verifiers[0].statespace, verifiers[2].statespace)
+
 
 class ApiTest(unittest.TestCase):
 